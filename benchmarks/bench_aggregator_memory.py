@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Memory benchmark comparing the object graph of ReportAggregator against the arrays of CompactReportAggregator. Every
+measurement runs in a fresh process, and reports the growth of its peak RSS while receiving the logs.
+
+The logs are made of KEYS distinct hosts and KEYS distinct resources, every host requesting two resources.
+
+usage: python benchmarks/bench_aggregator_memory.py [--keys KEYS [KEYS ...]]
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+from logAnalyze.core.compact_aggregator import CompactReportAggregator
+from logAnalyze.core.report_aggregator import ReportAggregator
+
+AGGREGATORS = {
+  'ReportAggregator': ReportAggregator,
+  'CompactReportAggregator': CompactReportAggregator
+}
+
+
+def get_peak_rss():
+  # ru_maxrss is in kilobytes on linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(aggregator_name, num_keys):
+  reporter = AGGREGATORS[aggregator_name]()
+  log_dict = {'host': None, 'request': None, 'status': None}
+  start_rss = get_peak_rss()
+  start = time.perf_counter()
+  for i in range(num_keys):
+    log_dict['host'] = 'host-%d.example.com' % i
+    for resource_num, status in ((i, '200'), ((i * 7 + 1) % num_keys, '404')):
+      log_dict['request'] = 'GET /resource/%d HTTP/1.0' % resource_num
+      log_dict['status'] = status
+      reporter.receive_log(log_dict)
+  elapsed = time.perf_counter() - start
+  print('%d %f' % (get_peak_rss() - start_rss, elapsed))
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description='Benchmark the memory used by the report aggregators')
+  arg_parser.add_argument('--keys', type=int, nargs='+', default=[1000000, 10000000],
+                          help='Number of distinct hosts and resources')
+  arg_parser.add_argument('--measure', nargs=2, help=argparse.SUPPRESS)
+  args = arg_parser.parse_args()
+
+  if args.measure:
+    measure(args.measure[0], int(args.measure[1]))
+    return
+
+  for num_keys in args.keys:
+    for aggregator_name in AGGREGATORS:
+      result = subprocess.run([sys.executable, __file__, '--measure', aggregator_name, str(num_keys)],
+                              stdout=subprocess.PIPE, universal_newlines=True)
+      if result.returncode != 0:
+        print('%10d keys  %-24s  failed (exit code %d)' % (num_keys, aggregator_name, result.returncode))
+        continue
+      rss, elapsed = result.stdout.split()
+      print('%10d keys  %-24s  %8.1f MB  %6.1f s' % (num_keys, aggregator_name, int(rss) / 2 ** 20, float(elapsed)))
+
+
+if __name__ == '__main__':
+  main()
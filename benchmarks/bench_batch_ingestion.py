@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Benchmark for the batch ingestion. Compares the throughput of parsing every line into a dict and handing it over to
+``ReportAggregator.receive_log`` against parsing chunks of lines with ``parse_many`` and handing them over to
+``ReportAggregator.receive_logs``.
+
+usage: python benchmarks/bench_batch_ingestion.py [--lines LINES] [--file FILE]
+"""
+import argparse
+import os
+import tempfile
+import time
+from functools import partial
+
+from bench_clf_date import write_log_file
+
+from logAnalyze.core.log_processor import CHUNK_SIZE
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.parse_utils import parse_many
+
+
+def per_record(path):
+  reporter = ReportAggregator()
+  parse_log = LogFormat.CLF.get_parser(reporter.fields)
+  with open(path, 'r') as log_file:
+    for log in log_file:
+      reporter.receive_log(parse_log(log))
+  return reporter
+
+
+def batched(path):
+  reporter = ReportAggregator()
+  with open(path, 'r') as log_file:
+    for logs in iter(partial(log_file.readlines, CHUNK_SIZE), []):
+      reporter.receive_logs(parse_many(LogFormat.CLF, logs, reporter.fields))
+  return reporter
+
+
+def measure(path, aggregate):
+  start = time.perf_counter()
+  reporter = aggregate(path)
+  num_lines = reporter.num_requests_successful + reporter.num_requests_unsuccessful
+  return num_lines / (time.perf_counter() - start)
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description='Benchmark the batch ingestion of the report aggregator')
+  arg_parser.add_argument('--lines', type=int, default=2000000, help='Number of log lines to generate')
+  arg_parser.add_argument('--file', type=str, default=None, help='Use this log file instead of generating one')
+  args = arg_parser.parse_args()
+
+  path = args.file
+  if path is None:
+    fd, path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    write_log_file(path, args.lines)
+  try:
+    before = measure(path, per_record)
+    after = measure(path, batched)
+  finally:
+    if args.file is None:
+      os.remove(path)
+
+  print('receive_log:  %10.0f lines/sec' % before)
+  print('receive_logs: %10.0f lines/sec' % after)
+  print('speedup:      %10.2fx' % (after / before))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Benchmark for the CLF timestamp parsing. Compares the throughput of ``parse()`` when the timestamps are handed over to
+dateutil (the previous implementation) against the dedicated CLF date parser.
+
+usage: python benchmarks/bench_clf_date.py [--lines LINES] [--file FILE]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from dateutil import parser as date_parser
+
+from logAnalyze.utils import parse_utils
+from logAnalyze.utils.constants import LogFormat
+
+
+def write_log_file(path, num_lines, seed=0):
+  """
+  Writes a NASA-style CLF log file where the timestamps move forward by a second every few lines
+  """
+  rng = random.Random(seed)
+  hosts = ['host%d.example.com' % i for i in range(1000)]
+  resources = ['/images/img%d.gif' % i for i in range(500)]
+  timestamp = datetime(1995, 7, 1, tzinfo=timezone(timedelta(hours=-4)))
+  with open(path, 'w') as log_file:
+    for _ in range(num_lines):
+      if rng.random() < 0.3:
+        timestamp += timedelta(seconds=1)
+      log_file.write('%s - - [%s] "GET %s HTTP/1.0" 200 %d\n' % (
+        rng.choice(hosts), timestamp.strftime('%d/%b/%Y:%H:%M:%S %z'), rng.choice(resources),
+        rng.randint(0, 16 * 1024)))
+
+
+def dateutil_clf_date(date):
+  return date_parser.parse(date.replace(':', ' ', 1))
+
+
+def measure(path, date_function):
+  original = parse_utils.get_datetime_from_clf_date
+  parse_utils.get_datetime_from_clf_date = date_function
+  try:
+    num_lines = 0
+    start = time.perf_counter()
+    with open(path, 'r') as log_file:
+      for log in log_file:
+        parse_utils.parse(LogFormat.CLF, log)
+        num_lines += 1
+    return num_lines / (time.perf_counter() - start)
+  finally:
+    parse_utils.get_datetime_from_clf_date = original
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description='Benchmark the CLF timestamp parsing')
+  arg_parser.add_argument('--lines', type=int, default=2000000, help='Number of log lines to generate')
+  arg_parser.add_argument('--file', type=str, default=None, help='Use this log file instead of generating one')
+  args = arg_parser.parse_args()
+
+  path = args.file
+  if path is None:
+    fd, path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    write_log_file(path, args.lines)
+  try:
+    before = measure(path, dateutil_clf_date)
+    after = measure(path, parse_utils.get_datetime_from_clf_date)
+  finally:
+    if args.file is None:
+      os.remove(path)
+
+  print('dateutil:        %10.0f lines/sec' % before)
+  print('CLF date parser: %10.0f lines/sec' % after)
+  print('speedup:         %10.2fx' % (after / before))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Benchmark suite measuring the throughput and the peak memory of ``parse``, ``ReportAggregator.receive_log``, the
+``get_top_*`` reports and the end-to-end ``log_reader`` script on a synthetic corpus (see
+``logAnalyze.test_utils.corpus``). Every benchmark runs in a fresh process, REPEAT times, keeping its fastest run.
+
+The results are saved as JSON, and can be compared against the results of a previous release to catch regressions:
+
+usage: python benchmarks/bench_suite.py [--lines LINES] [--output FILE] [--compare BASELINE]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.test_utils.corpus import write_corpus
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.parse_utils import parse
+
+# The path of the log_reader script
+LOG_READER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'scripts', 'log_reader')
+
+# The number of hosts and resources requested from the reports
+TOP = 10
+
+# The number of times the reports are generated when they are measured
+REPORT_CALLS = 20
+
+
+def get_peak_rss():
+  # ru_maxrss is in kilobytes on linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_parse(path):
+  with open(path, 'r') as log_file:
+    logs = log_file.readlines()
+  start_rss = get_peak_rss()
+  start = time.perf_counter()
+  for log in logs:
+    parse(LogFormat.CLF, log)
+  return time.perf_counter() - start, len(logs), get_peak_rss() - start_rss
+
+
+def bench_receive_log(path):
+  parse_log = LogFormat.CLF.get_parser(ReportAggregator.fields)
+  with open(path, 'r') as log_file:
+    log_dicts = [parse_log(log) for log in log_file]
+  reporter = ReportAggregator()
+  start_rss = get_peak_rss()
+  start = time.perf_counter()
+  for log_dict in log_dicts:
+    reporter.receive_log(log_dict)
+  return time.perf_counter() - start, len(log_dicts), get_peak_rss() - start_rss
+
+
+def get_report_bench(report):
+  def bench_report(path):
+    reporter = aggregate_file(path)
+    start_rss = get_peak_rss()
+    start = time.perf_counter()
+    for _ in range(REPORT_CALLS):
+      report(reporter)
+    return (time.perf_counter() - start) / REPORT_CALLS, None, get_peak_rss() - start_rss
+  return bench_report
+
+
+def bench_log_reader(path):
+  start = time.perf_counter()
+  subprocess.run([sys.executable, LOG_READER, '--file', path, '-H', str(TOP), '-R', str(TOP), '-U', str(TOP), '-N',
+                  str(TOP), '-S', '-F'], stdout=subprocess.DEVNULL, check=True)
+  elapsed = time.perf_counter() - start
+  # the peak memory of the script itself
+  peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+  with open(path, 'rb') as log_file:
+    num_lines = sum(chunk.count(b'\n') for chunk in iter(lambda: log_file.read(2 ** 20), b''))
+  return elapsed, num_lines, peak_rss
+
+
+# The benchmarks, each returning the (seconds, number of lines processed or None, peak memory in bytes) of a run.
+# The peak memory is the growth of the peak RSS while measuring, or the peak RSS of the script for log_reader.
+BENCHMARKS = {
+  'parse': bench_parse,
+  'receive_log': bench_receive_log,
+  'get_top_hosts': get_report_bench(lambda reporter: reporter.get_top_hosts(TOP)),
+  'get_top_requests': get_report_bench(lambda reporter: reporter.get_top_requests(TOP)),
+  'get_top_unsuccessful_requests': get_report_bench(lambda reporter: reporter.get_top_unsuccessful_requests(TOP)),
+  'host.get_top_requests': get_report_bench(lambda reporter: [host.get_top_requests(TOP)
+                                                              for host in reporter.get_top_hosts(TOP)]),
+  'log_reader': bench_log_reader
+}
+
+
+def run_benchmark(name, path, repeat):
+  """
+  Runs a benchmark in fresh processes, keeping its fastest run and its highest peak memory
+
+  :return: the results of the benchmark
+  :rtype: dict
+  """
+  runs = []
+  for _ in range(repeat):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', name, path],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    runs.append(json.loads(output))
+  seconds, num_lines, _ = min(runs)
+  result = {'seconds': seconds, 'peak_memory_bytes': max(peak_rss for _, _, peak_rss in runs)}
+  if num_lines is not None:
+    result['lines_per_second'] = num_lines / seconds
+  return result
+
+
+def compare(results, baseline, threshold):
+  """
+  Prints the benchmarks whose time or peak memory has grown by more than a threshold since a baseline
+
+  :return: True if any of the benchmarks has regressed
+  :rtype: bool
+  """
+  regressed = False
+  for name, result in results.items():
+    if name not in baseline:
+      continue
+    for key in ('seconds', 'peak_memory_bytes'):
+      before, after = baseline[name][key], result[key]
+      if after > before * (1 + threshold) and (key != 'peak_memory_bytes' or after - before > 2 ** 20):
+        print('REGRESSION %-30s %-15s %12.4g -> %12.4g (%+.1f%%)'
+              % (name, key, before, after, 100 * (after / before - 1)))
+        regressed = True
+  return regressed
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description='Benchmark the log parsing, aggregation and reports')
+  arg_parser.add_argument('--lines', type=int, default=1000000, help='Number of log lines to generate')
+  arg_parser.add_argument('--hosts', type=int, default=10000, help='Number of distinct hosts')
+  arg_parser.add_argument('--resources', type=int, default=5000, help='Number of distinct resources')
+  arg_parser.add_argument('--skew', type=float, default=1.1, help='Exponent of the Zipf distribution of the keys')
+  arg_parser.add_argument('--error-ratio', type=float, default=0.05, help='Ratio of unsuccessful requests')
+  arg_parser.add_argument('--seed', type=int, default=0, help='Seed of the corpus')
+  arg_parser.add_argument('--file', type=str, default=None, help='Use this log file instead of generating one')
+  arg_parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                          help='The benchmarks to be run (all by default)')
+  arg_parser.add_argument('--repeat', type=int, default=3, help='Number of runs of every benchmark')
+  arg_parser.add_argument('--output', type=str, default=None, help='Save the results to this JSON file')
+  arg_parser.add_argument('--compare', metavar='BASELINE', type=str, default=None,
+                          help='Compare the results against a JSON file saved by a previous run, exiting with 1 on '
+                               'any regression')
+  arg_parser.add_argument('--threshold', type=float, default=0.1,
+                          help='The relative growth of a time or peak memory reported as a regression')
+  arg_parser.add_argument('--measure', nargs=2, help=argparse.SUPPRESS)
+  args = arg_parser.parse_args()
+
+  if args.measure:
+    print(json.dumps(BENCHMARKS[args.measure[0]](args.measure[1])))
+    return
+
+  corpus = {'lines': args.lines, 'hosts': args.hosts, 'resources': args.resources, 'skew': args.skew,
+            'error_ratio': args.error_ratio, 'seed': args.seed}
+  path = args.file
+  if path is None:
+    fd, path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    write_corpus(path, args.lines, num_hosts=args.hosts, num_resources=args.resources, skew=args.skew,
+                 error_ratio=args.error_ratio, seed=args.seed)
+  else:
+    corpus = {'file': path}
+  try:
+    results = {}
+    for name in args.benchmarks:
+      results[name] = result = run_benchmark(name, path, args.repeat)
+      print('%-30s %10.4f s  %10s lines/sec  %8.1f MB' % (
+        name, result['seconds'], '%.0f' % result['lines_per_second'] if 'lines_per_second' in result else '-',
+        result['peak_memory_bytes'] / 2 ** 20))
+  finally:
+    if args.file is None:
+      os.remove(path)
+
+  if args.output is not None:
+    with open(args.output, 'w') as output_file:
+      json.dump({'date': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'corpus': corpus, 'results': results}, output_file, indent=2)
+  if args.compare is not None:
+    with open(args.compare, 'r') as baseline_file:
+      baseline = json.load(baseline_file)
+    if compare(results, baseline['results'], args.threshold):
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+Writes a reproducible synthetic CLF log file, whose hosts and resources are requested with a Zipf distribution (see
+``logAnalyze.test_utils.corpus``).
+
+usage: python benchmarks/generate_corpus.py FILE [--lines LINES] [--hosts HOSTS] [--resources RESOURCES]
+                                                 [--skew SKEW] [--error-ratio RATIO] [--seed SEED]
+"""
+import argparse
+import time
+
+from logAnalyze.test_utils.corpus import write_corpus
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description='Write a synthetic CLF log file')
+  arg_parser.add_argument('file', type=str, help='The path of the log file to be written')
+  arg_parser.add_argument('--lines', type=int, default=1000000, help='Number of log lines to generate')
+  arg_parser.add_argument('--hosts', type=int, default=10000, help='Number of distinct hosts')
+  arg_parser.add_argument('--resources', type=int, default=5000, help='Number of distinct resources')
+  arg_parser.add_argument('--skew', type=float, default=1.1,
+                          help='Exponent of the Zipf distribution of the hosts and resources (0 for uniform)')
+  arg_parser.add_argument('--error-ratio', metavar='RATIO', type=float, default=0.05,
+                          help='Ratio of unsuccessful requests')
+  arg_parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+  args = arg_parser.parse_args()
+
+  start = time.perf_counter()
+  write_corpus(args.file, args.lines, num_hosts=args.hosts, num_resources=args.resources, skew=args.skew,
+               error_ratio=args.error_ratio, seed=args.seed)
+  elapsed = time.perf_counter() - start
+  print('%d lines written in %.1f s (%.0f lines/sec)' % (args.lines, elapsed, args.lines / elapsed))
+
+
+if __name__ == '__main__':
+  main()
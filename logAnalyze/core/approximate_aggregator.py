@@ -0,0 +1,338 @@
+import heapq
+from collections import Counter, namedtuple
+
+from logAnalyze.core.report_aggregator import ReportAggregator, merge_status_counts
+from logAnalyze.utils.parse_utils import get_num_bytes
+
+# An approximately counted key. The true count lies between count - error and count.
+HeavyHitter = namedtuple('HeavyHitter', ['name', 'count', 'error'])
+
+
+class ApproximateReportAggregator:
+  """
+  A report aggregator which reports the top hosts, top resources, top unsuccessfully requested resources and top
+  resources by bytes served using a fixed amount of memory, however many distinct hosts and resources the logs
+  contain. The percentages of successful and unsuccessful requests, the number of requests per status code and the
+  number of bytes served are still exact.
+
+  Each of the four reports is tracked by a :class:`SpaceSaving` summary. Every reported count comes with the
+  maximum amount by which it may overestimate the true count, which is never more than the total count divided by
+  the capacity of the summary.
+
+  :ivar num_requests_successful: number of successful requests received
+  :ivar num_requests_unsuccessful: number of unsuccessful requests received
+  :ivar status_counts: a dictionary mapping the status codes to their numbers of requests
+  :ivar num_bytes: the number of bytes served
+  :ivar hosts: the summary of the requesting hosts
+  :ivar resources: the summary of the requested resources
+  :ivar unsuccessful_resources: the summary of the unsuccessfully requested resources
+  :ivar resource_bytes: the summary of the bytes served by the resources
+  :ivar normalizer: the normalizer of the request lines into resource names, or None to report the request lines
+  """
+
+  # The fields of the parsed log dict which are read by receive_log
+  fields = ReportAggregator.fields
+
+  # An estimate of the memory used by a single key of a summary, including the key itself
+  ENTRY_SIZE = 320
+
+  def __init__(self, memory_budget=256 * 2 ** 20, normalizer=None):
+    """
+    :param memory_budget: the number of bytes to be used by the four summaries put together
+    :type memory_budget: int
+    :param normalizer: the normalizer of the request lines into resource names (eg. their paths), or None
+    :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+    """
+    self.normalizer = normalizer
+    capacity = max(1, memory_budget // (4 * self.ENTRY_SIZE))
+    self.num_requests_successful = 0
+    self.num_requests_unsuccessful = 0
+    self.status_counts = {}
+    self.num_bytes = 0
+    self.hosts = SpaceSaving(capacity)
+    self.resources = SpaceSaving(capacity)
+    self.unsuccessful_resources = SpaceSaving(capacity)
+    self.resource_bytes = SpaceSaving(capacity)
+
+  def receive_log(self, log_dict):
+    """
+    This method is to be used to add a log to the report aggregator.
+
+    :param log_dict: The dictionary object which has been parsed from the log string
+    :type log_dict: dict
+    """
+    resource_name = log_dict['request']
+    if self.normalizer is not None:
+      resource_name = self.normalizer.normalize(resource_name)
+    status = log_dict['status']
+    num_bytes = get_num_bytes(log_dict['size'])
+    if ReportAggregator.is_success(status):
+      self.num_requests_successful += 1
+    else:
+      self.num_requests_unsuccessful += 1
+      self.unsuccessful_resources.add(resource_name)
+    self.status_counts[status] = self.status_counts.get(status, 0) + 1
+    self.num_bytes += num_bytes
+    self.hosts.add(log_dict['host'])
+    self.resources.add(resource_name)
+    if num_bytes:
+      self.resource_bytes.add(resource_name, num_bytes)
+
+  def receive_logs(self, records):
+    """
+    This method is to be used to add a batch of logs to the report aggregator. The hosts and resources are counted
+    within the batch first, so every summary is only updated once per distinct key of the batch.
+
+    :param records: the tuples of the fields (see fields) of the logs, eg. as returned by parse_utils.parse_many
+    :type records: collections.abc.Iterable
+    """
+    self.receive_counts(Counter(records))
+
+  def receive_counts(self, counts):
+    """
+    This method is to be used to add the logs counted by their fields to the report aggregator.
+
+    :param counts: a mapping of the tuples of the fields (see fields) of the logs to their numbers of occurrences
+    :type counts: collections.abc.Mapping
+    """
+    hosts = Counter()
+    resources = Counter()
+    unsuccessful_resources = Counter()
+    resource_bytes = Counter()
+    status_counts = self.status_counts
+    normalize = None if self.normalizer is None else self.normalizer.normalize
+    for (host_name, resource_name, status, size), count in counts.items():
+      if normalize is not None:
+        resource_name = normalize(resource_name)
+      if ReportAggregator.is_success(status):
+        self.num_requests_successful += count
+      else:
+        self.num_requests_unsuccessful += count
+        unsuccessful_resources[resource_name] += count
+      status_counts[status] = status_counts.get(status, 0) + count
+      num_bytes = get_num_bytes(size) * count
+      if num_bytes:
+        self.num_bytes += num_bytes
+        resource_bytes[resource_name] += num_bytes
+      hosts[host_name] += count
+      resources[resource_name] += count
+
+    for summary, counts in ((self.hosts, hosts), (self.resources, resources),
+                            (self.unsuccessful_resources, unsuccessful_resources),
+                            (self.resource_bytes, resource_bytes)):
+      for key, count in counts.items():
+        summary.add(key, count)
+
+  def merge(self, other):
+    """
+    Merges the summaries of another approximate report aggregator into this one
+
+    :param other: the report aggregator to be merged into this one
+    :type other: ApproximateReportAggregator
+    """
+    self.num_requests_successful += other.num_requests_successful
+    self.num_requests_unsuccessful += other.num_requests_unsuccessful
+    merge_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes += other.num_bytes
+    self.hosts.merge(other.hosts)
+    self.resources.merge(other.resources)
+    self.unsuccessful_resources.merge(other.unsuccessful_resources)
+    self.resource_bytes.merge(other.resource_bytes)
+
+  def get_top_hosts(self, n=10):
+    """
+    Get a list of the (approximate) top n hosts making the most requests
+
+    :param n: the number of hosts to return
+    :type n: int
+    :return: the list of HeavyHitter tuples of the top n hosts making the most requests
+    :rtype: list
+    """
+    return self.hosts.get_top(n)
+
+  def get_top_unsuccessful_requests(self, n=10):
+    """
+    Get a list of the (approximate) top n unsuccessfully requested resources
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of HeavyHitter tuples of the top n unsuccessfully requested resources
+    :rtype: list
+    """
+    return self.unsuccessful_resources.get_top(n)
+
+  def get_top_requests(self, n=10):
+    """
+    Get a list of the (approximate) top n requested resources
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of HeavyHitter tuples of the top n requested resources
+    :rtype: list
+    """
+    return self.resources.get_top(n)
+
+  def get_top_requests_by_bytes(self, n=10):
+    """
+    Get a list of the (approximate) top n resources by number of bytes served
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of HeavyHitter tuples of the top n resources by number of bytes served
+    :rtype: list
+    """
+    return self.resource_bytes.get_top(n)
+
+  def get_status_counts(self):
+    """
+    Number of requests per status code, in the order of the status codes
+
+    :rtype: dict
+    """
+    return dict(sorted(self.status_counts.items()))
+
+  def get_mean_bytes(self):
+    """
+    Mean number of bytes served per request.
+
+    :rtype: float
+    """
+    return self.num_bytes / (self.num_requests_successful + self.num_requests_unsuccessful)
+
+  def get_success_pct(self):
+    """
+    Percentage of successful requests received.
+
+    :rtype: float
+    """
+    return self.num_requests_successful / (self.num_requests_successful + self.num_requests_unsuccessful) * 100
+
+  def get_failed_pct(self):
+    """
+    Percentage of unsuccessful requests received.
+
+    :rtype: float
+    """
+    return 100 - self.get_success_pct()
+
+  def get_cardinality(self):
+    """
+    Number of hosts and resources being counted, at most the capacity of the counters.
+
+    :return: the (number of hosts, number of resources)
+    :rtype: tuple
+    """
+    return len(self.hosts.counters), len(self.resources.counters)
+
+
+class SpaceSaving(object):
+  """
+  The Space-Saving summary (Metwally et al.) of the most frequent keys of a stream, using at most capacity counters.
+
+  When a new key arrives and all the counters are in use, the key with the minimum count is evicted and the new key
+  takes over its count, remembering it as its error. So the counts are never underestimated, and overestimated by at
+  most the total count divided by the capacity. Every key whose true count exceeds that bound is guaranteed to be
+  tracked.
+
+  :ivar capacity: the maximum number of keys to be tracked
+  :ivar total: the total count of all the keys added
+  :ivar counters: a dictionary mapping the tracked keys to their [count, error] lists
+  """
+
+  def __init__(self, capacity):
+    self.capacity = capacity
+    self.total = 0
+    self.counters = {}
+    # a min-heap of (count, key) of all the tracked keys. The counts in the heap are only updated lazily, when an
+    # entry reaches the top of the heap, so they might be lower than the actual counts.
+    self._heap = []
+
+  def add(self, key, count=1):
+    """
+    Adds a number of occurrences of a key
+
+    :param key: the key
+    :param count: the number of occurrences
+    :type count: int
+    """
+    self.total += count
+    counter = self.counters.get(key)
+    if counter is not None:
+      counter[0] += count
+    elif len(self.counters) < self.capacity:
+      self.counters[key] = [count, 0]
+      heapq.heappush(self._heap, (count, key))
+    else:
+      min_count, min_key = self._pop_min()
+      self.counters[key] = [min_count + count, min_count]
+      heapq.heappush(self._heap, (min_count + count, key))
+
+  def _pop_min(self):
+    """
+    Removes the key with the minimum count from the summary
+
+    :return: the (count, key) of the removed key
+    :rtype: tuple
+    """
+    heap = self._heap
+    while True:
+      count, key = heap[0]
+      actual_count = self.counters[key][0]
+      if count == actual_count:
+        heapq.heappop(heap)
+        del self.counters[key]
+        return count, key
+      # the count in the heap is outdated, the entry is moved down to its actual position
+      heapq.heapreplace(heap, (actual_count, key))
+
+  def get_min_count(self):
+    """
+    The count which any key that is not tracked might have at most
+
+    :rtype: int
+    """
+    if len(self.counters) < self.capacity:
+      return 0
+    return min(count for count, error in self.counters.values())
+
+  def merge(self, other):
+    """
+    Merges another summary into this one (Agarwal et al.), so that it summarizes both of the streams. A key missing from
+    one of the summaries might have occurred up to the minimum count of that summary, which is added to its count and
+    error.
+
+    :param other: the summary to be merged into this one
+    :type other: SpaceSaving
+    """
+    min_count = self.get_min_count()
+    other_min_count = other.get_min_count()
+    counters = {}
+    for key, (count, error) in self.counters.items():
+      if key in other.counters:
+        other_count, other_error = other.counters[key]
+        counters[key] = [count + other_count, error + other_error]
+      else:
+        counters[key] = [count + other_min_count, error + other_min_count]
+    for key, (count, error) in other.counters.items():
+      if key not in counters:
+        counters[key] = [count + min_count, error + min_count]
+
+    if len(counters) > self.capacity:
+      counters = dict(heapq.nlargest(self.capacity, counters.items(), key=lambda item: (item[1][0], item[0])))
+    self.counters = counters
+    self._heap = [(count, key) for key, (count, error) in counters.items()]
+    heapq.heapify(self._heap)
+    self.total += other.total
+
+  def get_top(self, n=10):
+    """
+    Get the top n keys with the most occurrences. The ties are broken by the key, like the get_top_* methods of the
+    report aggregator.
+
+    :param n: the number of keys to return
+    :type n: int
+    :return: a list of HeavyHitter tuples
+    :rtype: list
+    """
+    top_counters = heapq.nlargest(n, self.counters.items(), key=lambda item: (item[1][0], item[0]))
+    return [HeavyHitter(key, count, error) for key, (count, error) in top_counters]
@@ -0,0 +1,176 @@
+"""
+This file contains methods which save the aggregation of a log file to a checkpoint, so that a later run only has to
+aggregate the logs appended to the file since then
+"""
+import marshal
+import os
+import zlib
+from collections import namedtuple
+from functools import partial
+
+from logAnalyze.core.compact_aggregator import CompactReportAggregator
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import CheckpointError
+from logAnalyze.utils.file_utils import get_lines_end
+
+# The identifier written at the start of every checkpoint file, along with the version of its layout
+CHECKPOINT_MAGIC = 'logAnalyze checkpoint'
+CHECKPOINT_VERSION = 2
+
+# The number of bytes at the start of the log file whose checksum is kept, to recognize the file when its inode has
+# been reused
+HEAD_SIZE = 4096
+
+# The log file which has been aggregated into a checkpoint, and how far:
+#  * :inode: the inode of the log file
+#  * :size: the size of the log file when it was aggregated
+#  * :offset: the byte offset up to which the logs have been aggregated (the end of the last complete line)
+#  * :checksum: the crc32 checksum of the first min(HEAD_SIZE, offset) bytes of the log file
+FileState = namedtuple('FileState', ['inode', 'size', 'offset', 'checksum'])
+
+
+def get_file_state(path, offset, stat=None):
+  """
+  Records the state of a log file which has been aggregated up to a byte offset
+
+  :param path: the path of the log file
+  :type path: str
+  :param offset: the byte offset up to which the logs have been aggregated
+  :type offset: int
+  :param stat: the os.stat() result of the log file taken before it was aggregated, or None to stat it now
+  :type stat: os.stat_result
+  :rtype: FileState
+  """
+  if stat is None:
+    stat = os.stat(path)
+  return FileState(stat.st_ino, stat.st_size, offset, get_head_checksum(path, offset))
+
+
+def get_head_checksum(path, offset):
+  with open(path, 'rb') as log_file:
+    return zlib.crc32(log_file.read(min(HEAD_SIZE, offset)))
+
+
+def is_appended(file_state, path):
+  """
+  Checks if a log file is still the file recorded in a file state, with lines only appended to it since then. The file
+  is taken to have been rotated if its inode or the checksum of its first bytes have changed, and to have been
+  truncated if it is now smaller than the offset which has been aggregated.
+
+  :param file_state: the recorded state of the log file
+  :type file_state: FileState
+  :param path: the path of the log file
+  :type path: str
+  :rtype: bool
+  """
+  stat = os.stat(path)
+  return (stat.st_ino == file_state.inode and stat.st_size >= file_state.offset and
+          get_head_checksum(path, file_state.offset) == file_state.checksum)
+
+
+def save_checkpoint(path, reporter, file_state):
+  """
+  Saves a compact report aggregator along with the state of the log file it has aggregated. The checkpoint file is
+  replaced atomically, so an interrupted run leaves the previous checkpoint intact.
+
+  :param path: the path of the checkpoint file
+  :type path: str
+  :param reporter: the report aggregator to be saved
+  :type reporter: CompactReportAggregator
+  :param file_state: the state of the log file aggregated by the report aggregator
+  :type file_state: FileState
+  """
+  temp_path = '%s.%d.tmp' % (path, os.getpid())
+  try:
+    with open(temp_path, 'wb') as checkpoint_file:
+      marshal.dump((CHECKPOINT_MAGIC, CHECKPOINT_VERSION) + tuple(file_state), checkpoint_file)
+      reporter.dump(checkpoint_file)
+    os.replace(temp_path, path)
+  except BaseException:
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+    raise
+
+
+def load_checkpoint(path):
+  """
+  Loads a checkpoint saved by :func:`save_checkpoint`
+
+  :param path: the path of the checkpoint file
+  :type path: str
+  :return: the (report aggregator, file state) saved to the checkpoint
+  :rtype: tuple
+  :raises CheckpointError: if the file is not a valid checkpoint
+  """
+  with open(path, 'rb') as checkpoint_file:
+    try:
+      header = marshal.load(checkpoint_file)
+    except (EOFError, ValueError, TypeError):
+      header = None
+    if (not isinstance(header, tuple) or len(header) != 2 + len(FileState._fields) or
+            header[0] != CHECKPOINT_MAGIC):
+      raise CheckpointError('Not a checkpoint file: %s' % path)
+    if header[1] != CHECKPOINT_VERSION:
+      raise CheckpointError('Unsupported version %s of the checkpoint file: %s' % (header[1], path))
+    try:
+      reporter = CompactReportAggregator.load(checkpoint_file)
+    except ValueError as ex:
+      raise CheckpointError('Corrupted checkpoint file %s: %s' % (path, ex)) from ex
+  return reporter, FileState(*header[2:])
+
+
+def aggregate_file_incrementally(path, checkpoint_path, log_format=LogFormat.CLF, encoding='utf-8', workers=1,
+                                 use_mmap=False, stats=None, malformed=None, normalizer=None):
+  """
+  Aggregates a log file, resuming from the checkpoint of a previous run if there is one. Only the lines appended to
+  the file since the checkpoint are read, unless the file has been rotated or truncated in the meantime, in which case
+  it is aggregated from its start again. Incomplete lines at the end of the file are left for the next run. The
+  checkpoint is then saved again.
+
+  :param path: the path of the log file
+  :type path: str
+  :param checkpoint_path: the path of the checkpoint file, which does not need to exist
+  :type checkpoint_path: str
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param encoding: the encoding of the log file
+  :type encoding: str
+  :param workers: the number of processes to be used
+  :type workers: int
+  :param use_mmap: True to memory map the file instead of reading it as text
+  :type use_mmap: bool
+  :param stats: the statistics of the run, to which the aggregation of the file is added, or None
+  :type stats: logAnalyze.utils.stats.RunStats
+  :param malformed: the collector of the malformed logs, which are skipped, or None to raise ParseError on any
+    malformed log
+  :type malformed: logAnalyze.utils.malformed.MalformedLogs
+  :param normalizer: the normalizer of the request lines into resource names, or None. The checkpoint is expected to
+    have been saved with the same normalization.
+  :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+  :return: the report aggregator which has received all the logs of the file, and True if it was resumed from the
+    checkpoint or False if the file was aggregated from its start
+  :rtype: tuple
+  :raises CheckpointError: if the checkpoint file is not a valid checkpoint
+  :raises ParseError: if any of the logs could not be parsed
+  :raises MalformedLogsError: if the maximum number of malformed logs of the collector is exceeded
+  """
+  stat = os.stat(path)
+  end = get_lines_end(path, stat.st_size)
+
+  reporter = None
+  if os.path.exists(checkpoint_path):
+    reporter, file_state = load_checkpoint(checkpoint_path)
+    if not is_appended(file_state, path):
+      reporter = None
+  resumed = reporter is not None
+  aggregator_factory = partial(CompactReportAggregator, normalizer)
+  if not resumed:
+    reporter = aggregate_file(path, log_format, encoding, workers, use_mmap, aggregator_factory, 0, end, stats,
+                              malformed)
+  elif end > file_state.offset:
+    reporter.merge(aggregate_file(path, log_format, encoding, workers, use_mmap, aggregator_factory,
+                                  file_state.offset, end, stats, malformed))
+
+  save_checkpoint(checkpoint_path, reporter, get_file_state(path, end, stat))
+  return reporter, resumed
@@ -0,0 +1,492 @@
+import heapq
+import marshal
+from array import array
+from collections import Counter
+from itertools import compress, repeat
+from operator import is_, is_not
+
+from logAnalyze.core.report_aggregator import ReportAggregator, Host, Resource, merge_status_counts
+from logAnalyze.utils.constants import STATUS_STRINGS
+from logAnalyze.utils.parse_utils import get_num_bytes
+
+
+class CompactReportAggregator:
+  """
+  A report aggregator providing the same reports as :class:`ReportAggregator`, meant for logs with tens of millions of
+  distinct hosts and resources.
+
+  Instead of keeping a Host object (with its own dictionary of Resource objects) per host, the hosts and resources are
+  interned to integer ids and their counters are stored in contiguous arrays. The requests of a host for a resource
+  are stored in a single dictionary keyed by the packed (host id, resource id) pair, so every resource name is stored
+  only once. The numbers of requests per status code of the hosts and resources are stored the same way, keyed by the
+  packed (id, status code) pairs. Host and Resource objects are only created for the entries returned by the get_top_*
+  methods.
+
+  :ivar num_requests_successful: number of successful requests received
+  :ivar num_requests_unsuccessful: number of unsuccessful requests received
+  :ivar status_counts: a dictionary mapping the status codes to their numbers of requests
+  :ivar num_bytes: the number of bytes served
+  :ivar host_ids: a dictionary mapping the host names to their ids
+  :ivar host_names: the list of host names, indexed by their ids
+  :ivar resource_ids: a dictionary mapping the resource names to their ids
+  :ivar resource_names: the list of resource names, indexed by their ids
+  :ivar pair_ids: a dictionary mapping the packed (host id, resource id) pairs to their ids
+  :ivar host_status_counts: a dictionary mapping the packed (host id, status code) pairs to their numbers of requests
+  :ivar resource_status_counts: a dictionary mapping the packed (resource id, status code) pairs to their numbers of
+    requests
+  :ivar normalizer: the normalizer of the request lines into resource names, or None to report the request lines
+  """
+
+  # The fields of the parsed log dict which are read by receive_log
+  fields = ReportAggregator.fields
+
+  # The number of bits used by the resource id in the packed (host id, resource id) pairs
+  PAIR_SHIFT = 32
+
+  # The number of bits used by the status code in the packed (id, status code) pairs
+  STATUS_SHIFT = 10
+
+  def __init__(self, normalizer=None):
+    """
+    :param normalizer: the normalizer of the request lines into resource names (eg. their paths), or None
+    :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+    """
+    self.normalizer = normalizer
+    self.num_requests_successful = 0
+    self.num_requests_unsuccessful = 0
+    self.status_counts = {}
+    self.num_bytes = 0
+    self.host_ids = {}
+    self.host_names = []
+    self.host_successful = array('Q')
+    self.host_unsuccessful = array('Q')
+    self.host_bytes = array('Q')
+    self.resource_ids = {}
+    self.resource_names = []
+    self.resource_successful = array('Q')
+    self.resource_unsuccessful = array('Q')
+    self.resource_bytes = array('Q')
+    self.pair_ids = {}
+    self.pair_successful = array('Q')
+    self.pair_unsuccessful = array('Q')
+    self.host_status_counts = {}
+    self.resource_status_counts = {}
+
+  def receive_log(self, log_dict):
+    """
+    This method is to be used to add a log to the report aggregator.
+
+    :param log_dict: The dictionary object which has been parsed from the log string
+    :type log_dict: dict
+    """
+    status = log_dict['status']
+    is_success = ReportAggregator.is_success(status)
+    resource_name = log_dict['request']
+    if self.normalizer is not None:
+      resource_name = self.normalizer.normalize(resource_name)
+    host_id, resource_id = self.add_requests(log_dict['host'], resource_name, int(is_success),
+                                             int(not is_success), get_num_bytes(log_dict['size']))
+    self.add_statuses(host_id, resource_id, status, 1)
+
+  def receive_logs(self, records):
+    """
+    This method is to be used to add a batch of logs to the report aggregator. The identical records are counted
+    together first, so the counters are only updated once per distinct (host, request, status, size) of the batch.
+
+    :param records: the tuples of the fields (see fields) of the logs, eg. as returned by parse_utils.parse_many
+    :type records: collections.abc.Iterable
+    """
+    self.receive_counts(Counter(records))
+
+  def receive_counts(self, counts):
+    """
+    This method is to be used to add the logs counted by their fields to the report aggregator.
+
+    :param counts: a mapping of the tuples of the fields (see fields) of the logs to their numbers of occurrences
+    :type counts: collections.abc.Mapping
+    """
+    normalize = None if self.normalizer is None else self.normalizer.normalize
+    for (host_name, resource_name, status, size), count in counts.items():
+      if normalize is not None:
+        resource_name = normalize(resource_name)
+      if ReportAggregator.is_success(status):
+        host_id, resource_id = self.add_requests(host_name, resource_name, count, 0, get_num_bytes(size) * count)
+      else:
+        host_id, resource_id = self.add_requests(host_name, resource_name, 0, count, get_num_bytes(size) * count)
+      self.add_statuses(host_id, resource_id, status, count)
+
+  def add_requests(self, host_name, resource_name, num_successful, num_unsuccessful, num_bytes=0):
+    """
+    Adds a number of requests made by a host for a resource
+
+    :param host_name: the name of the host
+    :type host_name: str
+    :param resource_name: the name of the resource
+    :type resource_name: str
+    :param num_successful: the number of successful requests
+    :type num_successful: int
+    :param num_unsuccessful: the number of unsuccessful requests
+    :type num_unsuccessful: int
+    :param num_bytes: the number of bytes served by the requests
+    :type num_bytes: int
+    :return: the (host id, resource id)
+    :rtype: tuple
+    """
+    self.num_requests_successful += num_successful
+    self.num_requests_unsuccessful += num_unsuccessful
+    self.num_bytes += num_bytes
+
+    host_id = self._get_host_id(host_name)
+    self.host_successful[host_id] += num_successful
+    self.host_unsuccessful[host_id] += num_unsuccessful
+    self.host_bytes[host_id] += num_bytes
+
+    resource_id = self._get_resource_id(resource_name)
+    self.resource_successful[resource_id] += num_successful
+    self.resource_unsuccessful[resource_id] += num_unsuccessful
+    self.resource_bytes[resource_id] += num_bytes
+
+    self._add_pair(host_id << self.PAIR_SHIFT | resource_id, num_successful, num_unsuccessful)
+    return host_id, resource_id
+
+  def add_statuses(self, host_id, resource_id, status, count):
+    """
+    Adds a number of requests of a status code made by a host for a resource
+
+    :param host_id: the id of the host
+    :type host_id: int
+    :param resource_id: the id of the resource
+    :type resource_id: int
+    :param status: the status code of the requests
+    :type status: str
+    :param count: the number of requests
+    :type count: int
+    """
+    self.status_counts[status] = self.status_counts.get(status, 0) + count
+    code = int(status)
+    key = host_id << self.STATUS_SHIFT | code
+    self.host_status_counts[key] = self.host_status_counts.get(key, 0) + count
+    key = resource_id << self.STATUS_SHIFT | code
+    self.resource_status_counts[key] = self.resource_status_counts.get(key, 0) + count
+
+  def _get_host_id(self, host_name):
+    host_id = self.host_ids.get(host_name)
+    if host_id is None:
+      host_id = self.host_ids[host_name] = len(self.host_names)
+      self.host_names.append(host_name)
+      self.host_successful.append(0)
+      self.host_unsuccessful.append(0)
+      self.host_bytes.append(0)
+    return host_id
+
+  def _get_resource_id(self, resource_name):
+    resource_id = self.resource_ids.get(resource_name)
+    if resource_id is None:
+      resource_id = self.resource_ids[resource_name] = len(self.resource_names)
+      self.resource_names.append(resource_name)
+      self.resource_successful.append(0)
+      self.resource_unsuccessful.append(0)
+      self.resource_bytes.append(0)
+    return resource_id
+
+  def _add_pair(self, pair, num_successful, num_unsuccessful):
+    pair_id = self.pair_ids.get(pair)
+    if pair_id is None:
+      pair_id = self.pair_ids[pair] = len(self.pair_successful)
+      self.pair_successful.append(0)
+      self.pair_unsuccessful.append(0)
+    self.pair_successful[pair_id] += num_successful
+    self.pair_unsuccessful[pair_id] += num_unsuccessful
+
+  def merge(self, other):
+    """
+    Merges the counters of another compact report aggregator into this one, as if all the logs received by the other
+    aggregator had been received by this one.
+
+    :param other: the report aggregator to be merged into this one
+    :type other: CompactReportAggregator
+    """
+    self.num_requests_successful += other.num_requests_successful
+    self.num_requests_unsuccessful += other.num_requests_unsuccessful
+    self.num_bytes += other.num_bytes
+    merge_status_counts(self.status_counts, other.status_counts)
+
+    # the names and pairs are interned in bulk and the counters added column by column, which is several times faster
+    # than adding the counters of every host, resource and pair in turn
+    host_ids = intern_keys(self.host_ids, other.host_names, self.host_names)
+    add_counts(self.host_successful, host_ids, other.host_successful)
+    add_counts(self.host_unsuccessful, host_ids, other.host_unsuccessful)
+    add_counts(self.host_bytes, host_ids, other.host_bytes)
+    resource_ids = intern_keys(self.resource_ids, other.resource_names, self.resource_names)
+    add_counts(self.resource_successful, resource_ids, other.resource_successful)
+    add_counts(self.resource_unsuccessful, resource_ids, other.resource_unsuccessful)
+    add_counts(self.resource_bytes, resource_ids, other.resource_bytes)
+    host_map = list(map(self.host_ids.__getitem__, other.host_names))
+    resource_map = list(map(self.resource_ids.__getitem__, other.resource_names))
+
+    # the ids of the pairs follow the order of the pair_ids dictionary
+    mask = (1 << self.PAIR_SHIFT) - 1
+    pairs = [host_map[pair >> self.PAIR_SHIFT] << self.PAIR_SHIFT | resource_map[pair & mask]
+             for pair in other.pair_ids]
+    pair_ids = intern_keys(self.pair_ids, pairs, None)
+    add_counts(self.pair_successful, pair_ids, other.pair_successful)
+    add_counts(self.pair_unsuccessful, pair_ids, other.pair_unsuccessful)
+
+    status_mask = (1 << self.STATUS_SHIFT) - 1
+    status_columns = ((self.host_status_counts, other.host_status_counts, host_map),
+                      (self.resource_status_counts, other.resource_status_counts, resource_map))
+    for status_counts, other_status_counts, id_map in status_columns:
+      for key, count in other_status_counts.items():
+        key = id_map[key >> self.STATUS_SHIFT] << self.STATUS_SHIFT | key & status_mask
+        status_counts[key] = status_counts.get(key, 0) + count
+
+  def _get_columns(self):
+    return (self.host_successful, self.host_unsuccessful, self.host_bytes, self.resource_successful,
+            self.resource_unsuccessful, self.resource_bytes, self.pair_successful, self.pair_unsuccessful)
+
+  def dump(self, file):
+    """
+    Writes the counters to a binary file, from which they can be read back by :meth:`load`. The names and the arrays of
+    counters are written as they are (the arrays in the native byte order), so no object is created per host or
+    resource.
+
+    :param file: the file opened for writing in binary mode
+    """
+    status_columns = tuple(array('Q', getter(status_counts)).tobytes()
+                           for status_counts in (self.host_status_counts, self.resource_status_counts)
+                           for getter in (dict.keys, dict.values))
+    file.write(marshal.dumps((self.num_requests_successful, self.num_requests_unsuccessful, self.num_bytes,
+                              self.status_counts, self.host_names, self.resource_names,
+                              array('Q', self.pair_ids).tobytes()) + status_columns
+                             + tuple(column.tobytes() for column in self._get_columns())))
+
+  @classmethod
+  def load(cls, file):
+    """
+    Reads the counters written by :meth:`dump` into a new compact report aggregator. The rest of the file is read at
+    once, which is much faster than letting marshal read it piece by piece.
+
+    :param file: the file opened for reading in binary mode, positioned where the counters were written
+    :return: the report aggregator having the counters read from the file
+    :rtype: CompactReportAggregator
+    :raises ValueError: if the file does not contain valid counters
+    """
+    try:
+      (num_requests_successful, num_requests_unsuccessful, num_bytes, status_counts, host_names, resource_names, pairs,
+       *columns) = marshal.loads(file.read())
+    except (EOFError, TypeError, ValueError) as ex:
+      raise ValueError('Invalid counters: %s' % ex) from ex
+    if len(columns) != 12:
+      raise ValueError('Invalid counters: %d arrays of counters instead of 12' % len(columns))
+
+    reporter = cls()
+    reporter.num_requests_successful = num_requests_successful
+    reporter.num_requests_unsuccessful = num_requests_unsuccessful
+    reporter.num_bytes = num_bytes
+    reporter.status_counts = status_counts
+    reporter.host_names = host_names
+    reporter.host_ids = dict(zip(host_names, range(len(host_names))))
+    reporter.resource_names = resource_names
+    reporter.resource_ids = dict(zip(resource_names, range(len(resource_names))))
+    pair_array = array('Q')
+    pair_array.frombytes(pairs)
+    reporter.pair_ids = dict(zip(pair_array, range(len(pair_array))))
+
+    status_arrays = [array('Q', data) for data in columns[:4]]
+    if len(status_arrays[0]) != len(status_arrays[1]) or len(status_arrays[2]) != len(status_arrays[3]):
+      raise ValueError('Invalid counters: the number of status counts does not match the number of keys')
+    reporter.host_status_counts = dict(zip(status_arrays[0], status_arrays[1]))
+    reporter.resource_status_counts = dict(zip(status_arrays[2], status_arrays[3]))
+
+    num_names = (len(host_names),) * 3 + (len(resource_names),) * 3 + (len(pair_array),) * 2
+    for column, data, num_counters in zip(reporter._get_columns(), columns[4:], num_names):
+      column.frombytes(data)
+      if len(column) != num_counters:
+        raise ValueError('Invalid counters: the number of counters does not match the number of names')
+    return reporter
+
+  def get_top_hosts(self, n=10):
+    """
+    Get a list of the top n hosts making the most requests
+
+    :param n: the number of hosts to return
+    :type n: int
+    :return: the list of top n hosts making the most requests
+    :rtype: list
+    """
+    names, successful, unsuccessful = self.host_names, self.host_successful, self.host_unsuccessful
+    top_ids = heapq.nlargest(n, range(len(names)), key=lambda i: (successful[i] + unsuccessful[i], names[i]))
+
+    hosts = {}
+    for host_id in top_ids:
+      host = Host(names[host_id])
+      host.num_requests_successful = successful[host_id]
+      host.num_requests_unsuccessful = unsuccessful[host_id]
+      host.num_bytes = self.host_bytes[host_id]
+      hosts[host_id] = host
+    self._fill_status_counts(hosts, self.host_status_counts)
+
+    # fill in the resources requested by the top hosts
+    mask = (1 << self.PAIR_SHIFT) - 1
+    for pair, pair_id in self.pair_ids.items():
+      host = hosts.get(pair >> self.PAIR_SHIFT)
+      if host is not None:
+        resource = self._get_resource(pair & mask)
+        resource.num_requests_successful = self.pair_successful[pair_id]
+        resource.num_requests_unsuccessful = self.pair_unsuccessful[pair_id]
+        host.resource_dict[resource.resource_name] = resource
+    return [hosts[host_id] for host_id in top_ids]
+
+  def get_top_unsuccessful_requests(self, n=10):
+    """
+    Get a list of the top n unsuccessfully requested resources
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: The list of top n unsuccessfully requested resources
+    :rtype: list
+    """
+    names, unsuccessful = self.resource_names, self.resource_unsuccessful
+    top_ids = heapq.nlargest(n, range(len(names)), key=lambda i: (unsuccessful[i], names[i]))
+    return self._get_resources(top_ids)
+
+  def get_top_requests(self, n=10):
+    """
+    Get a list of the top n requested resources
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of top n requested resources
+    :rtype: list
+    """
+    names, successful, unsuccessful = self.resource_names, self.resource_successful, self.resource_unsuccessful
+    top_ids = heapq.nlargest(n, range(len(names)), key=lambda i: (successful[i] + unsuccessful[i], names[i]))
+    return self._get_resources(top_ids)
+
+  def get_top_requests_by_bytes(self, n=10):
+    """
+    Get a list of the top n resources by number of bytes served
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of top n resources by number of bytes served
+    :rtype: list
+    """
+    names, resource_bytes = self.resource_names, self.resource_bytes
+    top_ids = heapq.nlargest(n, range(len(names)), key=lambda i: (resource_bytes[i], names[i]))
+    return self._get_resources(top_ids)
+
+  def _get_resources(self, resource_ids):
+    """
+    Creates the Resource objects of a list of resource ids, with all their counters
+    """
+    resources = {}
+    for resource_id in resource_ids:
+      resource = resources[resource_id] = self._get_resource(resource_id)
+      resource.num_requests_successful = self.resource_successful[resource_id]
+      resource.num_requests_unsuccessful = self.resource_unsuccessful[resource_id]
+      resource.num_bytes = self.resource_bytes[resource_id]
+    self._fill_status_counts(resources, self.resource_status_counts)
+    return [resources[resource_id] for resource_id in resource_ids]
+
+  def _get_resource(self, resource_id):
+    return Resource(self.resource_names[resource_id])
+
+  def _fill_status_counts(self, items, status_counts):
+    """
+    Fills in the numbers of requests per status code of the hosts or resources of a dictionary keyed by their ids
+    """
+    status_mask = (1 << self.STATUS_SHIFT) - 1
+    for key, count in status_counts.items():
+      item = items.get(key >> self.STATUS_SHIFT)
+      if item is not None:
+        item.status_counts[STATUS_STRINGS[key & status_mask]] = count
+
+  def get_status_counts(self):
+    """
+    Number of requests per status code, in the order of the status codes
+
+    :rtype: dict
+    """
+    return dict(sorted(self.status_counts.items()))
+
+  def get_mean_bytes(self):
+    """
+    Mean number of bytes served per request.
+
+    :rtype: float
+    """
+    return self.num_bytes / (self.num_requests_successful + self.num_requests_unsuccessful)
+
+  def get_success_pct(self):
+    """
+    Percentage of successful requests received.
+
+    :rtype: float
+    """
+    return self.num_requests_successful / (self.num_requests_successful + self.num_requests_unsuccessful) * 100
+
+  def get_failed_pct(self):
+    """
+    Percentage of unsuccessful requests received.
+
+    :rtype: float
+    """
+    return 100 - self.get_success_pct()
+
+  def get_cardinality(self):
+    """
+    Number of distinct hosts and resources received.
+
+    :return: the (number of hosts, number of resources)
+    :rtype: tuple
+    """
+    return len(self.host_names), len(self.resource_names)
+
+
+def intern_keys(ids, keys, names):
+  """
+  Maps distinct names or packed pairs to their ids, adding the missing ones with the ids following the existing ones, in
+  the order of the keys. The keys are looked up once and the new ones added in bulk, so that the cost per key stays
+  close to the one of a dictionary lookup. The counters of the new keys are appended by :func:`add_counts`.
+
+  :param ids: the dictionary mapping the names or pairs to their ids
+  :type ids: dict
+  :param keys: the distinct names or pairs
+  :type keys: list
+  :param names: the list of names indexed by their ids, to which the new names are appended, or None for pairs
+  :type names: list
+  :return: the list of the ids of the keys, None standing for the ids of the new keys
+  :rtype: list
+  :raises ValueError: If the keys are not distinct
+  """
+  key_ids = list(map(ids.get, keys))
+  new_keys = list(compress(keys, map(is_, key_ids, repeat(None))))
+  num_ids = len(ids)
+  ids.update(zip(new_keys, range(num_ids, num_ids + len(new_keys))))
+  if len(ids) != num_ids + len(new_keys):
+    raise ValueError('Duplicate keys')
+  if names is not None:
+    names.extend(new_keys)
+  return key_ids
+
+
+def add_counts(column, key_ids, counts):
+  """
+  Adds counters to the entries of an array of counters given by the ids returned by :func:`intern_keys`. Only the
+  counters of the existing entries are added one by one, the ones of the new entries being appended in bulk.
+
+  :param column: the array of counters, indexed by the ids of the keys interned before
+  :type column: array.array
+  :param key_ids: the ids of the entries, None standing for the new entries
+  :type key_ids: list
+  :param counts: the counters added to the entries, in the order of the ids
+  :type counts: array.array
+  """
+  if not column:
+    column.extend(counts)
+    return
+  existing = list(map(is_not, key_ids, repeat(None)))
+  for key_id, count in zip(compress(key_ids, existing), compress(counts, existing)):
+    column[key_id] += count
+  column.extend(compress(counts, map(is_, key_ids, repeat(None))))
@@ -0,0 +1,334 @@
+"""
+This file contains a long running service which receives logs over the network, aggregates them and serves the reports
+as JSON over HTTP
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from logAnalyze.core.log_processor import BATCH_SIZE
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import ReportError
+from logAnalyze.utils.malformed import MalformedLogs, get_decode_errors
+from logAnalyze.utils.parse_utils import parse_many
+
+# The number of bytes read from a stream connection at once, which become a single chunk of the queue
+READ_SIZE = 2 ** 16
+
+# The maximum length of a line received over a stream connection, past which it is parsed (as a malformed log)
+# without waiting for its newline
+MAX_LINE_SIZE = 2 ** 20
+
+# The number of chunks of logs waiting to be parsed by default, past which the senders are slowed down
+QUEUE_SIZE = 64
+
+# The RFC 3164 header which precedes the logs sent over syslog, eg. <190>Oct 18 12:00:00 web01 nginx:
+_syslog_header = re.compile(r'<\d{1,3}>.*?: ')
+
+# The reports served over HTTP, by path
+REPORT_PATHS = ('/top_hosts', '/top_requests', '/top_failed_requests', '/pct', '/status')
+
+# The reports of the report aggregator needed by the ones served over HTTP
+SERVED_REPORTS = ('pct', 'top_hosts', 'top_resources', 'top_failed_resources')
+
+# The reasons of the HTTP status codes sent by the daemon
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class LogDaemon:
+  """
+  A service receiving logs (one per line) over TCP, UDP (optionally framed as syslog messages) and Unix sockets, and
+  serving the reports of a report aggregator as JSON over a local HTTP endpoint.
+
+  The connections put the lines they receive on a bounded queue, from which they are parsed and aggregated in batches
+  by a separate thread, so the event loop keeps serving the connections meanwhile. When the queue is full, the stream
+  connections stop being read until it drains, which slows their senders down through the flow control of the
+  sockets. The datagrams received while the queue is full are dropped and counted, since their senders cannot be
+  slowed down. The reports are computed by the same thread as the aggregation, so they never see a batch half
+  aggregated.
+
+  Malformed logs are always skipped (and counted) rather than stopping the service, and so are the batches of logs
+  which could not be aggregated, whose error is printed to stderr.
+
+  :ivar log_format: the log format of the logs
+  :ivar reporter: the report aggregator of the logs received
+  :ivar encoding: the encoding of the logs
+  :ivar syslog: True if the syslog header of the logs is to be removed
+  :ivar batch_size: the number of logs parsed and aggregated at once (at most, unless a single chunk is larger)
+  :ivar malformed: the collector of the malformed logs
+  :ivar num_logs: the number of logs aggregated (including the malformed ones)
+  :ivar num_dropped: the number of logs received over UDP which were dropped since the queue was full
+  :ivar num_failed: the number of logs of the batches which could not be aggregated
+  :ivar addresses: a dictionary mapping the inputs (tcp, udp, unix and http) to their bound addresses, once started
+  """
+
+  def __init__(self, log_format=LogFormat.CLF, reporter=None, encoding='utf-8', syslog=False, queue_size=QUEUE_SIZE,
+               batch_size=BATCH_SIZE, malformed=None):
+    """
+    :param log_format: the log format of the logs
+    :type log_format: logAnalyze.utils.constants.LogFormat
+    :param reporter: the report aggregator of the logs, a new ReportAggregator of the SERVED_REPORTS by default
+    :param encoding: the encoding of the logs
+    :type encoding: str
+    :param syslog: True to remove the RFC 3164 syslog header (eg. <190>Oct 18 12:00:00 web01 nginx: ) of the logs
+    :type syslog: bool
+    :param queue_size: the number of chunks of logs waiting to be parsed, past which the senders are slowed down
+    :type queue_size: int
+    :param batch_size: the number of logs parsed and aggregated at once
+    :type batch_size: int
+    :param malformed: the collector of the malformed logs (without any maximum), a new one by default
+    :type malformed: logAnalyze.utils.malformed.MalformedLogs
+    """
+    self.log_format = log_format
+    self.reporter = ReportAggregator(reports=SERVED_REPORTS) if reporter is None else reporter
+    self.encoding = encoding
+    self.syslog = syslog
+    self.queue_size = queue_size
+    self.batch_size = batch_size
+    self.malformed = MalformedLogs() if malformed is None else malformed
+    self.num_logs = 0
+    self.num_dropped = 0
+    self.num_failed = 0
+    self.addresses = {}
+    self._errors = get_decode_errors(self.malformed)
+    self._queue = None
+    self._executor = None
+    self._servers = []
+    self._transports = []
+    self._consumer = None
+    self._unix_path = None
+
+  async def start(self, tcp_address=None, udp_address=None, unix_path=None, http_address=None):
+    """
+    Starts listening on the given inputs and serving the reports. The port 0 binds an available port, to be found in
+    the addresses attribute.
+
+    :param tcp_address: the (host, port) on which the logs are received over TCP, or None
+    :type tcp_address: tuple
+    :param udp_address: the (host, port) on which the logs are received over UDP, or None
+    :type udp_address: tuple
+    :param unix_path: the path of the Unix socket on which the logs are received, or None
+    :type unix_path: str
+    :param http_address: the (host, port) on which the reports are served over HTTP, or None
+    :type http_address: tuple
+    """
+    loop = asyncio.get_running_loop()
+    self._queue = asyncio.Queue(self.queue_size)
+    self._executor = ThreadPoolExecutor(max_workers=1)
+    self._consumer = asyncio.ensure_future(self._consume())
+    if tcp_address is not None:
+      server = await asyncio.start_server(self._handle_stream, *tcp_address)
+      self._servers.append(server)
+      self.addresses['tcp'] = server.sockets[0].getsockname()
+    if udp_address is not None:
+      transport, _ = await loop.create_datagram_endpoint(lambda: _DatagramProtocol(self), local_addr=udp_address)
+      self._transports.append(transport)
+      self.addresses['udp'] = transport.get_extra_info('sockname')
+    if unix_path is not None:
+      server = await asyncio.start_unix_server(self._handle_stream, unix_path)
+      self._servers.append(server)
+      self._unix_path = self.addresses['unix'] = unix_path
+    if http_address is not None:
+      server = await asyncio.start_server(self._handle_http, *http_address)
+      self._servers.append(server)
+      self.addresses['http'] = server.sockets[0].getsockname()
+
+  async def serve_forever(self):
+    """
+    Serves until the task is cancelled, then stops the daemon
+    """
+    try:
+      await asyncio.Event().wait()
+    finally:
+      await self.stop()
+
+  async def flush(self):
+    """
+    Waits until all the logs queued so far have been aggregated
+    """
+    await self._queue.join()
+
+  async def stop(self):
+    """
+    Stops listening, aggregates the logs already queued and releases the resources of the daemon
+    """
+    for server in self._servers:
+      server.close()
+      await server.wait_closed()
+    for transport in self._transports:
+      transport.close()
+    self._servers = []
+    self._transports = []
+    if self._unix_path is not None and os.path.exists(self._unix_path):
+      os.remove(self._unix_path)
+    if self._consumer is not None:
+      await self.flush()
+      self._consumer.cancel()
+      self._consumer = None
+      self._executor.shutdown()
+    if self.malformed.quarantine_path is not None:
+      self.malformed.flush()
+
+  async def _consume(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      lines = await self._queue.get()
+      num_chunks = 1
+      while len(lines) < self.batch_size and not self._queue.empty():
+        lines.extend(self._queue.get_nowait())
+        num_chunks += 1
+      try:
+        await loop.run_in_executor(self._executor, self.receive_lines, lines)
+      except Exception:
+        # the batch is skipped rather than stopping the aggregation of the following ones
+        self.num_failed += len(lines)
+        print('Could not aggregate a batch of %d logs:' % len(lines), file=sys.stderr)
+        traceback.print_exc()
+      finally:
+        for _ in range(num_chunks):
+          self._queue.task_done()
+
+  def receive_lines(self, lines):
+    """
+    Parses a batch of logs and adds them to the report aggregator
+
+    :param lines: the log strings
+    :type lines: list
+    """
+    self.reporter.receive_logs(parse_many(self.log_format, lines, self.reporter.fields, malformed=self.malformed))
+    self.num_logs += len(lines)
+
+  def split_lines(self, data):
+    """
+    Decodes complete lines of logs, removing their syslog header if needed
+
+    :param data: the bytes of the lines, without the newline of the last one
+    :type data: bytes
+    :rtype: list
+    """
+    lines = data.decode(self.encoding, self._errors).split('\n')
+    if self.syslog:
+      match = _syslog_header.match
+      for i, line in enumerate(lines):
+        header_match = match(line)
+        if header_match is not None:
+          lines[i] = line[header_match.end():]
+    return lines
+
+  async def _handle_stream(self, reader, writer):
+    partial_line = b''
+    try:
+      while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+          break
+        data = partial_line + data
+        end = data.rfind(b'\n')
+        if end < 0 and len(data) < MAX_LINE_SIZE:
+          partial_line = data
+          continue
+        if end < 0:
+          end = len(data)
+        partial_line = data[end + 1:]
+        # the connection is not read any further until the queue has room for its lines
+        await self._queue.put(self.split_lines(data[:end].replace(b'\r\n', b'\n')))
+      if partial_line.strip():
+        await self._queue.put(self.split_lines(partial_line))
+    finally:
+      writer.close()
+
+  def receive_datagram(self, data):
+    """
+    Queues the logs of a datagram, or drops them if the queue is full
+
+    :param data: the bytes of one or more lines of logs
+    :type data: bytes
+    """
+    lines = self.split_lines(data.rstrip(b'\r\n').replace(b'\r\n', b'\n'))
+    try:
+      self._queue.put_nowait(lines)
+    except asyncio.QueueFull:
+      self.num_dropped += len(lines)
+
+  async def _handle_http(self, reader, writer):
+    try:
+      request_line = await reader.readline()
+      while await reader.readline() not in (b'\r\n', b'\n', b''):
+        pass
+      try:
+        status, body = await self._respond(request_line.decode('latin-1'))
+      except ReportError as ex:
+        # the report aggregator was not configured with the report
+        status, body = 400, {'error': ex.message}
+      except Exception:
+        print('Could not compute the report of the request %r:' % request_line, file=sys.stderr)
+        traceback.print_exc()
+        status, body = 500, {'error': 'The report could not be computed'}
+      data = json.dumps(body).encode('utf-8')
+      writer.write(('HTTP/1.0 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                    'Connection: close\r\n\r\n' % (status, HTTP_REASONS[status], len(data))).encode('latin-1') + data)
+      await writer.drain()
+    except ConnectionError:
+      pass
+    finally:
+      writer.close()
+
+  async def _respond(self, request_line):
+    request = request_line.split()
+    if len(request) != 3:
+      return 400, {'error': 'Invalid request line'}
+    if request[0] != 'GET':
+      return 405, {'error': 'Only GET requests are served'}
+    url = urlsplit(request[1])
+    if url.path not in REPORT_PATHS:
+      return 400, {'error': 'Unknown report: %s (expected one of %s)' % (url.path, ', '.join(REPORT_PATHS))}
+    try:
+      n = int(parse_qs(url.query).get('n', ['10'])[-1])
+    except ValueError:
+      n = -1
+    if n < 0:
+      return 400, {'error': 'The number of entries n must be a non negative integer'}
+    report = await asyncio.get_running_loop().run_in_executor(self._executor, self.get_report, url.path[1:], n)
+    return 200, report
+
+  def get_report(self, name, n=10):
+    """
+    Computes a report of the logs received so far, as a JSON serializable object
+
+    :param name: the name of the report: top_hosts, top_requests, top_failed_requests, pct or status
+    :type name: str
+    :param n: the number of entries of the top_* reports
+    :type n: int
+    :rtype: dict
+    """
+    reporter = self.reporter
+    if name == 'top_hosts':
+      return {name: [{'host': host.host_name, 'requests': host.get_num_requests()}
+                     for host in reporter.get_top_hosts(n)]}
+    if name == 'top_requests':
+      return {name: [{'resource': resource.resource_name, 'requests': resource.get_num_requests()}
+                     for resource in reporter.get_top_requests(n)]}
+    if name == 'top_failed_requests':
+      return {name: [{'resource': resource.resource_name, 'requests': resource.num_requests_unsuccessful}
+                     for resource in reporter.get_top_unsuccessful_requests(n)]}
+    if name == 'pct':
+      try:
+        return {'success_pct': reporter.get_success_pct(), 'failed_pct': reporter.get_failed_pct()}
+      except ZeroDivisionError:
+        return {'success_pct': None, 'failed_pct': None}
+    return {'logs_received': self.num_logs, 'logs_dropped': self.num_dropped, 'logs_failed': self.num_failed,
+            'logs_malformed': dict(self.malformed.counts), 'chunks_queued': self._queue.qsize()}
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+  def __init__(self, daemon):
+    self.daemon = daemon
+
+  def datagram_received(self, data, addr):
+    self.daemon.receive_datagram(data)
@@ -0,0 +1,384 @@
+"""
+This file contains methods which read log files and feed them to the report aggregator
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.file_utils import split_file, read_chunks, map_file, get_compression, split_bgzf, \
+  read_bgzf_chunks, read_compressed_chunks, bisect_lines
+from logAnalyze.utils.malformed import MalformedLogs, get_decode_errors
+from logAnalyze.utils.parse_utils import parse_many
+from logAnalyze.utils.stats import RunStats
+
+# The number of bytes of logs which are parsed and handed over to the report aggregator as a single batch
+CHUNK_SIZE = 2 ** 20
+
+# The number of logs of a memory mapped file which are handed over to the report aggregator as a single batch
+BATCH_SIZE = 2 ** 14
+
+# The number of seconds by which the logs of a file may be out of time order, by default (a log is written when its
+# request completes, but records the time at which the request was received)
+TIME_TOLERANCE = 60
+
+
+def aggregate_files(paths, log_format=LogFormat.CLF, encoding='utf-8', workers=1, use_mmap=False,
+                    aggregator_factory=ReportAggregator, stats=None, malformed=None, since=None, until=None,
+                    tolerance=TIME_TOLERANCE):
+  """
+  Reads several log files (see :func:`aggregate_file`) and aggregates all of their logs into a single report
+  aggregator. With more than one worker, the byte ranges of all the files are aggregated by the same pool of
+  processes, so the files are read in parallel as well.
+
+  With since or until, only the part of every uncompressed file holding the logs of that time range (see
+  :func:`get_time_range`) is read. The report aggregator is still expected to drop the logs read outside of the time
+  range, like RollupAggregator does.
+
+  :param paths: the paths of the log files
+  :type paths: list
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param encoding: the encoding of the log files
+  :type encoding: str
+  :param workers: the number of processes to be used
+  :type workers: int
+  :param use_mmap: True to memory map the uncompressed files instead of reading them as text
+  :type use_mmap: bool
+  :param aggregator_factory: a callable creating an empty report aggregator, like the class of the report aggregator
+  :type aggregator_factory: collections.abc.Callable
+  :param stats: the statistics of the run, to which the aggregation of the files is added, or None
+  :type stats: logAnalyze.utils.stats.RunStats
+  :param malformed: the collector of the malformed logs, which are skipped, or None to raise ParseError on any
+    malformed log
+  :type malformed: logAnalyze.utils.malformed.MalformedLogs
+  :param since: the epoch second from which the logs are to be read, or None
+  :type since: float
+  :param until: the epoch second before which the logs are to be read, or None
+  :type until: float
+  :param tolerance: the number of seconds by which the logs of the files may be out of time order
+  :type tolerance: float
+  :return: the report aggregator which has received all the logs of the files
+  :rtype: ReportAggregator
+  :raises ParseError: if any of the logs could not be parsed
+  :raises MalformedLogsError: if the maximum number of malformed logs of the collector is exceeded
+  """
+  if since is None and until is None:
+    file_ranges = [(path, 0, None) for path in paths]
+  elif stats is None:
+    file_ranges = [(path,) + get_time_range(path, log_format, since, until, tolerance, encoding) for path in paths]
+  else:
+    with stats.stage('bisect'):
+      file_ranges = [(path,) + get_time_range(path, log_format, since, until, tolerance, encoding) for path in paths]
+  if len(paths) == 1:
+    path, start, end = file_ranges[0]
+    return aggregate_file(path, log_format, encoding, workers, use_mmap, aggregator_factory, start, end, stats,
+                          malformed)
+  if workers <= 1:
+    reporter = aggregator_factory()
+    for path, start, end in file_ranges:
+      file_reporter = aggregate_file(path, log_format, encoding, workers, use_mmap, aggregator_factory, start, end,
+                                     stats, malformed)
+      if stats is None:
+        reporter.merge(file_reporter)
+      else:
+        with stats.stage('merge'):
+          reporter.merge(file_reporter)
+    return reporter
+  ranges = [(path, range_start, range_end) for path, start, end in file_ranges
+            for range_start, range_end in get_ranges(path, workers, start, end)]
+  return aggregate_ranges(ranges, log_format, encoding, workers, use_mmap, aggregator_factory, stats, malformed)
+
+
+def get_time_range(path, log_format=LogFormat.CLF, since=None, until=None, tolerance=TIME_TOLERANCE,
+                   encoding='utf-8'):
+  """
+  Finds the byte range of a log file holding the logs of a time range, by binary searching the file for the time of
+  its logs (see file_utils.bisect_lines) instead of reading it from its start. The logs are expected to be in time
+  order, give or take the tolerance: the range starts at the first log received at or after since - tolerance, and
+  ends at the first log received at or after until + tolerance, so it may hold a few logs out of the time range.
+
+  :param path: the path of the log file
+  :type path: str
+  :param log_format: the log format to be used, which must have a time field
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param since: the epoch second from which the logs are searched, or None from the start of the file
+  :type since: float
+  :param until: the epoch second before which the logs are searched, or None till the end of the file
+  :type until: float
+  :param tolerance: the number of seconds by which the logs of the file may be out of time order
+  :type tolerance: float
+  :param encoding: the encoding of the log file
+  :type encoding: str
+  :return: the (start, end) byte offsets, end being None for the end of the file. Compressed files cannot be searched,
+    so their range is always (0, None).
+  :rtype: tuple
+  """
+  if get_compression(path) is not None:
+    return 0, None
+  # the malformed logs are skipped by the search, and left for the aggregation to report
+  parse_time = log_format.get_parser(('time',), MalformedLogs())
+
+  def get_epoch(line):
+    parsed_log = parse_time(line.decode(encoding, 'surrogateescape'))
+    return None if parsed_log is None else parsed_log['time'].timestamp()
+
+  start = 0 if since is None else bisect_lines(path, get_epoch, since - tolerance)
+  end = None if until is None else bisect_lines(path, get_epoch, until + tolerance, start)
+  return start, end
+
+
+def aggregate_file(path, log_format=LogFormat.CLF, encoding='utf-8', workers=1, use_mmap=False,
+                   aggregator_factory=ReportAggregator, start=0, end=None, stats=None, malformed=None):
+  """
+  Reads a log file and aggregates all of its logs into a report aggregator. The logs are read in chunks, which are
+  parsed with parse_utils.parse_many and handed over to the receive_logs method of the report aggregator as batches.
+
+  Files compressed with gzip, bzip2 or xz are detected from their first bytes, and decompressed on the fly by a
+  background thread.
+
+  With more than one worker, the file is split into byte ranges (aligned to the line boundaries) which are aggregated
+  in separate processes, and the partial aggregators are merged together at the end. The reports are the same as
+  when the file is aggregated by a single process. Of the compressed files, only BGZF files (made of independent gzip
+  blocks) can be split.
+
+  With use_mmap, an uncompressed file is memory mapped and scanned as bytes instead of being decoded line by line,
+  and only the fields needed by the report aggregator are decoded.
+
+  :param path: the path of the log file
+  :type path: str
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param encoding: the encoding of the log file
+  :type encoding: str
+  :param workers: the number of processes to be used
+  :type workers: int
+  :param use_mmap: True to memory map the file instead of reading it as text
+  :type use_mmap: bool
+  :param aggregator_factory: a callable creating an empty report aggregator, like the class of the report aggregator
+  :type aggregator_factory: collections.abc.Callable
+  :param start: the byte offset of the first log to be aggregated, expected to be the start of a line
+  :type start: int
+  :param end: the byte offset where the aggregation stops, or None to aggregate till the end of the file
+  :type end: int
+  :param stats: the statistics of the run, to which the aggregation of the file is added, or None
+  :type stats: logAnalyze.utils.stats.RunStats
+  :param malformed: the collector of the malformed logs, which are skipped, or None to raise ParseError on any
+    malformed log
+  :type malformed: logAnalyze.utils.malformed.MalformedLogs
+  :return: the report aggregator which has received all the logs of the file
+  :rtype: ReportAggregator
+  :raises ParseError: if any of the logs could not be parsed
+  :raises MalformedLogsError: if the maximum number of malformed logs of the collector is exceeded
+  :raises ValueError: if a byte range of a compressed file is requested
+  """
+  compression = get_compression(path)
+  if compression is not None and (start > 0 or end is not None):
+    raise ValueError('Byte ranges of compressed files cannot be aggregated: %s' % path)
+  if workers <= 1 or compression not in (None, 'bgzf'):
+    if compression is None and not use_mmap and start == 0 and end is None:
+      reporter = aggregator_factory()
+      with open(path, 'r', encoding=encoding, errors=get_decode_errors(malformed)) as log_file:
+        receive_chunks(reporter, iter(partial(log_file.readlines, CHUNK_SIZE), []), log_format, stats, malformed)
+      if stats is not None:
+        stats.num_bytes += os.path.getsize(path)
+      if malformed is not None:
+        malformed.flush()
+      return reporter
+    return aggregate_file_range(path, start, end, log_format, encoding, use_mmap, aggregator_factory, stats,
+                                malformed)
+
+  ranges = [(path, range_start, range_end) for range_start, range_end in get_ranges(path, workers, start, end)]
+  return aggregate_ranges(ranges, log_format, encoding, workers, use_mmap, aggregator_factory, stats, malformed)
+
+
+def get_ranges(path, num_ranges, start=0, end=None):
+  """
+  Splits a log file into the byte ranges which can be aggregated independently by aggregate_file_range
+
+  :param path: the path of the log file
+  :type path: str
+  :param num_ranges: the number of ranges to split the file into
+  :type num_ranges: int
+  :param start: the byte offset where the first range starts, expected to be the start of a line
+  :type start: int
+  :param end: the byte offset where the last range ends, or None to split the file till its end
+  :type end: int
+  :return: a list of (start, end) byte offsets, a single (0, None) range if the file cannot be split
+  :rtype: list
+  """
+  compression = get_compression(path)
+  if compression is None:
+    return split_file(path, num_ranges, start, end)
+  if compression == 'bgzf':
+    return split_bgzf(path, num_ranges)
+  return [(0, None)]
+
+
+def aggregate_ranges(ranges, log_format=LogFormat.CLF, encoding='utf-8', workers=1, use_mmap=False,
+                     aggregator_factory=ReportAggregator, stats=None, malformed=None):
+  """
+  Aggregates byte ranges of log files in a pool of processes, merging the partial aggregators in the order of the
+  ranges.
+
+  :param ranges: the list of (path, start, end) of the ranges
+  :type ranges: list
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param encoding: the encoding of the log files
+  :type encoding: str
+  :param workers: the number of processes to be used
+  :type workers: int
+  :param use_mmap: True to memory map the uncompressed files instead of reading them as text
+  :type use_mmap: bool
+  :param aggregator_factory: a callable creating an empty report aggregator, like the class of the report aggregator
+  :type aggregator_factory: collections.abc.Callable
+  :param stats: the statistics of the run, to which the statistics of every worker are added, or None
+  :type stats: logAnalyze.utils.stats.RunStats
+  :param malformed: the collector of the malformed logs, to which the malformed logs of every worker are added, or
+    None to raise ParseError on any malformed log
+  :type malformed: logAnalyze.utils.malformed.MalformedLogs
+  :return: the report aggregator which has received the logs within all the ranges
+  :rtype: ReportAggregator
+  """
+  reporter = aggregator_factory()
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    if stats is None and malformed is None:
+      futures = [executor.submit(aggregate_file_range, path, start, end, log_format, encoding, use_mmap,
+                                 aggregator_factory)
+                 for path, start, end in ranges]
+      for future in futures:
+        reporter.merge(future.result())
+      return reporter
+
+    futures = [executor.submit(aggregate_worker_range, path, start, end, log_format, encoding, use_mmap,
+                               aggregator_factory, stats is not None, None if malformed is None else malformed.spawn())
+               for path, start, end in ranges]
+    try:
+      for future in futures:
+        range_reporter, range_stats, range_malformed = future.result()
+        if stats is None:
+          reporter.merge(range_reporter)
+        else:
+          with stats.stage('merge'):
+            reporter.merge(range_reporter)
+          stats.merge(range_stats)
+          stats.add_batch(0)
+        if malformed is not None:
+          malformed.merge(range_malformed)
+    except BaseException:
+      for future in futures:
+        future.cancel()
+      raise
+  return reporter
+
+
+def aggregate_worker_range(path, start, end, log_format, encoding, use_mmap, aggregator_factory, with_stats,
+                           malformed):
+  """
+  Aggregates the logs lying within a byte range of a log file (see :func:`aggregate_file_range`) in a worker process,
+  collecting the statistics and the malformed logs of the worker
+
+  :return: the report aggregator which has received the logs within the range, the statistics of the worker (or None
+    if with_stats is False) and the collector of its malformed logs
+  :rtype: tuple
+  """
+  stats = RunStats() if with_stats else None
+  reporter = aggregate_file_range(path, start, end, log_format, encoding, use_mmap, aggregator_factory, stats,
+                                  malformed)
+  return reporter, stats, malformed
+
+
+def aggregate_file_range(path, start, end, log_format=LogFormat.CLF, encoding='utf-8', use_mmap=False,
+                         aggregator_factory=ReportAggregator, stats=None, malformed=None):
+  """
+  Aggregates the logs lying within a byte range of a log file. The start offset is expected to be the start of a line,
+  or of a block of a BGZF file. The other compressed files can only be aggregated as a whole.
+
+  :param path: the path of the log file
+  :type path: str
+  :param start: the byte offset of the first log to be aggregated
+  :type start: int
+  :param end: the byte offset where the aggregation stops, or None to aggregate till the end of the file
+  :type end: int
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param encoding: the encoding of the log file
+  :type encoding: str
+  :param use_mmap: True to memory map the file instead of reading it as text
+  :type use_mmap: bool
+  :param aggregator_factory: a callable creating an empty report aggregator, like the class of the report aggregator
+  :type aggregator_factory: collections.abc.Callable
+  :param stats: the statistics of the run, to which the aggregation of the range is added, or None
+  :type stats: logAnalyze.utils.stats.RunStats
+  :param malformed: the collector of the malformed logs, which are skipped, or None to raise ParseError on any
+    malformed log
+  :type malformed: logAnalyze.utils.malformed.MalformedLogs
+  :return: the report aggregator which has received the logs within the range
+  :rtype: ReportAggregator
+  """
+  reporter = aggregator_factory()
+  compression = get_compression(path)
+  errors = get_decode_errors(malformed)
+  if compression is not None:
+    if compression == 'bgzf' and (start > 0 or end is not None):
+      chunks = read_bgzf_chunks(path, start, end, encoding, errors)
+    else:
+      chunks = read_compressed_chunks(path, encoding, CHUNK_SIZE, errors=errors)
+    receive_chunks(reporter, chunks, log_format, stats, malformed)
+  elif use_mmap:
+    parse_logs = log_format.get_bytes_parser(reporter.fields, encoding, malformed)
+    with map_file(path) as buffer:
+      # itemgetter only returns a tuple for more than one field
+      get_record = itemgetter(*reporter.fields) if len(reporter.fields) > 1 else \
+        lambda log_dict: (log_dict[reporter.fields[0]],)
+      records = map(get_record, parse_logs(buffer, start, end))
+      batches = iter(lambda: list(islice(records, BATCH_SIZE)), [])
+      if stats is None:
+        for batch in batches:
+          reporter.receive_logs(batch)
+      else:
+        # the logs are read through the memory map as they are parsed
+        for batch in stats.timed(batches, 'parse'):
+          with stats.stage('aggregate'):
+            reporter.receive_logs(batch)
+          stats.add_batch(len(batch))
+  else:
+    receive_chunks(reporter, read_chunks(path, start, end, encoding, CHUNK_SIZE, errors), log_format, stats, malformed)
+  if stats is not None:
+    stats.num_bytes += (os.path.getsize(path) if end is None else end) - start
+  if malformed is not None:
+    malformed.flush()
+  return reporter
+
+
+def receive_chunks(reporter, chunks, log_format=LogFormat.CLF, stats=None, malformed=None):
+  """
+  Parses chunks of log strings with parse_utils.parse_many, and hands them over to a report aggregator as batches
+
+  :param reporter: the report aggregator
+  :param chunks: an iterable of the lists of log strings
+  :type chunks: collections.abc.Iterable
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param stats: the statistics of the run, to which the time spent reading, parsing and aggregating every chunk is
+    added, or None
+  :type stats: logAnalyze.utils.stats.RunStats
+  :param malformed: the collector of the malformed logs, which are skipped, or None to raise ParseError on any
+    malformed log
+  :type malformed: logAnalyze.utils.malformed.MalformedLogs
+  :raises ParseError: if any of the logs could not be parsed
+  """
+  if stats is None:
+    for logs in chunks:
+      reporter.receive_logs(parse_many(log_format, logs, reporter.fields, malformed=malformed))
+    return
+
+  for logs in stats.timed(chunks, 'read'):
+    records = list(parse_many(log_format, logs, reporter.fields, stats, malformed))
+    with stats.stage('aggregate'):
+      reporter.receive_logs(records)
+    stats.add_batch(len(records))
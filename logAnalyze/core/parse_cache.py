@@ -0,0 +1,250 @@
+"""
+This file contains methods which cache the parsed logs of a log file in a binary sidecar file, so that the reports of
+the file can be generated again without parsing it
+"""
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.utils.constants import LogFormat, STATUS_STRINGS
+from logAnalyze.utils.file_utils import read_log_chunks, map_file
+from logAnalyze.utils.parse_utils import parse_many, get_num_bytes
+
+# The suffix appended to the path of a log file to get the path of its parse cache
+CACHE_SUFFIX = '.lacache'
+
+# The identifier written at the start of every parse cache, along with the version of its layout
+CACHE_MAGIC = b'LACACHE\0'
+CACHE_VERSION = 2
+
+# The fields of the logs which are cached
+CACHED_FIELDS = ('host', 'request', 'status', 'size', 'time')
+
+# The sections of a parse cache, along with the array typecodes of the columns. The names are stored as a single
+# string of newline terminated names, since the fields of a log never contain any newline.
+SECTIONS = (('host_names', None), ('resource_names', None), ('hosts', 'I'), ('resources', 'I'), ('statuses', 'H'),
+            ('sizes', 'q'), ('epochs', 'q'))
+
+# The header of a parse cache: the magic, the version, the byte order of the columns, the size and the modification
+# time (in nanoseconds) of the log file, followed by the (offset, length) in bytes of every section
+HEADER = struct.Struct('<8sIcQq' + 'QQ' * len(SECTIONS))
+
+# The byte order of the columns, which are written in the native byte order
+BYTE_ORDER = b'L' if sys.byteorder == 'little' else b'B'
+
+# The alignment of the sections within the parse cache
+ALIGNMENT = 8
+
+
+class ParseCache:
+  """
+  The parsed logs of a log file, read from the memory mapped sidecar file written by :func:`write_parse_cache`.
+
+  Every log is a row of the columns, which are memoryviews of the sidecar file: the hosts and the resources are stored
+  as indices into the lists of names, the status codes and the numbers of bytes served as integers and the times as
+  epoch seconds.
+
+  :ivar host_names: the list of host names
+  :ivar resource_names: the list of resource names
+  :ivar hosts: the column of the host indices
+  :ivar resources: the column of the resource indices
+  :ivar statuses: the column of the status codes
+  :ivar sizes: the column of the numbers of bytes served ('-' being stored as 0)
+  :ivar epochs: the column of the epoch seconds
+  """
+
+  def __init__(self, buffer):
+    self._buffer = buffer
+    self._view = memoryview(buffer)
+    sections = HEADER.unpack_from(buffer)[5:]
+    for (name, typecode), offset, length in zip(SECTIONS, sections[::2], sections[1::2]):
+      section = self._view[offset:offset + length]
+      if typecode is None:
+        value = section.tobytes().decode('utf-8').split('\n')[:-1]
+      else:
+        value = section.cast(typecode)
+      setattr(self, name, value)
+
+  def __len__(self):
+    return len(self.statuses)
+
+  def release(self):
+    """
+    Releases the memoryviews of the sidecar file, so that it can be unmapped
+    """
+    for name, typecode in SECTIONS:
+      if typecode is not None:
+        getattr(self, name).release()
+    self._view.release()
+
+  def get_counts(self, fields=ReportAggregator.fields):
+    """
+    Counts the logs by the tuples of some of their host, request, status and size, eg. the fields read by a
+    ReportAggregator
+
+    :param fields: the names of the fields of the tuples
+    :type fields: tuple
+    :return: a Counter of the tuples of the fields
+    :rtype: collections.Counter
+    """
+    columns = {'host': self.hosts, 'request': self.resources, 'status': self.statuses, 'size': self.sizes}
+    decoders = {'host': self.host_names.__getitem__, 'request': self.resource_names.__getitem__,
+                'status': STATUS_STRINGS.__getitem__, 'size': str}
+    # the logs are counted by the indices and integers of the columns, which are then decoded once per distinct tuple
+    counts = Counter(zip(*(columns[field] for field in fields)))
+    keys = zip(*(map(decoders[field], column) for field, column in zip(fields, zip(*counts))))
+    return Counter(dict(zip(keys, counts.values())))
+
+  def feed(self, reporter):
+    """
+    Adds all the cached logs to a report aggregator, through its receive_columns method if it needs the time of the
+    logs, otherwise through its receive_counts method.
+
+    :param reporter: the report aggregator
+    """
+    if 'time' in reporter.fields:
+      reporter.receive_columns(self.host_names, self.resource_names, self.hosts, self.resources, self.statuses,
+                               self.sizes, self.epochs)
+    else:
+      reporter.receive_counts(self.get_counts(reporter.fields))
+
+
+def get_cache_path(path):
+  return path + CACHE_SUFFIX
+
+
+def get_source_key(path):
+  """
+  The (size, modification time in nanoseconds) of a log file, which identify the version of the file cached
+  """
+  stat = os.stat(path)
+  return stat.st_size, stat.st_mtime_ns
+
+
+def is_valid_cache(cache_path, path):
+  """
+  Checks if a parse cache exists and has been written for the current version of a log file
+
+  :param cache_path: the path of the parse cache
+  :type cache_path: str
+  :param path: the path of the log file
+  :type path: str
+  :rtype: bool
+  """
+  try:
+    with open(cache_path, 'rb') as cache_file:
+      header = cache_file.read(HEADER.size)
+  except FileNotFoundError:
+    return False
+  if len(header) < HEADER.size:
+    return False
+  magic, version, byteorder, size, mtime_ns = HEADER.unpack(header)[:5]
+  return (magic == CACHE_MAGIC and version == CACHE_VERSION and byteorder == BYTE_ORDER and
+          (size, mtime_ns) == get_source_key(path))
+
+
+def write_parse_cache(path, cache_path, log_format=LogFormat.CLF, encoding='utf-8'):
+  """
+  Parses a log file (compressed or not) and writes its parsed logs to a parse cache. The parse cache is replaced
+  atomically.
+
+  :param path: the path of the log file
+  :type path: str
+  :param cache_path: the path of the parse cache
+  :type cache_path: str
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param encoding: the encoding of the log file
+  :type encoding: str
+  :raises ParseError: if any of the logs could not be parsed
+  """
+  source_key = get_source_key(path)
+  host_ids = {}
+  resource_ids = {}
+  columns = {name: array(typecode) for name, typecode in SECTIONS if typecode is not None}
+  hosts, resources, statuses, sizes, epochs = (columns[name]
+                                               for name in ('hosts', 'resources', 'statuses', 'sizes', 'epochs'))
+  for logs in read_log_chunks(path, encoding):
+    for host_name, resource_name, status, size, time in parse_many(log_format, logs, CACHED_FIELDS):
+      host_id = host_ids.get(host_name)
+      if host_id is None:
+        host_id = host_ids[host_name] = len(host_ids)
+      resource_id = resource_ids.get(resource_name)
+      if resource_id is None:
+        resource_id = resource_ids[resource_name] = len(resource_ids)
+      hosts.append(host_id)
+      resources.append(resource_id)
+      statuses.append(int(status))
+      sizes.append(get_num_bytes(size))
+      epochs.append(int(time.timestamp()))
+
+  sections = [''.join(name + '\n' for name in names).encode('utf-8') for names in (host_ids, resource_ids)] + \
+             [columns[name].tobytes() for name, typecode in SECTIONS if typecode is not None]
+  offsets = []
+  offset = HEADER.size
+  for section in sections:
+    offset += -offset % ALIGNMENT
+    offsets.extend((offset, len(section)))
+    offset += len(section)
+
+  temp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+  try:
+    with open(temp_path, 'wb') as cache_file:
+      cache_file.write(HEADER.pack(CACHE_MAGIC, CACHE_VERSION, BYTE_ORDER, *source_key, *offsets))
+      for section, section_offset in zip(sections, offsets[::2]):
+        cache_file.write(b'\0' * (section_offset - cache_file.tell()))
+        cache_file.write(section)
+    os.replace(temp_path, cache_path)
+  except BaseException:
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+    raise
+
+
+def aggregate_cached_files(paths, log_format=LogFormat.CLF, encoding='utf-8', aggregator_factory=ReportAggregator,
+                           stats=None):
+  """
+  Aggregates several log files through their parse caches. The parse cache of a file is written first if it does not
+  exist yet or was written for an older version of the file. The reports are the same as those of
+  log_processor.aggregate_files.
+
+  :param paths: the paths of the log files
+  :type paths: list
+  :param log_format: the enum value of the log format to be used
+  :type log_format: logAnalyze.utils.constants.LogFormat
+  :param encoding: the encoding of the log files
+  :type encoding: str
+  :param aggregator_factory: a callable creating an empty report aggregator, providing receive_counts (or
+    receive_columns if it needs the 'time' field)
+  :type aggregator_factory: collections.abc.Callable
+  :param stats: the statistics of the run, to which the writing of the parse caches (as the 'cache' stage) and the
+    aggregation of the cached logs are added, or None
+  :type stats: logAnalyze.utils.stats.RunStats
+  :return: the report aggregator which has received all the logs of the files
+  :raises ParseError: if any of the logs could not be parsed
+  """
+  reporter = aggregator_factory()
+  for path in paths:
+    cache_path = get_cache_path(path)
+    if not is_valid_cache(cache_path, path):
+      if stats is None:
+        write_parse_cache(path, cache_path, log_format, encoding)
+      else:
+        with stats.stage('cache'):
+          write_parse_cache(path, cache_path, log_format, encoding)
+    with map_file(cache_path) as buffer:
+      cache = ParseCache(buffer)
+      try:
+        if stats is None:
+          cache.feed(reporter)
+        else:
+          with stats.stage('aggregate'):
+            cache.feed(reporter)
+          stats.num_bytes += len(buffer)
+          stats.add_batch(len(cache))
+      finally:
+        cache.release()
+  return reporter
@@ -0,0 +1,346 @@
+"""
+This file contains methods which write the counters of a report aggregator to a compact partial report file, and
+combine the partial reports of several log files (eg. of the machines of a web tier) into the reports of all their logs
+"""
+import struct
+import sys
+import zlib
+from array import array
+from itertools import repeat
+from operator import add
+
+from logAnalyze.core.compact_aggregator import CompactReportAggregator, intern_keys, add_counts
+from logAnalyze.core.report_aggregator import EXACT_REPORTS, merge_status_counts
+from logAnalyze.utils.constants import STATUS_STRINGS
+from logAnalyze.utils.custom_exceptions import PartialReportError
+
+# The identifier written at the start of every partial report, along with the version of its layout
+PARTIAL_MAGIC = b'LAPARTL\0'
+PARTIAL_VERSION = 1
+
+# The sections of a partial report, in the order in which they are written:
+#  * reports: the names of the reports of the aggregator
+#  * totals: the numbers of successful and unsuccessful requests, the number of bytes served, followed by the
+#    (status code, number of requests) pairs
+#  * resource_names, host_names: the names of the resources and hosts, the other sections referring to them by their
+#    indices
+#  * resource_*, host_*: a counter of every resource or host, in the order of their names
+#  * *_statuses, *_status_counts: the packed (index, status code) pairs of the resources or hosts and their numbers of
+#    requests (see CompactReportAggregator.STATUS_SHIFT)
+#  * pair_*: the host and resource indices of the resources requested by the hosts, and their numbers of requests
+# The names are stored as a single string of newline terminated names. The integers of the other sections are stored
+# as an array of the narrowest unsigned type holding all of them, prefixed with its typecode, so that the small counters
+# take a single byte each. Every section is compressed with zlib.
+SECTIONS = ('reports', 'totals', 'resource_names', 'resource_successful', 'resource_unsuccessful', 'resource_bytes',
+            'resource_statuses', 'resource_status_counts', 'host_names', 'host_successful', 'host_unsuccessful',
+            'host_bytes', 'host_statuses', 'host_status_counts', 'pair_hosts', 'pair_resources', 'pair_successful',
+            'pair_unsuccessful')
+
+# The header of a partial report: the magic, the version, followed by the compressed length of every section
+HEADER = struct.Struct('<8sI' + 'Q' * len(SECTIONS))
+
+# The zlib compression level of the sections
+COMPRESSION_LEVEL = 6
+
+# The typecodes of the arrays of integers, from the narrowest to the widest
+INTEGER_TYPECODES = 'BHIQ'
+
+
+def write_partial_report(path, reporter, reports=EXACT_REPORTS):
+  """
+  Writes the counters of a report aggregator to a partial report file, which can be combined with other partial
+  reports by :func:`combine_partial_reports`
+
+  :param path: the path of the partial report file, which is overwritten
+  :type path: str
+  :param reporter: the report aggregator
+  :type reporter: logAnalyze.core.report_aggregator.ReportAggregator or
+    logAnalyze.core.compact_aggregator.CompactReportAggregator
+  :param reports: the names of the reports provided by a compact report aggregator (eg. the reports of the partial
+    reports it combines), the ones of a report aggregator being written instead
+  :type reports: collections.abc.Iterable
+  :raises PartialReportError: If the aggregator is configured with the visitors reports, whose sketches are not stored
+  """
+  if isinstance(reporter, CompactReportAggregator):
+    compact_reporter = reporter
+  else:
+    if reporter.visitors is not None:
+      raise PartialReportError('The visitors reports cannot be written to a partial report')
+    reports = reporter.reports
+    compact_reporter = get_compact_reporter(reporter)
+
+  totals = [compact_reporter.num_requests_successful, compact_reporter.num_requests_unsuccessful,
+            compact_reporter.num_bytes]
+  for status, count in compact_reporter.status_counts.items():
+    totals += [int(status), count]
+  pair_mask = (1 << CompactReportAggregator.PAIR_SHIFT) - 1
+  columns = {
+    'reports': encode_names(sorted(reports)),
+    'totals': encode_integers(totals),
+    'resource_names': encode_names(compact_reporter.resource_names),
+    'resource_successful': compact_reporter.resource_successful,
+    'resource_unsuccessful': compact_reporter.resource_unsuccessful,
+    'resource_bytes': compact_reporter.resource_bytes,
+    'resource_statuses': compact_reporter.resource_status_counts.keys(),
+    'resource_status_counts': compact_reporter.resource_status_counts.values(),
+    'host_names': encode_names(compact_reporter.host_names),
+    'host_successful': compact_reporter.host_successful,
+    'host_unsuccessful': compact_reporter.host_unsuccessful,
+    'host_bytes': compact_reporter.host_bytes,
+    'host_statuses': compact_reporter.host_status_counts.keys(),
+    'host_status_counts': compact_reporter.host_status_counts.values(),
+    'pair_hosts': [pair >> CompactReportAggregator.PAIR_SHIFT for pair in compact_reporter.pair_ids],
+    'pair_resources': [pair & pair_mask for pair in compact_reporter.pair_ids],
+    'pair_successful': compact_reporter.pair_successful,
+    'pair_unsuccessful': compact_reporter.pair_unsuccessful,
+  }
+  with open(path, 'wb') as partial_file:
+    sections = []
+    for section in SECTIONS:
+      data = columns[section]
+      sections.append(zlib.compress(data if isinstance(data, bytes) else encode_integers(data), COMPRESSION_LEVEL))
+    partial_file.write(HEADER.pack(PARTIAL_MAGIC, PARTIAL_VERSION, *map(len, sections)))
+    for section in sections:
+      partial_file.write(section)
+
+
+def get_compact_reporter(reporter):
+  """
+  Copies the counters of a report aggregator into a compact report aggregator, which stores them in the columns of the
+  partial reports. The hosts, resources and pairs keep the order in which they were received.
+
+  :type reporter: logAnalyze.core.report_aggregator.ReportAggregator
+  :rtype: logAnalyze.core.compact_aggregator.CompactReportAggregator
+  """
+  compact_reporter = CompactReportAggregator()
+  compact_reporter.num_requests_successful = reporter.num_requests_successful
+  compact_reporter.num_requests_unsuccessful = reporter.num_requests_unsuccessful
+  compact_reporter.num_bytes = reporter.num_bytes
+  compact_reporter.status_counts = dict(reporter.status_counts)
+
+  resources = list(reporter.resource_dict.values())
+  hosts = list(reporter.host_dict.values())
+  compact_reporter.resource_names = [resource.resource_name for resource in resources]
+  compact_reporter.host_names = [host.host_name for host in hosts]
+  status_shift = CompactReportAggregator.STATUS_SHIFT
+  for items, prefix, status_counts in ((resources, 'resource_', compact_reporter.resource_status_counts),
+                                       (hosts, 'host_', compact_reporter.host_status_counts)):
+    getattr(compact_reporter, prefix + 'successful').extend(item.num_requests_successful for item in items)
+    getattr(compact_reporter, prefix + 'unsuccessful').extend(item.num_requests_unsuccessful for item in items)
+    getattr(compact_reporter, prefix + 'bytes').extend(item.num_bytes for item in items)
+    for index, item in enumerate(items):
+      for status, count in item.status_counts.items():
+        status_counts[index << status_shift | int(status)] = count
+  if 'host_resources' in reporter.dimensions and not resources:
+    # the resources requested by the hosts are tracked without the resources reports, so their counters are left at 0
+    compact_reporter.resource_names = list(dict.fromkeys(resource_name for host in hosts
+                                                         for resource_name in host.resource_dict))
+    for column in (compact_reporter.resource_successful, compact_reporter.resource_unsuccessful,
+                   compact_reporter.resource_bytes):
+      column.frombytes(bytes(column.itemsize * len(compact_reporter.resource_names)))
+  compact_reporter.resource_ids = resource_ids = dict(zip(compact_reporter.resource_names,
+                                                          range(len(compact_reporter.resource_names))))
+  compact_reporter.host_ids = dict(zip(compact_reporter.host_names, range(len(compact_reporter.host_names))))
+
+  pair_ids = compact_reporter.pair_ids
+  pair_shift = CompactReportAggregator.PAIR_SHIFT
+  if 'host_resources' in reporter.dimensions:
+    for host_index, host in enumerate(hosts):
+      host_key = host_index << pair_shift
+      for resource_name, resource in host.resource_dict.items():
+        pair_ids[host_key | resource_ids[resource_name]] = len(pair_ids)
+        compact_reporter.pair_successful.append(resource.num_requests_successful)
+        compact_reporter.pair_unsuccessful.append(resource.num_requests_unsuccessful)
+  return compact_reporter
+
+
+def read_partial_report(path, reporter=None, reports=None):
+  """
+  Reads a partial report written by :func:`write_partial_report`, merging its counters into a compact report aggregator
+
+  :param path: the path of the partial report file
+  :type path: str
+  :param reporter: the compact report aggregator into which the counters are merged, or None to create one
+  :type reporter: logAnalyze.core.compact_aggregator.CompactReportAggregator
+  :param reports: the sorted names of the reports which the partial report must provide, or None
+  :type reports: list
+  :return: the sorted names of the reports provided by the partial report, and the compact report aggregator
+  :rtype: tuple
+  :raises PartialReportError: If the file is not a valid partial report (the counters of the aggregator are then only
+    partly merged), or does not provide the reports
+  """
+  with open(path, 'rb') as partial_file:
+    header = partial_file.read(HEADER.size)
+    if len(header) < HEADER.size or not header.startswith(PARTIAL_MAGIC):
+      raise PartialReportError('Not a partial report file: %s' % path)
+    magic, version, *lengths = HEADER.unpack(header)
+    if version != PARTIAL_VERSION:
+      raise PartialReportError('Unsupported version %s of the partial report file: %s' % (version, path))
+    try:
+      sections = dict(zip(SECTIONS, (zlib.decompress(partial_file.read(length)) for length in lengths)))
+    except zlib.error as ex:
+      raise PartialReportError('Corrupted partial report file %s: %s' % (path, ex)) from ex
+
+  partial_reports = decode_names(sections['reports'])
+  if reports is not None and partial_reports != reports:
+    raise PartialReportError('The partial report file %s provides the reports %s instead of %s'
+                             % (path, ', '.join(partial_reports), ', '.join(reports)))
+  if reporter is None:
+    reporter = CompactReportAggregator()
+  try:
+    merge_sections(reporter, sections)
+  except (IndexError, ValueError) as ex:
+    raise PartialReportError('Corrupted partial report file %s: %s' % (path, ex)) from ex
+  return partial_reports, reporter
+
+
+def merge_sections(reporter, sections):
+  """
+  Merges the decompressed sections of a partial report into a compact report aggregator. The names are interned and the
+  counters added column by column, so no object is created per host or resource.
+
+  :raises IndexError, ValueError: If the sections are inconsistent
+  """
+  totals = decode_integers(sections['totals'])
+  if len(totals) < 3 or len(totals) % 2 == 0:
+    raise ValueError('invalid totals')
+  reporter.num_requests_successful += totals[0]
+  reporter.num_requests_unsuccessful += totals[1]
+  reporter.num_bytes += totals[2]
+  merge_status_counts(reporter.status_counts, {STATUS_STRINGS[code]: count
+                                               for code, count in zip(totals[3::2], totals[4::2])})
+
+  status_shift = CompactReportAggregator.STATUS_SHIFT
+  status_mask = (1 << status_shift) - 1
+  id_maps = {}
+  for prefix in ('resource_', 'host_'):
+    names = decode_names(sections[prefix + 'names'])
+    # the counters are decoded before the names are interned, so that the columns keep one counter per name
+    counters = {counter: get_column(sections, prefix + counter, len(names))
+                for counter in ('successful', 'unsuccessful', 'bytes')}
+    ids = getattr(reporter, prefix + 'ids')
+    empty = not ids
+    key_ids = intern_keys(ids, names, getattr(reporter, prefix + 'names'))
+    for counter, counts in counters.items():
+      add_counts(getattr(reporter, prefix + counter), key_ids, counts)
+    if empty:
+      # the names were interned by an empty aggregator, so their ids are their indices and nothing is remapped
+      id_map = id_maps[prefix] = None
+    else:
+      # the ids are looked up in an array, whose integers are contiguous unlike the ones of a list
+      id_map = id_maps[prefix] = array('Q', map(ids.__getitem__, names))
+
+    statuses = decode_integers(sections[prefix + 'statuses'])
+    counts = get_column(sections, prefix + 'status_counts', len(statuses))
+    if id_map is None:
+      check_indices(statuses, len(names), status_shift)
+    else:
+      statuses = [id_map[key >> status_shift] << status_shift | key & status_mask for key in statuses]
+    status_counts = getattr(reporter, prefix + 'status_counts')
+    if status_counts:
+      status_counts.update(zip(statuses, map(add, map(status_counts.get, statuses, repeat(0)), counts)))
+    else:
+      status_counts.update(zip(statuses, counts))
+
+  pair_shift = CompactReportAggregator.PAIR_SHIFT
+  pair_hosts = decode_integers(sections['pair_hosts'])
+  pair_resources = get_column(sections, 'pair_resources', len(pair_hosts))
+  host_map, resource_map = id_maps['host_'], id_maps['resource_']
+  if host_map is None:
+    check_indices(pair_hosts, len(reporter.host_names), 0)
+  if resource_map is None:
+    check_indices(pair_resources, len(reporter.resource_names), 0)
+  host_ids = pair_hosts if host_map is None else map(host_map.__getitem__, pair_hosts)
+  resource_ids = pair_resources if resource_map is None else map(resource_map.__getitem__, pair_resources)
+  pairs = [host_id << pair_shift | resource_id for host_id, resource_id in zip(host_ids, resource_ids)]
+  pair_successful = get_column(sections, 'pair_successful', len(pairs))
+  pair_unsuccessful = get_column(sections, 'pair_unsuccessful', len(pairs))
+  pair_ids = intern_keys(reporter.pair_ids, pairs, None)
+  add_counts(reporter.pair_successful, pair_ids, pair_successful)
+  add_counts(reporter.pair_unsuccessful, pair_ids, pair_unsuccessful)
+
+
+def check_indices(keys, num_names, shift):
+  """
+  Checks that the indices of names packed in the high bits of keys refer to existing names
+
+  :raises IndexError: If an index is out of range
+  """
+  if keys and max(keys) >> shift >= num_names:
+    raise IndexError('name index out of range')
+
+
+def get_column(sections, section, length):
+  """
+  Decodes a section of integers, checking that it has one integer per name or pair
+
+  :raises ValueError: If the section does not have the expected number of integers
+  """
+  column = decode_integers(sections[section])
+  if len(column) != length:
+    raise ValueError('%d integers in the %s section instead of %d' % (len(column), section, length))
+  return column
+
+
+def combine_partial_reports(paths):
+  """
+  Combines partial reports into a compact report aggregator, as if it had received the logs of all the partial reports.
+  The files are read one at a time, so only the counters of the aggregator and of a single partial report are in
+  memory at once.
+
+  :param paths: the paths of the partial report files, written with the same reports
+  :type paths: list
+  :return: the sorted names of the reports provided by the partial reports, and the compact report aggregator
+  :rtype: tuple
+  :raises PartialReportError: If any of the files is not a valid partial report, or they have different reports
+  """
+  reports, reporter = read_partial_report(paths[0])
+  for path in paths[1:]:
+    read_partial_report(path, reporter, reports)
+  return reports, reporter
+
+
+def encode_names(names):
+  return ''.join(name + '\n' for name in names).encode('utf-8', 'surrogateescape')
+
+
+def decode_names(data):
+  return data.decode('utf-8', 'surrogateescape').split('\n')[:-1]
+
+
+def encode_integers(values):
+  """
+  Encodes non-negative integers as a little endian array of the narrowest type holding all of them, prefixed with its
+  typecode
+
+  :param values: the integers
+  :type values: collections.abc.Iterable
+  :rtype: bytes
+  """
+  values = values if isinstance(values, array) else array('Q', values)
+  max_value = max(values, default=0)
+  typecode = next(typecode for typecode in INTEGER_TYPECODES if max_value >> 8 * array(typecode).itemsize == 0)
+  column = array(typecode, values) if typecode != values.typecode else values
+  if sys.byteorder == 'big':
+    column = array(typecode, column)
+    column.byteswap()
+  return typecode.encode('ascii') + column.tobytes()
+
+
+def decode_integers(data):
+  """
+  Decodes the integers encoded by :func:`encode_integers`
+
+  :param data: the typecode followed by the array of integers
+  :type data: bytes
+  :rtype: array.array
+  :raises ValueError: If the data is not a valid array of integers
+  """
+  typecode = data[:1].decode('latin-1')
+  if typecode == '' or typecode not in INTEGER_TYPECODES:
+    raise ValueError('invalid typecode %r' % typecode)
+  column = array(typecode)
+  column.frombytes(data[1:])
+  if sys.byteorder == 'big':
+    column.byteswap()
+  return column if typecode == 'Q' else array('Q', column)
@@ -1,7 +1,51 @@
-import re
-
-from logAnalyze.utils import constants
-from logAnalyze.utils.custom_exceptions import StatusError
+import heapq
+from collections import Counter
+
+from logAnalyze.core.visitor_aggregator import DEFAULT_PRECISION, VisitorAggregator
+from logAnalyze.utils.constants import SUCCESS_BY_STATUS
+from logAnalyze.utils.custom_exceptions import ReportError, StatusError
+from logAnalyze.utils.parse_utils import get_num_bytes
+
+# The dimensions counted by a report aggregator for each of its reports, besides the numbers of successful and
+# unsuccessful requests which are always counted:
+#  * statuses: the numbers of requests per status code and the numbers of bytes served, overall and per counted host
+#    and resource
+#  * resources: the numbers of successful and unsuccessful requests of every resource
+#  * hosts: the numbers of successful and unsuccessful requests of every host
+#  * host_resources: the counters of the resources requested by every host
+#  * visitors: the HyperLogLog sketches of the distinct hosts overall and per resource, and of the distinct resources
+#    per host (see visitor_aggregator.VisitorAggregator)
+REPORT_DIMENSIONS = {
+  'pct': (),
+  'status_codes': ('statuses',),
+  'top_hosts': ('hosts',),
+  'top_resources_per_host': ('hosts', 'host_resources'),
+  'top_resources': ('resources',),
+  'top_failed_resources': ('resources',),
+  'top_resources_by_bytes': ('resources', 'statuses'),
+  'unique_visitors': ('visitors',),
+  'top_resources_by_visitors': ('visitors',),
+  'top_hosts_by_resources': ('visitors',),
+}
+
+# The fields of the logs read for each dimension, besides the status which is always read
+DIMENSION_FIELDS = {
+  'statuses': ('size',),
+  'resources': ('request',),
+  'hosts': ('host',),
+  'host_resources': ('host', 'request'),
+  'visitors': ('host', 'request'),
+}
+
+# The reports which can be configured on a report aggregator
+REPORTS = tuple(REPORT_DIMENSIONS)
+
+# The exactly counted reports, leaving out the estimates of the visitors
+EXACT_REPORTS = tuple(report for report in REPORTS if REPORT_DIMENSIONS[report] != ('visitors',))
+
+# The reports configured by default: the exactly counted ones, leaving out the ones needing the status codes and bytes
+# of every log, which are only counted when asked for
+DEFAULT_REPORTS = tuple(report for report in EXACT_REPORTS if 'statuses' not in REPORT_DIMENSIONS[report])
 
 
 class ReportAggregator:
@@ -9,47 +53,195 @@ class ReportAggregator:
   This class receives incoming parsed log records (in a dict format), and generates aggregate reports
   like top 10 requesting hosts, percentage of unsuccessful requests etc.
 
+  The aggregator only counts the dimensions needed by the reports it is configured with, the functions counting them
+  being chosen once for all (see get_counters) so that the other dimensions cost nothing. Asking it for any other report
+  raises a ReportError.
+
+  :ivar reports: the names of the reports provided by the aggregator (see REPORTS)
+  :ivar dimensions: the names of the dimensions counted for these reports (see REPORT_DIMENSIONS)
+  :ivar fields: the fields of the logs read for these dimensions, in the order of the fields of the class
+  :ivar field_indices: a dictionary mapping the fields to their positions in the tuples of the logs
   :ivar num_requests_successful: number of successful requests received
   :ivar num_requests_unsuccessful: number of unsuccessful requests received
+  :ivar status_counts: a dictionary mapping the status codes to their numbers of requests
+  :ivar num_bytes: the number of bytes served
   :ivar host_dict: a dictionary of hosts which have made any requests
   :ivar resource_dict: a dictionary of resources requested any time
+  :ivar visitors: the aggregator estimating the numbers of distinct hosts and resources, or None if none of its reports
+    were configured
+  :ivar normalizer: the normalizer of the request lines into resource names, or None to report the request lines
   """
 
-  def __init__(self):
+  # The fields of the parsed log dict which may be read by receive_log, every aggregator only reading the ones of the
+  # dimensions it counts (see get_fields)
+  fields = ('host', 'request', 'status', 'size')
+
+  def __init__(self, normalizer=None, reports=DEFAULT_REPORTS, precision=DEFAULT_PRECISION):
+    """
+    :param normalizer: the normalizer of the request lines into resource names (eg. their paths), or None
+    :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+    :param reports: the names of the reports to be provided by the aggregator (see REPORTS), the report of the top
+      resources per host implying the one of the top hosts
+    :type reports: collections.abc.Iterable
+    :param precision: the precision of the HyperLogLog sketches of the visitors reports
+    :type precision: int
+    :raises ValueError: If any of the reports is unknown, or the precision is out of range
+    """
+    reports = frozenset(reports)
+    unknown_reports = reports.difference(REPORTS)
+    if unknown_reports:
+      raise ValueError('Unknown reports: %s (expected some of %s)'
+                       % (', '.join(sorted(unknown_reports)), ', '.join(REPORTS)))
+    if 'top_resources_per_host' in reports:
+      reports |= {'top_hosts'}
+    self.reports = reports
+    self.dimensions = frozenset(dimension for report in reports for dimension in REPORT_DIMENSIONS[report])
+    self.normalizer = normalizer
     self.num_requests_successful = 0
     self.num_requests_unsuccessful = 0
+    self.status_counts = {}
+    self.num_bytes = 0
     self.host_dict = {}
     self.resource_dict = {}
+    # the request lines are normalized by the aggregator before they reach the visitors
+    self.visitors = VisitorAggregator(precision) if 'visitors' in self.dimensions else None
+    self.fields = get_fields(self.dimensions)
+    self.field_indices = {field: index for index, field in enumerate(self.fields)}
+    self._counters = get_counters(self.dimensions)
+    self._log_counters = tuple(LOG_COUNTERS[counter] for counter in self._counters)
+
+  def _check_report(self, report):
+    if report not in self.reports:
+      raise ReportError('The report %s was not configured on the report aggregator, which only provides: %s'
+                        % (report, ', '.join(sorted(self.reports)) or 'no reports'))
 
   def receive_log(self, log_dict):
     """
-    This method is to be used to add a log to the report aggregator.
+    This method is to be used to add a log to the report aggregator. The log is counted directly by the functions of
+    its dimensions (see LOG_COUNTERS), without going through a batch.
 
     :param log_dict: The dictionary object which has been parsed from the log string
     :type log_dict: dict
+    :raises StatusError: If the status is not of the form xxx (where x is a decimal)
     """
-    host_name = log_dict['host']
-    resource_name = log_dict['request']
     status = log_dict['status']
     is_success = self.is_success(status)
     if is_success:
       self.num_requests_successful += 1
     else:
       self.num_requests_unsuccessful += 1
+    resource_name = log_dict.get('request')
+    if self.normalizer is not None and resource_name is not None:
+      resource_name = self.normalizer.normalize(resource_name)
+    for count_log in self._log_counters:
+      count_log(self, log_dict, resource_name, status, is_success)
+
+  def receive_logs(self, records):
+    """
+    This method is to be used to add a batch of logs to the report aggregator. The identical records are counted
+    together first, so the counters are only updated once per distinct record of the batch.
+
+    :param records: the tuples of the fields (see fields) of the logs, eg. as returned by parse_utils.parse_many
+    :type records: collections.abc.Iterable
+    :raises StatusError: If any of the statuses is not of the form xxx (where x is a decimal)
+    """
+    self.receive_counts(Counter(records))
+
+  def receive_counts(self, counts):
+    """
+    This method is to be used to add the logs counted by their fields to the report aggregator. The statuses of the
+    batch are all checked before any counter is updated, so that a batch with an unidentifiable status is not counted
+    at all. Every dimension is then counted by its own function (see get_counters).
 
-    if host_name in self.host_dict:
+    :param counts: a mapping of the tuples of the fields (see fields) of the logs to their numbers of occurrences
+    :type counts: collections.abc.Mapping
+    :raises StatusError: If any of the statuses is not of the form xxx (where x is a decimal)
+    """
+    status_index = self.field_indices['status']
+    status_counts = {}
+    for key, count in counts.items():
+      status = key[status_index]
+      status_counts[status] = status_counts.get(status, 0) + count
+    for status in status_counts:
+      self.is_success(status)
+
+    for status, count in status_counts.items():
+      if SUCCESS_BY_STATUS[status]:
+        self.num_requests_successful += count
+      else:
+        self.num_requests_unsuccessful += count
+    if self.normalizer is not None and 'request' in self.fields:
+      counts = normalize_counts(counts, self.field_indices['request'], self.normalizer)
+    # the numbers of bytes of the sizes of the batch are shared by its dimensions
+    sizes = {}
+    for count_dimension in self._counters:
+      count_dimension(self, counts, status_counts, sizes)
+
+  def merge(self, other):
+    """
+    Merges the counters of another report aggregator into this one, as if all the logs received by the other
+    aggregator had been received by this one.
+
+    :param other: the report aggregator to be merged into this one, configured with the same reports
+    :type other: ReportAggregator
+    :raises ReportError: If the other aggregator is configured with different reports
+    """
+    if other.reports != self.reports:
+      raise ReportError('Cannot merge report aggregators configured with different reports')
+    self.num_requests_successful += other.num_requests_successful
+    self.num_requests_unsuccessful += other.num_requests_unsuccessful
+    merge_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes += other.num_bytes
+
+    for resource_name, other_resource in other.resource_dict.items():
+      if resource_name in self.resource_dict:
+        resource = self.resource_dict[resource_name]
+      else:
+        resource = Resource(resource_name)
+        self.resource_dict[resource_name] = resource
+      resource.merge(other_resource)
+
+    for host_name, other_host in other.host_dict.items():
+      if host_name in self.host_dict:
+        host = self.host_dict[host_name]
+      else:
+        host = Host(host_name, other_host.resource_dict is not None)
+        self.host_dict[host_name] = host
+      host.merge(other_host, self.resource_dict if 'resources' in self.dimensions else None)
+
+    if self.visitors is not None:
+      self.visitors.merge(other.visitors)
+
+  def subtract(self, other):
+    """
+    Subtracts the counters of another report aggregator from this one, as if the logs received by the other aggregator
+    had never been received by this one. The other aggregator must only have received logs which were received by
+    this one as well. Hosts and resources left without any requests are removed.
+
+    :param other: the report aggregator to be subtracted from this one
+    :type other: ReportAggregator
+    :raises ReportError: If the other aggregator is configured with different reports, or with visitors reports
+    """
+    if other.reports != self.reports:
+      raise ReportError('Cannot subtract report aggregators configured with different reports')
+    if self.visitors is not None:
+      raise ReportError('Cannot subtract the HyperLogLog sketches of the visitors reports')
+    self.num_requests_successful -= other.num_requests_successful
+    self.num_requests_unsuccessful -= other.num_requests_unsuccessful
+    subtract_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes -= other.num_bytes
+
+    for host_name, other_host in other.host_dict.items():
       host = self.host_dict[host_name]
-    else:
-      host = Host(host_name)
-      self.host_dict[host_name] = host
-    host.add_resource(resource_name, is_success)
+      host.subtract(other_host)
+      if host.get_num_requests() == 0:
+        del self.host_dict[host_name]
 
-    if resource_name in self.resource_dict:
+    for resource_name, other_resource in other.resource_dict.items():
       resource = self.resource_dict[resource_name]
-    else:
-      resource = Resource(resource_name)
-      self.resource_dict[resource_name] = resource
-    resource.add_request(is_success)
+      resource.subtract(other_resource)
+      if resource.get_num_requests() == 0:
+        del self.resource_dict[resource_name]
 
   @staticmethod
   def is_success(status):
@@ -62,11 +254,10 @@ class ReportAggregator:
     :rtype: bool
     :raises StatusError: If the received http status is not of the form xxx (where x is a decimal)
     """
-    if re.match(constants.SUCCESS_STATUS, status):
-      return True
-    elif re.match(constants.FAIL_STATUS, status):
-      return False
-    raise StatusError('Unidentifiable http status code: %s' % status)
+    is_success = SUCCESS_BY_STATUS.get(status)
+    if is_success is None:
+      raise StatusError('Unidentifiable http status code: %s' % status)
+    return is_success
 
   def get_top_hosts(self, n=10):
     """
@@ -76,12 +267,11 @@ class ReportAggregator:
     :type n: int
     :return: the list of top n hosts making the most requests
     :rtype: list
+    :raises ReportError: If the aggregator was not configured with the top_hosts report
     """
-    # sort the dictionary in reverse order, first using the number of requests made by each host and then using the
-    # host name
-    sorted_host_list = sorted(self.host_dict.items(),
-                              key=lambda item: (item[1].get_num_requests(), item[1].host_name), reverse=True)
-    return [v for k, v in sorted_host_list[:n]]
+    self._check_report('top_hosts')
+    # select the largest hosts, first using the number of requests made by each host and then using the host name
+    return heapq.nlargest(n, self.host_dict.values(), key=lambda host: (host.get_num_requests(), host.host_name))
 
   def get_top_unsuccessful_requests(self, n=10):
     """
@@ -91,13 +281,13 @@ class ReportAggregator:
     :type n: int
     :return: The list of top n unsuccessfully requested resources
     :rtype: list
+    :raises ReportError: If the aggregator was not configured with the top_failed_resources report
     """
-    # sort the dictionary in reverse order, first using the number of unsuccessful requests for each resource and
-    # then using the resource name
-    sorted_resource_list = sorted(self.resource_dict.items(),
-                                  key=lambda item: (item[1].num_requests_unsuccessful, item[1].resource_name),
-                                  reverse=True)
-    return [v for k, v in sorted_resource_list[:n]]
+    self._check_report('top_failed_resources')
+    # select the largest resources, first using the number of unsuccessful requests for each resource and then using
+    # the resource name
+    return heapq.nlargest(n, self.resource_dict.values(),
+                          key=lambda resource: (resource.num_requests_unsuccessful, resource.resource_name))
 
   def get_top_requests(self, n=10):
     """
@@ -107,19 +297,56 @@ class ReportAggregator:
     :type n: int
     :return: the list of top n requested resources
     :rtype: list
+    :raises ReportError: If the aggregator was not configured with the top_resources report
+    """
+    self._check_report('top_resources')
+    # select the largest resources, first using the number of requests for each resource and then using the resource
+    # name
+    return heapq.nlargest(n, self.resource_dict.values(),
+                          key=lambda resource: (resource.get_num_requests(), resource.resource_name))
+
+  def get_top_requests_by_bytes(self, n=10):
+    """
+    Get a list of the top n resources by number of bytes served
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of top n resources by number of bytes served
+    :rtype: list
+    :raises ReportError: If the aggregator was not configured with the top_resources_by_bytes report
+    """
+    self._check_report('top_resources_by_bytes')
+    return heapq.nlargest(n, self.resource_dict.values(), key=lambda resource: (resource.num_bytes,
+                                                                                resource.resource_name))
+
+  def get_status_counts(self):
+    """
+    Number of requests per status code, in the order of the status codes
+
+    :rtype: dict
+    :raises ReportError: If the aggregator was not configured with the status_codes report
+    """
+    self._check_report('status_codes')
+    return dict(sorted(self.status_counts.items()))
+
+  def get_mean_bytes(self):
     """
-    # sort the dictionary in reverse order, first using the number of requests for each resource and then using the
-    # resource name
-    sorted_resource_list = sorted(self.resource_dict.items(),
-                                  key=lambda item: (item[1].get_num_requests(), item[1].resource_name), reverse=True)
-    return [v for k, v in sorted_resource_list[:n]]
+    Mean number of bytes served per request.
+
+    :rtype: float
+    :raises ReportError: If the aggregator was not configured with the status_codes report
+    """
+    self._check_report('status_codes')
+    return self.num_bytes / (self.num_requests_successful + self.num_requests_unsuccessful)
 
   def get_success_pct(self):
     """
     Percentage of successful requests received.
 
     :rtype: float
+    :raises ReportError: If the aggregator was not configured with the pct report
     """
+    self._check_report('pct')
     return self.num_requests_successful / (self.num_requests_successful + self.num_requests_unsuccessful) * 100
 
   def get_failed_pct(self):
@@ -127,9 +354,55 @@ class ReportAggregator:
     Percentage of unsuccessful requests received.
 
     :rtype: float
+    :raises ReportError: If the aggregator was not configured with the pct report
     """
     return 100 - self.get_success_pct()
 
+  def get_unique_visitors(self):
+    """
+    The estimated number of distinct hosts which requested any resource
+
+    :rtype: logAnalyze.core.visitor_aggregator.VisitorEstimate
+    :raises ReportError: If the aggregator was not configured with the unique_visitors report
+    """
+    self._check_report('unique_visitors')
+    return self.visitors.get_unique_visitors()
+
+  def get_top_resources_by_visitors(self, n=10):
+    """
+    Get a list of the top n resources requested by the most distinct hosts (estimated)
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of VisitorEstimate tuples of the top n resources
+    :rtype: list
+    :raises ReportError: If the aggregator was not configured with the top_resources_by_visitors report
+    """
+    self._check_report('top_resources_by_visitors')
+    return self.visitors.get_top_resources_by_visitors(n)
+
+  def get_top_hosts_by_resources(self, n=10):
+    """
+    Get a list of the top n hosts requesting the most distinct resources (estimated)
+
+    :param n: the number of hosts to return
+    :type n: int
+    :return: the list of VisitorEstimate tuples of the top n hosts
+    :rtype: list
+    :raises ReportError: If the aggregator was not configured with the top_hosts_by_resources report
+    """
+    self._check_report('top_hosts_by_resources')
+    return self.visitors.get_top_hosts_by_resources(n)
+
+  def get_cardinality(self):
+    """
+    Number of distinct hosts and resources received.
+
+    :return: the (number of hosts, number of resources)
+    :rtype: tuple
+    """
+    return len(self.host_dict), len(self.resource_dict)
+
 
 class Host(object):
   """
@@ -139,39 +412,126 @@ class Host(object):
   :ivar host_name: the domain name or the ip address of the host
   :ivar num_requests_successful: the number of successful requests made by this host
   :ivar num_requests unsuccessful: the number of unsuccessful requests made by this host
-  :ivar resource_dict: a dictionary of resources requested by this host
+  :ivar status_counts: a dictionary mapping the status codes to the numbers of requests made by this host, if the
+    statuses are counted by the report aggregator
+  :ivar num_bytes: the number of bytes served to this host, if the statuses are counted by the report aggregator
+  :ivar resource_dict: a dictionary of resources requested by this host, counting the successful and unsuccessful
+    requests of this host only, or None if they are not tracked
   """
 
-  def __init__(self, host_name):
+  def __init__(self, host_name, track_resources=True):
     self.host_name = host_name
     self.num_requests_successful = 0
     self.num_requests_unsuccessful = 0
-    self.resource_dict = {}
+    self.status_counts = {}
+    self.num_bytes = 0
+    self.resource_dict = {} if track_resources else None
+
+  def add_request(self, status, is_success, num_bytes=0, count=1):
+    """
+    Modify the counters of this host, without tracking the resource requested
+
+    :param status: the status code of the requests
+    :type status: str
+    :param is_success: True if the request was successful
+    :type is_success: bool
+    :param num_bytes: the number of bytes served by the requests
+    :type num_bytes: int
+    :param count: the number of requests
+    :type count: int
+    """
+    if is_success:
+      self.num_requests_successful += count
+    else:
+      self.num_requests_unsuccessful += count
+    self.status_counts[status] = self.status_counts.get(status, 0) + count
+    self.num_bytes += num_bytes
 
-  def add_resource(self, resource_name, is_success):
+  def add_resource(self, resource_name, status, is_success, num_bytes=0, count=1):
     """
     Add a resource to the list of resources requested by the host
 
     :param resource_name: the name of the resource
     :type resource_name: str
+    :param status: the status code of the requests
+    :type status: str
     :param is_success: True if the request to this resource succeeded
     :type is_success: bool
+    :param num_bytes: the number of bytes served by the requests
+    :type num_bytes: int
+    :param count: the number of requests made to this resource
+    :type count: int
     """
     if is_success:
-      self.num_requests_successful += 1
+      self.num_requests_successful += count
     else:
-      self.num_requests_unsuccessful += 1
+      self.num_requests_unsuccessful += count
+    self.status_counts[status] = self.status_counts.get(status, 0) + count
+    self.num_bytes += num_bytes
+
+    # the resources of a host only count its successful and unsuccessful requests
+    resource = self.resource_dict.get(resource_name)
+    if resource is None:
+      resource = self.resource_dict[resource_name] = Resource(resource_name, False)
+    if is_success:
+      resource.num_requests_successful += count
+    else:
+      resource.num_requests_unsuccessful += count
+
+  def merge(self, other, resource_dict=None):
+    """
+    Merges the counters of another host (with the same host name) into this one
+
+    :param other: the host to be merged into this one
+    :type other: Host
+    :param resource_dict: the resources of the report aggregator, whose names are given to the new resources of this
+      host so that they are stored only once, or None
+    :type resource_dict: dict
+    """
+    self.num_requests_successful += other.num_requests_successful
+    self.num_requests_unsuccessful += other.num_requests_unsuccessful
+    merge_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes += other.num_bytes
+    if self.resource_dict is None:
+      return
+
+    for resource_name, other_resource in other.resource_dict.items():
+      if resource_name in self.resource_dict:
+        resource = self.resource_dict[resource_name]
+      else:
+        if resource_dict is not None:
+          resource_name = resource_dict[resource_name].resource_name
+        resource = Resource(resource_name, False)
+        self.resource_dict[resource_name] = resource
+      resource.merge(other_resource)
+
+  def subtract(self, other):
+    """
+    Subtracts the counters of another host (with the same host name) from this one. Resources left without any
+    requests are removed.
 
-    if resource_name in self.resource_dict:
+    :param other: the host to be subtracted from this one
+    :type other: Host
+    """
+    self.num_requests_successful -= other.num_requests_successful
+    self.num_requests_unsuccessful -= other.num_requests_unsuccessful
+    subtract_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes -= other.num_bytes
+    if self.resource_dict is None:
+      return
+
+    for resource_name, other_resource in other.resource_dict.items():
       resource = self.resource_dict[resource_name]
-    else:
-      resource = Resource(resource_name)
-      self.resource_dict[resource_name] = resource
-    resource.add_request(is_success)
+      resource.subtract(other_resource)
+      if resource.get_num_requests() == 0:
+        del self.resource_dict[resource_name]
 
   def get_num_requests(self):
     return self.num_requests_successful + self.num_requests_unsuccessful
 
+  def get_mean_bytes(self):
+    return self.num_bytes / self.get_num_requests()
+
   def get_top_requests(self, n=5):
     """
     Get a list of the top n resources requested by this host
@@ -180,10 +540,12 @@ class Host(object):
     :type n: int
     :return: list of the top n requested resources
     :rtype: list
+    :raises ReportError: If the resources requested by this host are not tracked
     """
-    sorted_resource_list = sorted(self.resource_dict.items(),
-                                  key=lambda item: (item[1].get_num_requests(), item[1].resource_name), reverse=True)
-    return [v for k, v in sorted_resource_list[:n]]
+    if self.resource_dict is None:
+      raise ReportError('The report top_resources_per_host was not configured on the report aggregator')
+    return heapq.nlargest(n, self.resource_dict.values(),
+                          key=lambda resource: (resource.get_num_requests(), resource.resource_name))
 
 
 class Resource(object):
@@ -193,25 +555,452 @@ class Resource(object):
   :ivar resource_name: the name of the resource, generally represented by a path like /sample/resource
   :ivar num_requests_successful: the number of successful requests made on this resource
   :ivar num_requests_unsuccessful: the number of unsuccessful requests made on this resource
+  :ivar status_counts: a dictionary mapping the status codes to the numbers of requests made on this resource, if the
+    statuses are counted by the report aggregator, or None if they are not tracked (as for the resources of a host)
+  :ivar num_bytes: the number of bytes served by this resource, if the statuses are counted by the report aggregator
   """
 
-  def __init__(self, resource_name):
+  def __init__(self, resource_name, track_statuses=True):
     self.resource_name = resource_name
     self.num_requests_successful = 0
     self.num_requests_unsuccessful = 0
+    # the resources of the hosts are the most numerous ones, and only count their successful and unsuccessful requests
+    self.status_counts = {} if track_statuses else None
+    self.num_bytes = 0
 
-  def add_request(self, is_success):
+  def add_request(self, status, is_success, num_bytes=0, count=1):
     """
     Modify the counters of this resource. Increment num_requests_successful if the request was successful,
     otherwise increment num_requests_unsuccessful
 
+    :param status: the status code of the requests
+    :type status: str
     :param is_success: True if the request was successful
     :type is_success: bool
+    :param num_bytes: the number of bytes served by the requests
+    :type num_bytes: int
+    :param count: the number of requests
+    :type count: int
     """
     if is_success:
-      self.num_requests_successful += 1
+      self.num_requests_successful += count
     else:
-      self.num_requests_unsuccessful += 1
+      self.num_requests_unsuccessful += count
+    self.status_counts[status] = self.status_counts.get(status, 0) + count
+    self.num_bytes += num_bytes
 
   def get_num_requests(self):
     return self.num_requests_successful + self.num_requests_unsuccessful
+
+  def get_mean_bytes(self):
+    return self.num_bytes / self.get_num_requests()
+
+  def merge(self, other):
+    """
+    Merges the counters of another resource (with the same resource name) into this one
+
+    :param other: the resource to be merged into this one
+    :type other: Resource
+    """
+    self.num_requests_successful += other.num_requests_successful
+    self.num_requests_unsuccessful += other.num_requests_unsuccessful
+    if self.status_counts is not None:
+      merge_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes += other.num_bytes
+
+  def subtract(self, other):
+    """
+    Subtracts the counters of another resource (with the same resource name) from this one
+
+    :param other: the resource to be subtracted from this one
+    :type other: Resource
+    """
+    self.num_requests_successful -= other.num_requests_successful
+    self.num_requests_unsuccessful -= other.num_requests_unsuccessful
+    if self.status_counts is not None:
+      subtract_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes -= other.num_bytes
+
+
+def merge_status_counts(status_counts, other_status_counts):
+  """
+  Adds the numbers of requests per status code of a dictionary to another one
+  """
+  for status, count in other_status_counts.items():
+    status_counts[status] = status_counts.get(status, 0) + count
+
+
+def subtract_status_counts(status_counts, other_status_counts):
+  """
+  Subtracts the numbers of requests per status code of a dictionary from another one, removing the status codes left
+  without any requests
+  """
+  for status, count in other_status_counts.items():
+    count = status_counts[status] - count
+    if count:
+      status_counts[status] = count
+    else:
+      del status_counts[status]
+
+
+def get_fields(dimensions):
+  """
+  The fields of the logs read by the report aggregators counting the given dimensions (see DIMENSION_FIELDS), eg. to
+  check that a log format provides them
+
+  :param dimensions: the names of the dimensions counted
+  :type dimensions: collections.abc.Iterable
+  :return: the names of the fields, in the order of ReportAggregator.fields
+  :rtype: tuple
+  """
+  fields = {'status'}.union(*(DIMENSION_FIELDS[dimension] for dimension in dimensions))
+  return tuple(field for field in ReportAggregator.fields if field in fields)
+
+
+def get_report_fields(reports):
+  """
+  The fields of the logs read by the report aggregators configured with the given reports
+
+  :param reports: the names of the reports (see REPORTS)
+  :type reports: collections.abc.Iterable
+  :return: the names of the fields, in the order of ReportAggregator.fields
+  :rtype: tuple
+  """
+  return get_fields(dimension for report in reports for dimension in REPORT_DIMENSIONS[report])
+
+
+def normalize_counts(counts, request_index, normalizer):
+  """
+  Normalizes the request lines of counted logs, adding together the counts of the logs whose request lines are
+  normalized into the same resource name
+
+  :param counts: a mapping of the tuples of the fields of the logs to their numbers of occurrences
+  :type counts: collections.abc.Mapping
+  :param request_index: the position of the request line in the tuples
+  :type request_index: int
+  :param normalizer: the normalizer of the request lines into resource names
+  :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+  :return: a dictionary mapping the tuples of the fields, with the resource names in place of the request lines, to
+    their numbers of occurrences
+  :rtype: dict
+  """
+  normalize = normalizer.normalize
+  normalized_counts = {}
+  for key, count in counts.items():
+    key = key[:request_index] + (normalize(key[request_index]),) + key[request_index + 1:]
+    normalized_counts[key] = normalized_counts.get(key, 0) + count
+  return normalized_counts
+
+
+def get_counters(dimensions):
+  """
+  Chooses the functions counting a batch of logs for the given dimensions (see REPORT_DIMENSIONS), leaving the other
+  dimensions out instead of checking for them at every log. Every function takes the report aggregator, the counts of
+  the logs by the tuples of the fields it reads (see ReportAggregator.receive_counts, the request lines being
+  normalized), the numbers of requests of the batch per status code and the dictionary of the numbers of bytes of the
+  sizes of the batch, which is filled by the first function when the statuses are counted. The functions find the
+  fields they need in the tuples by the field_indices of the aggregator, and every one of them has a twin counting a
+  single log (see LOG_COUNTERS).
+
+  The numbers of requests per status code and of bytes served of the hosts and resources are counted by functions of
+  their own, so that the reports which do not need them only update the numbers of successful and unsuccessful
+  requests of every log. The resources and the resources of the hosts are counted in a single pass when both are
+  tracked, so that the hosts share the names of the resources without looking them up again.
+
+  :param dimensions: the names of the dimensions counted
+  :type dimensions: collections.abc.Set
+  :return: the functions, in the order in which they are to be called
+  :rtype: tuple
+  """
+  statuses = 'statuses' in dimensions
+  resources = 'resources' in dimensions
+  counters = []
+  if statuses:
+    counters.append(count_statuses)
+  if resources and 'host_resources' in dimensions:
+    counters.append(count_resources_and_host_resources)
+  elif resources:
+    counters.append(count_resources)
+  elif 'host_resources' in dimensions:
+    counters.append(count_host_resources)
+  if 'hosts' in dimensions and 'host_resources' not in dimensions:
+    counters.append(count_hosts)
+  if resources and statuses:
+    counters.append(count_resource_statuses)
+  if 'hosts' in dimensions and statuses:
+    counters.append(count_host_statuses)
+  if 'visitors' in dimensions:
+    counters.append(count_visitors)
+  return tuple(counters)
+
+
+def count_statuses(reporter, counts, status_counts, sizes):
+  """
+  Counts the numbers of requests per status code and the number of bytes served, filling the numbers of bytes of the
+  sizes of the batch
+  """
+  size_index = reporter.field_indices['size']
+  total_bytes = 0
+  for key, count in counts.items():
+    size = key[size_index]
+    num_bytes = sizes.get(size)
+    if num_bytes is None:
+      num_bytes = sizes[size] = get_num_bytes(size)
+    total_bytes += num_bytes * count
+  merge_status_counts(reporter.status_counts, status_counts)
+  reporter.num_bytes += total_bytes
+
+
+def count_resources(reporter, counts, status_counts, sizes):
+  """
+  Counts the numbers of successful and unsuccessful requests of every resource
+  """
+  resource_dict = reporter.resource_dict
+  success_by_status = SUCCESS_BY_STATUS
+  field_indices = reporter.field_indices
+  request_index, status_index = field_indices['request'], field_indices['status']
+  for key, count in counts.items():
+    resource_name = key[request_index]
+    resource = resource_dict.get(resource_name)
+    if resource is None:
+      resource = resource_dict[resource_name] = Resource(resource_name)
+    if success_by_status[key[status_index]]:
+      resource.num_requests_successful += count
+    else:
+      resource.num_requests_unsuccessful += count
+
+
+def count_resource_statuses(reporter, counts, status_counts, sizes):
+  """
+  Counts the numbers of requests per status code and the number of bytes served of every resource, once the resources
+  are counted by count_resources
+  """
+  resource_dict = reporter.resource_dict
+  field_indices = reporter.field_indices
+  request_index, status_index, size_index = field_indices['request'], field_indices['status'], field_indices['size']
+  for key, count in counts.items():
+    resource = resource_dict[key[request_index]]
+    status = key[status_index]
+    resource_status_counts = resource.status_counts
+    resource_status_counts[status] = resource_status_counts.get(status, 0) + count
+    resource.num_bytes += sizes[key[size_index]] * count
+
+
+def count_hosts(reporter, counts, status_counts, sizes):
+  """
+  Counts the numbers of successful and unsuccessful requests of every host, without the resources they requested
+  """
+  host_dict = reporter.host_dict
+  success_by_status = SUCCESS_BY_STATUS
+  field_indices = reporter.field_indices
+  host_index, status_index = field_indices['host'], field_indices['status']
+  for key, count in counts.items():
+    host_name = key[host_index]
+    host = host_dict.get(host_name)
+    if host is None:
+      host = host_dict[host_name] = Host(host_name, False)
+    if success_by_status[key[status_index]]:
+      host.num_requests_successful += count
+    else:
+      host.num_requests_unsuccessful += count
+
+
+def count_host_resources(reporter, counts, status_counts, sizes):
+  """
+  Counts the numbers of successful and unsuccessful requests of every host, along with the resources they requested
+  """
+  host_dict = reporter.host_dict
+  success_by_status = SUCCESS_BY_STATUS
+  field_indices = reporter.field_indices
+  host_index, request_index, status_index = field_indices['host'], field_indices['request'], field_indices['status']
+  for key, count in counts.items():
+    host_name, resource_name = key[host_index], key[request_index]
+    host = host_dict.get(host_name)
+    if host is None:
+      host = host_dict[host_name] = Host(host_name)
+    host_resource = host.resource_dict.get(resource_name)
+    if host_resource is None:
+      host_resource = host.resource_dict[resource_name] = Resource(resource_name, False)
+    if success_by_status[key[status_index]]:
+      host.num_requests_successful += count
+      host_resource.num_requests_successful += count
+    else:
+      host.num_requests_unsuccessful += count
+      host_resource.num_requests_unsuccessful += count
+
+
+def count_resources_and_host_resources(reporter, counts, status_counts, sizes):
+  """
+  Counts the numbers of successful and unsuccessful requests of every resource and of every host, along with the
+  resources they requested, in a single pass through the logs
+  """
+  resource_dict = reporter.resource_dict
+  host_dict = reporter.host_dict
+  success_by_status = SUCCESS_BY_STATUS
+  field_indices = reporter.field_indices
+  host_index, request_index, status_index = field_indices['host'], field_indices['request'], field_indices['status']
+  for key, count in counts.items():
+    host_name, resource_name = key[host_index], key[request_index]
+    resource = resource_dict.get(resource_name)
+    if resource is None:
+      resource = resource_dict[resource_name] = Resource(resource_name)
+    host = host_dict.get(host_name)
+    if host is None:
+      host = host_dict[host_name] = Host(host_name)
+    host_resource = host.resource_dict.get(resource_name)
+    if host_resource is None:
+      # the hosts share the name of the resource, so that it is stored only once
+      host_resource = host.resource_dict[resource_name] = Resource(resource.resource_name, False)
+    if success_by_status[key[status_index]]:
+      resource.num_requests_successful += count
+      host.num_requests_successful += count
+      host_resource.num_requests_successful += count
+    else:
+      resource.num_requests_unsuccessful += count
+      host.num_requests_unsuccessful += count
+      host_resource.num_requests_unsuccessful += count
+
+
+def count_host_statuses(reporter, counts, status_counts, sizes):
+  """
+  Counts the numbers of requests per status code and the number of bytes served of every host, once the hosts are
+  counted by count_hosts or count_host_resources
+  """
+  host_dict = reporter.host_dict
+  field_indices = reporter.field_indices
+  host_index, status_index, size_index = field_indices['host'], field_indices['status'], field_indices['size']
+  for key, count in counts.items():
+    host = host_dict[key[host_index]]
+    status = key[status_index]
+    host_status_counts = host.status_counts
+    host_status_counts[status] = host_status_counts.get(status, 0) + count
+    host.num_bytes += sizes[key[size_index]] * count
+
+
+def count_visitors(reporter, counts, status_counts, sizes):
+  """
+  Counts the visits of the resources by the hosts into the HyperLogLog sketches
+  """
+  field_indices = reporter.field_indices
+  host_index, request_index = field_indices['host'], field_indices['request']
+  reporter.visitors.receive_visits({(key[host_index], key[request_index]) for key in counts})
+
+
+def count_log_statuses(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the status code and the number of bytes served of a single log (see count_statuses)
+  """
+  status_counts = reporter.status_counts
+  status_counts[status] = status_counts.get(status, 0) + 1
+  reporter.num_bytes += get_num_bytes(log_dict['size'])
+
+
+def count_log_resources(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the request of a single log for its resource (see count_resources)
+  """
+  resource = reporter.resource_dict.get(resource_name)
+  if resource is None:
+    resource = reporter.resource_dict[resource_name] = Resource(resource_name)
+  if is_success:
+    resource.num_requests_successful += 1
+  else:
+    resource.num_requests_unsuccessful += 1
+
+
+def count_log_resource_statuses(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the status code and the number of bytes served of a single log for its resource (see
+  count_resource_statuses)
+  """
+  resource = reporter.resource_dict[resource_name]
+  resource.status_counts[status] = resource.status_counts.get(status, 0) + 1
+  resource.num_bytes += get_num_bytes(log_dict['size'])
+
+
+def count_log_hosts(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the request of a single log for its host (see count_hosts)
+  """
+  host_name = log_dict['host']
+  host = reporter.host_dict.get(host_name)
+  if host is None:
+    host = reporter.host_dict[host_name] = Host(host_name, False)
+  if is_success:
+    host.num_requests_successful += 1
+  else:
+    host.num_requests_unsuccessful += 1
+
+
+def count_log_host_resources(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the request of a single log for its host, along with the resource requested (see count_host_resources)
+  """
+  host_name = log_dict['host']
+  host = reporter.host_dict.get(host_name)
+  if host is None:
+    host = reporter.host_dict[host_name] = Host(host_name)
+  host_resource = host.resource_dict.get(resource_name)
+  if host_resource is None:
+    host_resource = host.resource_dict[resource_name] = Resource(resource_name, False)
+  if is_success:
+    host.num_requests_successful += 1
+    host_resource.num_requests_successful += 1
+  else:
+    host.num_requests_unsuccessful += 1
+    host_resource.num_requests_unsuccessful += 1
+
+
+def count_log_resources_and_host_resources(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the request of a single log for its resource and for its host, along with the resource requested (see
+  count_resources_and_host_resources)
+  """
+  resource = reporter.resource_dict.get(resource_name)
+  if resource is None:
+    resource = reporter.resource_dict[resource_name] = Resource(resource_name)
+  host_name = log_dict['host']
+  host = reporter.host_dict.get(host_name)
+  if host is None:
+    host = reporter.host_dict[host_name] = Host(host_name)
+  host_resource = host.resource_dict.get(resource_name)
+  if host_resource is None:
+    host_resource = host.resource_dict[resource_name] = Resource(resource.resource_name, False)
+  if is_success:
+    resource.num_requests_successful += 1
+    host.num_requests_successful += 1
+    host_resource.num_requests_successful += 1
+  else:
+    resource.num_requests_unsuccessful += 1
+    host.num_requests_unsuccessful += 1
+    host_resource.num_requests_unsuccessful += 1
+
+
+def count_log_host_statuses(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the status code and the number of bytes served of a single log for its host (see count_host_statuses)
+  """
+  host = reporter.host_dict[log_dict['host']]
+  host.status_counts[status] = host.status_counts.get(status, 0) + 1
+  host.num_bytes += get_num_bytes(log_dict['size'])
+
+
+def count_log_visitors(reporter, log_dict, resource_name, status, is_success):
+  """
+  Counts the visit of the resource of a single log by its host into the HyperLogLog sketches (see count_visitors)
+  """
+  reporter.visitors.receive_visits(((log_dict['host'], resource_name),))
+
+
+# The functions counting a single log (see ReportAggregator.receive_log) for each of the functions counting a batch of
+# logs chosen by get_counters, which they mirror
+LOG_COUNTERS = {
+  count_statuses: count_log_statuses,
+  count_resources: count_log_resources,
+  count_resource_statuses: count_log_resource_statuses,
+  count_hosts: count_log_hosts,
+  count_host_resources: count_log_host_resources,
+  count_resources_and_host_resources: count_log_resources_and_host_resources,
+  count_host_statuses: count_log_host_statuses,
+  count_visitors: count_log_visitors,
+}
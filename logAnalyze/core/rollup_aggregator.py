@@ -0,0 +1,407 @@
+import heapq
+from array import array
+from collections import Counter, namedtuple
+from itertools import compress, repeat
+from operator import and_, floordiv
+
+from logAnalyze.core.report_aggregator import ReportAggregator, Host, Resource
+from logAnalyze.utils.constants import STATUS_STRINGS, SUCCESS_BY_CODE, SUCCESS_BY_STATUS
+from logAnalyze.utils.custom_exceptions import StatusError
+from logAnalyze.utils.parse_utils import get_num_bytes
+
+# For every status code from 0 to 999: True if it is unsuccessful, False if it is successful and None if it is not a
+# valid http status
+UNSUCCESSFUL_STATUS = [None if is_success is None else not is_success for is_success in SUCCESS_BY_CODE]
+
+# The requests received within a time interval
+Interval = namedtuple('Interval', ['start', 'num_requests', 'num_requests_unsuccessful'])
+
+
+class RollupAggregator:
+  """
+  A report aggregator which keeps the time of every request, so that the requests can be rolled up into time
+  intervals (eg. requests and failures per minute) and the top hosts and resources can be reported for any time range.
+
+  The logs are stored as columns: the epoch seconds, the status code, the number of bytes served and the ids of the
+  host and the resource, each in a contiguous array which is filled in batches. The reports are computed by grouping
+  the columns with iterators running in C (Counter, map, compress), without a python loop per log.
+
+  :ivar since: the epoch second from which the logs are kept, or None
+  :ivar until: the epoch second before which the logs are kept, or None
+  :ivar host_names: the list of host names, indexed by their ids
+  :ivar resource_names: the list of resource names, indexed by their ids
+  :ivar epochs: the column of the epoch seconds of the requests
+  :ivar statuses: the column of the status codes of the requests
+  :ivar sizes: the column of the numbers of bytes served by the requests
+  :ivar host_column: the column of the host ids of the requests
+  :ivar resource_column: the column of the resource ids of the requests
+  :ivar normalizer: the normalizer of the request lines into resource names, or None to report the request lines
+  """
+
+  # The fields of the parsed log dict which are read by receive_log
+  fields = ReportAggregator.fields + ('time',)
+
+  # The number of logs collected before they are appended to the columns
+  BATCH_SIZE = 65536
+
+  def __init__(self, since=None, until=None, normalizer=None):
+    """
+    :param since: the epoch second from which the logs are to be kept (inclusive), or None to keep all the older logs
+    :type since: int
+    :param until: the epoch second before which the logs are to be kept (exclusive), or None to keep all the newer logs
+    :type until: int
+    :param normalizer: the normalizer of the request lines into resource names (eg. their paths), or None
+    :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+    """
+    self.normalizer = normalizer
+    self.since = since
+    self.until = until
+    self.host_ids = {}
+    self.host_names = []
+    self.resource_ids = {}
+    self.resource_names = []
+    self.epochs = array('q')
+    self.statuses = array('H')
+    self.sizes = array('q')
+    self.host_column = array('I')
+    self.resource_column = array('I')
+    self._batch = ([], [], [], [], [])
+
+  def receive_log(self, log_dict):
+    """
+    This method is to be used to add a log to the report aggregator.
+
+    :param log_dict: The dictionary object which has been parsed from the log string
+    :type log_dict: dict
+    :raises StatusError: If the status of the log is not of the form xxx (where x is a decimal) or not a valid http
+      status code
+    """
+    self._add(log_dict['host'], log_dict['request'], log_dict['status'], log_dict['size'], log_dict['time'])
+
+  def receive_logs(self, records):
+    """
+    This method is to be used to add a batch of logs to the report aggregator.
+
+    :param records: the tuples of the fields (see fields) of the logs, eg. as returned by parse_utils.parse_many
+    :type records: collections.abc.Iterable
+    :raises StatusError: If any of the statuses is not of the form xxx (where x is a decimal) or not a valid http
+      status code
+    """
+    for host_name, resource_name, status, size, time in records:
+      self._add(host_name, resource_name, status, size, time)
+
+  def _add(self, host_name, resource_name, status, size, time):
+    epoch = int(time.timestamp())
+    if self.since is not None and epoch < self.since or self.until is not None and epoch >= self.until:
+      return
+
+    if SUCCESS_BY_STATUS.get(status) is None:
+      raise StatusError('Unidentifiable http status code: %s' % status)
+
+    epochs, statuses, sizes, hosts, resources = self._batch
+    epochs.append(epoch)
+    statuses.append(int(status))
+    sizes.append(get_num_bytes(size))
+    if self.normalizer is not None:
+      resource_name = self.normalizer.normalize(resource_name)
+    hosts.append(self._get_id(self.host_ids, self.host_names, host_name))
+    resources.append(self._get_id(self.resource_ids, self.resource_names, resource_name))
+    if len(epochs) >= self.BATCH_SIZE:
+      self.flush()
+
+  @staticmethod
+  def _get_id(ids, names, name):
+    name_id = ids.get(name)
+    if name_id is None:
+      name_id = ids[name] = len(names)
+      names.append(name)
+    return name_id
+
+  def flush(self):
+    """
+    Appends the logs collected in the current batch to the columns
+    """
+    for column, values in zip((self.epochs, self.statuses, self.sizes, self.host_column, self.resource_column),
+                              self._batch):
+      column.extend(values)
+      values.clear()
+
+  def merge(self, other):
+    """
+    Merges the logs of another rollup aggregator into this one
+
+    :param other: the report aggregator to be merged into this one
+    :type other: RollupAggregator
+    """
+    self.flush()
+    other.flush()
+    host_map = [self._get_id(self.host_ids, self.host_names, name) for name in other.host_names]
+    resource_map = [self._get_id(self.resource_ids, self.resource_names, name) for name in other.resource_names]
+    self.epochs.extend(other.epochs)
+    self.statuses.extend(other.statuses)
+    self.sizes.extend(other.sizes)
+    self.host_column.extend(map(host_map.__getitem__, other.host_column))
+    self.resource_column.extend(map(resource_map.__getitem__, other.resource_column))
+
+  def receive_columns(self, host_names, resource_names, hosts, resources, statuses, sizes, epochs):
+    """
+    This method is to be used to add logs given as columns (eg. read from a parse cache), the hosts and the resources
+    being given by their indices into lists of names.
+
+    :param host_names: the list of host names
+    :type host_names: list
+    :param resource_names: the list of resource names
+    :type resource_names: list
+    :param hosts: the indices of the host names of the logs
+    :type hosts: collections.abc.Sequence
+    :param resources: the indices of the resource names of the logs
+    :type resources: collections.abc.Sequence
+    :param statuses: the status codes of the logs
+    :type statuses: collections.abc.Sequence
+    :param sizes: the numbers of bytes served by the logs
+    :type sizes: collections.abc.Sequence
+    :param epochs: the epoch seconds of the logs
+    :type epochs: collections.abc.Sequence
+    :raises StatusError: If any of the status codes is not a valid http status code
+    """
+    for code in set(statuses):
+      if code >= len(UNSUCCESSFUL_STATUS) or UNSUCCESSFUL_STATUS[code] is None:
+        raise StatusError('Unidentifiable http status code: %03d' % code)
+
+    self.flush()
+    if self.normalizer is not None:
+      resource_names = list(map(self.normalizer.normalize, resource_names))
+    host_map = [self._get_id(self.host_ids, self.host_names, name) for name in host_names]
+    resource_map = [self._get_id(self.resource_ids, self.resource_names, name) for name in resource_names]
+    mask = self._get_time_mask(epochs, self.since, self.until)
+    self.epochs.extend(self._select(epochs, mask))
+    self.statuses.extend(self._select(statuses, mask))
+    self.sizes.extend(self._select(sizes, mask))
+    self.host_column.extend(map(host_map.__getitem__, self._select(hosts, mask)))
+    self.resource_column.extend(map(resource_map.__getitem__, self._select(resources, mask)))
+
+  def _get_mask(self, since, until):
+    """
+    The list of flags selecting the logs within a time range, or None to select all the logs
+    """
+    self.flush()
+    return self._get_time_mask(self.epochs, since, until)
+
+  @staticmethod
+  def _get_time_mask(epochs, since, until):
+    if since is None and until is None:
+      return None
+    if until is None:
+      return list(map(int(since).__le__, epochs))
+    if since is None:
+      return list(map(int(until).__gt__, epochs))
+    return list(map(and_, map(int(since).__le__, epochs), map(int(until).__gt__, epochs)))
+
+  @staticmethod
+  def _select(column, mask):
+    return iter(column) if mask is None else compress(column, mask)
+
+  def _get_unsuccessful(self, mask):
+    return map(UNSUCCESSFUL_STATUS.__getitem__, self._select(self.statuses, mask))
+
+  def get_intervals(self, interval, since=None, until=None):
+    """
+    Rolls up the requests into time intervals of a fixed length
+
+    :param interval: the length of an interval in seconds
+    :type interval: int
+    :param since: the epoch second from which the requests are to be counted, or None
+    :type since: int
+    :param until: the epoch second before which the requests are to be counted, or None
+    :type until: int
+    :return: the list of Interval tuples of the intervals having any requests, in chronological order
+    :rtype: list
+    """
+    interval = int(interval)
+    mask = self._get_mask(since, until)
+    num_requests = Counter(map(floordiv, self._select(self.epochs, mask), repeat(interval)))
+    num_requests_unsuccessful = Counter(map(floordiv, compress(self._select(self.epochs, mask),
+                                                               self._get_unsuccessful(mask)), repeat(interval)))
+    return [Interval(bucket * interval, num_requests[bucket], num_requests_unsuccessful[bucket])
+            for bucket in sorted(num_requests)]
+
+  def get_top_hosts(self, n=10, since=None, until=None):
+    """
+    Get a list of the top n hosts making the most requests within a time range. The resource dicts of the hosts are
+    filled in as well.
+
+    :param n: the number of hosts to return
+    :type n: int
+    :param since: the epoch second from which the requests are to be counted, or None
+    :type since: int
+    :param until: the epoch second before which the requests are to be counted, or None
+    :type until: int
+    :return: the list of top n hosts making the most requests
+    :rtype: list
+    """
+    mask = self._get_mask(since, until)
+    totals, unsuccessful = self._count(self.host_column, mask)
+    names = self.host_names
+    top_ids = heapq.nlargest(n, totals, key=lambda i: (totals[i], names[i]))
+
+    hosts = {}
+    for host_id in top_ids:
+      host = hosts[host_id] = Host(names[host_id])
+      host.num_requests_unsuccessful = unsuccessful[host_id]
+      host.num_requests_successful = totals[host_id] - host.num_requests_unsuccessful
+    self._fill_counters(hosts, self.host_column, mask)
+
+    # count the requests of the top hosts per resource
+    is_top_host = list(map(hosts.__contains__, self._select(self.host_column, mask)))
+    pairs = Counter(compress(zip(self._select(self.host_column, mask), self._select(self.resource_column, mask),
+                                 self._get_unsuccessful(mask)), is_top_host))
+    for (host_id, resource_id, is_unsuccessful), count in pairs.items():
+      resource_dict = hosts[host_id].resource_dict
+      resource_name = self.resource_names[resource_id]
+      resource = resource_dict.get(resource_name)
+      if resource is None:
+        resource = resource_dict[resource_name] = Resource(resource_name)
+      if is_unsuccessful:
+        resource.num_requests_unsuccessful += count
+      else:
+        resource.num_requests_successful += count
+    return [hosts[host_id] for host_id in top_ids]
+
+  def get_top_requests(self, n=10, since=None, until=None):
+    """
+    Get a list of the top n requested resources within a time range
+
+    :param n: the number of resources to return
+    :type n: int
+    :param since: the epoch second from which the requests are to be counted, or None
+    :type since: int
+    :param until: the epoch second before which the requests are to be counted, or None
+    :type until: int
+    :return: the list of top n requested resources
+    :rtype: list
+    """
+    mask = self._get_mask(since, until)
+    totals, unsuccessful = self._count(self.resource_column, mask)
+    names = self.resource_names
+    top_ids = heapq.nlargest(n, totals, key=lambda i: (totals[i], names[i]))
+    return self._get_resources(top_ids, totals, unsuccessful, mask)
+
+  def get_top_unsuccessful_requests(self, n=10, since=None, until=None):
+    """
+    Get a list of the top n unsuccessfully requested resources within a time range
+
+    :param n: the number of resources to return
+    :type n: int
+    :param since: the epoch second from which the requests are to be counted, or None
+    :type since: int
+    :param until: the epoch second before which the requests are to be counted, or None
+    :type until: int
+    :return: The list of top n unsuccessfully requested resources
+    :rtype: list
+    """
+    mask = self._get_mask(since, until)
+    totals, unsuccessful = self._count(self.resource_column, mask)
+    names = self.resource_names
+    top_ids = heapq.nlargest(n, totals, key=lambda i: (unsuccessful[i], names[i]))
+    return self._get_resources(top_ids, totals, unsuccessful, mask)
+
+  def get_top_requests_by_bytes(self, n=10, since=None, until=None):
+    """
+    Get a list of the top n resources by number of bytes served within a time range
+
+    :param n: the number of resources to return
+    :type n: int
+    :param since: the epoch second from which the requests are to be counted, or None
+    :type since: int
+    :param until: the epoch second before which the requests are to be counted, or None
+    :type until: int
+    :return: the list of top n resources by number of bytes served
+    :rtype: list
+    """
+    mask = self._get_mask(since, until)
+    resource_bytes = Counter()
+    # the sizes are summed per distinct (resource, size), as most resources are always served with the same size
+    for (resource_id, size), count in Counter(zip(self._select(self.resource_column, mask),
+                                                  self._select(self.sizes, mask))).items():
+      resource_bytes[resource_id] += size * count
+    names = self.resource_names
+    top_ids = heapq.nlargest(n, resource_bytes, key=lambda i: (resource_bytes[i], names[i]))
+    totals, unsuccessful = self._count(self.resource_column, mask)
+    return self._get_resources(top_ids, totals, unsuccessful, mask)
+
+  def _count(self, column, mask):
+    """
+    Counts the total and the unsuccessful requests per id of a column
+    """
+    totals = Counter(self._select(column, mask))
+    unsuccessful = Counter(compress(self._select(column, mask), self._get_unsuccessful(mask)))
+    return totals, unsuccessful
+
+  def _get_resources(self, resource_ids, totals, unsuccessful, mask):
+    resources = {}
+    for resource_id in resource_ids:
+      resource = resources[resource_id] = Resource(self.resource_names[resource_id])
+      resource.num_requests_unsuccessful = unsuccessful[resource_id]
+      resource.num_requests_successful = totals[resource_id] - resource.num_requests_unsuccessful
+    self._fill_counters(resources, self.resource_column, mask)
+    return [resources[resource_id] for resource_id in resource_ids]
+
+  def _fill_counters(self, items, column, mask):
+    """
+    Fills in the numbers of bytes served and of requests per status code of the hosts or resources of a dictionary
+    keyed by their ids, counting the distinct (id, status code, size) of the requests
+    """
+    triples = Counter(zip(self._select(column, mask), self._select(self.statuses, mask),
+                          self._select(self.sizes, mask)))
+    for (item_id, code, size), count in triples.items():
+      item = items.get(item_id)
+      if item is not None:
+        item.num_bytes += size * count
+        status = STATUS_STRINGS[code]
+        item.status_counts[status] = item.status_counts.get(status, 0) + count
+
+  def get_status_counts(self, since=None, until=None):
+    """
+    Number of requests per status code within a time range, in the order of the status codes
+
+    :rtype: dict
+    """
+    counts = Counter(self._select(self.statuses, self._get_mask(since, until)))
+    return {STATUS_STRINGS[code]: counts[code] for code in sorted(counts)}
+
+  def get_mean_bytes(self, since=None, until=None):
+    """
+    Mean number of bytes served per request within a time range.
+
+    :rtype: float
+    """
+    mask = self._get_mask(since, until)
+    num_requests = len(self.statuses) if mask is None else sum(mask)
+    return sum(self._select(self.sizes, mask)) / num_requests
+
+  def get_success_pct(self, since=None, until=None):
+    """
+    Percentage of successful requests received within a time range.
+
+    :rtype: float
+    """
+    mask = self._get_mask(since, until)
+    num_requests = len(self.statuses) if mask is None else sum(mask)
+    return (num_requests - sum(self._get_unsuccessful(mask))) / num_requests * 100
+
+  def get_failed_pct(self, since=None, until=None):
+    """
+    Percentage of unsuccessful requests received within a time range.
+
+    :rtype: float
+    """
+    return 100 - self.get_success_pct(since, until)
+
+  def get_cardinality(self):
+    """
+    Number of distinct hosts and resources received.
+
+    :return: the (number of hosts, number of resources)
+    :rtype: tuple
+    """
+    return len(self.host_names), len(self.resource_names)
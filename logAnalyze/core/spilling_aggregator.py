@@ -0,0 +1,543 @@
+"""
+This file contains a report aggregator giving exact reports of logs with more distinct hosts and resources than fit in
+memory, by spilling its counters to temporary files sorted by key and merging them back when the reports are generated
+"""
+import heapq
+import marshal
+import os
+import struct
+import tempfile
+import weakref
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from logAnalyze.core.report_aggregator import ReportAggregator, Host, Resource, merge_status_counts
+from logAnalyze.utils.constants import SUCCESS_BY_STATUS
+from logAnalyze.utils.custom_exceptions import StatusError
+from logAnalyze.utils.parse_utils import get_num_bytes
+
+# The number of bits used by the number of requests in the packed (number of bytes, number of requests) counters, the
+# number of bytes taking the bits above them
+COUNT_SHIFT = 40
+COUNT_MASK = (1 << COUNT_SHIFT) - 1
+
+# Estimates of the memory used by a counter of the buffers, besides the characters of the names in its key: the dict
+# entry, the key tuple, the packed counter, the strings of the key and the entry of the list sorting the keys to spill
+HOST_ENTRY_SIZE = 320
+RESOURCE_ENTRY_SIZE = 240
+
+# The number of records written at once to a run file, which is also the number of records held in memory per run
+# while the runs are merged
+BLOCK_SIZE = 1024
+
+# The number of runs of a kind past which they are merged into a single run, which bounds the number of files opened
+# at once and the memory used by the merge
+MERGE_FAN_IN = 64
+
+# The length of the marshalled blocks of the run files
+_block_header = struct.Struct('<I')
+
+
+class SpillingReportAggregator:
+  """
+  A report aggregator providing the same exact reports as :class:`ReportAggregator` (including the top resources per
+  host) within a memory budget, for logs with more distinct (host, resource) pairs than fit in memory.
+
+  The logs are counted in two buffers: one keyed by (host, resource, status) for the reports of the hosts, and one
+  keyed by (resource, status) for the reports of the resources. Whenever the estimated size of the buffers exceeds
+  the memory budget, they are sorted by key and written to temporary run files, and emptied. The reports are generated
+  by a streaming k-way merge of the runs, which adds up the counters of the same key across the runs, so the memory
+  they use only depends on the number of entries reported and on the number of runs. The runs of a kind are merged
+  into a single one whenever there are MERGE_FAN_IN of them, and all of them before the first report is generated, so
+  that the following reports only read one run of each kind. As long as the buffers were never spilled, the reports
+  are generated from the buffers without writing any file.
+
+  The run files are removed when the aggregator is closed or garbage collected. Pickling the aggregator (eg. to send
+  it back from a worker process) hands its run files over to the unpickled aggregator, and merging an aggregator into
+  another one hands its run files over to the other one.
+
+  :ivar num_requests_successful: number of successful requests received
+  :ivar num_requests_unsuccessful: number of unsuccessful requests received
+  :ivar status_counts: a dictionary mapping the status codes to their numbers of requests
+  :ivar num_bytes: the number of bytes served
+  :ivar memory_budget: the number of bytes which the buffers are estimated to use at most
+  :ivar temp_dir: the directory of the run files, or None for the default temporary directory
+  :ivar resources_per_host: the number of resources kept by the hosts of get_top_hosts, or None to keep all of them
+  :ivar num_spills: the number of times the buffers were spilled to run files
+  :ivar normalizer: the normalizer of the request lines into resource names, or None to report the request lines
+  """
+
+  # The fields of the parsed log dict which are read by receive_log
+  fields = ReportAggregator.fields
+
+  def __init__(self, memory_budget=256 * 2 ** 20, normalizer=None, temp_dir=None, resources_per_host=None):
+    """
+    :param memory_budget: the number of bytes to be used by the buffers of the counters
+    :type memory_budget: int
+    :param normalizer: the normalizer of the request lines into resource names (eg. their paths), or None
+    :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+    :param temp_dir: the directory in which the run files are written, or None for the default temporary directory
+    :type temp_dir: str
+    :param resources_per_host: the number of top resources kept by each host returned by get_top_hosts (the memory
+      used by the report being proportional to it), or None to keep all the resources of the hosts
+    :type resources_per_host: int
+    """
+    self.normalizer = normalizer
+    self.memory_budget = memory_budget
+    self.temp_dir = temp_dir
+    self.resources_per_host = resources_per_host
+    self.num_requests_successful = 0
+    self.num_requests_unsuccessful = 0
+    self.status_counts = {}
+    self.num_bytes = 0
+    self.num_spills = 0
+    self._hosts = {}
+    self._resources = {}
+    self._buffer_size = 0
+    # the sorted keys of the buffers which were never spilled, kept from a report to the next until a log is received
+    self._sorted_keys = {}
+    self._runs = {'hosts': [], 'resources': []}
+    self._finalizer = weakref.finalize(self, remove_runs, self._runs)
+
+  def __getstate__(self):
+    # the unpickled aggregator takes over the run files
+    state = self.__dict__.copy()
+    del state['_finalizer']
+    state['_runs'] = {kind: list(runs) for kind, runs in self._runs.items()}
+    for runs in self._runs.values():
+      runs.clear()
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._finalizer = weakref.finalize(self, remove_runs, self._runs)
+
+  def close(self):
+    """
+    Removes the run files of the aggregator, after which its reports are no longer available
+    """
+    self._finalizer()
+
+  def receive_log(self, log_dict):
+    """
+    This method is to be used to add a log to the report aggregator.
+
+    :param log_dict: The dictionary object which has been parsed from the log string
+    :type log_dict: dict
+    :raises StatusError: If the status is not of the form xxx (where x is a decimal)
+    """
+    self.receive_counts({tuple(log_dict[field] for field in self.fields): 1})
+
+  def receive_logs(self, records):
+    """
+    This method is to be used to add a batch of logs to the report aggregator. The identical records are counted
+    together first, so the counters are only updated once per distinct (host, request, status, size) of the batch.
+
+    :param records: the tuples of the fields (see fields) of the logs, eg. as returned by parse_utils.parse_many
+    :type records: collections.abc.Iterable
+    :raises StatusError: If any of the statuses is not of the form xxx (where x is a decimal)
+    """
+    self.receive_counts(Counter(records))
+
+  def receive_counts(self, counts):
+    """
+    This method is to be used to add the logs counted by their fields to the report aggregator. The buffers are
+    spilled as soon as they exceed the memory budget.
+
+    :param counts: a mapping of the tuples of the fields (see fields) of the logs to their numbers of occurrences
+    :type counts: collections.abc.Mapping
+    :raises StatusError: If any of the statuses is not of the form xxx (where x is a decimal)
+    """
+    self._sorted_keys.clear()
+    hosts = self._hosts
+    resources = self._resources
+    status_counts = self.status_counts
+    sizes = {}
+    normalize = None if self.normalizer is None else self.normalizer.normalize
+    for (host_name, resource_name, status, size), count in counts.items():
+      if normalize is not None:
+        resource_name = normalize(resource_name)
+      is_success = SUCCESS_BY_STATUS.get(status)
+      if is_success is None:
+        raise StatusError('Unidentifiable http status code: %s' % status)
+      if is_success:
+        self.num_requests_successful += count
+      else:
+        self.num_requests_unsuccessful += count
+      status_counts[status] = status_counts.get(status, 0) + count
+      num_bytes = sizes.get(size)
+      if num_bytes is None:
+        num_bytes = sizes[size] = get_num_bytes(size)
+      num_bytes *= count
+      self.num_bytes += num_bytes
+      counter = num_bytes << COUNT_SHIFT | count
+
+      key = (host_name, resource_name, status)
+      previous = hosts.get(key)
+      # the buffers only grow with their new keys, after which they are spilled if they exceed the budget
+      if previous is None:
+        hosts[key] = counter
+        self._buffer_size += HOST_ENTRY_SIZE + len(host_name) + len(resource_name)
+        if self._buffer_size > self.memory_budget:
+          self.spill()
+      else:
+        hosts[key] = previous + counter
+      key = (resource_name, status)
+      previous = resources.get(key)
+      if previous is None:
+        resources[key] = counter
+        self._buffer_size += RESOURCE_ENTRY_SIZE + len(resource_name)
+        if self._buffer_size > self.memory_budget:
+          self.spill()
+      else:
+        resources[key] = previous + counter
+
+  def spill(self):
+    """
+    Writes the buffers to new run files sorted by key, and empties them
+    """
+    self._sorted_keys.clear()
+    for kind, buffer in (('hosts', self._hosts), ('resources', self._resources)):
+      if buffer:
+        runs = self._runs[kind]
+        runs.append(self._write_run(get_buffer_records(buffer)))
+        buffer.clear()
+        if len(runs) >= MERGE_FAN_IN:
+          self._merge_runs(kind)
+    self._buffer_size = 0
+    self.num_spills += 1
+
+  def _write_run(self, records):
+    """
+    Writes records sorted by key to a new run file, in blocks of marshalled lists of records
+
+    :return: the path of the run file
+    :rtype: str
+    """
+    file_descriptor, path = tempfile.mkstemp(suffix='.run', prefix='logAnalyze-', dir=self.temp_dir)
+    try:
+      with open(file_descriptor, 'wb') as run_file:
+        block = []
+        for record in records:
+          block.append(record)
+          if len(block) == BLOCK_SIZE:
+            write_block(run_file, block)
+            block = []
+        if block:
+          write_block(run_file, block)
+    except BaseException:
+      os.remove(path)
+      raise
+    return path
+
+  def _merge_runs(self, kind):
+    """
+    Merges all the runs of a kind into a single one
+    """
+    runs = self._runs[kind]
+    path = self._write_run(merge_records([read_run(run) for run in runs]))
+    for run in runs:
+      os.remove(run)
+    runs[:] = [path]
+
+  def _get_records(self, kind):
+    """
+    Iterates over the records of a kind sorted by key, the counters of the same key being added up
+    """
+    buffer = self._hosts if kind == 'hosts' else self._resources
+    if not self._runs[kind]:
+      keys = self._sorted_keys.get(kind)
+      if keys is None:
+        keys = self._sorted_keys[kind] = sorted(buffer)
+      return get_buffer_records(buffer, keys)
+    if buffer:
+      self.spill()
+    if len(self._runs[kind]) > 1:
+      self._merge_runs(kind)
+    return read_run(self._runs[kind][0])
+
+  def merge(self, other):
+    """
+    Merges the counters of another spilling report aggregator into this one, as if all the logs received by the other
+    aggregator had been received by this one. The run files of the other aggregator are handed over to this one, so
+    the other aggregator is left without them.
+
+    :param other: the report aggregator to be merged into this one
+    :type other: SpillingReportAggregator
+    """
+    self.num_requests_successful += other.num_requests_successful
+    self.num_requests_unsuccessful += other.num_requests_unsuccessful
+    merge_status_counts(self.status_counts, other.status_counts)
+    self.num_bytes += other.num_bytes
+    self.num_spills += other.num_spills
+    self._sorted_keys.clear()
+    for kind, runs in other._runs.items():
+      self._runs[kind].extend(runs)
+      runs.clear()
+    for kind, runs in self._runs.items():
+      if len(runs) >= MERGE_FAN_IN:
+        self._merge_runs(kind)
+
+    hosts = self._hosts
+    for key, counter in other._hosts.items():
+      previous = hosts.get(key)
+      if previous is None:
+        hosts[key] = counter
+        self._buffer_size += HOST_ENTRY_SIZE + len(key[0]) + len(key[1])
+      else:
+        hosts[key] = previous + counter
+    resources = self._resources
+    for key, counter in other._resources.items():
+      previous = resources.get(key)
+      if previous is None:
+        resources[key] = counter
+        self._buffer_size += RESOURCE_ENTRY_SIZE + len(key[0])
+      else:
+        resources[key] = previous + counter
+    if self._buffer_size > self.memory_budget:
+      self.spill()
+
+  def _iter_hosts(self):
+    """
+    Iterates over the hosts with all their counters, their resources being limited to the top resources_per_host
+    """
+    resources_per_host = self.resources_per_host
+    for host_name, host_records in groupby(self._get_records('hosts'), itemgetter(0)):
+      host = Host(host_name)
+      if resources_per_host == 0:
+        count_records(host, host_records)
+        yield host
+        continue
+      # the tuples of the resources are ordered as the top resources of a host
+      host_resources = iter_host_resources(host, host_records)
+      if resources_per_host is not None:
+        host_resources = heapq.nlargest(resources_per_host, host_resources)
+      for _, resource_name, num_requests_successful, num_requests_unsuccessful in host_resources:
+        resource = host.resource_dict[resource_name] = Resource(resource_name)
+        resource.num_requests_successful = num_requests_successful
+        resource.num_requests_unsuccessful = num_requests_unsuccessful
+      yield host
+
+  def _iter_resources(self):
+    """
+    Iterates over the resources with all their counters
+    """
+    for resource_name, records in groupby(self._get_records('resources'), itemgetter(0)):
+      resource = Resource(resource_name)
+      count_records(resource, records)
+      yield resource
+
+  def get_top_hosts(self, n=10):
+    """
+    Get a list of the top n hosts making the most requests
+
+    :param n: the number of hosts to return
+    :type n: int
+    :return: the list of top n hosts making the most requests
+    :rtype: list
+    """
+    return heapq.nlargest(n, self._iter_hosts(), key=lambda host: (host.get_num_requests(), host.host_name))
+
+  def get_top_unsuccessful_requests(self, n=10):
+    """
+    Get a list of the top n unsuccessfully requested resources
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: The list of top n unsuccessfully requested resources
+    :rtype: list
+    """
+    return heapq.nlargest(n, self._iter_resources(),
+                          key=lambda resource: (resource.num_requests_unsuccessful, resource.resource_name))
+
+  def get_top_requests(self, n=10):
+    """
+    Get a list of the top n requested resources
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of top n requested resources
+    :rtype: list
+    """
+    return heapq.nlargest(n, self._iter_resources(),
+                          key=lambda resource: (resource.get_num_requests(), resource.resource_name))
+
+  def get_top_requests_by_bytes(self, n=10):
+    """
+    Get a list of the top n resources by number of bytes served
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of top n resources by number of bytes served
+    :rtype: list
+    """
+    return heapq.nlargest(n, self._iter_resources(), key=lambda resource: (resource.num_bytes,
+                                                                           resource.resource_name))
+
+  def get_status_counts(self):
+    """
+    Number of requests per status code, in the order of the status codes
+
+    :rtype: dict
+    """
+    return dict(sorted(self.status_counts.items()))
+
+  def get_mean_bytes(self):
+    """
+    Mean number of bytes served per request.
+
+    :rtype: float
+    """
+    return self.num_bytes / (self.num_requests_successful + self.num_requests_unsuccessful)
+
+  def get_success_pct(self):
+    """
+    Percentage of successful requests received.
+
+    :rtype: float
+    """
+    return self.num_requests_successful / (self.num_requests_successful + self.num_requests_unsuccessful) * 100
+
+  def get_failed_pct(self):
+    """
+    Percentage of unsuccessful requests received.
+
+    :rtype: float
+    """
+    return 100 - self.get_success_pct()
+
+  def get_cardinality(self):
+    """
+    Number of distinct hosts and resources received, counted by merging the runs.
+
+    :return: the (number of hosts, number of resources)
+    :rtype: tuple
+    """
+    return (sum(1 for _ in groupby(self._get_records('hosts'), itemgetter(0))),
+            sum(1 for _ in groupby(self._get_records('resources'), itemgetter(0))))
+
+
+def count_records(item, records):
+  """
+  Adds the counters of the records of a host or resource to it, the status code of a record being before its counter
+  """
+  num_requests_successful = num_requests_unsuccessful = num_bytes = 0
+  status_counts = item.status_counts
+  for record in records:
+    status = record[-2]
+    counter = record[-1]
+    count = counter & COUNT_MASK
+    if SUCCESS_BY_STATUS[status]:
+      num_requests_successful += count
+    else:
+      num_requests_unsuccessful += count
+    status_counts[status] = status_counts.get(status, 0) + count
+    num_bytes += counter >> COUNT_SHIFT
+  item.num_requests_successful += num_requests_successful
+  item.num_requests_unsuccessful += num_requests_unsuccessful
+  item.num_bytes += num_bytes
+
+
+def iter_host_resources(host, host_records):
+  """
+  Iterates over the (number of requests, resource name, number of successful requests, number of unsuccessful
+  requests) of the resources requested by a host, counting their requests into the host as well once exhausted. The
+  resources of a host only count its successful and unsuccessful requests.
+  """
+  status_counts = host.status_counts
+  host_successful = host_unsuccessful = num_bytes = 0
+  resource_name = None
+  num_requests_successful = num_requests_unsuccessful = 0
+  for _, name, status, counter in host_records:
+    if name != resource_name:
+      if resource_name is not None:
+        yield (num_requests_successful + num_requests_unsuccessful, resource_name, num_requests_successful,
+               num_requests_unsuccessful)
+        host_successful += num_requests_successful
+        host_unsuccessful += num_requests_unsuccessful
+      resource_name = name
+      num_requests_successful = num_requests_unsuccessful = 0
+    count = counter & COUNT_MASK
+    if SUCCESS_BY_STATUS[status]:
+      num_requests_successful += count
+    else:
+      num_requests_unsuccessful += count
+    status_counts[status] = status_counts.get(status, 0) + count
+    num_bytes += counter >> COUNT_SHIFT
+  if resource_name is not None:
+    yield (num_requests_successful + num_requests_unsuccessful, resource_name, num_requests_successful,
+           num_requests_unsuccessful)
+  host.num_requests_successful += host_successful + num_requests_successful
+  host.num_requests_unsuccessful += host_unsuccessful + num_requests_unsuccessful
+  host.num_bytes += num_bytes
+
+
+def get_buffer_records(buffer, keys=None):
+  """
+  Iterates over the records of a buffer sorted by key, a record being the key followed by its packed counter
+
+  :param buffer: the dictionary mapping the keys to their packed counters
+  :type buffer: dict
+  :param keys: the sorted keys of the buffer, or None to sort them
+  :type keys: list
+  :rtype: collections.abc.Iterator
+  """
+  for key in sorted(buffer) if keys is None else keys:
+    yield key + (buffer[key],)
+
+
+def write_block(run_file, block):
+  data = marshal.dumps(block)
+  run_file.write(_block_header.pack(len(data)))
+  run_file.write(data)
+
+
+def read_run(path):
+  """
+  Iterates over the records of a run file, reading them a block at a time
+  """
+  with open(path, 'rb') as run_file:
+    while True:
+      header = run_file.read(_block_header.size)
+      if not header:
+        return
+      yield from marshal.loads(run_file.read(_block_header.unpack(header)[0]))
+
+
+def merge_records(iterables):
+  """
+  Merges several iterables of records sorted by key into a single one, adding up the counters of the same key
+
+  :param iterables: the iterables of records, a record being a key tuple followed by its packed counter
+  :type iterables: list
+  :rtype: collections.abc.Iterator
+  """
+  key = None
+  counter = 0
+  for record in heapq.merge(*iterables):
+    record_key = record[:-1]
+    if record_key == key:
+      counter += record[-1]
+    else:
+      if key is not None:
+        yield key + (counter,)
+      key, counter = record_key, record[-1]
+  if key is not None:
+    yield key + (counter,)
+
+
+def remove_runs(runs):
+  """
+  Removes the run files of a spilling report aggregator
+
+  :param runs: a dictionary mapping the kinds of runs to the lists of their paths, which are emptied
+  :type runs: dict
+  """
+  for paths in runs.values():
+    for path in paths:
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+    paths.clear()
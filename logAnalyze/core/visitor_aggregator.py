@@ -0,0 +1,464 @@
+import heapq
+import math
+from collections import Counter, namedtuple
+from hashlib import blake2b
+
+# The number of bits of the hashes of the keys added to a sketch
+HASH_BITS = 64
+
+# The range of the precisions of a sketch, which has 2 ** precision registers of one byte
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+# The default precision: 1024 registers, ie. 1KB per sketch and a standard error of 3.25%
+DEFAULT_PRECISION = 10
+
+# A sketch keeps its non-zero registers in a dictionary until it has more than 1/64th of its registers set (more than
+# one for the sketches of less than 64 registers), at which point the dictionary would take about as much memory as the
+# array of all the registers (see get_sparse_limit)
+SPARSE_SHIFT = 6
+
+# A distinct count estimated by a sketch, along with the standard error of the estimate: about 68% of the estimates
+# are within one standard error of the true count, and 99.7% within three
+VisitorEstimate = namedtuple('VisitorEstimate', ['name', 'count', 'error'])
+
+
+class VisitorAggregator:
+  """
+  An aggregator estimating the numbers of unique visitors (distinct requesting hosts) of the logs, of every resource
+  and optionally of every time bucket, and the number of distinct resources requested by every host.
+
+  The distinct counts are estimated by :class:`HyperLogLog` sketches, which take at most 2 ** precision bytes each
+  (1KB by default) however many hosts or resources they count, and can be merged. Their standard error is
+  1.04 / sqrt(2 ** precision), ie. 3.25% with the default precision, 1.63% with a precision of 12 (4KB). Small counts
+  (up to 5 / 2 of the number of registers) are nearly exact.
+
+  :ivar precision: the precision of the sketches
+  :ivar bucket: the length of the time buckets in seconds, or None if the visitors are not counted per time bucket
+  :ivar visitors: the sketch of all the requesting hosts
+  :ivar resource_visitors: a dictionary mapping the resource names to the sketches of their requesting hosts
+  :ivar host_resources: a dictionary mapping the host names to the sketches of the resources they requested
+  :ivar bucket_visitors: a dictionary mapping the bucket numbers (epoch time divided by the length of a bucket) to the
+    sketches of the hosts requesting any resource within them
+  :ivar normalizer: the normalizer of the request lines into resource names, or None to report the request lines
+  """
+
+  # The fields of the parsed log dict which are read by receive_log, along with the time if the visitors are counted
+  # per time bucket
+  fields = ('host', 'request')
+
+  def __init__(self, precision=DEFAULT_PRECISION, bucket=None, normalizer=None):
+    """
+    :param precision: the precision of the sketches, between MIN_PRECISION and MAX_PRECISION
+    :type precision: int
+    :param bucket: the length of the time buckets in seconds, or None not to count the visitors per time bucket
+    :type bucket: float
+    :param normalizer: the normalizer of the request lines into resource names (eg. their paths), or None
+    :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+    :raises ValueError: If the precision is out of range
+    """
+    self.precision = precision
+    self.bucket = bucket
+    if bucket is not None:
+      self.fields = VisitorAggregator.fields + ('time',)
+    self.normalizer = normalizer
+    self.visitors = HyperLogLog(precision)
+    self.resource_visitors = {}
+    self.host_resources = {}
+    self.bucket_visitors = {}
+
+  def receive_log(self, log_dict):
+    """
+    This method is to be used to add a log to the aggregator.
+
+    :param log_dict: The dictionary object which has been parsed from the log string
+    :type log_dict: dict
+    """
+    self.receive_counts({tuple(log_dict[field] for field in self.fields): 1})
+
+  def receive_logs(self, records):
+    """
+    This method is to be used to add a batch of logs to the aggregator. The sketches are only updated once per distinct
+    visit of the batch.
+
+    :param records: the tuples of the fields (see fields) of the logs, eg. as returned by parse_utils.parse_many
+    :type records: collections.abc.Iterable
+    """
+    self.receive_counts(Counter(records))
+
+  def receive_counts(self, counts):
+    """
+    This method is to be used to add the logs counted by their fields to the aggregator. Only the host and the request
+    (and the time) are read, so the tuples may go on with other fields.
+
+    :param counts: a mapping of the tuples of the fields (see fields) of the logs to their numbers of occurrences
+    :type counts: collections.abc.Mapping
+    """
+    if self.bucket is None:
+      self.receive_visits(counts)
+    else:
+      bucket = self.bucket
+      self.receive_visits({(host_name, resource_name, int(log_time.timestamp() // bucket))
+                           for host_name, resource_name, log_time in counts})
+
+  def receive_columns(self, host_names, resource_names, hosts, resources, statuses, sizes, epochs):
+    """
+    This method is to be used to add logs given as columns (eg. read from a parse cache), the hosts and the resources
+    being given by their indices into lists of names.
+
+    :param host_names: the list of host names
+    :type host_names: list
+    :param resource_names: the list of resource names
+    :type resource_names: list
+    :param hosts: the indices of the host names of the logs
+    :type hosts: collections.abc.Sequence
+    :param resources: the indices of the resource names of the logs
+    :type resources: collections.abc.Sequence
+    :param statuses: the status codes of the logs (ignored)
+    :type statuses: collections.abc.Sequence
+    :param sizes: the numbers of bytes served by the logs (ignored)
+    :type sizes: collections.abc.Sequence
+    :param epochs: the epoch seconds of the logs
+    :type epochs: collections.abc.Sequence
+    """
+    if self.bucket is None:
+      self.receive_visits((host_names[host], resource_names[resource]) for host, resource in set(zip(hosts, resources)))
+    else:
+      bucket = self.bucket
+      bucket_nums = (int(epoch // bucket) for epoch in epochs)
+      self.receive_visits((host_names[host], resource_names[resource], bucket_num)
+                          for host, resource, bucket_num in set(zip(hosts, resources, bucket_nums)))
+
+  def receive_visits(self, visits):
+    """
+    Adds the visits of resources by hosts to the sketches. Every host and resource name is hashed only once per call.
+
+    :param visits: the (host name, request line) tuples of the visits, or (host name, request line, bucket number)
+      tuples if the visitors are counted per time bucket
+    :type visits: collections.abc.Iterable
+    """
+    precision = self.precision
+    resource_visitors = self.resource_visitors
+    host_resources = self.host_resources
+    bucket_visitors = self.bucket_visitors
+    bucketed = self.bucket is not None
+    normalize = None if self.normalizer is None else self.normalizer.normalize
+    add_visitor = self.visitors.add_hash
+    host_hashes = {}
+    resource_hashes = {}
+    for visit in visits:
+      host_name = visit[0]
+      resource_name = visit[1]
+      if normalize is not None:
+        resource_name = normalize(resource_name)
+      host_hash = host_hashes.get(host_name)
+      if host_hash is None:
+        host_hash = host_hashes[host_name] = get_hash(host_name)
+        add_visitor(host_hash)
+      resource_hash = resource_hashes.get(resource_name)
+      if resource_hash is None:
+        resource_hash = resource_hashes[resource_name] = get_hash(resource_name)
+
+      sketch = resource_visitors.get(resource_name)
+      if sketch is None:
+        sketch = resource_visitors[resource_name] = HyperLogLog(precision)
+      sketch.add_hash(host_hash)
+      sketch = host_resources.get(host_name)
+      if sketch is None:
+        sketch = host_resources[host_name] = HyperLogLog(precision)
+      sketch.add_hash(resource_hash)
+      if bucketed:
+        sketch = bucket_visitors.get(visit[2])
+        if sketch is None:
+          sketch = bucket_visitors[visit[2]] = HyperLogLog(precision)
+        sketch.add_hash(host_hash)
+
+  def merge(self, other):
+    """
+    Merges the sketches of another aggregator into this one, as if all the logs received by the other aggregator had
+    been received by this one.
+
+    :param other: the aggregator to be merged into this one, with the same precision and time buckets
+    :type other: VisitorAggregator
+    :raises ValueError: If the other aggregator has a different precision or time buckets
+    """
+    if other.precision != self.precision or other.bucket != self.bucket:
+      raise ValueError('Cannot merge visitor aggregators with different precisions or time buckets')
+    self.visitors.merge(other.visitors)
+    for sketches, other_sketches in ((self.resource_visitors, other.resource_visitors),
+                                     (self.host_resources, other.host_resources),
+                                     (self.bucket_visitors, other.bucket_visitors)):
+      for key, other_sketch in other_sketches.items():
+        sketch = sketches.get(key)
+        if sketch is None:
+          sketches[key] = other_sketch.copy()
+        else:
+          sketch.merge(other_sketch)
+
+  def get_error(self):
+    """
+    The relative standard error of the estimates
+
+    :rtype: float
+    """
+    return get_standard_error(self.precision)
+
+  def _get_estimate(self, name, sketch):
+    count = sketch.count()
+    return VisitorEstimate(name, count, round(count * self.get_error()))
+
+  def _get_top(self, sketches, n):
+    counts = ((sketch.count(), name) for name, sketch in sketches.items())
+    return [VisitorEstimate(name, count, round(count * self.get_error())) for count, name in heapq.nlargest(n, counts)]
+
+  def get_unique_visitors(self):
+    """
+    The estimated number of distinct hosts which requested any resource
+
+    :rtype: VisitorEstimate
+    """
+    return self._get_estimate(None, self.visitors)
+
+  def get_top_resources_by_visitors(self, n=10):
+    """
+    Get a list of the top n resources requested by the most distinct hosts
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of VisitorEstimate tuples of the top n resources, ties being broken by the resource name
+    :rtype: list
+    """
+    return self._get_top(self.resource_visitors, n)
+
+  def get_top_hosts_by_resources(self, n=10):
+    """
+    Get a list of the top n hosts requesting the most distinct resources
+
+    :param n: the number of hosts to return
+    :type n: int
+    :return: the list of VisitorEstimate tuples of the top n hosts, ties being broken by the host name
+    :rtype: list
+    """
+    return self._get_top(self.host_resources, n)
+
+  def get_visitors_per_bucket(self):
+    """
+    The estimated number of distinct hosts within every time bucket which received any request
+
+    :return: the list of VisitorEstimate tuples named by the epoch seconds at which their buckets start, in the order
+      of time
+    :rtype: list
+    :raises ValueError: If the visitors are not counted per time bucket
+    """
+    if self.bucket is None:
+      raise ValueError('The visitors are not counted per time bucket')
+    return [self._get_estimate(bucket_num * self.bucket, sketch)
+            for bucket_num, sketch in sorted(self.bucket_visitors.items())]
+
+  def get_cardinality(self):
+    """
+    Number of distinct hosts and resources received, exactly (not estimated).
+
+    :return: the (number of hosts, number of resources)
+    :rtype: tuple
+    """
+    return len(self.host_resources), len(self.resource_visitors)
+
+
+class HyperLogLog(object):
+  """
+  The HyperLogLog sketch (Flajolet et al.) of the distinct keys of a stream, estimating their number with a fixed
+  array of 2 ** precision registers of one byte.
+
+  The first precision bits of the hash of a key select a register, which keeps the maximum rank (position of the
+  first 1 bit) of the other bits of the hashes it was selected by. The harmonic mean of 2 ** rank over the registers
+  estimates the number of distinct keys per register, with a standard error of 1.04 / sqrt(2 ** precision). The
+  estimate is corrected for the empty registers (Ertl), so that it has no bias for small counts either, which are
+  nearly exact.
+
+  The sketches of two streams are merged by keeping the maximum of every register, the result being the sketch of the
+  union of the streams. Sketches with few keys keep their non-zero registers in a dictionary instead of an array, so
+  that keys with a few visitors (the vast majority of the resources of a site) take much less memory.
+
+  :ivar precision: the number of bits of the hashes selecting a register
+  :ivar registers: a dictionary mapping the indices of the non-zero registers to their ranks while the sketch is
+    sparse, then a bytearray of all the registers
+  """
+
+  __slots__ = ('precision', 'registers')
+
+  def __init__(self, precision=DEFAULT_PRECISION):
+    """
+    :param precision: the number of bits of the hashes selecting a register, between MIN_PRECISION and MAX_PRECISION
+    :type precision: int
+    :raises ValueError: If the precision is out of range
+    """
+    if not MIN_PRECISION <= precision <= MAX_PRECISION:
+      raise ValueError('The precision of a HyperLogLog sketch must be between %d and %d'
+                       % (MIN_PRECISION, MAX_PRECISION))
+    self.precision = precision
+    self.registers = {}
+
+  def add(self, key):
+    """
+    Adds a key to the sketch
+
+    :param key: the key
+    :type key: str
+    """
+    self.add_hash(get_hash(key))
+
+  def add_hash(self, hash_value):
+    """
+    Adds a key to the sketch, given by its hash (see get_hash)
+
+    :param hash_value: the 64 bits hash of the key
+    :type hash_value: int
+    """
+    rank_bits = HASH_BITS - self.precision
+    index = hash_value >> rank_bits
+    rank = rank_bits + 1 - (hash_value & ((1 << rank_bits) - 1)).bit_length()
+    registers = self.registers
+    if type(registers) is dict:
+      if rank > registers.get(index, 0):
+        registers[index] = rank
+        if len(registers) > get_sparse_limit(self.precision):
+          self._densify()
+    elif rank > registers[index]:
+      registers[index] = rank
+
+  def _densify(self):
+    """
+    Switches the sketch to the array of all its registers
+    """
+    registers = bytearray(1 << self.precision)
+    for index, rank in self.registers.items():
+      registers[index] = rank
+    self.registers = registers
+
+  def merge(self, other):
+    """
+    Merges another sketch into this one, so that it sketches the union of both of the streams
+
+    :param other: the sketch to be merged into this one, with the same precision
+    :type other: HyperLogLog
+    :raises ValueError: If the other sketch has a different precision
+    """
+    if other.precision != self.precision:
+      raise ValueError('Cannot merge HyperLogLog sketches with different precisions')
+    other_registers = other.registers
+    registers = self.registers
+    if type(other_registers) is bytearray:
+      if type(registers) is dict:
+        self._densify()
+      self.registers = bytearray(map(max, self.registers, other_registers))
+    elif type(registers) is bytearray:
+      for index, rank in other_registers.items():
+        if rank > registers[index]:
+          registers[index] = rank
+    else:
+      for index, rank in other_registers.items():
+        if rank > registers.get(index, 0):
+          registers[index] = rank
+      if len(registers) > get_sparse_limit(self.precision):
+        self._densify()
+
+  def copy(self):
+    """
+    A copy of the sketch
+
+    :rtype: HyperLogLog
+    """
+    sketch = HyperLogLog(self.precision)
+    sketch.registers = self.registers.copy()
+    return sketch
+
+  def count(self):
+    """
+    The estimated number of distinct keys added to the sketch
+
+    :rtype: int
+    """
+    num_registers = 1 << self.precision
+    registers = self.registers
+    if type(registers) is dict:
+      rank_counts = Counter(registers.values())
+      rank_counts[0] = num_registers - len(registers)
+    else:
+      rank_counts = {rank: registers.count(rank) for rank in range(max(registers) + 1)}
+    # the improved estimator of Ertl (2017), which corrects the estimate of the harmonic mean for the empty registers
+    # and the registers reaching the maximum rank, instead of switching to linear counting for small counts
+    max_rank = HASH_BITS - self.precision + 1
+    estimate = num_registers * _tau(1 - rank_counts.get(max_rank, 0) / num_registers)
+    for rank in range(max_rank - 1, 0, -1):
+      estimate = (estimate + rank_counts.get(rank, 0)) / 2
+    estimate += num_registers * _sigma(rank_counts.get(0, 0) / num_registers)
+    return round(num_registers * num_registers / (2 * math.log(2) * estimate))
+
+
+def get_hash(key):
+  """
+  The 64 bits hash of a key added to HyperLogLog sketches. It does not depend on the process (unlike the built-in hash
+  of a string), so that the sketches of parallel workers can be merged.
+
+  :param key: the key
+  :type key: str
+  :rtype: int
+  """
+  return int.from_bytes(blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'little')
+
+
+def _sigma(x):
+  """
+  The sum of x ** (2 ** k) * 2 ** (k - 1) over k >= 1, plus x (the correction for the empty registers)
+  """
+  if x == 1:
+    return math.inf
+  y = 1
+  z = x
+  while True:
+    x *= x
+    previous_z = z
+    z += x * y
+    y += y
+    if z == previous_z:
+      return z
+
+
+def _tau(x):
+  """
+  The correction for the registers reaching the maximum rank
+  """
+  if x == 0 or x == 1:
+    return 0
+  y = 1
+  z = 1 - x
+  while True:
+    x = math.sqrt(x)
+    previous_z = z
+    y /= 2
+    z -= (1 - x) ** 2 * y
+    if z == previous_z:
+      return z / 3
+
+
+def get_standard_error(precision):
+  """
+  The relative standard error of the estimates of HyperLogLog sketches of a precision
+
+  :param precision: the precision of the sketches
+  :type precision: int
+  :rtype: float
+  """
+  return 1.04 / math.sqrt(1 << precision)
+
+
+def get_sparse_limit(precision):
+  """
+  The number of non-zero registers up to which a HyperLogLog sketch of a precision keeps them in a dictionary
+
+  :param precision: the precision of the sketch
+  :type precision: int
+  :rtype: int
+  """
+  return 1 << max(0, precision - SPARSE_SHIFT)
@@ -0,0 +1,217 @@
+from logAnalyze.core.report_aggregator import ReportAggregator, DEFAULT_REPORTS, normalize_counts
+
+
+class WindowedReportAggregator:
+  """
+  A report aggregator whose reports only cover the logs received within a sliding time window, eg. the last 5 minutes.
+
+  The window is split into buckets of a fixed granularity (eg. 1 second), each bucket being a report aggregator of
+  the logs whose time falls into it. The reports are served by a running total of all the buckets, and when the
+  window slides forward the expired buckets are subtracted from the total instead of recomputing it from scratch.
+
+  The window ends at the latest log time received, so it follows the time of the logs rather than the wall clock.
+  Logs older than the window are dropped.
+
+  :ivar window: the length of the window in seconds, a multiple of the granularity
+  :ivar granularity: the length of a bucket in seconds
+  :ivar total: the report aggregator of all the logs within the window
+  :ivar buckets: a dictionary mapping the bucket numbers (epoch time divided by granularity) to their aggregators
+  :ivar num_logs_dropped: the number of logs which arrived after their bucket had already expired
+  :ivar normalizer: the normalizer of the request lines into resource names, or None to report the request lines
+  :ivar reports: the names of the reports provided by the aggregator (see report_aggregator.REPORTS)
+  """
+
+  # The fields of the parsed log dict which may be read by receive_log, along with the time: every aggregator only
+  # reads the ones of its reports (see report_aggregator.get_fields)
+  fields = ReportAggregator.fields + ('time',)
+
+  def __init__(self, window=300, granularity=1, normalizer=None, reports=DEFAULT_REPORTS):
+    """
+    :param window: the length of the window in seconds, rounded down to a multiple of the granularity
+    :type window: float
+    :param granularity: the length of a bucket in seconds
+    :type granularity: float
+    :param normalizer: the normalizer of the request lines into resource names (eg. their paths), or None
+    :type normalizer: logAnalyze.utils.request_utils.RequestNormalizer
+    :param reports: the names of the reports to be provided by the aggregator, the DEFAULT_REPORTS by default
+    :type reports: collections.abc.Iterable
+    :raises ValueError: If any of the reports is unknown, or is a visitors report whose sketches cannot be subtracted
+      from the window
+    """
+    self.normalizer = normalizer
+    self.granularity = granularity
+    self.num_buckets = max(1, int(window // granularity))
+    self.window = self.num_buckets * granularity
+    self.total = ReportAggregator(reports=reports)
+    if self.total.visitors is not None:
+      raise ValueError('The visitors reports cannot be provided over a sliding window')
+    self.reports = self.total.reports
+    self.fields = self.total.fields + ('time',)
+    self.buckets = {}
+    self.latest_bucket = None
+    self.num_logs_dropped = 0
+
+  def receive_log(self, log_dict):
+    """
+    This method is to be used to add a log to the report aggregator.
+
+    :param log_dict: The dictionary object which has been parsed from the log string
+    :type log_dict: dict
+    """
+    bucket_num = int(log_dict['time'].timestamp() // self.granularity)
+    if self.latest_bucket is not None and bucket_num <= self.latest_bucket - self.num_buckets:
+      self.num_logs_dropped += 1
+      return
+
+    # the request line is normalized once for the bucket and the total, which then share the name of the resource
+    if self.normalizer is not None and 'request' in self.fields:
+      log_dict = dict(log_dict, request=self.normalizer.normalize(log_dict['request']))
+    bucket = self.buckets.get(bucket_num)
+    if bucket is None:
+      bucket = self.buckets[bucket_num] = ReportAggregator(reports=self.reports)
+    bucket.receive_log(log_dict)
+    self.total.receive_log(log_dict)
+
+    if self.latest_bucket is None or bucket_num > self.latest_bucket:
+      self.latest_bucket = bucket_num
+      self.expire(bucket_num - self.num_buckets)
+
+  def receive_logs(self, records):
+    """
+    This method is to be used to add a batch of logs to the report aggregator. The logs are counted by bucket first, as
+    if they had been received one at a time, so every bucket and the total only receive the counts of the batch once.
+
+    :param records: the tuples of the fields (see fields) of the logs, eg. as returned by parse_utils.parse_many
+    :type records: collections.abc.Iterable
+    """
+    granularity = self.granularity
+    latest_bucket = self.latest_bucket
+    bucket_counts = {}
+    for record in records:
+      bucket_num = int(record[-1].timestamp() // granularity)
+      if latest_bucket is not None and bucket_num <= latest_bucket - self.num_buckets:
+        self.num_logs_dropped += 1
+        continue
+      if latest_bucket is None or bucket_num > latest_bucket:
+        latest_bucket = bucket_num
+      counts = bucket_counts.get(bucket_num)
+      if counts is None:
+        counts = bucket_counts[bucket_num] = {}
+      key = record[:-1]
+      counts[key] = counts.get(key, 0) + 1
+
+    for bucket_num, counts in bucket_counts.items():
+      # the request lines are normalized once for the bucket and the total
+      if self.normalizer is not None and 'request' in self.fields:
+        counts = normalize_counts(counts, self.total.field_indices['request'], self.normalizer)
+      bucket = self.buckets.get(bucket_num)
+      if bucket is None:
+        bucket = self.buckets[bucket_num] = ReportAggregator(reports=self.reports)
+      bucket.receive_counts(counts)
+      self.total.receive_counts(counts)
+
+    # the buckets which expired while the batch was received are subtracted at once
+    if latest_bucket != self.latest_bucket:
+      self.latest_bucket = latest_bucket
+      self.expire(latest_bucket - self.num_buckets)
+
+  def expire(self, last_bucket_num):
+    """
+    Subtracts the buckets up to (and including) a bucket number from the running total
+
+    :param last_bucket_num: the number of the last bucket to be expired
+    :type last_bucket_num: int
+    """
+    for bucket_num in sorted(self.buckets):
+      if bucket_num > last_bucket_num:
+        break
+      self.total.subtract(self.buckets.pop(bucket_num))
+
+  def get_window_end(self):
+    """
+    The epoch time at which the window ends, or None if no logs have been received
+
+    :rtype: float
+    """
+    if self.latest_bucket is None:
+      return None
+    return (self.latest_bucket + 1) * self.granularity
+
+  def get_num_requests(self):
+    return self.total.num_requests_successful + self.total.num_requests_unsuccessful
+
+  def get_top_hosts(self, n=10):
+    """
+    Get a list of the top n hosts making the most requests within the window
+
+    :param n: the number of hosts to return
+    :type n: int
+    :return: the list of top n hosts making the most requests
+    :rtype: list
+    """
+    return self.total.get_top_hosts(n)
+
+  def get_top_unsuccessful_requests(self, n=10):
+    """
+    Get a list of the top n unsuccessfully requested resources within the window
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: The list of top n unsuccessfully requested resources
+    :rtype: list
+    """
+    return self.total.get_top_unsuccessful_requests(n)
+
+  def get_top_requests(self, n=10):
+    """
+    Get a list of the top n requested resources within the window
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of top n requested resources
+    :rtype: list
+    """
+    return self.total.get_top_requests(n)
+
+  def get_top_requests_by_bytes(self, n=10):
+    """
+    Get a list of the top n resources by number of bytes served within the window
+
+    :param n: the number of resources to return
+    :type n: int
+    :return: the list of top n resources by number of bytes served
+    :rtype: list
+    """
+    return self.total.get_top_requests_by_bytes(n)
+
+  def get_status_counts(self):
+    """
+    Number of requests per status code within the window, in the order of the status codes
+
+    :rtype: dict
+    """
+    return self.total.get_status_counts()
+
+  def get_mean_bytes(self):
+    """
+    Mean number of bytes served per request within the window.
+
+    :rtype: float
+    """
+    return self.total.get_mean_bytes()
+
+  def get_success_pct(self):
+    """
+    Percentage of successful requests received within the window.
+
+    :rtype: float
+    """
+    return self.total.get_success_pct()
+
+  def get_failed_pct(self):
+    """
+    Percentage of unsuccessful requests received within the window.
+
+    :rtype: float
+    """
+    return self.total.get_failed_pct()
@@ -0,0 +1,148 @@
+"""
+This file contains a generator of synthetic CLF log corpora, used by the tests and the benchmarks. The corpora are
+reproducible (the same seed always generates the same logs) and the hosts and resources are requested with a Zipf
+distribution, a few of them receiving most of the requests as in production logs.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+# The status codes of the generated logs, along with their relative weights among the successful and the
+# unsuccessful requests
+SUCCESS_STATUSES = (('200', 85), ('304', 10), ('302', 4), ('206', 1))
+FAIL_STATUSES = (('404', 70), ('500', 10), ('403', 10), ('503', 5), ('400', 4), ('101', 1))
+
+# The methods of the generated requests, along with their relative weights
+METHODS = (('GET', 90), ('POST', 6), ('HEAD', 4))
+
+# The extensions of the generated resources
+EXTENSIONS = ('.html', '.gif', '.jpg', '.css', '.js', '')
+
+# The time of the first log of a corpus, by default
+START_TIME = datetime(1995, 7, 1, tzinfo=timezone(timedelta(hours=-4)))
+
+# The number of logs generated at once
+BATCH_SIZE = 2 ** 16
+
+
+def get_zipf_weights(num_keys, skew):
+  """
+  Returns the cumulative weights of the keys of a Zipf distribution, the key of rank k having a weight of 1 / k^skew
+
+  :param num_keys: the number of distinct keys
+  :type num_keys: int
+  :param skew: the exponent of the distribution, 0 for a uniform distribution
+  :type skew: float
+  :rtype: list
+  """
+  return list(accumulate(1 / rank ** skew for rank in range(1, num_keys + 1)))
+
+
+def get_hosts(rng, num_hosts):
+  """
+  Returns a list of distinct host names, which are either IP addresses or domain names
+  """
+  hosts = set()
+  while len(hosts) < num_hosts:
+    if rng.getrandbits(1):
+      hosts.add('%d.%d.%d.%d' % tuple(rng.randrange(1, 255) for _ in range(4)))
+    else:
+      hosts.add('%s%d.%s.com' % (rng.choice(('www', 'proxy', 'dialup', 'host')), rng.randrange(10000),
+                                 get_word(rng, rng.randint(4, 10))))
+  hosts = sorted(hosts)
+  rng.shuffle(hosts)
+  return hosts
+
+
+def get_requests(rng, num_resources):
+  """
+  Returns a list of distinct requests (method, resource and protocol), along with the size of the response to every
+  request
+  """
+  methods = [method for method, _ in METHODS]
+  method_weights = list(accumulate(weight for _, weight in METHODS))
+  requests = {}
+  while len(requests) < num_resources:
+    path = '/' + '/'.join(get_word(rng, rng.randint(2, 8)) for _ in range(rng.randint(1, 4)))
+    path += rng.choice(EXTENSIONS)
+    if rng.random() < 0.1:
+      path += '?%s=%d' % (get_word(rng, 3), rng.randrange(1000))
+    request = '%s %s HTTP/1.0' % (rng.choices(methods, cum_weights=method_weights)[0], path)
+    requests[request] = str(rng.randrange(16 * 1024 * 1024) if path.endswith('.jpg') else rng.randrange(64 * 1024))
+  request_list = sorted(requests)
+  rng.shuffle(request_list)
+  return request_list, requests
+
+
+def get_word(rng, length):
+  return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(length))
+
+
+def generate_logs(num_lines, num_hosts=10000, num_resources=5000, skew=1.1, error_ratio=0.05, seed=0,
+                  start=START_TIME, lines_per_second=20):
+  """
+  Generates a synthetic corpus of CLF logs, in batches of lines. The logs move forward in time by a second every
+  lines_per_second logs.
+
+  :param num_lines: the number of logs to be generated
+  :type num_lines: int
+  :param num_hosts: the number of distinct hosts
+  :type num_hosts: int
+  :param num_resources: the number of distinct requests
+  :type num_resources: int
+  :param skew: the exponent of the Zipf distribution of the hosts and requests, 0 for uniform distributions
+  :type skew: float
+  :param error_ratio: the ratio of the requests which are unsuccessful
+  :type error_ratio: float
+  :param seed: the seed of the random generator
+  :type seed: int
+  :param start: the time of the first log
+  :type start: datetime.datetime
+  :param lines_per_second: the number of logs per second
+  :type lines_per_second: int
+  :return: a generator of lists of log lines (ending with a newline)
+  :rtype: collections.abc.Iterator
+  """
+  rng = random.Random(seed)
+  hosts = get_hosts(rng, num_hosts)
+  requests, sizes = get_requests(rng, num_resources)
+  host_weights = get_zipf_weights(num_hosts, skew)
+  request_weights = get_zipf_weights(num_resources, skew)
+  statuses = [status for status, _ in SUCCESS_STATUSES + FAIL_STATUSES]
+  status_weights = list(accumulate([weight * (1 - error_ratio) / sum(w for _, w in SUCCESS_STATUSES)
+                                    for _, weight in SUCCESS_STATUSES] +
+                                   [weight * error_ratio / sum(w for _, w in FAIL_STATUSES)
+                                    for _, weight in FAIL_STATUSES]))
+
+  # every column has its own random generator, so that the logs do not depend on the size of the batches
+  host_rng, request_rng, status_rng = (random.Random(rng.getrandbits(64)) for _ in range(3))
+  dates = {}
+  for batch_start in range(0, num_lines, BATCH_SIZE):
+    batch_size = min(BATCH_SIZE, num_lines - batch_start)
+    # the dates of the batch, formatted once per second
+    first_second = batch_start // lines_per_second
+    last_second = (batch_start + batch_size - 1) // lines_per_second
+    dates = {second: dates.get(second) or (start + timedelta(seconds=second)).strftime('%d/%b/%Y:%H:%M:%S %z')
+             for second in range(first_second, last_second + 1)}
+    logs = []
+    for i, host, request, status in zip(range(batch_start, batch_start + batch_size),
+                                        host_rng.choices(hosts, cum_weights=host_weights, k=batch_size),
+                                        request_rng.choices(requests, cum_weights=request_weights, k=batch_size),
+                                        status_rng.choices(statuses, cum_weights=status_weights, k=batch_size)):
+      logs.append('%s - - [%s] "%s" %s %s\n' % (host, dates[i // lines_per_second], request, status,
+                                                sizes[request] if status == '200' else '-'))
+    yield logs
+
+
+def write_corpus(path, num_lines, **kwargs):
+  """
+  Writes a synthetic corpus of CLF logs to a file (see :func:`generate_logs` for the keyword arguments)
+
+  :param path: the path of the log file
+  :type path: str
+  :param num_lines: the number of logs to be generated
+  :type num_lines: int
+  """
+  with open(path, 'w') as log_file:
+    for logs in generate_logs(num_lines, **kwargs):
+      log_file.writelines(logs)
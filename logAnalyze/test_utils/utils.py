@@ -2,6 +2,8 @@
 This file contains some utility functions that are used by our tests
 """
 import random
+import struct
+import zlib
 from string import ascii_lowercase
 from rstr import xeger
 from datetime import datetime, timedelta
@@ -18,7 +20,7 @@ def get_clf_log(host, resource, status):
 
 
 def get_random_host():
-  if get_random_bool:
+  if get_random_bool():
     # fetch a random ip address
     return ".".join(map(str, (random.randint(0, 255) for _ in range(4))))
   else:
@@ -27,7 +29,7 @@ def get_random_host():
 
 
 def get_random_id():
-  if get_random_bool:
+  if get_random_bool():
     return '-'
   else:
     return get_random_string(4)
@@ -39,7 +41,7 @@ def get_random_path(nesting=4, max_len=5):
 
 
 def get_random_query(max_len=5):
-  if get_random_bool:
+  if get_random_bool():
     return ''
   else:
     return '?' + get_random_string(random.randint(1, max_len))
@@ -110,3 +112,48 @@ def get_top_requests(dct, n, choice):
     top_list.append({'name': key, 'num': get_num(key)})
 
   return sorted(top_list, key=lambda item: (item['num'], item['name']), reverse=True)[:n]
+
+
+def get_report_dict(reporter):
+  """
+  Converts the counters of a report aggregator into plain nested dicts, so that two aggregators can be compared
+
+  :param reporter: the report aggregator
+  :type reporter: logAnalyze.core.report_aggregator.ReportAggregator
+  :rtype: dict
+  """
+  def get_counts(item):
+    return {'num_requests_successful': item.num_requests_successful,
+            'num_requests_unsuccessful': item.num_requests_unsuccessful}
+
+  host_dict = {}
+  for host_name, host in reporter.host_dict.items():
+    host_dict[host_name] = get_counts(host)
+    host_dict[host_name]['resource_dict'] = {k: get_counts(v) for k, v in host.resource_dict.items()}
+  return {'host_dict': host_dict,
+          'resource_dict': {k: get_counts(v) for k, v in reporter.resource_dict.items()},
+          'num_requests_successful': reporter.num_requests_successful,
+          'num_requests_unsuccessful': reporter.num_requests_unsuccessful}
+
+
+def write_bgzf(path, data, block_size=2 ** 16 - 1024):
+  """
+  Writes data to a BGZF file, ie. a gzip file made of independent members of block_size uncompressed bytes, each
+  recording its compressed size in the BC subfield of its extra field, followed by the empty end-of-file block.
+
+  :param path: the path of the file to be written
+  :type path: str
+  :param data: the uncompressed data
+  :type data: bytes
+  :param block_size: the number of uncompressed bytes per block
+  :type block_size: int
+  """
+  with open(path, 'wb') as bgzf_file:
+    for offset in list(range(0, len(data), block_size)) + [len(data)]:
+      block = data[offset:offset + block_size]
+      compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+      deflated = compressor.compress(block) + compressor.flush()
+      # header (18 bytes) + deflated data + crc32 and size (8 bytes)
+      bgzf_file.write(struct.pack('<4BI2BH2s2H', 0x1f, 0x8b, 8, 4, 0, 0, 255, 6, b'BC', 2, 18 + len(deflated) + 8 - 1))
+      bgzf_file.write(deflated)
+      bgzf_file.write(struct.pack('<2I', zlib.crc32(block), len(block)))
@@ -0,0 +1,72 @@
+import random
+import unittest
+from collections import Counter
+
+from logAnalyze.core.approximate_aggregator import ApproximateReportAggregator, SpaceSaving
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.parse_utils import parse, parse_many
+
+
+class TestApproximateReportAggregator(unittest.TestCase):
+  def test_report(self):
+    logs, _ = logs_and_report()
+    reporter = ReportAggregator(reports=EXACT_REPORTS)
+    # a budget large enough to track every key, so that the counts are exact
+    approximate_reporter = ApproximateReportAggregator(memory_budget=2 ** 20)
+    # the same logs, received as a single batch
+    batch_reporter = ApproximateReportAggregator(memory_budget=2 ** 20)
+    for log in logs:
+      log_dict = parse(LogFormat.CLF, log)
+      reporter.receive_log(log_dict)
+      approximate_reporter.receive_log(log_dict)
+    batch_reporter.receive_logs(parse_many(LogFormat.CLF, logs, batch_reporter.fields))
+
+    for tested_reporter in (approximate_reporter, batch_reporter):
+      self.assertEqual(tested_reporter.get_success_pct(), reporter.get_success_pct())
+      self.assertEqual([(host.host_name, host.get_num_requests(), 0) for host in reporter.get_top_hosts(10)],
+                       tested_reporter.get_top_hosts(10))
+      self.assertEqual([(resource.resource_name, resource.get_num_requests(), 0)
+                        for resource in reporter.get_top_requests(10)], tested_reporter.get_top_requests(10))
+      self.assertEqual([(resource.resource_name, resource.num_requests_unsuccessful, 0)
+                        for resource in reporter.get_top_unsuccessful_requests(10)],
+                       tested_reporter.get_top_unsuccessful_requests(10))
+      self.assertEqual([(resource.resource_name, resource.num_bytes, 0)
+                        for resource in reporter.get_top_requests_by_bytes(10)],
+                       tested_reporter.get_top_requests_by_bytes(10))
+      self.assertEqual(tested_reporter.get_status_counts(), reporter.get_status_counts())
+      self.assertEqual(tested_reporter.get_mean_bytes(), reporter.get_mean_bytes())
+
+  def test_space_saving(self):
+    rng = random.Random(7)
+    # a skewed stream, where key i occurs with a probability proportional to 1 / (i + 1)
+    keys = list(range(5000))
+    stream = rng.choices(keys, weights=[1 / (key + 1) for key in keys], k=50000)
+    counts = Counter(stream)
+
+    summary = SpaceSaving(200)
+    for key in stream:
+      summary.add(key)
+    self.assertEqual(len(summary.counters), 200)
+    self.check_summary(summary, counts)
+
+    # merging the summaries of two halves of the stream
+    first_summary, second_summary = SpaceSaving(200), SpaceSaving(200)
+    for key in stream[:20000]:
+      first_summary.add(key)
+    for key in stream[20000:]:
+      second_summary.add(key)
+    first_summary.merge(second_summary)
+    self.check_summary(first_summary, counts)
+
+  def check_summary(self, summary, counts):
+    max_error = summary.total // summary.capacity
+    for key, count, error in summary.get_top(summary.capacity):
+      self.assertLessEqual(count - error, counts[key])
+      self.assertGreaterEqual(count, counts[key])
+      self.assertLessEqual(error, max_error)
+    # every key occurring more often than the error bound is tracked
+    for key, count in counts.items():
+      if count > max_error:
+        self.assertIn(key, summary.counters)
@@ -0,0 +1,111 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from logAnalyze.core.checkpoint import aggregate_file_incrementally, load_checkpoint
+from logAnalyze.core.compact_aggregator import CompactReportAggregator
+from logAnalyze.test_utils.utils import get_random_int
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.custom_exceptions import CheckpointError
+
+
+class TestCheckpoint(unittest.TestCase):
+  def setUp(self):
+    self.logs, self.expected_report = logs_and_report()
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'access.log')
+    self.checkpoint_path = os.path.join(self.directory, 'access.checkpoint')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def append(self, text):
+    with open(self.path, 'a') as log_file:
+      log_file.write(text)
+
+  def test_resume(self):
+    text = '\n'.join(self.logs) + '\n'
+    first_split = get_random_int(1, len(text) // 2)
+    second_split = get_random_int(first_split + 1, len(text) - 1)
+
+    self.append(text[:first_split])
+    reporter, resumed = aggregate_file_incrementally(self.path, self.checkpoint_path)
+    self.assertFalse(resumed)
+    # the incomplete line at the end of the file is left for the next run
+    self.assertEqual(load_checkpoint(self.checkpoint_path)[1].offset, text.rfind('\n', 0, first_split) + 1)
+
+    self.append(text[first_split:second_split])
+    reporter, resumed = aggregate_file_incrementally(self.path, self.checkpoint_path, workers=2)
+    self.assertTrue(resumed)
+    self.append(text[second_split:])
+    reporter, resumed = aggregate_file_incrementally(self.path, self.checkpoint_path, use_mmap=True)
+    self.assertTrue(resumed)
+    self.assertEqual(get_compact_report_dict(reporter), self.expected_report)
+
+    # nothing new to be read
+    reporter, resumed = aggregate_file_incrementally(self.path, self.checkpoint_path)
+    self.assertTrue(resumed)
+    self.assertEqual(get_compact_report_dict(reporter), self.expected_report)
+
+  def test_rotation_and_truncation(self):
+    self.append('\n'.join(self.logs[:10]) + '\n')
+    aggregate_file_incrementally(self.path, self.checkpoint_path)
+
+    # truncation
+    with open(self.path, 'w') as log_file:
+      log_file.write(self.logs[0] + '\n')
+    reporter, resumed = aggregate_file_incrementally(self.path, self.checkpoint_path)
+    self.assertFalse(resumed)
+    self.assertEqual(reporter.num_requests_successful + reporter.num_requests_unsuccessful, 1)
+
+    # rotation, the new file being larger than the old one
+    os.rename(self.path, self.path + '.1')
+    self.append('\n'.join(self.logs) + '\n')
+    reporter, resumed = aggregate_file_incrementally(self.path, self.checkpoint_path)
+    self.assertFalse(resumed)
+    self.assertEqual(get_compact_report_dict(reporter), self.expected_report)
+
+  def test_invalid_checkpoint(self):
+    self.append('\n'.join(self.logs) + '\n')
+    with open(self.checkpoint_path, 'w') as checkpoint_file:
+      checkpoint_file.write('\n'.join(self.logs))
+    self.assertRaises(CheckpointError, aggregate_file_incrementally, self.path, self.checkpoint_path)
+
+    # a checkpoint cut short
+    os.remove(self.checkpoint_path)
+    aggregate_file_incrementally(self.path, self.checkpoint_path)
+    with open(self.checkpoint_path, 'r+b') as checkpoint_file:
+      checkpoint_file.truncate(os.path.getsize(self.checkpoint_path) // 2)
+    self.assertRaises(CheckpointError, load_checkpoint, self.checkpoint_path)
+
+  def test_dump_and_load(self):
+    reporter = CompactReportAggregator()
+    for i in range(100):
+      host_id, resource_id = reporter.add_requests('host%d' % (i % 7), '/resource%d' % (i % 11), i % 3, i % 2, i)
+      reporter.add_statuses(host_id, resource_id, ('200', '404', '503')[i % 3], i % 3 + i % 2)
+    file = io.BytesIO()
+    reporter.dump(file)
+    file.seek(0)
+    loaded_reporter = CompactReportAggregator.load(file)
+    self.assertEqual(vars(loaded_reporter), vars(reporter))
+
+
+def get_compact_report_dict(reporter):
+  """
+  Converts the counters of a compact report aggregator into the nested dicts of test_utils.utils.get_report_dict
+  """
+  def get_counts(item):
+    return {'num_requests_successful': item.num_requests_successful,
+            'num_requests_unsuccessful': item.num_requests_unsuccessful}
+
+  host_dict = {}
+  for host in reporter.get_top_hosts(len(reporter.host_names)):
+    host_dict[host.host_name] = get_counts(host)
+    host_dict[host.host_name]['resource_dict'] = {k: get_counts(v) for k, v in host.resource_dict.items()}
+  return {'host_dict': host_dict,
+          'resource_dict': {resource.resource_name: get_counts(resource)
+                            for resource in reporter.get_top_requests(len(reporter.resource_names))},
+          'num_requests_successful': reporter.num_requests_successful,
+          'num_requests_unsuccessful': reporter.num_requests_unsuccessful}
@@ -0,0 +1,89 @@
+import unittest
+
+from logAnalyze.core.compact_aggregator import CompactReportAggregator
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.test_utils.utils import get_random_int
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.parse_utils import parse, parse_many
+
+
+class TestCompactReportAggregator(unittest.TestCase):
+  def test_report(self):
+    logs, _ = logs_and_report()
+
+    reporter = ReportAggregator(reports=EXACT_REPORTS)
+    compact_reporter = CompactReportAggregator()
+    for log in logs:
+      log_dict = parse(LogFormat.CLF, log)
+      reporter.receive_log(log_dict)
+      compact_reporter.receive_log(log_dict)
+
+    # the reports should be the same as those of the report aggregator
+    self.assertEqual(compact_reporter.get_success_pct(), reporter.get_success_pct())
+    self.assertEqual(compact_reporter.get_failed_pct(), reporter.get_failed_pct())
+
+    x = get_random_int(5, 15)
+    self.assertEqual(get_counts(compact_reporter.get_top_requests(x)), get_counts(reporter.get_top_requests(x)))
+    self.assertEqual(get_counts(compact_reporter.get_top_unsuccessful_requests(x)),
+                     get_counts(reporter.get_top_unsuccessful_requests(x)))
+
+    top_hosts = compact_reporter.get_top_hosts(x)
+    expected_top_hosts = reporter.get_top_hosts(x)
+    self.assertEqual(get_counts(top_hosts), get_counts(expected_top_hosts))
+    for host, expected_host in zip(top_hosts, expected_top_hosts):
+      self.assertEqual(get_counts(host.get_top_requests(x)), get_counts(expected_host.get_top_requests(x)))
+      self.assertEqual((host.status_counts, host.num_bytes), (expected_host.status_counts, expected_host.num_bytes))
+
+    # the status code histograms and bytes served
+    self.assertEqual(compact_reporter.get_status_counts(), reporter.get_status_counts())
+    self.assertEqual(compact_reporter.get_mean_bytes(), reporter.get_mean_bytes())
+    self.assertEqual(get_histograms(compact_reporter.get_top_requests_by_bytes(x)),
+                     get_histograms(reporter.get_top_requests_by_bytes(x)))
+
+  def test_receive_logs(self):
+    logs, expected_report = logs_and_report()
+    reporter = CompactReportAggregator()
+    reporter.receive_logs(parse_many(LogFormat.CLF, logs, reporter.fields))
+    self.assertEqual(reporter.num_requests_successful, expected_report['num_requests_successful'])
+    self.assertEqual(reporter.num_requests_unsuccessful, expected_report['num_requests_unsuccessful'])
+
+    expected_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    expected_reporter.receive_logs(parse_many(LogFormat.CLF, logs, expected_reporter.fields))
+    top_hosts = reporter.get_top_hosts(len(expected_report['host_dict']))
+    self.assertEqual({host.host_name: sorted(get_counts(host.resource_dict.values())) for host in top_hosts},
+                     {host.host_name: sorted(get_counts(host.resource_dict.values()))
+                      for host in expected_reporter.host_dict.values()})
+
+  def test_merge(self):
+    logs, expected_report = logs_and_report()
+    split = get_random_int(1, len(logs) - 1)
+
+    reporter = CompactReportAggregator()
+    for log in logs[:split]:
+      reporter.receive_log(parse(LogFormat.CLF, log))
+    other_reporter = CompactReportAggregator()
+    for log in logs[split:]:
+      other_reporter.receive_log(parse(LogFormat.CLF, log))
+    reporter.merge(other_reporter)
+
+    expected_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log in logs:
+      expected_reporter.receive_log(parse(LogFormat.CLF, log))
+    top_hosts = reporter.get_top_hosts(len(expected_report['host_dict']))
+    self.assertEqual({host.host_name: sorted(get_counts(host.resource_dict.values())) for host in top_hosts},
+                     {host.host_name: sorted(get_counts(host.resource_dict.values()))
+                      for host in expected_reporter.host_dict.values()})
+    self.assertEqual(get_histograms(top_hosts), get_histograms(expected_reporter.get_top_hosts(len(top_hosts))))
+    self.assertEqual(get_histograms(reporter.get_top_requests(len(expected_report['resource_dict']))),
+                     get_histograms(expected_reporter.get_top_requests(len(expected_report['resource_dict']))))
+
+
+def get_counts(items):
+  return [(getattr(item, 'host_name', None) or item.resource_name, item.num_requests_successful,
+           item.num_requests_unsuccessful) for item in items]
+
+
+def get_histograms(items):
+  return [(getattr(item, 'host_name', None) or item.resource_name, item.status_counts, item.num_bytes)
+          for item in items]
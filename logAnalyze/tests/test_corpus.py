@@ -0,0 +1,38 @@
+import unittest
+from collections import Counter
+
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.test_utils.corpus import generate_logs
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.parse_utils import parse_many
+
+
+class TestCorpus(unittest.TestCase):
+  def get_logs(self, num_lines, **kwargs):
+    return [log for logs in generate_logs(num_lines, **kwargs) for log in logs]
+
+  def test_reproducible(self):
+    logs = self.get_logs(1000, seed=7)
+    self.assertEqual(len(logs), 1000)
+    self.assertEqual(logs, self.get_logs(1000, seed=7))
+    self.assertNotEqual(logs, self.get_logs(1000, seed=8))
+    # a corpus is the start of any larger corpus with the same seed
+    self.assertEqual(logs, self.get_logs(100000, seed=7)[:1000])
+
+  def test_distribution(self):
+    logs = self.get_logs(100000, num_hosts=500, num_resources=200, skew=1.2, error_ratio=0.25)
+    records = list(parse_many(LogFormat.CLF, logs, ('host', 'request', 'status', 'time')))
+    host_counts = Counter(host for host, _, _, _ in records)
+    self.assertLessEqual(len(host_counts), 500)
+    self.assertLessEqual(len(set(request for _, request, _, _ in records)), 200)
+    # the most requested host receives a large share of the requests
+    self.assertGreater(host_counts.most_common(1)[0][1], len(records) / 10)
+    num_unsuccessful = sum(1 for _, _, status, _ in records if not ReportAggregator.is_success(status))
+    self.assertAlmostEqual(num_unsuccessful / len(records), 0.25, delta=0.01)
+    times = [time for _, _, _, time in records]
+    self.assertEqual(times, sorted(times))
+
+    # uniform distribution
+    logs = self.get_logs(100000, num_hosts=500, skew=0)
+    host_counts = Counter(host for host, in parse_many(LogFormat.CLF, logs, ('host',)))
+    self.assertLess(host_counts.most_common(1)[0][1], 2 * len(logs) / 500)
@@ -0,0 +1,141 @@
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+from logAnalyze.test_utils.utils import write_bgzf
+from logAnalyze.utils.file_utils import follow_lines, get_compression, read_compressed_chunks, split_bgzf, \
+  read_bgzf_chunks, read_ahead, bisect_lines
+
+
+class TestFileUtils(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'access.log')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def append(self, text, path=None):
+    with open(path or self.path, 'a') as log_file:
+      log_file.write(text)
+
+  def test_follow_lines(self):
+    self.append('old line\n')
+    lines = follow_lines(self.path, poll_interval=0)
+    self.assertIsNone(next(lines))
+
+    # incomplete lines are held back
+    self.append('first line\nsecond ')
+    self.assertEqual(next(lines), 'first line\n')
+    self.assertIsNone(next(lines))
+    self.append('line\n')
+    self.assertEqual(next(lines), 'second line\n')
+
+    # rotation: the rest of the old file is read before switching to the new one
+    self.append('last line\n')
+    os.rename(self.path, self.path + '.1')
+    self.assertEqual(next(lines), 'last line\n')
+    self.assertIsNone(next(lines))
+    self.append('new line\n')
+    self.assertEqual(next(lines), 'new line\n')
+
+    # truncation
+    with open(self.path, 'w') as log_file:
+      log_file.write('a\n')
+    self.assertEqual(next(lines), 'a\n')
+
+    # the incomplete last line is generated when the file is rotated or truncated
+    self.append('cut ')
+    self.assertIsNone(next(lines))
+    os.rename(self.path, self.path + '.1')
+    self.append('b\n')
+    self.assertEqual(next(lines), 'cut ')
+    self.assertEqual(next(lines), 'b\n')
+    self.append('cut again')
+    self.assertIsNone(next(lines))
+    with open(self.path, 'w') as log_file:
+      log_file.write('c\n')
+    self.assertEqual(next(lines), 'cut again')
+    self.assertEqual(next(lines), 'c\n')
+    lines.close()
+
+    lines = follow_lines(self.path, poll_interval=0, from_start=True)
+    self.assertEqual(next(lines), 'c\n')
+    lines.close()
+
+  def test_compressed_files(self):
+    lines = ['line %d %s' % (i, 'x' * (i % 100)) for i in range(5000)]
+    data = ('\n'.join(lines) + '\n').encode()
+    self.append('\n'.join(lines))
+    self.assertIsNone(get_compression(self.path))
+
+    for compression, open_file in (('gzip', gzip.open), ('bz2', bz2.open), ('xz', lzma.open)):
+      # the compression is detected from the content, not from the name
+      path = os.path.join(self.directory, 'access.log.%s' % compression)
+      with open_file(path, 'wb') as compressed_file:
+        compressed_file.write(data)
+      self.assertEqual(get_compression(path), compression)
+      self.assertEqual([line for chunk in read_compressed_chunks(path, chunk_size=1000) for line in chunk], lines)
+
+    # the lines of the BGZF ranges are read exactly once, whichever the block a line starts in
+    path = os.path.join(self.directory, 'access.log.bgz')
+    for block_size in (1000, 2 ** 15, len(data)):
+      write_bgzf(path, data, block_size)
+      self.assertEqual(get_compression(path), 'bgzf')
+      self.assertEqual([line for chunk in read_compressed_chunks(path) for line in chunk], lines)
+      for num_ranges in (1, 3, 50):
+        ranges = split_bgzf(path, num_ranges)
+        self.assertEqual((ranges[0][0], ranges[-1][1]), (0, os.path.getsize(path)))
+        self.assertEqual([line for start, end in ranges for chunk in read_bgzf_chunks(path, start, end)
+                          for line in chunk], lines)
+
+    # blocks ending right at the end of a line, and an incomplete last line
+    write_bgzf(path, b'a\nb\nc\nd', 2)
+    ranges = split_bgzf(path, 4)
+    self.assertEqual(len(ranges), 4)
+    self.assertEqual([line for start, end in ranges for chunk in read_bgzf_chunks(path, start, end)
+                      for line in chunk], ['a', 'b', 'c', 'd'])
+
+  def test_bisect_lines(self):
+    # sorted numbers of various lengths, with a few lines without any key
+    keys = sorted(n * n % 1000 for n in range(500))
+    lines = ['%d %s\n' % (key, 'x' * (key % 7)) for key in keys]
+    lines[10:10] = ['malformed\n'] * 3
+    lines.append('-\n')
+    self.append(''.join(lines))
+    offsets = [0]
+    for line in lines:
+      offsets.append(offsets[-1] + len(line))
+
+    def get_key(line):
+      return int(line.split()[0]) if line[:1].isdigit() else None
+
+    for target in (-1, 0, 1, 250, 500, 501, 998, 999, 1000):
+      offset = bisect_lines(self.path, get_key, target)
+      # the offset is the start of the first line whose key is at least the target
+      index = offsets.index(offset)
+      self.assertTrue(all(get_key(line.encode()) is None or get_key(line.encode()) < target
+                          for line in lines[:index]))
+      self.assertTrue(index == len(lines) - 1 and target > keys[-1] or get_key(lines[index].encode()) >= target)
+      # the search may be limited to a byte range
+      self.assertEqual(bisect_lines(self.path, get_key, target, offsets[100], offsets[400]),
+                       min(max(offset, offsets[100]), offsets[400]))
+
+  def test_read_ahead(self):
+    def produce(put):
+      for i in range(10):
+        put(i)
+      raise ValueError('failed')
+
+    items = read_ahead(produce, 2)
+    self.assertEqual([next(items) for _ in range(10)], list(range(10)))
+    self.assertRaises(ValueError, next, items)
+
+    # closing the generator early stops the producer
+    items = read_ahead(lambda put: all(put(i) for i in range(10 ** 6)), 2)
+    self.assertEqual(next(items), 0)
+    items.close()
@@ -0,0 +1,103 @@
+import os
+import pickle
+import random
+import re
+import tempfile
+import unittest
+
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.test_utils.utils import get_report_dict
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import ParseError
+from logAnalyze.utils.format_compiler import compile_log_format, get_log_format, get_tokenizer
+from logAnalyze.utils.parse_utils import parse, parse_many
+
+COMBINED_LOG = '127.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] "GET /apache_pb.gif HTTP/1.0" 200 2326 ' \
+               '"http://www.example.com/start.html" "Mozilla/4.08 [en] (Win98; I ;Nav)"'
+
+# Compiled log formats, along with a log of every format
+FORMATS_AND_LOGS = (
+  ('%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i"', COMBINED_LOG),
+  ('$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" '
+   '"$http_user_agent" "$http_x_forwarded_for" $request_time',
+   '10.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "GET / HTTP/1.1" 304 0 "-" "curl/7.68.0" "1.2.3.4, 5.6.7.8" 0.004'),
+  ('%v:%p %h %l %u %t \\"%r\\" %>s %O %D', 'www.example.com:443 ::1 - - [10/Oct/2000:13:55:36 -0700] "GET / HTTP/1.1" '
+                                           '200 512 1042'),
+  ('%h|%>s|%r', 'host|404|GET /a b HTTP/1.0'),
+)
+
+
+class TestFormatCompiler(unittest.TestCase):
+  def test_compile_log_format(self):
+    log_format = compile_log_format(FORMATS_AND_LOGS[0][0])
+    self.assertIs(compile_log_format(FORMATS_AND_LOGS[0][0]), log_format)
+    self.assertEqual(log_format.value['fields'], LogFormat.COMBINED.value['fields'])
+    self.assertEqual(parse(log_format, COMBINED_LOG), parse(LogFormat.COMBINED, COMBINED_LOG))
+    self.assertEqual(parse(LogFormat.COMBINED, COMBINED_LOG)['user_agent'], 'Mozilla/4.08 [en] (Win98; I ;Nav)')
+
+    nginx_format = compile_log_format(FORMATS_AND_LOGS[1][0])
+    self.assertEqual(nginx_format.value['fields'], ('host', 'user', 'time', 'request', 'status', 'size', 'referer',
+                                                    'user_agent', 'http_x_forwarded_for', 'request_time'))
+    parsed_log = parse(nginx_format, FORMATS_AND_LOGS[1][1])
+    self.assertEqual((parsed_log['status'], parsed_log['http_x_forwarded_for'], parsed_log['request_time']),
+                     ('304', '1.2.3.4, 5.6.7.8', '0.004'))
+
+    vhost_format = compile_log_format(FORMATS_AND_LOGS[2][0])
+    self.assertEqual(parse(vhost_format, FORMATS_AND_LOGS[2][1])['vhost'], 'www.example.com')
+    self.assertEqual(parse(vhost_format, FORMATS_AND_LOGS[2][1])['host'], '::1')
+
+    self.assertIs(get_log_format('Combined'), LogFormat.COMBINED)
+    self.assertIs(get_log_format(FORMATS_AND_LOGS[0][0]), log_format)
+    # the compiled log formats can be handed over to the parallel workers
+    self.assertIs(pickle.loads(pickle.dumps(log_format)), log_format)
+
+    for invalid_format in ('%h %', 'no fields', '%h %l %{Referer'):
+      self.assertRaises(ParseError, compile_log_format, invalid_format)
+    self.assertRaises(ParseError, parse_many(nginx_format, [], ('identity',)).__next__)
+
+  def test_tokenizer(self):
+    rng = random.Random(3)
+    log_formats = [(LogFormat.CLF, COMBINED_LOG), (LogFormat.COMBINED, COMBINED_LOG)]
+    log_formats += [(compile_log_format(format_string), log) for format_string, log in FORMATS_AND_LOGS]
+    for log_format, log in log_formats:
+      # the timestamps of the mangled logs are not always valid dates
+      fields = tuple(field for field in log_format.value['fields'] if field != 'time')
+      self.assertIsNotNone(get_tokenizer(log_format, fields))
+      match = re.compile(log_format.value['regex']).match
+      # logs mangled around the separators of the fields, some of them with other whitespace than spaces
+      logs = []
+      for _ in range(2000):
+        characters = list(log)
+        for _ in range(rng.randint(0, 3)):
+          position = rng.randrange(len(characters))
+          if rng.getrandbits(1):
+            characters.insert(position, rng.choice(' "[]-:|09a\t'))
+          else:
+            del characters[position]
+        logs.append(''.join(characters) + '\n')
+
+      # the tokenizer falls back to the regex, so the fields are always those of the regex
+      valid_logs = [log for log in logs if match(log) is not None]
+      expected_records = [match(log).group(*fields) for log in valid_logs]
+      for batch in (valid_logs, [log for log in valid_logs if '\t' not in log]):
+        self.assertEqual(list(parse_many(log_format, batch, fields)),
+                         [match(log).group(*fields) for log in batch])
+      self.assertEqual(list(parse_many(log_format, valid_logs, fields[::-1])),
+                       [record[::-1] for record in expected_records])
+
+    # two fields which are not separated by any literal text
+    self.assertIsNone(get_tokenizer(compile_log_format('%h%l %>s'), ('host',)))
+
+  def test_aggregate_file(self):
+    logs, expected_report = logs_and_report()
+    log_format = compile_log_format('%{X-Forwarded-For}i %h %l %u %t "%r" %>s %b "%{User-agent}i"')
+    fd, path = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'w') as log_file:
+      log_file.writelines('1.2.3.4 %s "Mozilla/5.0 (X11)"\n' % log for log in logs)
+    try:
+      for workers, use_mmap in ((1, False), (1, True), (2, False)):
+        reporter = aggregate_file(path, log_format, workers=workers, use_mmap=use_mmap)
+        self.assertEqual(get_report_dict(reporter), expected_report)
+    finally:
+      os.remove(path)
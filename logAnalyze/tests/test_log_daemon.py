@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+
+from logAnalyze.core.log_daemon import LogDaemon, SERVED_REPORTS
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.test_utils.utils import get_report_dict
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.parse_utils import parse_address, parse
+
+
+async def get_json(address, path):
+  reader, writer = await asyncio.open_connection(*address[:2])
+  writer.write(('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path).encode('ascii'))
+  response = await reader.read()
+  writer.close()
+  head, _, body = response.partition(b'\r\n\r\n')
+  return int(head.split()[1]), json.loads(body)
+
+
+async def send_stream(reader_writer, lines):
+  _, writer = await reader_writer
+  # the lines are split at arbitrary positions, as they would be by the network
+  data = ''.join(line + '\r\n' for line in lines).encode('utf-8')
+  for start in range(0, len(data), 1000):
+    writer.write(data[start:start + 1000])
+    await writer.drain()
+  writer.close()
+  await writer.wait_closed()
+
+
+class FailingReportAggregator(ReportAggregator):
+  """
+  A report aggregator failing to aggregate its first batch of logs
+  """
+  failed = False
+
+  def receive_logs(self, records):
+    if not self.failed:
+      self.failed = True
+      raise RuntimeError('Failing batch')
+    super().receive_logs(records)
+
+
+class TestLogDaemon(unittest.TestCase):
+  def test_daemon(self):
+    logs, expected_report = logs_and_report()
+    # a few lines of every input are malformed
+    inputs = [logs[i::3] + ['garbage'] for i in range(3)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+      unix_path = os.path.join(temp_dir, 'logs.sock')
+
+      async def run():
+        # every report is aggregated, to be compared with the expected ones
+        daemon = LogDaemon(reporter=ReportAggregator(reports=EXACT_REPORTS), syslog=True, queue_size=2, batch_size=100)
+        await daemon.start(('127.0.0.1', 0), ('127.0.0.1', 0), unix_path, ('127.0.0.1', 0))
+        try:
+          self.assertEqual(await get_json(daemon.addresses['http'], '/pct'),
+                           (200, {'success_pct': None, 'failed_pct': None}))
+          with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+            for line in inputs[2]:
+              udp_socket.sendto(('<190>Oct 18 12:00:00 web01 nginx: %s\n' % line).encode('utf-8'),
+                                daemon.addresses['udp'])
+              # the datagrams are not dropped as long as the queue has room for them
+              await asyncio.sleep(0.001)
+              while daemon._queue.full():
+                await asyncio.sleep(0.001)
+          # the stream senders are slowed down by the small queue, but none of their logs is lost
+          await asyncio.gather(send_stream(asyncio.open_connection(*daemon.addresses['tcp']), inputs[0]),
+                               send_stream(asyncio.open_unix_connection(unix_path), inputs[1]))
+          # the daemon may not have read the end of the connections yet
+          while daemon.num_logs + daemon.num_dropped < len(logs) + 3:
+            await daemon.flush()
+            await asyncio.sleep(0.01)
+
+          status, top_hosts = await get_json(daemon.addresses['http'], '/top_hosts?n=3')
+          self.assertEqual(status, 200)
+          self.assertEqual(top_hosts, {'top_hosts': [{'host': host.host_name, 'requests': host.get_num_requests()}
+                                                     for host in expected_reporter.get_top_hosts(3)]})
+          _, top_requests = await get_json(daemon.addresses['http'], '/top_requests?n=1000')
+          self.assertEqual(len(top_requests['top_requests']), len(expected_reporter.resource_dict))
+          _, pct = await get_json(daemon.addresses['http'], '/pct')
+          self.assertAlmostEqual(pct['success_pct'], expected_reporter.get_success_pct())
+          _, daemon_status = await get_json(daemon.addresses['http'], '/status')
+          self.assertEqual(daemon_status['logs_received'] + daemon_status['logs_dropped'], len(logs) + 3)
+          self.assertEqual(daemon_status['logs_malformed'], {'format': 3})
+
+          self.assertEqual((await get_json(daemon.addresses['http'], '/top_hosts?n=-1'))[0], 400)
+          self.assertEqual((await get_json(daemon.addresses['http'], '/unknown'))[0], 400)
+          self.assertEqual((await get_json(daemon.addresses['http'], '/top_hosts?n=x'))[0], 400)
+        finally:
+          await daemon.stop()
+        self.assertFalse(os.path.exists(unix_path))
+        return daemon
+
+      expected_reporter = ReportAggregator()
+      for log in logs:
+        expected_reporter.receive_log(parse(LogFormat.CLF, log))
+      daemon = asyncio.run(run())
+    self.assertEqual(daemon.num_dropped, 0)
+    self.assertEqual(get_report_dict(daemon.reporter), expected_report)
+
+  def test_failed_batch(self):
+    logs, _ = logs_and_report()
+
+    async def run():
+      daemon = LogDaemon(reporter=FailingReportAggregator(), batch_size=2)
+      await daemon.start(http_address=('127.0.0.1', 0))
+      try:
+        await daemon._queue.put(logs[:2])
+        await daemon.flush()
+        await daemon._queue.put(logs[2:4])
+        await daemon.flush()
+        # the daemon keeps aggregating the batches following the failed one
+        _, daemon_status = await get_json(daemon.addresses['http'], '/status')
+        self.assertEqual((daemon_status['logs_received'], daemon_status['logs_failed']), (2, 2))
+        self.assertFalse(daemon._consumer.done())
+      finally:
+        await daemon.stop()
+      return daemon
+
+    with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+      daemon = asyncio.run(run())
+    self.assertEqual(daemon.reporter.num_requests_successful + daemon.reporter.num_requests_unsuccessful, 2)
+
+  def test_http_errors(self):
+    async def run():
+      # the top_hosts report is not provided, and the pct one fails
+      daemon = LogDaemon(reporter=ReportAggregator(reports=('pct', 'top_resources')))
+      daemon.reporter.get_success_pct = None
+      await daemon.start(http_address=('127.0.0.1', 0))
+      try:
+        self.assertEqual((await get_json(daemon.addresses['http'], '/top_requests'))[0], 200)
+        self.assertEqual((await get_json(daemon.addresses['http'], '/top_hosts'))[0], 400)
+        self.assertEqual((await get_json(daemon.addresses['http'], '/pct'))[0], 500)
+      finally:
+        await daemon.stop()
+
+    with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+      asyncio.run(run())
+
+  def test_default_reports(self):
+    daemon = LogDaemon()
+    self.assertEqual(daemon.reporter.reports, frozenset(SERVED_REPORTS))
+    self.assertEqual(daemon.reporter.fields, ('host', 'request', 'status'))
+    # every report served over HTTP is provided
+    for name in ('top_hosts', 'top_requests', 'top_failed_requests'):
+      self.assertEqual(daemon.get_report(name, 1), {name: []})
+    self.assertEqual(daemon.get_report('pct'), {'success_pct': None, 'failed_pct': None})
+
+  def test_parse_address(self):
+    self.assertEqual(parse_address('127.0.0.1:8080'), ('127.0.0.1', 8080))
+    self.assertEqual(parse_address('[::1]:514'), ('::1', 514))
+    self.assertEqual(parse_address(':514'), (None, 514))
+    for address in ('localhost', 'localhost:http', 'localhost:70000'):
+      self.assertRaises(ValueError, parse_address, address)
@@ -0,0 +1,122 @@
+import gzip
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from logAnalyze.core.log_processor import aggregate_file, aggregate_files, get_time_range
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.core.rollup_aggregator import RollupAggregator
+from logAnalyze.test_utils.utils import get_report_dict, get_random_int, write_bgzf
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.file_utils import split_file, read_lines, read_chunks
+from logAnalyze.utils.malformed import MalformedLogs
+
+
+class TestLogProcessor(unittest.TestCase):
+  def setUp(self):
+    self.logs, self.expected_report = logs_and_report()
+    fd, self.path = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'w') as log_file:
+      log_file.write('\n'.join(self.logs) + '\n')
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def test_split_file(self):
+    for num_ranges in (1, 2, 7, 100):
+      ranges = split_file(self.path, num_ranges)
+      self.assertLessEqual(len(ranges), num_ranges)
+      # the ranges cover the whole file, and every line is read exactly once
+      self.assertEqual(ranges[0][0], 0)
+      self.assertEqual(ranges[-1][1], os.path.getsize(self.path))
+      lines = []
+      for start, end in ranges:
+        lines.extend(line.rstrip('\n') for line in read_lines(self.path, start, end))
+      self.assertEqual(lines, self.logs)
+
+      lines = []
+      for start, end in ranges:
+        for chunk in read_chunks(self.path, start, end, chunk_size=1000):
+          lines.extend(line.rstrip('\n') for line in chunk)
+      self.assertEqual(lines, self.logs)
+
+  def test_aggregate_file(self):
+    self.assertEqual(get_report_dict(aggregate_file(self.path)), self.expected_report)
+    self.assertEqual(get_report_dict(aggregate_file(self.path, workers=3)), self.expected_report)
+    self.assertEqual(get_report_dict(aggregate_file(self.path, use_mmap=True)), self.expected_report)
+    self.assertEqual(get_report_dict(aggregate_file(self.path, workers=3, use_mmap=True)), self.expected_report)
+
+    # the aggregators only parse the fields of their reports, down to the status alone
+    factory = partial(ReportAggregator, reports=('pct',))
+    for use_mmap in (False, True):
+      reporter = aggregate_file(self.path, use_mmap=use_mmap, aggregator_factory=factory)
+      self.assertEqual(reporter.fields, ('status',))
+      self.assertEqual((reporter.num_requests_successful, reporter.num_requests_unsuccessful),
+                       (self.expected_report['num_requests_successful'],
+                        self.expected_report['num_requests_unsuccessful']))
+
+  def test_aggregate_files(self):
+    # the logs split between a plain file, a gzip file and a BGZF file
+    split = get_random_int(1, len(self.logs) - 2)
+    second_split = get_random_int(split + 1, len(self.logs) - 1)
+    with open(self.path, 'w') as log_file:
+      log_file.write('\n'.join(self.logs[:split]) + '\n')
+    gzip_path = self.path + '.1.gz'
+    bgzf_path = self.path + '.2.gz'
+    try:
+      with gzip.open(gzip_path, 'wt') as log_file:
+        log_file.write('\n'.join(self.logs[split:second_split]) + '\n')
+      write_bgzf(bgzf_path, ('\n'.join(self.logs[second_split:]) + '\n').encode(), 5000)
+
+      paths = [self.path, gzip_path, bgzf_path]
+      self.assertEqual(get_report_dict(aggregate_files(paths)), self.expected_report)
+      self.assertEqual(get_report_dict(aggregate_files(paths, workers=3, use_mmap=True)), self.expected_report)
+      self.assertRaises(ValueError, aggregate_file, gzip_path, start=10)
+    finally:
+      os.remove(gzip_path)
+      os.remove(bgzf_path)
+
+  def test_time_range(self):
+    # a day of logs in time order, except for a few which are up to 30 seconds late, and a few malformed lines
+    rng = random.Random(5)
+    start = datetime(2020, 1, 31, tzinfo=timezone.utc)
+    epochs = sorted(rng.randrange(86400) for _ in range(3000))
+    for i in rng.sample(range(100, len(epochs)), 50):
+      epochs[i] -= rng.randrange(30)
+    lines = ['%s - - [%s] "GET /%d HTTP/1.0" %s 10\n'
+             % (rng.choice('abc'), (start + timedelta(seconds=epoch)).strftime('%d/%b/%Y:%H:%M:%S %z'), epoch % 7,
+                rng.choice(('200', '404')))
+             for epoch in epochs]
+    for i in rng.sample(range(len(lines)), 10):
+      lines[i] = 'malformed\n'
+    gzip_path = self.path + '.gz'
+    with open(self.path, 'w') as log_file:
+      log_file.writelines(lines[:2000])
+    try:
+      with gzip.open(gzip_path, 'wt') as log_file:
+        log_file.writelines(lines[2000:])
+
+      base = int(start.timestamp())
+      for since, until in ((None, base + 3600), (base + 7200, None), (base + 36000, base + 39600),
+                           (base + 36000, base + 36000), (base - 3600, base), (base + 90000, None)):
+        aggregator_factory = partial(RollupAggregator, since, until)
+        expected_reporter = aggregate_files([self.path, gzip_path], aggregator_factory=aggregator_factory,
+                                            malformed=MalformedLogs())
+        for workers in (1, 2):
+          reporter = aggregate_files([self.path, gzip_path], workers=workers, aggregator_factory=aggregator_factory,
+                                     malformed=MalformedLogs(), since=since, until=until, tolerance=30)
+          self.assertEqual(reporter.get_intervals(60), expected_reporter.get_intervals(60))
+          self.assertEqual([(resource.resource_name, resource.num_requests_unsuccessful)
+                            for resource in reporter.get_top_requests()],
+                           [(resource.resource_name, resource.num_requests_unsuccessful)
+                            for resource in expected_reporter.get_top_requests()])
+
+      # only the logs around the time range are read
+      start_offset, end_offset = get_time_range(self.path, since=base + 36000, until=base + 39600, tolerance=30)
+      self.assertLess(end_offset - start_offset, os.path.getsize(self.path) / 10)
+      self.assertEqual(get_time_range(gzip_path, since=base + 36000), (0, None))
+    finally:
+      os.remove(gzip_path)
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stderr
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+
+from logAnalyze.core.approximate_aggregator import ApproximateReportAggregator
+from logAnalyze.utils.custom_exceptions import MalformedLogsError
+
+LOG_READER_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'log_reader')
+
+
+def load_log_reader():
+  """
+  Imports the log_reader script, which has no .py extension, as a module
+  """
+  loader = SourceFileLoader('log_reader', LOG_READER_PATH)
+  module = module_from_spec(spec_from_loader('log_reader', loader))
+  loader.exec_module(module)
+  return module
+
+
+class TestLogReader(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.log_reader = load_log_reader()
+
+  def parse_args(self, *args):
+    return self.log_reader.get_arg_parser().parse_args(['--file', 'access.log'] + list(args))
+
+  def test_approximate_budget(self):
+    args = self.parse_args('--approximate', '--workers', '8', '--memory-budget', '1MB')
+    aggregator_factory = self.log_reader.get_aggregator_factory(args, None)
+    aggregators = [aggregator_factory() for _ in range(args.workers)]
+    for aggregator in aggregators:
+      self.assertIsInstance(aggregator, ApproximateReportAggregator)
+    # every aggregator holds four summaries of the same capacity
+    total_size = sum(4 * aggregator.ENTRY_SIZE * aggregator.hosts.capacity for aggregator in aggregators)
+    self.assertLessEqual(total_size, args.memory_budget)
+    self.assertGreater(total_size, args.memory_budget // 2)
+
+  def test_time_tolerance(self):
+    self.assertEqual(self.parse_args('--since', '2020-01-31', '--time-tolerance', '0').time_tolerance, 0)
+    self.assertEqual(self.parse_args('--since', '2020-01-31', '--time-tolerance', '2m').time_tolerance, 120)
+    with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+      self.assertRaises(SystemExit, self.parse_args, '--time-tolerance', '-1')
+
+  def test_spill_budget(self):
+    args = self.parse_args('--spill', '--workers', '4', '--memory-budget', '1MB')
+    aggregator_factory = self.log_reader.get_aggregator_factory(args, None)
+    self.assertEqual(aggregator_factory().memory_budget, args.memory_budget // 4)
+
+  def test_follow_strict(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      path = os.path.join(temp_dir, 'access.log')
+      open(path, 'w').close()
+
+      def append():
+        with open(path, 'a') as log_file:
+          log_file.write('127.0.0.1 - - [01/Jul/1995:00:00:01 -0400] "GET / HTTP/1.0" 200 100\ngarbage\n')
+
+      # the lines are appended once the file is followed from its end
+      timer = threading.Timer(0.2, append)
+      timer.start()
+      try:
+        args = self.log_reader.get_arg_parser().parse_args(['--file', path, '--follow', '--refresh', '0.05'])
+        # in strict mode, the malformed log stops the run with a MalformedLogsError rather than a ParseError
+        self.assertRaises(MalformedLogsError, self.log_reader.follow, path, args)
+      finally:
+        timer.cancel()
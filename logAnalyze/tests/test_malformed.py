@@ -0,0 +1,85 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.core.rollup_aggregator import RollupAggregator
+from logAnalyze.test_utils.utils import get_report_dict
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import MalformedLogsError, ParseError
+from logAnalyze.utils.malformed import MalformedLogs
+from logAnalyze.utils.parse_utils import parse_many
+
+# The malformed logs inserted among the valid logs, along with the reason for which they are skipped
+MALFORMED_LOGS = (
+  (b'garbage line', 'format'),
+  (b'host1 - - [31/Foo/1995:00:00:00 -0400] "GET /a HTTP/1.0" 200 12', 'time'),
+  (b'host1 - - [01/Jul/1995:00:00:00 -0400] "GET /a HTTP/1.0" 999 12', 'status'),
+  (b'host1 - - [01/Jul/1995:00:00:00 -0400] "GET /\xff\xfe HTTP/1.0" 200 12', 'encoding'),
+)
+
+
+class TestMalformed(unittest.TestCase):
+  def setUp(self):
+    self.logs, self.expected_report = logs_and_report()
+    lines = [log.encode() for log in self.logs]
+    for i, (log, _) in enumerate(MALFORMED_LOGS):
+      lines.insert(i * len(lines) // len(MALFORMED_LOGS), log)
+    self.data = b'\n'.join(lines) + b'\n'
+    fd, self.path = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'wb') as log_file:
+      log_file.write(self.data)
+    self.quarantine_path = self.path + '.quarantine'
+
+  def tearDown(self):
+    for path in (self.path, self.path + '.gz', self.quarantine_path):
+      if os.path.exists(path):
+        os.remove(path)
+
+  def test_aggregate_file(self):
+    with gzip.open(self.path + '.gz', 'wb') as gz_file:
+      gz_file.write(self.data)
+    for path, workers, use_mmap in ((self.path, 1, False), (self.path, 1, True), (self.path, 3, False),
+                                    (self.path, 3, True), (self.path + '.gz', 1, False)):
+      # the undecodable bytes are not escaped in strict mode
+      self.assertRaises((ParseError, UnicodeDecodeError), aggregate_file, path, workers=workers, use_mmap=use_mmap)
+
+      open(self.quarantine_path, 'w').close()
+      malformed = MalformedLogs(self.quarantine_path)
+      reporter = aggregate_file(path, workers=workers, use_mmap=use_mmap, aggregator_factory=RollupAggregator,
+                                malformed=malformed)
+      self.assertEqual(sum(interval.num_requests for interval in reporter.get_intervals(3600)), len(self.logs))
+      self.assertEqual(dict(malformed.counts), {reason: 1 for _, reason in MALFORMED_LOGS})
+      with open(self.quarantine_path, 'rb') as quarantine_file:
+        self.assertEqual(sorted(quarantine_file.read().splitlines()), sorted(log for log, _ in MALFORMED_LOGS))
+
+      # the time is not parsed when the reports do not need it
+      malformed = MalformedLogs()
+      reporter = aggregate_file(path, workers=workers, use_mmap=use_mmap, malformed=malformed)
+      self.assertEqual(dict(malformed.counts), {reason: 1 for _, reason in MALFORMED_LOGS if reason != 'time'})
+      self.assertIn('host1', get_report_dict(reporter)['host_dict'])
+
+  def test_max_errors(self):
+    for workers in (1, 3):
+      malformed = MalformedLogs(max_errors=2)
+      self.assertRaises(MalformedLogsError, aggregate_file, self.path, workers=workers,
+                        aggregator_factory=RollupAggregator, malformed=malformed)
+    malformed = MalformedLogs(max_errors=len(MALFORMED_LOGS))
+    aggregate_file(self.path, aggregator_factory=RollupAggregator, malformed=malformed)
+    self.assertEqual(malformed.get_total(), len(MALFORMED_LOGS))
+
+  def test_parser(self):
+    malformed = MalformedLogs()
+    parse_log = LogFormat.CLF.get_parser(malformed=malformed)
+    for log, reason in MALFORMED_LOGS:
+      self.assertIsNone(parse_log(log.decode('utf-8', 'surrogateescape')))
+      self.assertEqual(malformed.counts[reason], 1)
+    self.assertEqual(parse_log(self.logs[0]), LogFormat.CLF.get_parser()(self.logs[0]))
+
+    logs = [log.decode('utf-8', 'surrogateescape') for log in self.data.splitlines()]
+    malformed = MalformedLogs()
+    self.assertEqual(list(parse_many(LogFormat.CLF, logs, ('host', 'time', 'status'), malformed=malformed)),
+                     list(parse_many(LogFormat.CLF, self.logs, ('host', 'time', 'status'))))
+    self.assertEqual(malformed.get_total(), len(MALFORMED_LOGS))
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from functools import partial
+
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.core.parse_cache import aggregate_cached_files, get_cache_path, is_valid_cache, ParseCache
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.core.rollup_aggregator import RollupAggregator
+from logAnalyze.test_utils.utils import get_report_dict
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.file_utils import map_file
+
+
+class TestParseCache(unittest.TestCase):
+  def setUp(self):
+    self.logs, self.expected_report = logs_and_report()
+    fd, self.path = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'w') as log_file:
+      log_file.write('\n'.join(self.logs) + '\n')
+    self.cache_path = get_cache_path(self.path)
+
+  def tearDown(self):
+    for path in (self.path, self.cache_path):
+      if os.path.exists(path):
+        os.remove(path)
+
+  def test_report(self):
+    self.assertFalse(is_valid_cache(self.cache_path, self.path))
+    self.assertEqual(get_report_dict(aggregate_cached_files([self.path])), self.expected_report)
+    self.assertTrue(is_valid_cache(self.cache_path, self.path))
+    # the second run reads the parse cache
+    self.assertEqual(get_report_dict(aggregate_cached_files([self.path])), self.expected_report)
+    # the logs are counted by the fields read by the report aggregator only
+    reporter = aggregate_cached_files([self.path], aggregator_factory=partial(ReportAggregator, reports=('top_hosts',)))
+    self.assertEqual({host_name: (host.num_requests_successful, host.num_requests_unsuccessful)
+                      for host_name, host in reporter.host_dict.items()},
+                     {host_name: (counts['num_requests_successful'], counts['num_requests_unsuccessful'])
+                      for host_name, counts in self.expected_report['host_dict'].items()})
+
+    with map_file(self.cache_path) as buffer:
+      cache = ParseCache(buffer)
+      try:
+        self.assertEqual(len(cache), len(self.logs))
+        self.assertEqual([cache.host_names[host] for host in cache.hosts], [log.split()[0] for log in self.logs])
+        self.assertEqual(list(cache.sizes), [int(log.rsplit(' ', 1)[1]) for log in self.logs])
+      finally:
+        cache.release()
+
+  def test_rollup_report(self):
+    reporter = aggregate_file(self.path, aggregator_factory=RollupAggregator)
+    intervals = reporter.get_intervals(24 * 60 * 60)
+    since = intervals[len(intervals) // 4].start
+    until = intervals[len(intervals) // 2].start
+    factory = partial(RollupAggregator, since, until)
+    expected_reporter = aggregate_file(self.path, aggregator_factory=factory)
+    cached_reporter = aggregate_cached_files([self.path], aggregator_factory=factory)
+    self.assertEqual(cached_reporter.get_intervals(60), expected_reporter.get_intervals(60))
+    n = len(self.logs)
+    self.assertEqual(sorted(get_counts(cached_reporter.get_top_hosts(n))),
+                     sorted(get_counts(expected_reporter.get_top_hosts(n))))
+    self.assertEqual(sorted(get_counts(cached_reporter.get_top_requests(n))),
+                     sorted(get_counts(expected_reporter.get_top_requests(n))))
+
+  def test_invalidation(self):
+    aggregate_cached_files([self.path])
+    # a log appended to the file, which served no content
+    with open(self.path, 'a') as log_file:
+      log_file.write(self.logs[0].rsplit(' ', 1)[0] + ' -\n')
+    self.assertFalse(is_valid_cache(self.cache_path, self.path))
+    reporter = aggregate_cached_files([self.path], aggregator_factory=partial(ReportAggregator, reports=EXACT_REPORTS))
+    self.assertEqual(reporter.num_requests_successful + reporter.num_requests_unsuccessful, len(self.logs) + 1)
+    self.assertEqual(reporter.num_bytes, sum(int(log.rsplit(' ', 1)[1]) for log in self.logs))
+    with map_file(self.cache_path) as buffer:
+      cache = ParseCache(buffer)
+      try:
+        self.assertEqual(cache.sizes[-1], 0)
+      finally:
+        cache.release()
+
+    # a file rewritten with the same size
+    stat = os.stat(self.path)
+    os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    self.assertFalse(is_valid_cache(self.cache_path, self.path))
+
+
+def get_counts(items):
+  return [(getattr(item, 'host_name', None) or item.resource_name, item.num_requests_successful,
+           item.num_requests_unsuccessful) for item in items]
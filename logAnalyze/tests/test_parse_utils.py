@@ -1,11 +1,13 @@
 import unittest
 from datetime import datetime
 
-from dateutil.tz import tzoffset
+from dateutil import parser
+from dateutil.tz import tzoffset, tzutc
 
 from logAnalyze.utils.constants import LogFormat
 from logAnalyze.utils.custom_exceptions import ParseError
-from logAnalyze.utils.parse_utils import parse
+from logAnalyze.utils.parse_utils import parse, get_datetime_from_clf_date, parse_size, \
+  parse_duration, parse_non_negative_duration, parse_datetime, parse_many
 
 
 class TestParseUtils(unittest.TestCase):
@@ -27,6 +29,98 @@ class TestParseUtils(unittest.TestCase):
     # Perform test by passing non-string log
     self.assertRaises(TypeError, parse, LogFormat.CLF, 123)
 
+  def test_get_parser(self):
+    log, expected_log_dict = get_test_log_record()
+    self.assertEqual(LogFormat.CLF.get_parser()(log), expected_log_dict)
+
+    # only the requested fields are extracted
+    parse_log = LogFormat.CLF.get_parser(['host', 'request', 'status'])
+    self.assertEqual(parse_log(log), {'host': '127.0.0.1', 'request': 'GET /apache_pb.gif HTTP/1.0', 'status': '200'})
+    self.assertEqual(LogFormat.CLF.get_parser(['time'])(log), {'time': expected_log_dict['time']})
+
+    for invalid_log in get_invalid_test_log_records():
+      self.assertRaises(ParseError, parse_log, invalid_log)
+    self.assertRaises(ParseError, LogFormat.CLF.get_parser, ['host', 'referer'])
+
+  def test_parse_many(self):
+    log, expected_log_dict = get_test_log_record()
+    self.assertEqual(list(parse_many(LogFormat.CLF, [log, log])), [tuple(expected_log_dict.values())] * 2)
+    self.assertEqual(list(parse_many(LogFormat.CLF, [log], ['status', 'time', 'host'])),
+                     [('200', expected_log_dict['time'], '127.0.0.1')])
+    self.assertEqual(list(parse_many(LogFormat.CLF, [log], ['request'])), [('GET /apache_pb.gif HTTP/1.0',)])
+    self.assertEqual(list(parse_many(LogFormat.CLF, [])), [])
+
+    for invalid_log in get_invalid_test_log_records():
+      self.assertRaises(ParseError, list, parse_many(LogFormat.CLF, [log, invalid_log]))
+    self.assertRaises(ParseError, list, parse_many('invalid log format', [log]))
+    self.assertRaises(ParseError, list, parse_many(LogFormat.CLF, [log], ['host', 'referer']))
+
+  def test_get_bytes_parser(self):
+    log, expected_log_dict = get_test_log_record()
+    buffer = ('%s\n%s' % (log, log)).encode()
+    self.assertEqual(list(LogFormat.CLF.get_bytes_parser()(buffer)), [expected_log_dict] * 2)
+    self.assertEqual(list(LogFormat.CLF.get_bytes_parser(['time'])(buffer)), [{'time': expected_log_dict['time']}] * 2)
+
+    # only the lines inside the range are parsed
+    parse_logs = LogFormat.CLF.get_bytes_parser(['host', 'status'])
+    self.assertEqual(list(parse_logs(buffer + b'\n', len(log) + 1)), [{'host': '127.0.0.1', 'status': '200'}])
+    self.assertEqual(list(parse_logs(buffer, 0, len(log) + 1)), [{'host': '127.0.0.1', 'status': '200'}])
+    self.assertEqual(list(parse_logs(b'')), [])
+
+    for invalid_log in get_invalid_test_log_records() + ['']:
+      invalid_buffer = ('%s\n%s\n%s\n' % (log, invalid_log, log)).encode()
+      self.assertRaises(ParseError, list, parse_logs(invalid_buffer))
+
+  def test_clf_date(self):
+    dates = ['10/Nov/2000:13:55:36 -0700', '01/Aug/1995:00:01:49 -0400', '29/Feb/2020:23:59:59 +0530',
+             '31/Dec/1999:00:00:00 +0000', '05/Jan/2021:07:08:09 -1230']
+    for date in dates:
+      dt = get_datetime_from_clf_date(date)
+      self.assertEqual(dt, parser.parse(date.replace(':', ' ', 1)))
+      self.assertEqual(dt.utcoffset(), parser.parse(date.replace(':', ' ', 1)).utcoffset())
+
+    # the tzinfo objects are shared between timestamps with the same offset
+    first = get_datetime_from_clf_date('10/Nov/2000:13:55:36 -0700')
+    second = get_datetime_from_clf_date('11/Nov/2000:13:55:36 -0700')
+    self.assertIs(first.tzinfo, second.tzinfo)
+    self.assertEqual(get_datetime_from_clf_date('31/Dec/1999:00:00:00 +0000').tzinfo, tzutc())
+
+    # dates not following the fixed layout fall back to dateutil
+    self.assertEqual(get_datetime_from_clf_date('10/Nov/2000:13:55:36'), datetime(2000, 11, 10, 13, 55, 36))
+    self.assertEqual(get_datetime_from_clf_date('1/Nov/2000:13:55:36 -0700'),
+                     datetime(2000, 11, 1, 13, 55, 36, tzinfo=tzoffset(None, -25200)))
+    self.assertRaises(ValueError, get_datetime_from_clf_date, '31/Feb/2000:13:55:36 -0700')
+
+  def test_parse_size(self):
+    self.assertEqual(parse_size('4096'), 4096)
+    self.assertEqual(parse_size('256MB'), 256 * 2 ** 20)
+    self.assertEqual(parse_size('1.5g'), 3 * 2 ** 29)
+    self.assertEqual(parse_size('64 K'), 64 * 2 ** 10)
+    for size in ['', 'MB', '12 parsecs', '-1']:
+      self.assertRaises(ValueError, parse_size, size)
+
+  def test_parse_duration(self):
+    self.assertEqual(parse_duration('30'), 30)
+    self.assertEqual(parse_duration('5m'), 300)
+    self.assertEqual(parse_duration('1.5h'), 5400)
+    self.assertEqual(parse_duration('2 d'), 172800)
+    for duration in ['', 'm', '0s', '5 fortnights', '-1']:
+      self.assertRaises(ValueError, parse_duration, duration)
+
+  def test_parse_non_negative_duration(self):
+    self.assertEqual(parse_non_negative_duration('0'), 0)
+    self.assertEqual(parse_non_negative_duration('0s'), 0)
+    self.assertEqual(parse_non_negative_duration('5m'), 300)
+    for duration in ['', 'm', '5 fortnights', '-1']:
+      self.assertRaises(ValueError, parse_non_negative_duration, duration)
+
+  def test_parse_datetime(self):
+    expected_datetime = datetime(2000, 11, 10, 13, 55, 36, tzinfo=tzoffset(None, -25200))
+    self.assertEqual(parse_datetime('10/Nov/2000:13:55:36 -0700'), expected_datetime)
+    self.assertEqual(parse_datetime('2000-11-10T13:55:36-07:00'), expected_datetime)
+    self.assertEqual(parse_datetime('2000-11-10 20:55:36'), expected_datetime)
+    self.assertRaises(ValueError, parse_datetime, 'yesterday')
+
 
 def get_test_log_record():
   log = '127.0.0.1 user-identifier frank [10/Nov/2000:13:55:36 -0700] "GET /apache_pb.gif HTTP/1.0" 200 2326'
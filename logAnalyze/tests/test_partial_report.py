@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+from logAnalyze.core.compact_aggregator import CompactReportAggregator
+from logAnalyze.core.partial_report import (write_partial_report, read_partial_report, combine_partial_reports,
+                                            encode_integers, decode_integers, HEADER, PARTIAL_MAGIC)
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.test_utils.utils import get_random_int
+from logAnalyze.tests.test_compact_aggregator import get_counts, get_histograms
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import PartialReportError
+from logAnalyze.utils.parse_utils import parse, parse_many
+
+
+class TestPartialReport(unittest.TestCase):
+  def setUp(self):
+    self.logs, self.expected_report = logs_and_report()
+    self.temp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def write_partials(self, reporters):
+    """
+    Writes the partial reports of report aggregators receiving consecutive parts of the logs
+    """
+    splits = sorted(get_random_int(1, len(self.logs) - 1) for _ in range(len(reporters) - 1))
+    paths = []
+    for i, (reporter, start, end) in enumerate(zip(reporters, [0] + splits, splits + [len(self.logs)])):
+      reporter.receive_logs(parse_many(LogFormat.CLF, self.logs[start:end], reporter.fields))
+      paths.append(os.path.join(self.temp_dir.name, 'node%d.bin' % i))
+      write_partial_report(paths[-1], reporter)
+    return paths
+
+  def assertSameReports(self, reporter, expected_reporter):
+    num_hosts, num_resources = len(self.expected_report['host_dict']), len(self.expected_report['resource_dict'])
+    self.assertEqual(reporter.get_cardinality(), (num_hosts, num_resources))
+    self.assertEqual(reporter.get_success_pct(), expected_reporter.get_success_pct())
+    self.assertEqual(reporter.get_status_counts(), expected_reporter.get_status_counts())
+    self.assertEqual(reporter.get_mean_bytes(), expected_reporter.get_mean_bytes())
+    top_hosts = reporter.get_top_hosts(num_hosts)
+    self.assertEqual(get_histograms(top_hosts), get_histograms(expected_reporter.get_top_hosts(num_hosts)))
+    self.assertEqual({host.host_name: sorted(get_counts(host.resource_dict.values())) for host in top_hosts},
+                     {host.host_name: sorted(get_counts(host.resource_dict.values()))
+                      for host in expected_reporter.host_dict.values()})
+    for getter in ('get_top_requests', 'get_top_unsuccessful_requests', 'get_top_requests_by_bytes'):
+      self.assertEqual(get_histograms(getattr(reporter, getter)(num_resources)),
+                       get_histograms(getattr(expected_reporter, getter)(num_resources)))
+
+  def test_combine(self):
+    expected_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log in self.logs:
+      expected_reporter.receive_log(parse(LogFormat.CLF, log))
+
+    # the partial reports of report aggregators and of compact ones can be combined together
+    paths = self.write_partials([ReportAggregator(reports=EXACT_REPORTS), ReportAggregator(reports=EXACT_REPORTS),
+                                 CompactReportAggregator()])
+    reports, reporter = combine_partial_reports(paths)
+    self.assertEqual(reports, sorted(EXACT_REPORTS))
+    self.assertSameReports(reporter, expected_reporter)
+
+    # the combined counters are written again, eg. to be combined with the ones of another data center
+    path = os.path.join(self.temp_dir.name, 'combined.bin')
+    write_partial_report(path, reporter, reports)
+    reports, reporter = read_partial_report(path)
+    self.assertEqual(reports, sorted(EXACT_REPORTS))
+    self.assertSameReports(reporter, expected_reporter)
+
+  def test_reports(self):
+    # the resources requested by the hosts are stored without the counters of the resources
+    expected_reporter = ReportAggregator(reports=('top_resources_per_host',))
+    for log in self.logs:
+      expected_reporter.receive_log(parse(LogFormat.CLF, log))
+    paths = self.write_partials([ReportAggregator(reports=('top_resources_per_host',)) for _ in range(2)])
+    reports, reporter = combine_partial_reports(paths)
+    self.assertEqual(reports, ['top_hosts', 'top_resources_per_host'])
+    num_hosts = len(self.expected_report['host_dict'])
+    top_hosts = reporter.get_top_hosts(num_hosts)
+    self.assertEqual(get_counts(top_hosts), get_counts(expected_reporter.get_top_hosts(num_hosts)))
+    self.assertEqual({host.host_name: sorted(get_counts(host.resource_dict.values())) for host in top_hosts},
+                     {host.host_name: sorted(get_counts(host.resource_dict.values()))
+                      for host in expected_reporter.host_dict.values()})
+
+    # the partial reports of different reports cannot be combined
+    path = os.path.join(self.temp_dir.name, 'pct.bin')
+    write_partial_report(path, ReportAggregator(reports=('pct',)))
+    self.assertRaises(PartialReportError, combine_partial_reports, paths + [path])
+    self.assertRaises(PartialReportError, write_partial_report, path, ReportAggregator(reports=('unique_visitors',)))
+
+  def test_invalid_files(self):
+    path, = self.write_partials([ReportAggregator()])
+    with open(path, 'rb') as partial_file:
+      data = partial_file.read()
+    invalid_path = os.path.join(self.temp_dir.name, 'invalid.bin')
+    for invalid_data in (b'', b'LACACHE\0' + data[8:], PARTIAL_MAGIC + b'\x02' + data[9:], data[:HEADER.size + 10],
+                         data[:HEADER.size] + bytes(len(data) - HEADER.size)):
+      with open(invalid_path, 'wb') as partial_file:
+        partial_file.write(invalid_data)
+      self.assertRaises(PartialReportError, read_partial_report, invalid_path)
+
+  def test_integers(self):
+    # the narrowest type holding all the integers is used
+    for values, typecode in (([], 'B'), ([0, 255, 3], 'B'), ([256, 1], 'H'), ([2 ** 32 - 1], 'I'),
+                             ([2 ** 64 - 1], 'Q')):
+      data = encode_integers(values)
+      self.assertEqual(data[:1], typecode.encode('ascii'))
+      self.assertEqual(list(decode_integers(data)), values)
+    self.assertRaises(ValueError, decode_integers, b'')
+    self.assertRaises(ValueError, decode_integers, b'H\x00')
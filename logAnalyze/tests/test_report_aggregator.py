@@ -1,11 +1,14 @@
+import pickle
 import unittest
+from collections import Counter
 
-from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.core.report_aggregator import ReportAggregator, REPORTS, EXACT_REPORTS, get_report_fields
 from logAnalyze.test_utils.utils import get_random_int, get_random_host, get_random_status, \
-  get_random_element, get_clf_log, get_top_requests, get_random_string
+  get_random_element, get_clf_log, get_top_requests, get_random_string, get_report_dict
 from logAnalyze.utils.constants import LogFormat
-from logAnalyze.utils.custom_exceptions import StatusError
-from logAnalyze.utils.parse_utils import parse
+from logAnalyze.utils.custom_exceptions import ReportError, StatusError
+from logAnalyze.utils.request_utils import RequestNormalizer
+from logAnalyze.utils.parse_utils import get_num_bytes, parse, parse_many
 
 
 class TestReportAggregator(unittest.TestCase):
@@ -58,6 +61,193 @@ class TestReportAggregator(unittest.TestCase):
         self.assertEqual(expected_top_resources_per_host[i]['name'], req.resource_name)
         self.assertEqual(expected_top_resources_per_host[i]['num'], req.get_num_requests())
 
+  def test_top_ties(self):
+    reporter = ReportAggregator()
+    for host, request in [('b', '/x'), ('a', '/y'), ('c', '/x'), ('a', '/z'), ('b', '/z'), ('c', '/y')]:
+      reporter.receive_log({'host': host, 'request': request, 'status': '404', 'size': '-'})
+
+    # the ties are broken by the name, in reverse order
+    self.assertEqual([host.host_name for host in reporter.get_top_hosts(2)], ['c', 'b'])
+    self.assertEqual([resource.resource_name for resource in reporter.get_top_requests(5)], ['/z', '/y', '/x'])
+    self.assertEqual([resource.resource_name for resource in reporter.get_top_unsuccessful_requests(1)], ['/z'])
+    self.assertEqual([resource.resource_name for resource in reporter.host_dict['a'].get_top_requests(1)], ['/z'])
+
+  def test_receive_logs(self):
+    logs, expected_report = logs_and_report()
+    split = get_random_int(1, len(logs) - 1)
+
+    # the batches give the same counters as the logs received one by one
+    reporter = ReportAggregator(reports=EXACT_REPORTS)
+    reporter.receive_logs(parse_many(LogFormat.CLF, logs[:split], reporter.fields))
+    reporter.receive_logs(parse_many(LogFormat.CLF, logs[split:], reporter.fields))
+    self.assertEqual(get_report_dict(reporter), expected_report)
+
+    reporter.receive_logs([])
+    self.assertEqual(get_report_dict(reporter), expected_report)
+    self.assertRaises(StatusError, reporter.receive_logs, [('host', 'request', '888', '12')])
+
+    # a batch with an unidentifiable status is not counted at all, its other logs included
+    histograms = get_histograms(reporter)
+    self.assertRaises(StatusError, reporter.receive_logs, [('host', '/request', '200', '12'),
+                                                           ('host', '/request', '888', '12')])
+    self.assertEqual(get_report_dict(reporter), expected_report)
+    self.assertEqual(get_histograms(reporter), histograms)
+
+  def test_merge(self):
+    logs, expected_report = logs_and_report()
+    split = get_random_int(1, len(logs) - 1)
+
+    reporter = ReportAggregator()
+    for log in logs[:split]:
+      reporter.receive_log(parse(LogFormat.CLF, log))
+    other_reporter = ReportAggregator()
+    for log in logs[split:]:
+      other_reporter.receive_log(parse(LogFormat.CLF, log))
+
+    reporter.merge(other_reporter)
+    self.assertEqual(get_report_dict(reporter), expected_report)
+
+  def test_subtract(self):
+    logs, expected_report = logs_and_report()
+    split = get_random_int(1, len(logs) - 1)
+
+    reporter = ReportAggregator()
+    other_reporter = ReportAggregator()
+    for i, log in enumerate(logs):
+      reporter.receive_log(parse(LogFormat.CLF, log))
+      if i >= split:
+        other_reporter.receive_log(parse(LogFormat.CLF, log))
+      else:
+        # logs which are subtracted completely should leave no trace
+        reporter.receive_log({'host': 'subtracted', 'request': 'subtracted', 'status': '200', 'size': '12'})
+        other_reporter.receive_log({'host': 'subtracted', 'request': 'subtracted', 'status': '200', 'size': '12'})
+
+    reporter.subtract(other_reporter)
+    expected_reporter = ReportAggregator()
+    for log in logs[:split]:
+      expected_reporter.receive_log(parse(LogFormat.CLF, log))
+    self.assertEqual(get_report_dict(reporter), get_report_dict(expected_reporter))
+
+  def test_status_counts_and_bytes(self):
+    logs, _ = logs_and_report()
+    log_dicts = [parse(LogFormat.CLF, log) for log in logs]
+    # a response without any body
+    log_dicts.append({'host': 'empty', 'request': 'empty', 'status': '304', 'size': '-'})
+    expected_status_counts = Counter(log_dict['status'] for log_dict in log_dicts)
+    host_bytes = Counter()
+    resource_bytes = Counter()
+    for log_dict in log_dicts:
+      host_bytes[log_dict['host']] += get_num_bytes(log_dict['size'])
+      resource_bytes[log_dict['request']] += get_num_bytes(log_dict['size'])
+
+    reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log_dict in log_dicts:
+      reporter.receive_log(log_dict)
+    batch_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    batch_reporter.receive_logs(tuple(log_dict[field] for field in batch_reporter.fields) for log_dict in log_dicts)
+
+    for tested_reporter in (reporter, batch_reporter):
+      self.assertEqual(tested_reporter.get_status_counts(), dict(sorted(expected_status_counts.items())))
+      self.assertEqual(tested_reporter.num_bytes, sum(host_bytes.values()))
+      self.assertAlmostEqual(tested_reporter.get_mean_bytes(), tested_reporter.num_bytes / len(log_dicts))
+      for host in tested_reporter.host_dict.values():
+        self.assertEqual(host.num_bytes, host_bytes[host.host_name])
+        self.assertEqual(sum(host.status_counts.values()), host.get_num_requests())
+      for resource in tested_reporter.resource_dict.values():
+        self.assertEqual(resource.num_bytes, resource_bytes[resource.resource_name])
+        self.assertEqual(sum(resource.status_counts.values()), resource.get_num_requests())
+      self.assertEqual(tested_reporter.host_dict['empty'].status_counts, {'304': 1})
+
+      top_resources = tested_reporter.get_top_requests_by_bytes(5)
+      self.assertEqual([(resource.resource_name, resource.num_bytes) for resource in top_resources],
+                       sorted(resource_bytes.items(), key=lambda item: (item[1], item[0]), reverse=True)[:5])
+
+    # the histograms and bytes are merged and subtracted along with the other counters
+    split = get_random_int(1, len(log_dicts) - 1)
+    first_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log_dict in log_dicts[:split]:
+      first_reporter.receive_log(log_dict)
+    second_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log_dict in log_dicts[split:]:
+      second_reporter.receive_log(log_dict)
+    first_reporter.merge(second_reporter)
+    self.assertEqual(get_histograms(first_reporter), get_histograms(reporter))
+    reporter.subtract(second_reporter)
+    expected_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log_dict in log_dicts[:split]:
+      expected_reporter.receive_log(log_dict)
+    self.assertEqual(get_histograms(reporter), get_histograms(expected_reporter))
+
+  def test_reports(self):
+    logs, _ = logs_and_report()
+    log_dicts = [parse(LogFormat.CLF, log) for log in logs]
+    split = get_random_int(1, len(log_dicts) - 1)
+    getters = {
+      'pct': lambda reporter: reporter.get_success_pct(),
+      'status_codes': lambda reporter: (reporter.get_status_counts(), reporter.get_mean_bytes()),
+      'top_hosts': lambda reporter: [(host.host_name, host.get_num_requests()) for host in reporter.get_top_hosts(5)],
+      'top_resources_per_host': lambda reporter: [[(resource.resource_name, resource.get_num_requests())
+                                                   for resource in host.get_top_requests(3)]
+                                                  for host in reporter.get_top_hosts(5)],
+      'top_resources': lambda reporter: [(resource.resource_name, resource.get_num_requests())
+                                         for resource in reporter.get_top_requests(5)],
+      'top_failed_resources': lambda reporter: [(resource.resource_name, resource.num_requests_unsuccessful)
+                                                for resource in reporter.get_top_unsuccessful_requests(5)],
+      'top_resources_by_bytes': lambda reporter: [(resource.resource_name, resource.num_bytes)
+                                                  for resource in reporter.get_top_requests_by_bytes(5)],
+    }
+    for normalizer in (None, RequestNormalizer('path')):
+      expected_reporter = ReportAggregator(normalizer, EXACT_REPORTS)
+      for log_dict in log_dicts:
+        expected_reporter.receive_log(log_dict)
+
+      for reports in [(), ('pct',), ('status_codes', 'top_failed_resources'), ('top_hosts',),
+                      ('status_codes', 'top_hosts'),
+                      ('top_resources_per_host',), ('top_resources', 'top_resources_per_host'), REPORTS]:
+        reporter = ReportAggregator(normalizer, reports)
+        for log_dict in log_dicts[:split]:
+          reporter.receive_log(log_dict)
+        # the aggregators of the parallel workers are pickled along with their reports
+        other_reporter = pickle.loads(pickle.dumps(ReportAggregator(normalizer, reports)))
+        other_reporter.receive_logs(tuple(log_dict[field] for field in other_reporter.fields)
+                                    for log_dict in log_dicts[split:])
+        reporter.merge(other_reporter)
+
+        for report, get_report in getters.items():
+          if report in reporter.reports:
+            self.assertEqual(get_report(reporter), get_report(expected_reporter))
+          else:
+            self.assertRaises(ReportError, get_report, reporter)
+        self.assertTrue(set(reports) <= reporter.reports)
+        # the status codes and bytes of the hosts and resources are only counted along with the statuses
+        for dimension, name in (('hosts', 'host_dict'), ('resources', 'resource_dict')):
+          counters = {key: (value.status_counts, value.num_bytes) for key, value in getattr(reporter, name).items()}
+          if 'statuses' in reporter.dimensions and dimension in reporter.dimensions:
+            self.assertEqual(counters, {key: (value.status_counts, value.num_bytes)
+                                        for key, value in getattr(expected_reporter, name).items()})
+          else:
+            self.assertTrue(all(counter == ({}, 0) for counter in counters.values()))
+        if 'top_hosts' not in reporter.reports:
+          self.assertEqual(reporter.host_dict, {})
+        self.assertRaises(ReportError, reporter.merge, ReportAggregator(normalizer, ('pct', 'top_hosts')))
+
+    self.assertRaises(ValueError, ReportAggregator, reports=('top_hosts', 'unknown'))
+    reporter = ReportAggregator(reports=('pct',))
+    self.assertRaises(StatusError, reporter.receive_log, {'host': 'a', 'request': 'b', 'status': '888', 'size': '1'})
+    self.assertRaises(StatusError, reporter.receive_logs, [('888',)])
+
+    # the aggregators only read the fields of their reports
+    for reports, fields in (((), ('status',)), (('status_codes',), ('status', 'size')),
+                            (('top_hosts',), ('host', 'status')), (('top_resources',), ('request', 'status')),
+                            (('top_resources_by_bytes',), ('request', 'status', 'size')),
+                            (('top_resources_per_host',), ('host', 'request', 'status')),
+                            (('unique_visitors',), ('host', 'request', 'status')), (REPORTS, ReportAggregator.fields)):
+      self.assertEqual(ReportAggregator(reports=reports).fields, fields)
+      self.assertEqual(get_report_fields(reports), fields)
+    # the status codes and bytes are only counted when their reports are asked for
+    self.assertEqual(ReportAggregator().fields, ('host', 'request', 'status'))
+    self.assertNotIn('statuses', ReportAggregator().dimensions)
+
   def test_status_error(self):
     log = get_clf_log(get_random_host, get_random_string(10), '888')  # pass an invalid status
     reporter = ReportAggregator()
@@ -65,6 +255,15 @@ class TestReportAggregator(unittest.TestCase):
     self.assertRaises(StatusError, reporter.receive_log, log_dict)
 
 
+def get_histograms(reporter):
+  """
+  The status code histograms and bytes served of a report aggregator, globally and per host and resource
+  """
+  return (reporter.get_status_counts(), reporter.num_bytes,
+          {host_name: (host.status_counts, host.num_bytes) for host_name, host in reporter.host_dict.items()},
+          {name: (resource.status_counts, resource.num_bytes) for name, resource in reporter.resource_dict.items()})
+
+
 def logs_and_report():
   host_num = get_random_int(25, 50)
   hosts = []  # list of hosts that would fire request
@@ -0,0 +1,88 @@
+import pickle
+import random
+import unittest
+from datetime import datetime, timezone
+
+from logAnalyze.core.approximate_aggregator import ApproximateReportAggregator
+from logAnalyze.core.compact_aggregator import CompactReportAggregator
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.core.rollup_aggregator import RollupAggregator
+from logAnalyze.core.windowed_aggregator import WindowedReportAggregator
+from logAnalyze.test_utils.utils import get_random_path, get_random_host
+from logAnalyze.utils.request_utils import RequestNormalizer, split_request
+
+
+def get_top_requests(reporter):
+  if isinstance(reporter, ApproximateReportAggregator):
+    return sorted((resource.name, resource.count) for resource in reporter.get_top_requests(1000))
+  return sorted((resource.resource_name, resource.get_num_requests()) for resource in reporter.get_top_requests(1000))
+
+
+class TestRequestUtils(unittest.TestCase):
+  def test_split_request(self):
+    self.assertEqual(split_request('GET /images/rollout.gif HTTP/1.0'), ('GET', '/images/rollout.gif', 'HTTP/1.0'))
+    self.assertEqual(split_request('GET /a b.html HTTP/1.1'), ('GET', '/a b.html', 'HTTP/1.1'))
+    self.assertEqual(split_request('GET /index.html'), ('GET', '/index.html', ''))
+    self.assertEqual(split_request('-'), ('', '-', ''))
+
+  def test_normalize(self):
+    request = 'GET /users/42/posts/7%20x;v=1?page=2#top HTTP/1.1'
+    self.assertEqual(RequestNormalizer().normalize(request), request)
+    self.assertEqual(RequestNormalizer('method_path').normalize(request), 'GET /users/42/posts/7%20x;v=1?page=2#top')
+    self.assertEqual(RequestNormalizer('path', strip_query=True).normalize(request), '/users/42/posts/7%20x;v=1')
+    self.assertEqual(RequestNormalizer('path', True, collapse_ids=True).normalize(request),
+                     '/users/{id}/posts/7%20x;v=1')
+    self.assertEqual(RequestNormalizer('method_path', True, True, url_decode=True).normalize(request),
+                     'GET /users/{id}/posts/7 x;v=1')
+    self.assertEqual(RequestNormalizer('request', collapse_ids=True).normalize('POST /items/3;edit HTTP/1.0'),
+                     'POST /items/{id};edit HTTP/1.0')
+    self.assertEqual(RequestNormalizer('method_path').normalize('-'), '-')
+    self.assertRaises(ValueError, RequestNormalizer, 'host')
+
+    # the request lines sharing a normalized name share the same string as well
+    normalizer = RequestNormalizer('path', strip_query=True)
+    name = normalizer.normalize('GET /index.html?a=1 HTTP/1.0')
+    self.assertIs(normalizer.normalize(''.join(['HEAD /index.html', ' HTTP/1.1'])), name)
+    normalizer = pickle.loads(pickle.dumps(normalizer))
+    self.assertEqual((normalizer.group_by, normalizer.strip_query, normalizer._names), ('path', True, {}))
+
+  def test_aggregators(self):
+    paths = [get_random_path() for _ in range(20)]
+    hosts = [get_random_host() for _ in range(10)]
+    methods = ('GET', 'POST', 'HEAD')
+    records = []
+    for _ in range(2000):
+      request = '%s %s/%d?q=%d %s' % (random.choice(methods), random.choice(paths), random.randrange(5),
+                                      random.randrange(100), random.choice(('HTTP/1.0', 'HTTP/1.1')))
+      records.append((random.choice(hosts), request, random.choice(('200', '304', '404')), str(random.randrange(10)),
+                      datetime.fromtimestamp(1e9 + random.randrange(100), timezone.utc)))
+
+    normalizer = RequestNormalizer('path', strip_query=True, collapse_ids=True)
+    expected_reporter = ReportAggregator()
+    expected_reporter.receive_logs((host, normalizer.get_name(request), status, size)
+                                   for host, request, status, size, _ in records)
+    expected_requests = get_top_requests(expected_reporter)
+    self.assertEqual(len(expected_requests), len(paths))
+
+    reporters = [ReportAggregator(normalizer), CompactReportAggregator(normalizer),
+                 ApproximateReportAggregator(normalizer=normalizer), RollupAggregator(normalizer=normalizer)]
+    for reporter in reporters:
+      reporter.receive_logs(record[:len(reporter.fields)] for record in records[:1000])
+      for record in records[1000:]:
+        reporter.receive_log(dict(zip(reporter.fields, record)))
+      self.assertEqual(get_top_requests(reporter), expected_requests)
+
+    windowed_reporter = WindowedReportAggregator(1000, normalizer=normalizer)
+    windowed_reporter.receive_logs(records)
+    self.assertEqual(get_top_requests(windowed_reporter), expected_requests)
+
+    # the hosts share the names of the resources of the report aggregator, even across merges
+    reporter = ReportAggregator(normalizer)
+    for other_records in (records[:1000], records[1000:]):
+      other_reporter = pickle.loads(pickle.dumps(ReportAggregator(normalizer)))
+      other_reporter.receive_logs(record[:4] for record in other_records)
+      reporter.merge(pickle.loads(pickle.dumps(other_reporter)))
+    self.assertEqual(get_top_requests(reporter), expected_requests)
+    for host in reporter.host_dict.values():
+      for resource_name in host.resource_dict:
+        self.assertIs(resource_name, reporter.resource_dict[resource_name].resource_name)
@@ -0,0 +1,109 @@
+import unittest
+from collections import Counter
+
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.core.rollup_aggregator import RollupAggregator
+from logAnalyze.test_utils.utils import get_random_int, get_random_host, get_random_string, get_clf_log
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import StatusError
+from logAnalyze.utils.parse_utils import parse
+
+
+class TestRollupAggregator(unittest.TestCase):
+  def setUp(self):
+    logs, _ = logs_and_report()
+    self.log_dicts = [parse(LogFormat.CLF, log) for log in logs]
+    self.epochs = sorted(int(log_dict['time'].timestamp()) for log_dict in self.log_dicts)
+
+  def get_expected_reporter(self, since=None, until=None):
+    reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log_dict in self.log_dicts:
+      epoch = int(log_dict['time'].timestamp())
+      if (since is None or epoch >= since) and (until is None or epoch < until):
+        reporter.receive_log(log_dict)
+    return reporter
+
+  def assert_same_reports(self, reporter, expected_reporter, since=None, until=None):
+    x = get_random_int(5, 15)
+    self.assertAlmostEqual(reporter.get_success_pct(since, until), expected_reporter.get_success_pct())
+    self.assertEqual(get_counts(reporter.get_top_requests(x, since, until)),
+                     get_counts(expected_reporter.get_top_requests(x)))
+    self.assertEqual(get_counts(reporter.get_top_unsuccessful_requests(x, since, until)),
+                     get_counts(expected_reporter.get_top_unsuccessful_requests(x)))
+    top_hosts = reporter.get_top_hosts(x, since, until)
+    expected_top_hosts = expected_reporter.get_top_hosts(x)
+    self.assertEqual(get_counts(top_hosts), get_counts(expected_top_hosts))
+    for host, expected_host in zip(top_hosts, expected_top_hosts):
+      self.assertEqual(get_counts(host.get_top_requests(x)), get_counts(expected_host.get_top_requests(x)))
+      self.assertEqual((host.status_counts, host.num_bytes), (expected_host.status_counts, expected_host.num_bytes))
+    self.assertEqual(reporter.get_status_counts(since, until), expected_reporter.get_status_counts())
+    self.assertAlmostEqual(reporter.get_mean_bytes(since, until), expected_reporter.get_mean_bytes())
+    self.assertEqual([(resource.resource_name, resource.status_counts, resource.num_bytes)
+                      for resource in reporter.get_top_requests_by_bytes(x, since, until)],
+                     [(resource.resource_name, resource.status_counts, resource.num_bytes)
+                      for resource in expected_reporter.get_top_requests_by_bytes(x)])
+
+  def test_report(self):
+    reporter = RollupAggregator()
+    reporter.BATCH_SIZE = 100
+    for log_dict in self.log_dicts:
+      reporter.receive_log(log_dict)
+    self.assert_same_reports(reporter, self.get_expected_reporter())
+
+    # reports for a time range
+    since = self.epochs[len(self.epochs) // 4]
+    until = self.epochs[len(self.epochs) // 2]
+    self.assert_same_reports(reporter, self.get_expected_reporter(since, until), since, until)
+
+    # the logs outside the range of the aggregator are not kept at all
+    range_reporter = RollupAggregator(since, until)
+    for log_dict in self.log_dicts:
+      range_reporter.receive_log(log_dict)
+    self.assert_same_reports(range_reporter, self.get_expected_reporter(since, until))
+
+  def test_intervals(self):
+    reporter = RollupAggregator()
+    for log_dict in self.log_dicts:
+      reporter.receive_log(log_dict)
+
+    interval = 7 * 24 * 60 * 60
+    num_requests = Counter()
+    num_requests_unsuccessful = Counter()
+    for log_dict in self.log_dicts:
+      start = int(log_dict['time'].timestamp()) // interval * interval
+      num_requests[start] += 1
+      if not ReportAggregator.is_success(log_dict['status']):
+        num_requests_unsuccessful[start] += 1
+
+    intervals = reporter.get_intervals(interval)
+    self.assertEqual([interval.start for interval in intervals], sorted(num_requests))
+    for start, count, unsuccessful_count in intervals:
+      self.assertEqual(count, num_requests[start])
+      self.assertEqual(unsuccessful_count, num_requests_unsuccessful[start])
+
+    since = self.epochs[len(self.epochs) // 2]
+    self.assertEqual(sum(interval.num_requests for interval in reporter.get_intervals(60, since)),
+                     sum(1 for epoch in self.epochs if epoch >= since))
+
+  def test_merge(self):
+    split = get_random_int(1, len(self.log_dicts) - 1)
+    reporter = RollupAggregator()
+    for log_dict in self.log_dicts[:split]:
+      reporter.receive_log(log_dict)
+    other_reporter = RollupAggregator()
+    for log_dict in self.log_dicts[split:]:
+      other_reporter.receive_log(log_dict)
+    reporter.merge(other_reporter)
+    self.assert_same_reports(reporter, self.get_expected_reporter())
+
+  def test_status_error(self):
+    reporter = RollupAggregator()
+    for status in ['888', '099']:
+      log_dict = parse(LogFormat.CLF, get_clf_log(get_random_host(), get_random_string(10), status))
+      self.assertRaises(StatusError, reporter.receive_log, log_dict)
+
+
+def get_counts(items):
+  return [(getattr(item, 'host_name', None) or item.resource_name, item.num_requests_successful,
+           item.num_requests_unsuccessful) for item in items]
@@ -0,0 +1,129 @@
+import os
+import pickle
+import tempfile
+import unittest
+from functools import partial
+
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.core.spilling_aggregator import SpillingReportAggregator, MERGE_FAN_IN
+from logAnalyze.test_utils.utils import get_random_int
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.parse_utils import parse, parse_many
+from logAnalyze.utils.request_utils import RequestNormalizer
+
+
+def get_reports(reporter, n=10 ** 6):
+  """
+  Lists all the hosts and resources of a report aggregator in the order of its reports, with all their counters
+  """
+  def get_counters(item):
+    return (item.num_requests_successful, item.num_requests_unsuccessful, item.num_bytes, item.status_counts)
+
+  return {
+    'hosts': [(host.host_name, get_counters(host), [(resource.resource_name, resource.get_num_requests())
+                                                    for resource in host.get_top_requests(n)])
+              for host in reporter.get_top_hosts(n)],
+    'resources': [(resource.resource_name, get_counters(resource)) for resource in reporter.get_top_requests(n)],
+    'unsuccessful': [resource.resource_name for resource in reporter.get_top_unsuccessful_requests(n)],
+    'bytes': [resource.resource_name for resource in reporter.get_top_requests_by_bytes(n)],
+    'status_counts': reporter.get_status_counts(),
+    'pct': reporter.get_success_pct(),
+    'cardinality': reporter.get_cardinality(),
+  }
+
+
+class TestSpillingReportAggregator(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.logs, _ = logs_and_report()
+    self.log_dicts = [parse(LogFormat.CLF, log) for log in self.logs]
+    self.expected_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log_dict in self.log_dicts:
+      self.expected_reporter.receive_log(log_dict)
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def get_run_files(self):
+    return os.listdir(self.temp_dir.name)
+
+  def test_report(self):
+    expected_reports = get_reports(self.expected_reporter)
+    # a budget fitting all the counters, and a budget of a few counters spilling them all the time (the runs being
+    # merged together on the way)
+    for memory_budget in (2 ** 30, 2000):
+      reporter = SpillingReportAggregator(memory_budget, temp_dir=self.temp_dir.name)
+      for log_dict in self.log_dicts:
+        reporter.receive_log(log_dict)
+      batch_reporter = SpillingReportAggregator(memory_budget, temp_dir=self.temp_dir.name)
+      for start in range(0, len(self.logs), 100):
+        batch_reporter.receive_logs(parse_many(LogFormat.CLF, self.logs[start:start + 100], batch_reporter.fields))
+
+      for tested_reporter in (reporter, batch_reporter):
+        if memory_budget < 2 ** 30:
+          self.assertGreater(tested_reporter.num_spills, MERGE_FAN_IN)
+          # the runs of a kind are merged as soon as there are MERGE_FAN_IN of them
+          for runs in tested_reporter._runs.values():
+            self.assertLess(len(runs), MERGE_FAN_IN)
+        else:
+          self.assertEqual(tested_reporter.num_spills, 0)
+        self.assertEqual(get_reports(tested_reporter), expected_reports)
+        self.assertAlmostEqual(tested_reporter.get_mean_bytes(), self.expected_reporter.get_mean_bytes())
+        tested_reporter.close()
+      self.assertEqual(self.get_run_files(), [])
+
+    # the hosts only keep their top resources
+    reporter = SpillingReportAggregator(2000, temp_dir=self.temp_dir.name, resources_per_host=2)
+    for log_dict in self.log_dicts:
+      reporter.receive_log(log_dict)
+    self.assertEqual([[resource.resource_name for resource in host.get_top_requests(5)]
+                      for host in reporter.get_top_hosts(5)],
+                     [[resource.resource_name for resource in host.get_top_requests(2)]
+                      for host in self.expected_reporter.get_top_hosts(5)])
+
+  def test_budget(self):
+    # many hosts requesting a few resources grow the buffer of the hosts far more than the one of the resources
+    memory_budget = 100000
+    reporter = SpillingReportAggregator(memory_budget, temp_dir=self.temp_dir.name)
+    expected_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for i in range(5000):
+      log_dict = {'host': 'host-%d' % i, 'request': 'GET /page-%d HTTP/1.1' % (i % 3), 'status': '200', 'size': '100'}
+      reporter.receive_log(log_dict)
+      expected_reporter.receive_log(log_dict)
+      self.assertLessEqual(reporter._buffer_size, memory_budget)
+    self.assertGreater(reporter.num_spills, 0)
+    self.assertEqual(get_reports(reporter), get_reports(expected_reporter))
+    reporter.close()
+
+  def test_merge(self):
+    split = get_random_int(1, len(self.log_dicts) - 1)
+    normalizer = RequestNormalizer('path')
+    expected_reporter = ReportAggregator(normalizer, EXACT_REPORTS)
+    for log_dict in self.log_dicts:
+      expected_reporter.receive_log(log_dict)
+
+    reporter = SpillingReportAggregator(5000, normalizer, self.temp_dir.name)
+    for log_dict in self.log_dicts[:split]:
+      reporter.receive_log(log_dict)
+    other_reporter = SpillingReportAggregator(5000, normalizer, self.temp_dir.name)
+    for log_dict in self.log_dicts[split:]:
+      other_reporter.receive_log(log_dict)
+    # the run files are handed over to the unpickled aggregator, then to the one it is merged into
+    other_reporter = pickle.loads(pickle.dumps(other_reporter))
+    reporter.merge(other_reporter)
+    del other_reporter
+    self.assertEqual(get_reports(reporter), get_reports(expected_reporter))
+    del reporter
+    self.assertEqual(self.get_run_files(), [])
+
+  def test_aggregate_file(self):
+    with open(os.path.join(self.temp_dir.name, 'access.log'), 'w') as log_file:
+      log_file.write('\n'.join(self.logs) + '\n')
+    aggregator_factory = partial(SpillingReportAggregator, 5000, temp_dir=self.temp_dir.name)
+    reporter = aggregate_file(log_file.name, workers=3, aggregator_factory=aggregator_factory)
+    self.assertGreater(reporter.num_spills, 0)
+    self.assertEqual(get_reports(reporter), get_reports(self.expected_reporter))
+    reporter.close()
+    self.assertEqual(self.get_run_files(), ['access.log'])
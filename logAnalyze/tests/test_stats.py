@@ -0,0 +1,53 @@
+import io
+import os
+import tempfile
+import unittest
+
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.test_utils.utils import get_report_dict
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import ParseError
+from logAnalyze.utils.parse_utils import parse_many
+from logAnalyze.utils.stats import RunStats
+
+
+class TestStats(unittest.TestCase):
+  def setUp(self):
+    self.logs, self.expected_report = logs_and_report()
+    fd, self.path = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'w') as log_file:
+      log_file.write('\n'.join(self.logs) + '\n')
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def test_aggregate_file(self):
+    for workers, use_mmap in ((1, False), (1, True), (3, False)):
+      progress = io.StringIO()
+      stats = RunStats(progress_interval=0, progress_file=progress)
+      reporter = aggregate_file(self.path, workers=workers, use_mmap=use_mmap, stats=stats)
+      self.assertEqual(get_report_dict(reporter), self.expected_report)
+
+      report = stats.get_report(reporter)
+      self.assertEqual(report['lines'], len(self.logs))
+      self.assertEqual(report['bytes'], os.path.getsize(self.path))
+      self.assertEqual(report['parse_errors'], 0)
+      self.assertEqual((report['distinct_hosts'], report['distinct_resources']),
+                       (len(self.expected_report['host_dict']), len(self.expected_report['resource_dict'])))
+      self.assertIn('parse_seconds', report)
+      self.assertIn('aggregate_seconds', report)
+      self.assertGreater(report['peak_rss_bytes'], 0)
+      self.assertIn('[progress] %d logs' % len(self.logs), progress.getvalue())
+
+  def test_parse_many(self):
+    fields = ('host', 'time', 'status')
+    stats = RunStats()
+    self.assertEqual(list(parse_many(LogFormat.CLF, self.logs, fields, stats)),
+                     list(parse_many(LogFormat.CLF, self.logs, fields)))
+    self.assertEqual(list(parse_many(LogFormat.CLF, self.logs, ('host',), stats)),
+                     [(log.split()[0],) for log in self.logs])
+    self.assertEqual(list(stats.stages), ['parse', 'time'])
+
+    self.assertRaises(ParseError, list, parse_many(LogFormat.CLF, self.logs + ['invalid log'], fields, stats))
+    self.assertEqual(stats.num_parse_errors, 1)
@@ -0,0 +1,194 @@
+import math
+import os
+import pickle
+import tempfile
+import unittest
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from logAnalyze.core.log_processor import aggregate_file
+from logAnalyze.core.report_aggregator import ReportAggregator
+from logAnalyze.core.visitor_aggregator import VisitorAggregator, HyperLogLog, MIN_PRECISION, get_standard_error
+from logAnalyze.core.windowed_aggregator import WindowedReportAggregator
+from logAnalyze.test_utils.utils import get_random_int
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import ReportError
+from logAnalyze.utils.parse_utils import parse, parse_many
+from logAnalyze.utils.request_utils import RequestNormalizer
+
+
+def get_registers(sketch):
+  """
+  The non-zero registers of a sketch, whether it is sparse or not
+  """
+  if isinstance(sketch.registers, bytearray):
+    return {index: rank for index, rank in enumerate(sketch.registers) if rank}
+  return sketch.registers
+
+
+class TestHyperLogLog(unittest.TestCase):
+  def test_count(self):
+    # the hashes do not depend on the process, so the estimates of these keys are always the same
+    for precision in (8, 10, 12):
+      standard_error = get_standard_error(precision)
+      sketch = HyperLogLog(precision)
+      self.assertEqual(sketch.count(), 0)
+      num_keys = 0
+      # the small counts of the sparse sketches, the counts around the number of registers and the large counts
+      for expected_count in (1, 10, 200, 1000, 3000, 10000, 50000):
+        for i in range(num_keys, expected_count):
+          sketch.add('host-%d' % i)
+          # adding a key again does not change the sketch
+          sketch.add('host-%d' % (i // 2))
+        num_keys = expected_count
+        # 4 standard errors, which a correct estimate exceeds once in 15000 times
+        self.assertLessEqual(abs(sketch.count() - expected_count), 4 * standard_error * expected_count,
+                             '%d estimated instead of %d' % (sketch.count(), expected_count))
+      self.assertIsInstance(sketch.registers, bytearray)
+      self.assertEqual(len(sketch.registers), 2 ** precision)
+
+    # the root mean square of the relative errors of many sketches is the standard error
+    relative_errors = []
+    for i in range(100):
+      sketch = HyperLogLog(8)
+      for j in range(1000):
+        sketch.add('%d-%d' % (i, j))
+      relative_errors.append(sketch.count() / 1000 - 1)
+    self.assertLessEqual(math.sqrt(sum(error ** 2 for error in relative_errors) / len(relative_errors)),
+                         1.2 * get_standard_error(8))
+
+    # the smallest sketches are dense from their second register on
+    sketch = HyperLogLog(MIN_PRECISION)
+    for i in range(1000):
+      sketch.add('host-%d' % i)
+    self.assertIsInstance(sketch.registers, bytearray)
+    self.assertLessEqual(abs(sketch.count() - 1000), 4 * get_standard_error(MIN_PRECISION) * 1000)
+
+    self.assertRaises(ValueError, HyperLogLog, 3)
+    self.assertRaises(ValueError, HyperLogLog, 17)
+
+  def test_merge(self):
+    # the merged sketch is the sketch of the union of the keys, whether the sketches are sparse or not
+    for num_keys, other_num_keys in ((5, 8), (5, 3000), (3000, 5), (2000, 3000)):
+      sketch = HyperLogLog()
+      other_sketch = HyperLogLog()
+      union_sketch = HyperLogLog()
+      for i in range(num_keys):
+        sketch.add(str(i))
+        union_sketch.add(str(i))
+      for i in range(num_keys // 2, num_keys // 2 + other_num_keys):
+        other_sketch.add(str(i))
+        union_sketch.add(str(i))
+      sketch = pickle.loads(pickle.dumps(sketch))
+      sketch.merge(other_sketch)
+      self.assertEqual(get_registers(sketch), get_registers(union_sketch))
+      self.assertEqual(sketch.count(), union_sketch.count())
+    for precision in (MIN_PRECISION, MIN_PRECISION + 1):
+      sketch = HyperLogLog(precision)
+      other_sketch = HyperLogLog(precision)
+      union_sketch = HyperLogLog(precision)
+      sketch.add('a')
+      union_sketch.add('a')
+      for i in range(100):
+        other_sketch.add(str(i))
+        union_sketch.add(str(i))
+      sketch.merge(other_sketch)
+      self.assertEqual(get_registers(sketch), get_registers(union_sketch))
+    self.assertRaises(ValueError, HyperLogLog(10).merge, HyperLogLog(11))
+
+
+class TestVisitorAggregator(unittest.TestCase):
+  def setUp(self):
+    logs, _ = logs_and_report()
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    self.logs = logs
+    self.log_dicts = []
+    for i, log in enumerate(logs):
+      log_dict = parse(LogFormat.CLF, log)
+      log_dict['time'] = start + timedelta(seconds=i)
+      self.log_dicts.append(log_dict)
+
+  def get_expected_visits(self, normalizer=None, bucket=None):
+    """
+    The exact sets of the distinct hosts per resource and per time bucket, and of the distinct resources per host
+    """
+    visits = {'resources': defaultdict(set), 'hosts': defaultdict(set), 'buckets': defaultdict(set)}
+    for log_dict in self.log_dicts:
+      resource_name = log_dict['request'] if normalizer is None else normalizer.normalize(log_dict['request'])
+      visits['resources'][resource_name].add(log_dict['host'])
+      visits['hosts'][log_dict['host']].add(resource_name)
+      if bucket is not None:
+        visits['buckets'][log_dict['time'].timestamp() // bucket * bucket].add(log_dict['host'])
+    return visits
+
+  def assertEstimates(self, estimates, expected_sets, precision):
+    for estimate in estimates:
+      expected_count = len(expected_sets[estimate.name])
+      # the small counts are only off when the hashes of a few keys select the same register, which makes the tail of
+      # their errors heavier than the one of the large counts
+      self.assertLessEqual(abs(estimate.count - expected_count),
+                           max(6 * get_standard_error(precision) * expected_count, 6))
+
+  def test_visitors(self):
+    normalizer = RequestNormalizer('path')
+    expected_visits = self.get_expected_visits(normalizer, 60)
+    for precision in (6, 10):
+      reporter = VisitorAggregator(precision, 60, normalizer)
+      split = get_random_int(1, len(self.log_dicts) - 1)
+      for log_dict in self.log_dicts[:split]:
+        reporter.receive_log(log_dict)
+      # the aggregators of the parallel workers are pickled
+      other_reporter = pickle.loads(pickle.dumps(VisitorAggregator(precision, 60, normalizer)))
+      other_reporter.receive_logs(tuple(log_dict[field] for field in other_reporter.fields)
+                                  for log_dict in self.log_dicts[split:])
+      reporter.merge(other_reporter)
+
+      self.assertEqual(reporter.get_cardinality(), (len(expected_visits['hosts']), len(expected_visits['resources'])))
+      estimate = reporter.get_unique_visitors()
+      self.assertEstimates([estimate._replace(name=None)], {None: expected_visits['hosts']}, precision)
+      self.assertEqual(estimate.error, round(estimate.count * get_standard_error(precision)))
+      self.assertEstimates(reporter.get_top_resources_by_visitors(len(self.logs)), expected_visits['resources'],
+                           precision)
+      self.assertEstimates(reporter.get_top_hosts_by_resources(len(self.logs)), expected_visits['hosts'], precision)
+      buckets = reporter.get_visitors_per_bucket()
+      self.assertEqual([estimate.name for estimate in buckets], sorted(expected_visits['buckets']))
+      self.assertEstimates(buckets, expected_visits['buckets'], precision)
+
+    self.assertRaises(ValueError, VisitorAggregator(10).get_visitors_per_bucket)
+    self.assertRaises(ValueError, reporter.merge, VisitorAggregator(10))
+
+  def test_report_aggregator(self):
+    reports = ('top_hosts', 'unique_visitors', 'top_resources_by_visitors', 'top_hosts_by_resources')
+    expected_reporter = VisitorAggregator(12)
+    reporter = ReportAggregator(reports=reports, precision=12)
+    other_reporter = ReportAggregator(reports=reports, precision=12)
+    for log_dict in self.log_dicts:
+      expected_reporter.receive_log(log_dict)
+    split = get_random_int(1, len(self.log_dicts) - 1)
+    for log_dict in self.log_dicts[:split]:
+      reporter.receive_log(log_dict)
+    other_reporter.receive_logs(parse_many(LogFormat.CLF, self.logs[split:], other_reporter.fields))
+    reporter.merge(pickle.loads(pickle.dumps(other_reporter)))
+
+    # the merged sketches are the sketches of all the logs
+    self.assertEqual(reporter.get_unique_visitors(), expected_reporter.get_unique_visitors())
+    self.assertEqual(reporter.get_top_resources_by_visitors(5), expected_reporter.get_top_resources_by_visitors(5))
+    self.assertEqual(reporter.get_top_hosts_by_resources(5), expected_reporter.get_top_hosts_by_resources(5))
+    self.assertRaises(ReportError, reporter.subtract, other_reporter)
+    self.assertRaises(ReportError, ReportAggregator().get_unique_visitors)
+    self.assertIsNone(ReportAggregator().visitors)
+    self.assertRaises(ValueError, WindowedReportAggregator, reports=('unique_visitors',))
+
+  def test_aggregate_file(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      path = os.path.join(temp_dir, 'access.log')
+      with open(path, 'w') as log_file:
+        log_file.write('\n'.join(self.logs) + '\n')
+      expected_reporter = VisitorAggregator()
+      for log_dict in self.log_dicts:
+        expected_reporter.receive_log(log_dict)
+      reporter = aggregate_file(path, workers=3, aggregator_factory=partial(VisitorAggregator))
+    self.assertEqual(reporter.get_top_resources_by_visitors(10), expected_reporter.get_top_resources_by_visitors(10))
+    self.assertEqual(reporter.get_unique_visitors(), expected_reporter.get_unique_visitors())
@@ -0,0 +1,87 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from logAnalyze.core.report_aggregator import ReportAggregator, EXACT_REPORTS
+from logAnalyze.core.windowed_aggregator import WindowedReportAggregator
+from logAnalyze.test_utils.utils import get_random_int, get_report_dict
+from logAnalyze.tests.test_report_aggregator import logs_and_report
+from logAnalyze.utils.constants import LogFormat
+from logAnalyze.utils.custom_exceptions import ReportError
+from logAnalyze.utils.parse_utils import parse
+from logAnalyze.utils.request_utils import RequestNormalizer
+
+
+class TestWindowedReportAggregator(unittest.TestCase):
+  def test_window(self):
+    logs, _ = logs_and_report()
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    log_dicts = []
+    for i, log in enumerate(logs):
+      log_dict = parse(LogFormat.CLF, log)
+      # a few logs every second
+      log_dict['time'] = start + timedelta(seconds=i // 3)
+      log_dicts.append(log_dict)
+
+    window = get_random_int(10, 100)
+    reporter = WindowedReportAggregator(window, 2, reports=EXACT_REPORTS)
+    for log_dict in log_dicts:
+      reporter.receive_log(log_dict)
+
+    # the reports only cover the logs within the window ending at the last bucket
+    self.assertEqual(reporter.get_window_end(), (log_dicts[-1]['time'].timestamp() // 2 + 1) * 2)
+    expected_reporter = ReportAggregator(reports=EXACT_REPORTS)
+    for log_dict in log_dicts:
+      if log_dict['time'].timestamp() >= reporter.get_window_end() - reporter.window:
+        expected_reporter.receive_log(log_dict)
+    self.assertEqual(get_report_dict(reporter.total), get_report_dict(expected_reporter))
+    self.assertEqual(reporter.get_num_requests(), len(logs) - sum(
+      1 for log_dict in log_dicts if log_dict['time'].timestamp() < reporter.get_window_end() - reporter.window))
+    self.assertEqual([host.host_name for host in reporter.get_top_hosts(5)],
+                     [host.host_name for host in expected_reporter.get_top_hosts(5)])
+    self.assertEqual(reporter.get_success_pct(), expected_reporter.get_success_pct())
+    self.assertEqual(reporter.get_status_counts(), expected_reporter.get_status_counts())
+    self.assertAlmostEqual(reporter.get_mean_bytes(), expected_reporter.get_mean_bytes())
+
+    # logs older than the window are dropped
+    reporter.receive_log(log_dicts[0])
+    self.assertEqual(reporter.num_logs_dropped, 1)
+    self.assertEqual(get_report_dict(reporter.total), get_report_dict(expected_reporter))
+
+    # the buckets only count the dimensions of the reports of the window
+    reporter = WindowedReportAggregator(window, 2, reports=('top_hosts',))
+    self.assertEqual(reporter.fields, ('host', 'status', 'time'))
+    for log_dict in log_dicts:
+      reporter.receive_log({field: log_dict[field] for field in reporter.fields})
+    self.assertEqual([(host.host_name, host.get_num_requests()) for host in reporter.get_top_hosts(5)],
+                     [(host.host_name, host.get_num_requests()) for host in expected_reporter.get_top_hosts(5)])
+    self.assertEqual(reporter.total.resource_dict, {})
+    self.assertRaises(ReportError, reporter.get_success_pct)
+
+  def test_receive_logs(self):
+    logs, _ = logs_and_report()
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    log_dicts = []
+    for i, log in enumerate(logs):
+      log_dict = parse(LogFormat.CLF, log)
+      # a few logs every second, some of them late enough to be dropped
+      log_dict['time'] = start + timedelta(seconds=i // 3 - (30 if i % 17 == 0 else 0))
+      log_dicts.append(log_dict)
+
+    for normalizer in (None, RequestNormalizer('path')):
+      expected_reporter = WindowedReportAggregator(20, 2, normalizer, EXACT_REPORTS)
+      for log_dict in log_dicts:
+        expected_reporter.receive_log(log_dict)
+      self.assertGreater(expected_reporter.num_logs_dropped, 0)
+
+      # the batches are counted as if their logs had been received one at a time
+      reporter = WindowedReportAggregator(20, 2, normalizer, EXACT_REPORTS)
+      split = get_random_int(1, len(log_dicts) - 1)
+      for batch in (log_dicts[:split], log_dicts[split:]):
+        reporter.receive_logs(tuple(log_dict[field] for field in reporter.fields) for log_dict in batch)
+      self.assertEqual(reporter.num_logs_dropped, expected_reporter.num_logs_dropped)
+      self.assertEqual(reporter.latest_bucket, expected_reporter.latest_bucket)
+      self.assertEqual(sorted(reporter.buckets), sorted(expected_reporter.buckets))
+      self.assertEqual(get_report_dict(reporter.total), get_report_dict(expected_reporter.total))
+      self.assertEqual(reporter.total.status_counts, expected_reporter.total.status_counts)
+      reporter.receive_logs([])
+      self.assertEqual(reporter.latest_bucket, expected_reporter.latest_bucket)
@@ -1,6 +1,7 @@
 """
 This file contains some constants to be used commonly in our project.
 """
+import re
 from enum import Enum
 
 # Regex patterns for the identifiable entities inside the logs
@@ -11,13 +12,89 @@ USER = r'(?P<user>\S+)'
 TIME = r'\[(?P<time>.*?)\]'
 REQUEST = r'\"(?P<request>.*?)\"'
 STATUS = r'(?P<status>\d{3})'
-SIZE = r'(?P<size>\S+)'
+SIZE = r'(?P<size>\d+|-)'
+REFERER = r'\"(?P<referer>.*?)\"'
+USER_AGENT = r'\"(?P<user_agent>.*?)\"'
+VHOST = r'^(?P<vhost>\S+?):(?P<port>\d+)'
+CLIENT = r'(?P<host>\S+)'
 FAIL_STATUS = r'[145]\d\d'
 SUCCESS_STATUS = r'[23]\d\d'
 
+# The status strings of the status codes from 0 to 999
+STATUS_STRINGS = tuple('%03d' % code for code in range(1000))
+
+# For every status code from 0 to 999: True if it is successful, False if it is unsuccessful and None if it is not a
+# valid http status. SUCCESS_BY_STATUS maps the status strings to the same values, so that a status is classified by a
+# single lookup.
+SUCCESS_BY_CODE = tuple(True if re.fullmatch(SUCCESS_STATUS, status) else
+                        False if re.fullmatch(FAIL_STATUS, status) else None
+                        for status in STATUS_STRINGS)
+SUCCESS_BY_STATUS = dict(zip(STATUS_STRINGS, SUCCESS_BY_CODE))
+
+# The fields which are extracted from a CLF log record, in the order in which they appear
+FIELDS = ('host', 'identity', 'user', 'time', 'request', 'status', 'size')
+
 
 class LogFormat(Enum):
+  """
+  The predefined log formats. Their values hold the regex matching the logs, the display name, the fields extracted
+  from the logs and the equivalent Apache LogFormat string, from which the tokenizers of the logs are generated (see
+  format_compiler.get_tokenizer). Any other Apache or nginx format is compiled by format_compiler.compile_log_format.
+  """
   CLF = {
     'regex': HOST + SPACE + IDENTITY + SPACE + USER + SPACE + TIME + SPACE + REQUEST + SPACE + STATUS + SPACE + SIZE,
-    'name': 'Common Log Format'
+    'name': 'Common Log Format',
+    'fields': FIELDS,
+    'format': '%h %l %u %t "%r" %>s %b'
+  }
+  COMBINED = {
+    'regex': HOST + SPACE + IDENTITY + SPACE + USER + SPACE + TIME + SPACE + REQUEST + SPACE + STATUS + SPACE + SIZE +
+    SPACE + REFERER + SPACE + USER_AGENT,
+    'name': 'Combined Log Format',
+    'fields': FIELDS + ('referer', 'user_agent'),
+    'format': '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i"'
+  }
+  VHOST_COMBINED = {
+    'regex': VHOST + SPACE + CLIENT + SPACE + IDENTITY + SPACE + USER + SPACE + TIME + SPACE + REQUEST + SPACE +
+    STATUS + SPACE + SIZE + SPACE + REFERER + SPACE + USER_AGENT,
+    'name': 'Combined Log Format with virtual hosts',
+    'fields': ('vhost', 'port') + FIELDS + ('referer', 'user_agent'),
+    'format': '%v:%p %h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"'
   }
+
+  def get_parser(self, fields=None, malformed=None):
+    """
+    Returns a compiled parser for this log format which only extracts the requested fields.
+
+    :param fields: the names of the fields to be extracted (see the 'fields' of the value), all the fields are
+      extracted if None
+    :type fields: collections.abc.Iterable
+    :param malformed: the collector of the malformed logs, for which the parser returns None, or None to raise
+      ParseError on any malformed log
+    :type malformed: logAnalyze.utils.malformed.MalformedLogs
+    :return: a callable which parses a log string into a dictionary of the requested fields
+    :rtype: collections.abc.Callable
+    :raises ParseError: if any of the requested fields is unknown
+    """
+    from logAnalyze.utils.parse_utils import get_parser
+    return get_parser(self, fields, malformed)
+
+  def get_bytes_parser(self, fields=None, encoding='utf-8', malformed=None):
+    """
+    Returns a compiled parser for this log format which extracts the requested fields from the log lines of a
+    bytes-like buffer, without decoding the whole lines.
+
+    :param fields: the names of the fields to be extracted (see the 'fields' of the value), all the fields are
+      extracted if None
+    :type fields: collections.abc.Iterable
+    :param encoding: the encoding used to decode the extracted fields
+    :type encoding: str
+    :param malformed: the collector of the malformed logs, which are skipped, or None to raise ParseError on any
+      malformed log
+    :type malformed: logAnalyze.utils.malformed.MalformedLogs
+    :return: a callable which parses the log lines of a buffer into dictionaries of the requested fields
+    :rtype: collections.abc.Callable
+    :raises ParseError: if any of the requested fields is unknown
+    """
+    from logAnalyze.utils.parse_utils import get_bytes_parser
+    return get_bytes_parser(self, fields, encoding, malformed)
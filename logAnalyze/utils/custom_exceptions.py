@@ -12,3 +12,35 @@ class StatusError(Exception):
   """
   def __init__(self, message):
     self.message = message
+
+
+class CheckpointError(Exception):
+  """
+  A custom exception class that is thrown when a checkpoint file could not be read
+  """
+  def __init__(self, message):
+    self.message = message
+
+
+class MalformedLogsError(Exception):
+  """
+  A custom exception class that is thrown when more logs than allowed were malformed
+  """
+  def __init__(self, message):
+    self.message = message
+
+
+class ReportError(Exception):
+  """
+  A custom exception class that is thrown when a report aggregator is asked for a report it was not configured with
+  """
+  def __init__(self, message):
+    self.message = message
+
+
+class PartialReportError(Exception):
+  """
+  A custom exception class that is thrown when a partial report file could not be written, read or combined
+  """
+  def __init__(self, message):
+    self.message = message
@@ -0,0 +1,557 @@
+"""
+This file contains some utility methods for reading log files
+"""
+import bisect
+import bz2
+import gzip
+import lzma
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import partial
+
+# The magic bytes at the start of the compressed files, and the functions opening them
+COMPRESSIONS = {
+  'gzip': (b'\x1f\x8b', gzip.open),
+  'bz2': (b'BZh', bz2.open),
+  'xz': (b'\xfd7zXZ\x00', lzma.open)
+}
+# BGZF (blocked gzip) files are gzip files made of independent members of at most 64KB, each recording its own size
+COMPRESSIONS['bgzf'] = COMPRESSIONS['gzip']
+
+# The size of the fixed part of a gzip member header, up to the XLEN field
+GZIP_HEADER_SIZE = 12
+
+
+def split_file(path, num_ranges, start=0, end=None):
+  """
+  Splits a file (or a byte range of it) into (at most) num_ranges byte ranges of roughly equal size. The ranges are
+  aligned to the line boundaries, so that every line of the file falls into exactly one of the ranges.
+
+  :param path: the path of the file to be split
+  :type path: str
+  :param num_ranges: the number of ranges to split the file into
+  :type num_ranges: int
+  :param start: the byte offset where the first range starts, expected to be the start of a line
+  :type start: int
+  :param end: the byte offset where the last range ends, or None to split the file till its end
+  :type end: int
+  :return: a list of (start, end) byte offsets, where start is inclusive and end is exclusive
+  :rtype: list
+  """
+  size = os.path.getsize(path) if end is None else end
+  boundaries = [start]
+  with open(path, 'rb') as log_file:
+    for i in range(1, num_ranges):
+      offset = start + (size - start) * i // num_ranges
+      if offset <= boundaries[-1]:
+        continue
+      # move to the start of the line following the byte just before the offset, which is the offset itself if the
+      # offset already is the start of a line
+      log_file.seek(offset - 1)
+      log_file.readline()
+      boundary = log_file.tell()
+      if boundary >= size:
+        break
+      if boundary > boundaries[-1]:
+        boundaries.append(boundary)
+  boundaries.append(size)
+  return [(boundary, next_boundary) for boundary, next_boundary in zip(boundaries, boundaries[1:])
+          if boundary < next_boundary]
+
+
+def get_lines_end(path, size=None, block_size=2 ** 16):
+  """
+  Finds the end of the last complete line of a file, ie. the byte offset just past its last newline. The bytes after
+  it are an incomplete line which might still be being written.
+
+  :param path: the path of the file
+  :type path: str
+  :param size: only look for the newlines before this byte offset, or None to look in the whole file
+  :type size: int
+  :param block_size: the number of bytes read at once, backwards from the end
+  :type block_size: int
+  :return: the byte offset just past the last newline, or 0 if there is none
+  :rtype: int
+  """
+  if size is None:
+    size = os.path.getsize(path)
+  with open(path, 'rb') as log_file:
+    end = size
+    while end > 0:
+      start = max(0, end - block_size)
+      log_file.seek(start)
+      newline = log_file.read(end - start).rfind(b'\n')
+      if newline >= 0:
+        return start + newline + 1
+      end = start
+  return 0
+
+
+def bisect_lines(path, key, target, start=0, end=None):
+  """
+  Binary searches a file whose lines are sorted by a key (eg. the time of the logs) for the first line whose key is
+  at least the target, reading only a few lines at the byte offsets probed. Every probe seeks to an offset, skips to
+  the start of the next line and computes the key of the first line from there whose key is not None, so lines
+  without any key (eg. malformed logs) are skipped.
+
+  :param path: the path of the file
+  :type path: str
+  :param key: a callable computing the key of a line (as bytes, including its newline), or None if it has none
+  :type key: collections.abc.Callable
+  :param target: the key searched for
+  :param start: the byte offset where the search starts, expected to be the start of a line
+  :type start: int
+  :param end: the byte offset where the search stops, or None to search till the end of the file
+  :type end: int
+  :return: the byte offset of the start of the first line whose key is at least the target, or the end offset if
+    there is none
+  :rtype: int
+  """
+  size = os.path.getsize(path) if end is None else end
+  with open(path, 'rb') as log_file:
+    def get_line_start(offset):
+      # the start of the line following the byte just before the offset, which is the offset itself if the offset
+      # already is the start of a line
+      if offset <= start:
+        return start
+      log_file.seek(offset - 1)
+      log_file.readline()
+      return min(log_file.tell(), size)
+
+    def get_key(offset):
+      log_file.seek(get_line_start(offset))
+      while log_file.tell() < size:
+        line_key = key(log_file.readline())
+        if line_key is not None:
+          return line_key
+      return None
+
+    low, high = start, size
+    while low < high:
+      middle = (low + high) // 2
+      middle_key = get_key(middle)
+      if middle_key is None or middle_key >= target:
+        high = middle
+      else:
+        low = middle + 1
+    return get_line_start(low)
+
+
+def read_lines(path, start=0, end=None, encoding='utf-8', errors='strict'):
+  """
+  Reads the lines of a file lying within a byte range. The start offset is expected to be the start of a line.
+
+  :param path: the path of the file to be read
+  :type path: str
+  :param start: the byte offset of the first line to be read
+  :type start: int
+  :param end: the byte offset where the reading stops, or None to read till the end of the file
+  :type end: int
+  :param encoding: the encoding of the file
+  :type encoding: str
+  :param errors: the error handler of the decoding, as with bytes.decode
+  :type errors: str
+  :return: a generator of the decoded lines
+  :rtype: collections.abc.Iterator
+  """
+  with open(path, 'rb') as log_file:
+    log_file.seek(start)
+    position = start
+    for line in log_file:
+      if end is not None and position >= end:
+        break
+      position += len(line)
+      yield line.decode(encoding, errors)
+
+
+def read_chunks(path, start=0, end=None, encoding='utf-8', chunk_size=2 ** 20, errors='strict'):
+  """
+  Reads the lines of a file lying within a byte range in chunks of roughly chunk_size bytes, so that they can be
+  processed in batches. The start offset is expected to be the start of a line.
+
+  :param path: the path of the file to be read
+  :type path: str
+  :param start: the byte offset of the first line to be read
+  :type start: int
+  :param end: the byte offset where the reading stops, or None to read till the end of the file
+  :type end: int
+  :param encoding: the encoding of the file
+  :type encoding: str
+  :param chunk_size: the number of bytes after which a chunk is complete
+  :type chunk_size: int
+  :param errors: the error handler of the decoding, as with bytes.decode
+  :type errors: str
+  :return: a generator of the lists of decoded lines
+  :rtype: collections.abc.Iterator
+  """
+  with open(path, 'rb') as log_file:
+    log_file.seek(start)
+    position = start
+    while end is None or position < end:
+      lines = log_file.readlines(chunk_size)
+      if not lines:
+        break
+      if end is not None:
+        # cut the chunk at the first line starting at or after the end
+        for i, line in enumerate(lines):
+          if position >= end:
+            del lines[i:]
+            break
+          position += len(line)
+      yield [line.decode(encoding, errors) for line in lines]
+
+
+@contextmanager
+def map_file(path):
+  """
+  Memory maps a file for reading. An empty buffer is provided for empty files, since those cannot be mapped.
+
+  :param path: the path of the file to be mapped
+  :type path: str
+  :return: a context manager providing the read-only buffer of the file
+  """
+  with open(path, 'rb') as log_file:
+    if os.fstat(log_file.fileno()).st_size == 0:
+      yield b''
+      return
+    with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+      yield buffer
+
+
+def follow_lines(path, encoding='utf-8', poll_interval=1.0, from_start=False, errors='strict'):
+  """
+  Follows a growing file like ``tail -F``, generating its lines as they are appended to it.
+
+  If the file is rotated (the path now refers to a different file), the rest of the old file is read and the new file
+  is followed from its start. If the file is truncated, it is followed from its start again. Incomplete lines are held
+  back until their newline has been written, or generated without their newline when the file is rotated or truncated
+  (for the parser to skip them as malformed if they were cut).
+
+  Whenever there is no new line to be read, the generator waits for poll_interval seconds and generates None, so that
+  the caller gets a chance to do some periodic work.
+
+  :param path: the path of the file to be followed
+  :type path: str
+  :param encoding: the encoding of the file
+  :type encoding: str
+  :param poll_interval: the number of seconds to wait for new lines
+  :type poll_interval: float
+  :param from_start: True to read the lines already present in the file, otherwise only the lines appended later are
+    generated
+  :type from_start: bool
+  :param errors: the error handler of the decoding, as with bytes.decode
+  :type errors: str
+  :return: a never ending generator of the decoded lines (or None)
+  :rtype: collections.abc.Iterator
+  """
+  log_file = open(path, 'rb')
+  try:
+    if not from_start:
+      log_file.seek(0, os.SEEK_END)
+    partial_line = b''
+    while True:
+      line = log_file.readline()
+      if line.endswith(b'\n'):
+        yield (partial_line + line).decode(encoding, errors)
+        partial_line = b''
+        continue
+      partial_line += line
+      if line:
+        continue
+
+      try:
+        stat = os.stat(path)
+      except FileNotFoundError:
+        # the file has been moved away, and the new one is yet to be created
+        stat = None
+      rotated = stat is not None and stat.st_ino != os.fstat(log_file.fileno()).st_ino
+      truncated = not rotated and stat is not None and stat.st_size < log_file.tell()
+      if not rotated and not truncated:
+        time.sleep(poll_interval)
+        yield None
+        continue
+
+      if partial_line:
+        # the incomplete last line of the old content is never to be completed
+        yield partial_line.decode(encoding, errors)
+        partial_line = b''
+      if rotated:
+        # the file has been rotated, and the old one has been read completely
+        log_file.close()
+        log_file = open(path, 'rb')
+      else:
+        # the file has been truncated
+        log_file.seek(0)
+  finally:
+    log_file.close()
+
+
+def get_compression(path):
+  """
+  Detects the compression of a file from its first bytes, whatever its name
+
+  :param path: the path of the file
+  :type path: str
+  :return: one of the keys of COMPRESSIONS ('bgzf' for gzip files in the BGZF format), or None if the file is not
+    compressed
+  :rtype: str
+  """
+  with open(path, 'rb') as log_file:
+    header = log_file.read(GZIP_HEADER_SIZE)
+    for compression, (magic, _) in COMPRESSIONS.items():
+      if header.startswith(magic):
+        break
+    else:
+      return None
+    if compression == 'gzip' and _get_bgzf_block_size(log_file, header) is not None:
+      return 'bgzf'
+    return compression
+
+
+def _get_bgzf_block_size(log_file, header):
+  """
+  Reads the size of a BGZF block (ie. the BC subfield of the extra field of its gzip header)
+
+  :param log_file: the file, positioned just past the fixed part of the header
+  :param header: the fixed part of the header
+  :type header: bytes
+  :return: the size of the whole block in bytes, or None if it is not a BGZF block
+  :rtype: int
+  """
+  # FLG.FEXTRA
+  if len(header) < GZIP_HEADER_SIZE or not header[3] & 4:
+    return None
+  extra_length = struct.unpack('<H', header[10:12])[0]
+  extra = log_file.read(extra_length)
+  position = 0
+  while position + 4 <= len(extra):
+    subfield_id = extra[position:position + 2]
+    subfield_length = struct.unpack('<H', extra[position + 2:position + 4])[0]
+    if subfield_id == b'BC' and subfield_length == 2:
+      return struct.unpack('<H', extra[position + 4:position + 6])[0] + 1
+    position += 4 + subfield_length
+  return None
+
+
+def get_bgzf_blocks(path):
+  """
+  Lists the blocks of a BGZF file, only reading their headers
+
+  :param path: the path of the BGZF file
+  :type path: str
+  :return: the list of byte offsets of the blocks
+  :rtype: list
+  :raises ValueError: if the file is not a BGZF file
+  """
+  offsets = []
+  size = os.path.getsize(path)
+  with open(path, 'rb') as log_file:
+    offset = 0
+    while offset < size:
+      log_file.seek(offset)
+      block_size = _get_bgzf_block_size(log_file, log_file.read(GZIP_HEADER_SIZE))
+      if block_size is None:
+        raise ValueError('Not a BGZF block at offset %d of %s' % (offset, path))
+      offsets.append(offset)
+      offset += block_size
+  return offsets
+
+
+def split_bgzf(path, num_ranges):
+  """
+  Splits a BGZF file into (at most) num_ranges byte ranges of roughly equal size, aligned to its blocks, so that the
+  ranges can be decompressed independently (see :func:`read_bgzf_chunks`).
+
+  :param path: the path of the BGZF file
+  :type path: str
+  :param num_ranges: the number of ranges to split the file into
+  :type num_ranges: int
+  :return: a list of (start, end) byte offsets, where start is inclusive and end is exclusive
+  :rtype: list
+  :raises ValueError: if the file is not a BGZF file
+  """
+  offsets = get_bgzf_blocks(path)
+  size = os.path.getsize(path)
+  boundaries = sorted({0, size} | {offsets[bisect.bisect_left(offsets, size * i // num_ranges)]
+                                   for i in range(1, num_ranges) if size * i // num_ranges <= offsets[-1]})
+  return [(boundary, next_boundary) for boundary, next_boundary in zip(boundaries, boundaries[1:])]
+
+
+def read_bgzf_chunks(path, start=0, end=None, encoding='utf-8', errors='strict'):
+  """
+  Reads the lines of a BGZF file lying within a range of its blocks, a chunk per block.
+
+  Since the lines run across the blocks, a line belongs to the range in which it starts: unless the range starts at
+  the start of the file, the lines are read from the first newline onwards, and the last line is read past the end of
+  the range (a line starting right at the end of the range included). So the ranges of :func:`split_bgzf` read every
+  line exactly once.
+
+  :param path: the path of the BGZF file
+  :type path: str
+  :param start: the byte offset of the first block of the range
+  :type start: int
+  :param end: the byte offset of the block following the range, or None to read till the end of the file
+  :type end: int
+  :param encoding: the encoding of the decompressed file
+  :type encoding: str
+  :param errors: the error handler of the decoding, as with bytes.decode
+  :type errors: str
+  :return: a generator of the lists of decoded lines (without their newlines)
+  :rtype: collections.abc.Iterator
+  :raises ValueError: if the file is not a BGZF file
+  """
+  skipping = start > 0
+  incomplete_line = b''
+  with open(path, 'rb') as log_file:
+    offset = start
+    while True:
+      log_file.seek(offset)
+      header = log_file.read(GZIP_HEADER_SIZE)
+      if not header:
+        break
+      block_size = _get_bgzf_block_size(log_file, header)
+      if block_size is None:
+        raise ValueError('Not a BGZF block at offset %d of %s' % (offset, path))
+      log_file.seek(offset)
+      data = incomplete_line + zlib.decompress(log_file.read(block_size), 16 + zlib.MAX_WBITS)
+      past_end = end is not None and offset >= end
+      offset += block_size
+
+      if skipping or past_end:
+        newline = data.find(b'\n')
+        if newline < 0:
+          incomplete_line = b'' if skipping else data
+          continue
+        if past_end:
+          # the line starting before the end (or right at it) is complete
+          if not skipping:
+            yield [data[:newline].decode(encoding, errors)]
+          return
+        data = data[newline + 1:]
+        skipping = False
+
+      last_newline = data.rfind(b'\n')
+      incomplete_line = data[last_newline + 1:]
+      if last_newline >= 0:
+        yield data[:last_newline].decode(encoding, errors).split('\n')
+  if incomplete_line and not skipping:
+    yield [incomplete_line.decode(encoding, errors)]
+
+
+def read_log_chunks(path, encoding='utf-8', chunk_size=2 ** 20, errors='strict'):
+  """
+  Reads all the lines of a log file in chunks, decompressing it on the fly if it is compressed
+
+  :param path: the path of the log file
+  :type path: str
+  :param encoding: the encoding of the (decompressed) file
+  :type encoding: str
+  :param chunk_size: the number of bytes after which a chunk is complete
+  :type chunk_size: int
+  :param errors: the error handler of the decoding, as with bytes.decode
+  :type errors: str
+  :return: a generator of the lists of decoded lines
+  :rtype: collections.abc.Iterator
+  """
+  if get_compression(path) is None:
+    return read_chunks(path, 0, None, encoding, chunk_size, errors)
+  return read_compressed_chunks(path, encoding, chunk_size, errors=errors)
+
+
+def read_compressed_chunks(path, encoding='utf-8', chunk_size=2 ** 20, queue_size=4, errors='strict'):
+  """
+  Reads the lines of a compressed file in chunks. The file is decompressed by a background thread, which stays up to
+  queue_size chunks ahead, so the decompression (which releases the GIL) overlaps with the processing of the lines.
+
+  :param path: the path of the compressed file
+  :type path: str
+  :param encoding: the encoding of the decompressed file
+  :type encoding: str
+  :param chunk_size: the number of decompressed bytes read at once
+  :type chunk_size: int
+  :param queue_size: the number of decompressed chunks which can be waiting to be processed
+  :type queue_size: int
+  :param errors: the error handler of the decoding, as with bytes.decode
+  :type errors: str
+  :return: a generator of the lists of decoded lines (without their newlines)
+  :rtype: collections.abc.Iterator
+  :raises ValueError: if the file is not compressed
+  """
+  compression = get_compression(path)
+  if compression is None:
+    raise ValueError('Not a compressed file: %s' % path)
+  open_file = COMPRESSIONS[compression][1]
+
+  def read_blocks(put):
+    with open_file(path, 'rb') as log_file:
+      for block in iter(partial(log_file.read, chunk_size), b''):
+        if not put(block):
+          return
+
+  incomplete_line = b''
+  for block in read_ahead(read_blocks, queue_size):
+    data = incomplete_line + block
+    last_newline = data.rfind(b'\n')
+    incomplete_line = data[last_newline + 1:]
+    if last_newline >= 0:
+      yield data[:last_newline].decode(encoding, errors).split('\n')
+  if incomplete_line:
+    yield [incomplete_line.decode(encoding, errors)]
+
+
+# The item marking the end of the items of read_ahead
+_END = object()
+
+
+def read_ahead(produce, queue_size=4):
+  """
+  Runs a producer in a background thread, generating the items it produces through a bounded queue. The exceptions
+  raised by the producer are raised by the generator.
+
+  :param produce: a callable taking a put(item) callable, which returns False once the generator has been closed
+  :type produce: collections.abc.Callable
+  :param queue_size: the maximum number of produced items waiting to be generated
+  :type queue_size: int
+  :return: a generator of the produced items
+  :rtype: collections.abc.Iterator
+  """
+  # the queue holds (item, None) pairs, followed by a final (_END, exception or None) pair
+  items = queue.Queue(queue_size)
+  closed = threading.Event()
+
+  def put_entry(entry):
+    while not closed.is_set():
+      try:
+        items.put(entry, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def run():
+    try:
+      produce(lambda item: put_entry((item, None)))
+    except BaseException as ex:
+      put_entry((_END, ex))
+    else:
+      put_entry((_END, None))
+
+  thread = threading.Thread(target=run, daemon=True)
+  thread.start()
+  try:
+    while True:
+      item, error = items.get()
+      if item is _END:
+        if error is not None:
+          raise error
+        return
+      yield item
+  finally:
+    closed.set()
+    thread.join()
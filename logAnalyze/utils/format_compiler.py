@@ -0,0 +1,317 @@
+"""
+This file contains the compiler of the Apache LogFormat and nginx log_format strings into log formats. A compiled log
+format parses the logs with a regex and, where the format permits it, with a generated tokenizer which splits the logs
+on the literal text between their fields instead of matching them.
+"""
+import re
+from functools import lru_cache
+
+from logAnalyze.utils.custom_exceptions import ParseError
+
+# The patterns of the kinds of fields:
+#  * :token: a string without any whitespace
+#  * :text: any string (the shortest one followed by the next literal text, or the rest of the log at its end)
+#  * :status: a 3 digit status code
+#  * :size: a number of bytes, or '-' when no content was returned
+#  * :number: a decimal number
+FIELD_PATTERNS = {'token': r'\S+', 'text': r'.*?', 'status': r'\d{3}', 'size': r'\d+|-', 'number': r'\d+'}
+
+# The fields of the Apache LogFormat directives, along with their kinds. The other directives are matched as unnamed
+# tokens, and %t is matched within the square brackets it writes.
+APACHE_DIRECTIVES = {
+  'h': ('host', 'token'), 'a': ('host', 'token'), 'l': ('identity', 'token'), 'u': ('user', 'token'),
+  't': ('time', 'text'), 'r': ('request', 'text'), 's': ('status', 'status'), 'b': ('size', 'size'),
+  'B': ('size', 'size'), 'O': ('size', 'size'), 'v': ('vhost', 'token'), 'V': ('vhost', 'token'),
+  'p': ('port', 'number'), 'D': ('duration', 'number'),
+}
+
+# The fields of the nginx log_format variables, along with their kinds. The $http_* variables are the request headers,
+# the other variables are matched as unnamed tokens.
+NGINX_VARIABLES = {
+  'remote_addr': ('host', 'token'), 'remote_user': ('user', 'token'), 'time_local': ('time', 'text'),
+  'request': ('request', 'text'), 'status': ('status', 'status'), 'body_bytes_sent': ('size', 'size'),
+  'bytes_sent': ('size', 'size'), 'host': ('vhost', 'token'), 'server_name': ('vhost', 'token'),
+  'server_port': ('port', 'number'), 'request_time': ('request_time', 'token'),
+}
+
+# The fields of the request headers which have a name of their own, the other headers being named http_<header>
+HEADER_FIELDS = {'referer': 'referer', 'user_agent': 'user_agent'}
+
+# An Apache directive: % followed by the optional < or > modifier, the optional status codes condition, the optional
+# {argument} and the letter of the directive
+_APACHE_DIRECTIVE = re.compile(r'%[<>]?(?:!?\d{3}(?:,\d{3})*)?(?:\{([^}]*)\})?([a-zA-Z%])|%')
+
+# An nginx variable, eg. $status or ${status}
+_NGINX_VARIABLE = re.compile(r'\$(?:\{(\w+)\}|(\w+))')
+
+
+class CompiledLogFormat:
+  """
+  A log format compiled from an Apache LogFormat or an nginx log_format string. It can be used wherever a LogFormat is
+  expected, its value being a dictionary with the same keys as the values of the LogFormat members.
+
+  :ivar value: a dictionary of the regex, the display name, the fields and the format string of the log format
+  """
+
+  def __init__(self, format_string, name=None):
+    elements = parse_format(format_string)
+    self.value = {
+      'regex': get_regex(elements),
+      'name': name or format_string,
+      'fields': tuple(element[0] for element in elements if isinstance(element, tuple) and element[0] is not None),
+      'format': format_string,
+    }
+
+  def __reduce__(self):
+    # the compiled log formats are handed over to the parallel workers by their format string
+    if self.value['name'] == self.value['format']:
+      return compile_log_format, (self.value['format'],)
+    return compile_log_format, (self.value['format'], self.value['name'])
+
+  def __repr__(self):
+    return '<CompiledLogFormat %r>' % self.value['format']
+
+  def get_parser(self, fields=None, malformed=None):
+    """
+    Returns a compiled parser for this log format which only extracts the requested fields (see LogFormat.get_parser)
+
+    :rtype: collections.abc.Callable
+    """
+    from logAnalyze.utils.parse_utils import get_parser
+    return get_parser(self, fields, malformed)
+
+  def get_bytes_parser(self, fields=None, encoding='utf-8', malformed=None):
+    """
+    Returns a compiled parser for this log format which extracts the requested fields from the log lines of a
+    bytes-like buffer (see LogFormat.get_bytes_parser)
+
+    :rtype: collections.abc.Callable
+    """
+    from logAnalyze.utils.parse_utils import get_bytes_parser
+    return get_bytes_parser(self, fields, encoding, malformed)
+
+
+@lru_cache(maxsize=None)
+def compile_log_format(format_string, name=None):
+  """
+  Compiles an Apache LogFormat string (eg. '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i"') or an nginx
+  log_format string (eg. '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent') into a log
+  format. The same format string always gives the same log format.
+
+  The fields of the logs are named after the directives or variables: host (%h, %a, $remote_addr), identity (%l),
+  user (%u, $remote_user), time (%t, $time_local), request (%r, $request), status (%s, %>s, $status), size (%b, %B,
+  %O, $body_bytes_sent, $bytes_sent), vhost (%v, %V, $host, $server_name), port (%p, $server_port), duration (%D),
+  request_time ($request_time), referer and user_agent (%{Referer}i, %{User-agent}i, $http_referer,
+  $http_user_agent) and http_<header> for the other request headers. When a field appears more than once, only its
+  first occurrence is extracted.
+
+  :param format_string: the Apache or nginx format string
+  :type format_string: str
+  :param name: the display name of the log format, the format string by default
+  :type name: str
+  :rtype: CompiledLogFormat
+  :raises ParseError: if the format string is invalid
+  """
+  return CompiledLogFormat(format_string, name)
+
+
+def get_log_format(value):
+  """
+  Returns the log format of a name (eg. clf or combined, see LogFormat) or of an Apache or nginx format string
+
+  :param value: the name of a LogFormat member, case insensitive, or a format string
+  :type value: str
+  :rtype: logAnalyze.utils.constants.LogFormat or CompiledLogFormat
+  :raises ParseError: if the value is neither a known name nor a valid format string
+  """
+  from logAnalyze.utils.constants import LogFormat
+  if value.upper() in LogFormat.__members__:
+    return LogFormat[value.upper()]
+  return compile_log_format(value)
+
+
+@lru_cache(maxsize=None)
+def parse_format(format_string):
+  """
+  Splits an Apache or nginx format string into its elements: the literal strings between the fields, and the
+  (name, kind) tuples of the fields (see FIELD_PATTERNS), the name being None for the fields which are not extracted.
+  The format is an nginx one if it contains variables but no Apache directive.
+
+  :param format_string: the Apache or nginx format string
+  :type format_string: str
+  :rtype: tuple
+  :raises ParseError: if the format string is invalid
+  """
+  # the quotes are escaped in the format strings of the Apache configuration files
+  format_string = format_string.replace('\\"', '"')
+  elements = []
+  names = set()
+
+  def add_field(name, kind):
+    if name in names:
+      name = None
+    names.add(name)
+    elements.append((name, kind))
+
+  def add_literal(literal):
+    if elements and isinstance(elements[-1], str):
+      elements[-1] += literal
+    elif literal:
+      elements.append(literal)
+
+  if _APACHE_DIRECTIVE.search(format_string) is None and _NGINX_VARIABLE.search(format_string) is not None:
+    position = 0
+    for variable in _NGINX_VARIABLE.finditer(format_string):
+      add_literal(format_string[position:variable.start()])
+      position = variable.end()
+      variable_name = variable.group(1) or variable.group(2)
+      if variable_name.startswith('http_'):
+        add_field(get_header_field(variable_name[5:]), 'text')
+      else:
+        add_field(*NGINX_VARIABLES.get(variable_name, (None, 'token')))
+    add_literal(format_string[position:])
+  else:
+    position = 0
+    for directive in _APACHE_DIRECTIVE.finditer(format_string):
+      add_literal(format_string[position:directive.start()])
+      position = directive.end()
+      argument, letter = directive.groups()
+      if letter is None:
+        raise ParseError('Invalid directive at position %d of the log format: %s' % (directive.start(), format_string))
+      if letter == '%':
+        add_literal('%')
+      elif letter == 'i' and argument is not None:
+        add_field(get_header_field(argument), 'text')
+      elif letter == 't':
+        if argument is None:
+          # the time is written within square brackets
+          add_literal('[')
+          add_field('time', 'text')
+          add_literal(']')
+        else:
+          add_field(None, 'text')
+      elif argument is None and letter in APACHE_DIRECTIVES:
+        add_field(*APACHE_DIRECTIVES[letter])
+      else:
+        add_field(None, 'token')
+    add_literal(format_string[position:])
+
+  if not any(isinstance(element, tuple) for element in elements):
+    raise ParseError('No field in the log format: %s' % format_string)
+  return tuple(elements)
+
+
+def get_header_field(header):
+  """
+  The name of the field of a request header, eg. user_agent for User-Agent or http_x_forwarded_for for
+  X-Forwarded-For, or None if the header name is not a valid field name
+  """
+  name = header.lower().replace('-', '_')
+  if not name.isidentifier():
+    return None
+  return HEADER_FIELDS.get(name, 'http_' + name)
+
+
+def get_regex(elements):
+  """
+  Builds the regex of the elements of a log format. The tokens followed by a literal text which does not start with a
+  whitespace end at the first occurrence of the literal, and a text ending the log spans the rest of the log.
+
+  :param elements: the elements of the log format (see parse_format)
+  :type elements: tuple
+  :rtype: str
+  """
+  parts = ['^']
+  for i, element in enumerate(elements):
+    if isinstance(element, str):
+      parts.append(re.escape(element))
+      continue
+    name, kind = element
+    pattern = FIELD_PATTERNS[kind]
+    following = elements[i + 1] if i + 1 < len(elements) else None
+    if kind == 'token' and isinstance(following, str) and not following[0].isspace():
+      pattern = r'\S+?'
+    elif kind == 'text' and following is None:
+      pattern = r'.*'
+    parts.append('(?:%s)' % pattern if name is None else '(?P<%s>%s)' % (name, pattern))
+  return ''.join(parts)
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(log_format, fields):
+  """
+  Generates the tokenizer of a log format extracting the requested fields, or returns None if the format does not
+  permit it (eg. when two fields are not separated by any literal text).
+
+  The tokenizer splits the logs on the literal texts between their fields with str.partition, taking the first
+  occurrence of every literal as the lazy patterns of the regex would, and validates all the fields at once. It gives
+  the same fields as the regex of the log format for the logs which only contain spaces as whitespace (besides the line
+  feed ending them), and hands the logs it rejects over to a fallback so that the regex can have the last word.
+
+  The returned callable takes a batch of logs and the fallback, which is called with every rejected log, and returns
+  the list of the tuples of the requested fields of the logs (or of whatever the fallback returns).
+
+  :param log_format: the log format, which holds its format string under the 'format' key of its value
+  :type log_format: logAnalyze.utils.constants.LogFormat or CompiledLogFormat
+  :param fields: the names of the requested fields, in the order in which they are returned
+  :type fields: tuple
+  :rtype: collections.abc.Callable
+  """
+  elements = parse_format(log_format.value['format'])
+  if isinstance(elements[0], str):
+    prefix, elements = elements[0], elements[1:]
+  else:
+    prefix = ''
+  # the fields with the literal text following them, None at the end of the log
+  pairs = []
+  for i in range(0, len(elements), 2):
+    following = elements[i + 1] if i + 1 < len(elements) else None
+    if not isinstance(elements[i], tuple) or (following is not None and not isinstance(following, str)):
+      return None
+    pairs.append((elements[i], following))
+
+  variables = {}
+  statements = ['rest = log[%d:]' % len(prefix)] if prefix else []
+  conditions = ['log.startswith(%r)' % prefix] if prefix else []
+  source = 'rest' if prefix else 'log'
+  for i, ((name, kind), following) in enumerate(pairs):
+    variable = variables[name] = 'f%d' % i
+    if following is None:
+      statements.append("%s = %s.rstrip('\\n')" % (variable, source))
+    else:
+      if kind in ('status', 'size', 'number') and (following[0].isdecimal() or following[0] == '-'):
+        # a number ends at the last digit followed by the literal, not at the first occurrence of the literal
+        return None
+      statements.append('%s, s%d, rest = %s.partition(%r)' % (variable, i, source, following))
+      conditions.append('s%d' % i)
+      source = 'rest'
+    if kind == 'token':
+      conditions.append(variable if following == ' ' else "%s and ' ' not in %s" % (variable, variable))
+    elif kind == 'status':
+      conditions.append('len(%s) == 3 and %s.isdecimal()' % (variable, variable))
+    elif kind == 'size':
+      conditions.append("(%s == '-' or %s.isdecimal())" % (variable, variable))
+    elif kind == 'number':
+      conditions.append('%s.isdecimal()' % variable)
+
+  record = '(%s,)' % ', '.join(variables[field] for field in fields)
+  condition = ' and '.join(conditions) or 'True'
+  code = _TOKENIZER_TEMPLATE.format(statements=''.join('\n    ' + statement for statement in statements),
+                                    condition=condition, record=record)
+  namespace = {}
+  exec(code, namespace)
+  return namespace['tokenize']
+
+
+# The source code of the tokenizers generated by get_tokenizer, the statements splitting a log being inlined in the loop
+_TOKENIZER_TEMPLATE = """
+def tokenize(logs, fallback):
+  records = []
+  append = records.append
+  for log in logs:{statements}
+    if {condition}:
+      append({record})
+    else:
+      append(fallback(log))
+  return records
+"""
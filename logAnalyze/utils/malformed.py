@@ -0,0 +1,115 @@
+"""
+This file contains the collector of the malformed logs skipped by the parsers in tolerant mode, which counts them by
+reason and optionally writes them to a quarantine file
+"""
+import os
+from collections import Counter
+
+from logAnalyze.utils.custom_exceptions import MalformedLogsError
+
+# The reasons for which a log is malformed:
+#  * :format: the log does not match the log format
+#  * :time: the timestamp of the log could not be parsed
+#  * :status: the status code of the log is neither a successful nor an unsuccessful status
+#  * :encoding: the log could not be decoded with the encoding of the file
+REASONS = ('format', 'time', 'status', 'encoding')
+
+# The number of bytes of malformed logs which are buffered before they are written to the quarantine file
+QUARANTINE_BUFFER_SIZE = 2 ** 16
+
+
+class MalformedLogs:
+  """
+  This class collects the malformed logs skipped by the parsers. The logs are counted by reason, and written to a
+  quarantine file in bulk if there is one. The quarantine file is opened in append mode for every write, so that the
+  parallel workers can share it (the logs of different workers may then be interleaved).
+
+  :ivar counts: a Counter of the number of malformed logs by reason
+  :ivar quarantine_path: the path of the quarantine file, or None
+  :ivar max_errors: the maximum number of malformed logs, or None if there is no maximum
+  """
+
+  def __init__(self, quarantine_path=None, max_errors=None):
+    self.counts = Counter()
+    self.quarantine_path = quarantine_path
+    self.max_errors = max_errors
+    self._buffer = []
+    self._buffer_size = 0
+
+  def spawn(self):
+    """
+    Creates an empty collector with the same quarantine file and maximum, eg. for a parallel worker
+
+    :rtype: MalformedLogs
+    """
+    return MalformedLogs(self.quarantine_path, self.max_errors)
+
+  def add(self, reason, log):
+    """
+    Records a malformed log
+
+    :param reason: the reason for which the log is malformed (see REASONS)
+    :type reason: str
+    :param log: the malformed log
+    :type log: str
+    :raises MalformedLogsError: if the maximum number of malformed logs is exceeded
+    """
+    self.counts[reason] += 1
+    if self.quarantine_path is not None:
+      self._buffer.append(log.rstrip('\n') + '\n')
+      self._buffer_size += len(log)
+      if self._buffer_size >= QUARANTINE_BUFFER_SIZE:
+        self.flush()
+    self.check()
+
+  def get_total(self):
+    return sum(self.counts.values())
+
+  def check(self):
+    """
+    :raises MalformedLogsError: if the maximum number of malformed logs is exceeded
+    """
+    if self.max_errors is not None and self.get_total() > self.max_errors:
+      self.flush()
+      raise MalformedLogsError('More than %d malformed logs (%s)' % (self.max_errors, self.format_counts()))
+
+  def merge(self, other):
+    """
+    Adds the counts of another collector (eg. of a parallel worker, which has flushed its logs) to this one
+
+    :raises MalformedLogsError: if the maximum number of malformed logs is exceeded
+    """
+    self.counts.update(other.counts)
+    self.check()
+
+  def flush(self):
+    """
+    Writes the buffered malformed logs to the quarantine file
+    """
+    if not self._buffer:
+      return
+    data = ''.join(self._buffer).encode('utf-8', 'surrogateescape')
+    self._buffer = []
+    self._buffer_size = 0
+    fd = os.open(self.quarantine_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+      # a single write, so that the logs of parallel workers are not mixed within a line
+      while data:
+        data = data[os.write(fd, data):]
+    finally:
+      os.close(fd)
+
+  def format_counts(self):
+    return ', '.join('%s: %d' % (reason, self.counts[reason]) for reason in REASONS if self.counts[reason])
+
+
+def get_decode_errors(malformed):
+  """
+  The error handler used to decode the log files: the undecodable bytes are escaped as surrogates in tolerant mode,
+  so that the parsers can skip their logs
+
+  :param malformed: the collector of the malformed logs, or None if the logs are parsed strictly
+  :type malformed: MalformedLogs
+  :rtype: str
+  """
+  return 'strict' if malformed is None else 'surrogateescape'
@@ -2,18 +2,35 @@
 This file contains some utility methods which can be used be our core package
 """
 import re
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from itertools import repeat
 
-from dateutil import parser
+from dateutil import parser, tz
 
 from logAnalyze.utils.custom_exceptions import ParseError
-from .constants import LogFormat
+from .constants import LogFormat, SUCCESS_BY_STATUS
+from .format_compiler import CompiledLogFormat, get_tokenizer
+
+# The status codes which are either successful or unsuccessful, the logs with any other status code being malformed
+KNOWN_STATUSES = frozenset(status for status, is_success in SUCCESS_BY_STATUS.items() if is_success is not None)
+
+# Finds the surrogates escaping the bytes which could not be decoded
+_find_surrogate = re.compile('[\udc80-\udcff]').search
+
+# Finds the whitespace other than the spaces and the line feeds, which the tokenizers do not split the logs on
+_find_odd_space = re.compile(r'[^\S \n]').search
+
+# The ASCII whitespace other than the space and the line feed, which are looked for directly in ASCII logs
+ODD_ASCII_SPACES = '\t\r\x0b\x0c\x1c\x1d\x1e\x1f'
 
 
 def parse(log_format, log):
   """
-  This method parses a CLF log string line into a dictionary of objects that can be used for further analysis.
+  This method parses a log string line into a dictionary of objects that can be used for further analysis.
 
-  The parsed dict contains the following fields:
+  The parsed dict contains the fields of the log format, for the CLF format:
     * :host: the client host that made the request
     * :identity: the client's identity (usually '-')
     * :user: the userid of the person requesting the document (usually '-')
@@ -22,48 +39,498 @@ def parse(log_format, log):
     * :status: the http status code returned to the client
     * :size: size of the object returned to the client (measured in bytes)
 
-  :param log_format: the enum value of the log format to be used
-  :type log_format: .constants.LogFormat
-  :param log: a string containing a single record of the CLF log type
+  :param log_format: the log format to be used
+  :type log_format: .constants.LogFormat or .format_compiler.CompiledLogFormat
+  :param log: a string containing a single record of the log format
   :type log: str
   :return: a dictionary of standard fields with well defined meanings
   :rtype: dict
   :raises ParseError: if the log is not in the desired format or the log_format provided was invalid
   """
-  if not isinstance(log_format, LogFormat):
-    raise ParseError('Please pass a valid log_format of type %s' % LogFormat)
+  try:
+    parse_log = _parsers[log_format]
+  except (KeyError, TypeError):
+    parse_log = get_parser(log_format)
+    _parsers[log_format] = parse_log
+  return parse_log(log)
+
+
+# The parsers extracting all the fields, used by parse()
+_parsers = {}
+
+
+def get_parser(log_format, fields=None, malformed=None):
+  """
+  Compiles a parser for the log format which only extracts the requested fields. The fields which are not requested
+  are skipped entirely, so for example the time conversion is only paid for if the 'time' field is requested.
+
+  The returned callable takes a log string and returns a dictionary containing just the requested fields, with the
+  same values as the dictionary returned by :func:`parse`.
+
+  In tolerant mode, when a collector of the malformed logs is provided, the malformed logs (including those with an
+  unidentifiable status code) are recorded in the collector and the parser returns None instead of raising.
+
+  :param log_format: the log format to be used
+  :type log_format: .constants.LogFormat or .format_compiler.CompiledLogFormat
+  :param fields: the names of the fields to be extracted (see the 'fields' of the value of the log format), all the
+    fields are extracted if None
+  :type fields: collections.abc.Iterable
+  :param malformed: the collector of the malformed logs, or None to raise ParseError on any malformed log
+  :type malformed: .malformed.MalformedLogs
+  :return: a callable which parses a log string into a dictionary of the requested fields
+  :rtype: collections.abc.Callable
+  :raises ParseError: if the log_format provided was invalid or any of the requested fields is unknown
+  """
+  fields = get_fields(log_format, fields)
 
+  match = re.compile(log_format.value['regex']).match
+  format_name = log_format.value['name']
+  single_field = fields[0] if len(fields) == 1 else None
+  parse_time = 'time' in fields
+
+  def parse_log(log):
+    log_match = match(log)
+    if log_match is None:
+      raise ParseError('Could not parse the log of type [%s]: %s' % (format_name, log))
+    if single_field is None:
+      parsed_log = dict(zip(fields, log_match.group(*fields)))
+    else:
+      parsed_log = {single_field: log_match.group(single_field)}
+    if parse_time:
+      try:
+        parsed_log['time'] = get_datetime_from_clf_date(parsed_log['time'])
+      except ValueError as ex:
+        raise ParseError('Could not parse the log of type [%s]: %s' % (format_name, log)) from ex
+    return parsed_log
+
+  if malformed is None:
+    return parse_log
+
+  check_status = 'status' in fields
+
+  def parse_log_tolerantly(log):
+    if _find_surrogate(log) is not None:
+      malformed.add('encoding', log)
+      return None
+    log_match = match(log)
+    if log_match is None:
+      malformed.add('format', log)
+      return None
+    if check_status and log_match.group('status') not in KNOWN_STATUSES:
+      malformed.add('status', log)
+      return None
+    try:
+      return parse_log(log)
+    except ParseError:
+      malformed.add('time', log)
+      return None
+
+  return parse_log_tolerantly
+
+
+def parse_many(log_format, logs, fields=None, stats=None, malformed=None):
+  """
+  Parses a batch of log strings into tuples of the requested fields, in the order in which the fields are requested.
+  The logs are split by the generated tokenizer of the log format where it permits it, the pattern of the log format
+  only being matched against the logs the tokenizer rejects, and no dictionary is built per log.
+
+  In tolerant mode, when a collector of the malformed logs is provided, the malformed logs (including those with an
+  unidentifiable status code) are recorded in the collector and skipped instead of raising.
+
+  :param log_format: the log format to be used
+  :type log_format: .constants.LogFormat or .format_compiler.CompiledLogFormat
+  :param logs: the log strings to be parsed
+  :type logs: collections.abc.Iterable
+  :param fields: the names of the fields to be extracted (see the 'fields' of the value of the log format), all the
+    fields are extracted if None
+  :type fields: collections.abc.Iterable
+  :param stats: the statistics of the run, to which the time spent splitting the logs and parsing their timestamps is
+    added (the whole batch being parsed at once), or None
+  :type stats: .stats.RunStats
+  :param malformed: the collector of the malformed logs, or None to raise ParseError on any malformed log
+  :type malformed: .malformed.MalformedLogs
+  :return: a generator of the tuples of the requested fields of every log, with the same values as the dictionary
+    returned by :func:`parse`
+  :rtype: collections.abc.Iterator
+  :raises ParseError: if any of the logs is not in the desired format, the log_format provided was invalid or any of
+    the requested fields is unknown
+  :raises MalformedLogsError: if the maximum number of malformed logs of the collector is exceeded
+  """
+  fields = get_fields(log_format, fields)
+  yield from _parse_batch(list(logs), log_format, fields, stats, malformed)
+
+
+def _parse_batch(logs, log_format, fields, stats, malformed):
+  """
+  Parses a batch of logs for :func:`parse_many` in two passes, the splitting of the logs and the parsing of their
+  timestamps, timing every pass as a stage of the run statistics if there are any. The malformed logs are skipped if
+  there is a collector of the malformed logs.
+  """
+  match = re.compile(log_format.value['regex']).match
+  format_name = log_format.value['name']
+  # the first field is requested twice when it is the only one, so that group() always returns a tuple
+  group_names = fields if len(fields) > 1 else fields * 2
+  single_field = len(fields) == 1
+  time_index = fields.index('time') if 'time' in fields else None
+  stage = _null_stage if stats is None else stats.stage
+  num_malformed = 0 if malformed is None else malformed.get_total()
   try:
-    log_match = re.match(log_format.value['regex'], log)
-    host = log_match.group('host')
-    identity = log_match.group('identity')
-    user = log_match.group('user')
-    time = get_datetime_from_clf_date(log_match.group('time'))
-    request = log_match.group('request')
-    status = log_match.group('status')
-    size = log_match.group('size')
-  except (AttributeError, ParseError, ValueError) as ex:
-    raise ParseError('Could not parse the log of type [%s]: %s' % (log_format.value['name'], log)) from ex
-
-  parsed_log = {
-    'host': host,
-    'identity': identity,
-    'user': user,
-    'time': time,
-    'request': request,
-    'status': status,
-    'size': size
-  }
-  return parsed_log
+    with stage('parse'):
+      # the undecodable bytes are escaped as surrogates, which are looked for in the whole batch at once
+      check_encoding = malformed is not None and _find_surrogate(''.join(logs)) is not None
+
+      def match_log(log):
+        log_match = match(log)
+        if log_match is None or check_encoding and _find_surrogate(log) is not None:
+          if malformed is None:
+            raise ParseError('Could not parse the log of type [%s]: %s' % (format_name, log))
+          malformed.add('format' if log_match is None else 'encoding', log)
+          return None
+        record = log_match.group(*group_names)
+        return record[:1] if single_field else record
+
+      tokenize = get_tokenizer(log_format, fields)
+      if tokenize is not None and not check_encoding and is_plain(logs):
+        records = tokenize(logs, match_log)
+      else:
+        records = list(map(match_log, logs))
+
+      if malformed is not None:
+        status_index = fields.index('status') if 'status' in fields else None
+        valid_records = []
+        valid_logs = []
+        for record, log in zip(records, logs):
+          if record is None:
+            continue
+          if status_index is not None and record[status_index] not in KNOWN_STATUSES:
+            malformed.add('status', log)
+            continue
+          valid_records.append(record)
+          valid_logs.append(log)
+        records, logs = valid_records, valid_logs
+
+    if time_index is not None:
+      with stage('time'):
+        parsed_records = []
+        for record, log in zip(records, logs):
+          try:
+            parsed_records.append(record[:time_index] + (get_datetime_from_clf_date(record[time_index]),) +
+                                  record[time_index + 1:])
+          except ValueError as ex:
+            if malformed is None:
+              raise ParseError('Could not parse the log of type [%s]: %s' % (format_name, log)) from ex
+            malformed.add('time', log)
+        records = parsed_records
+  except ParseError:
+    if stats is not None:
+      stats.num_parse_errors += 1
+    raise
+  if stats is not None and malformed is not None:
+    stats.num_parse_errors += malformed.get_total() - num_malformed
+  return records
+
+
+def is_plain(logs):
+  """
+  Checks that the only whitespace of a batch of logs are the spaces and the line feeds ending the logs, in which case
+  the generated tokenizers split the logs as the patterns of the log formats would
+
+  :param logs: the log strings
+  :type logs: collections.abc.Sequence
+  :rtype: bool
+  """
+  text = ''.join(logs)
+  if text.isascii():
+    # a few substring searches are much faster than a regex search
+    if any(space in text for space in ODD_ASCII_SPACES):
+      return False
+  elif _find_odd_space(text) is not None:
+    return False
+  return text.count('\n') == sum(map(str.endswith, logs, repeat('\n')))
+
+
+@contextmanager
+def _null_stage(name):
+  yield
+
+
+def get_bytes_parser(log_format, fields=None, encoding='utf-8', malformed=None):
+  """
+  Compiles a parser for the log format which scans a bytes-like buffer (eg. a memory mapped file) instead of strings,
+  so that the lines never have to be decoded as a whole. Only the requested fields are extracted and decoded, and the
+  decoded values are shared between the logs having the same value (eg. the same host).
+
+  The returned callable takes the buffer along with the start and end offsets of the range to be scanned (the start
+  offset is expected to be the start of a line), and returns a generator of dictionaries containing just the
+  requested fields of every line in the range, with the same values as the dictionary returned by :func:`parse`.
+
+  In tolerant mode, when a collector of the malformed logs is provided, the malformed lines (including those with an
+  unidentifiable status code) are recorded in the collector and skipped: the scan of the buffer resumes after them.
+
+  :param log_format: the log format to be used
+  :type log_format: .constants.LogFormat or .format_compiler.CompiledLogFormat
+  :param fields: the names of the fields to be extracted (see the 'fields' of the value of the log format), all the
+    fields are extracted if None
+  :type fields: collections.abc.Iterable
+  :param encoding: the encoding used to decode the extracted fields
+  :type encoding: str
+  :param malformed: the collector of the malformed logs, or None to raise ParseError on any malformed log
+  :type malformed: .malformed.MalformedLogs
+  :return: a callable which parses the log lines of a buffer into dictionaries of the requested fields
+  :rtype: collections.abc.Callable
+  :raises ParseError: if the log_format provided was invalid or any of the requested fields is unknown
+  """
+  fields = get_fields(log_format, fields)
+  parse_time = 'time' in fields
+  cached_fields = tuple(field for field in fields if field != 'time')
+  # the 'malformed' group is requested as well so that group() always returns a tuple, zip() never reaches it
+  group_names = cached_fields + ('malformed', 'malformed')
+
+  # Every line is matched, either by the log format or by the 'malformed' group, so the lines can be scanned with a
+  # single finditer() call. The pattern is multiline since the range does not start at the beginning of the buffer.
+  finditer = re.compile(b'(?:' + log_format.value['regex'].encode() + br'[^\n]*|(?P<malformed>[^\n]*))(?:\n|\Z)',
+                        re.MULTILINE).finditer
+  format_name = log_format.value['name']
+
+  check_status = malformed is not None and 'status' in fields
+
+  def parse_logs(buffer, start=0, end=None):
+    if end is None:
+      end = len(buffer)
+    decode = _DecodeCache(encoding).__getitem__
+    while True:
+      log_match = None
+      try:
+        for log_match in finditer(buffer, start, end):
+          # the fields of malformed lines are None, which fail to be decoded
+          parsed_log = dict(zip(cached_fields, map(decode, log_match.group(*group_names))))
+          if parse_time:
+            parsed_log['time'] = get_datetime_from_clf_date(log_match.group('time').decode(encoding))
+          if check_status and parsed_log['status'] not in KNOWN_STATUSES:
+            malformed.add('status', log_match.group(0).decode(encoding, 'surrogateescape'))
+            continue
+          yield parsed_log
+        return
+      except (AttributeError, ValueError) as ex:
+        if log_match is None:
+          raise
+        if log_match.start() == end:
+          # the empty match past the last line
+          return
+        if malformed is None:
+          raise ParseError('Could not parse the log of type [%s]: %s' % (
+            format_name, log_match.group(0).decode(encoding, 'replace').rstrip('\n'))) from ex
+        if log_match.group('malformed') is not None:
+          reason = 'format'
+        else:
+          reason = 'encoding' if isinstance(ex, UnicodeDecodeError) else 'time'
+        malformed.add(reason, log_match.group(0).decode(encoding, 'surrogateescape'))
+        # resume the scan after the malformed line
+        start = log_match.end()
+
+  return parse_logs
+
+
+class _DecodeCache(dict):
+  """
+  A dictionary of the decoded strings of the byte strings looked up in it
+  """
 
+  def __init__(self, encoding):
+    super().__init__()
+    self.encoding = encoding
 
+  def __missing__(self, value):
+    decoded_value = self[value] = value.decode(self.encoding)
+    return decoded_value
+
+
+def get_fields(log_format, fields=None):
+  """
+  Validates the fields requested from a parser of the log format
+
+  :param log_format: the log format to be used
+  :type log_format: .constants.LogFormat or .format_compiler.CompiledLogFormat
+  :param fields: the names of the fields to be extracted (see the 'fields' of the value of the log format), all the
+    fields if None
+  :type fields: collections.abc.Iterable
+  :return: the tuple of requested fields, without any duplicates
+  :rtype: tuple
+  :raises ParseError: if the log_format provided was invalid or any of the requested fields is unknown
+  """
+  if not isinstance(log_format, (LogFormat, CompiledLogFormat)):
+    raise ParseError('Please pass a valid log_format of type %s or %s' % (LogFormat, CompiledLogFormat))
+
+  format_fields = log_format.value['fields']
+  if fields is None:
+    return format_fields
+  fields = tuple(dict.fromkeys(fields))
+  unknown_fields = [field for field in fields if field not in format_fields]
+  if unknown_fields:
+    raise ParseError('Unknown fields requested: %s' % ', '.join(unknown_fields))
+  return fields
+
+
+# Month abbreviations as they appear in the CLF time field
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+# Number of distinct timestamps to remember. Log lines arrive roughly in time order, so consecutive lines very often
+# share the same second.
+CLF_DATE_CACHE_SIZE = 1024
+
+# tzinfo objects shared between all the parsed timestamps, keyed by the offset string (eg. '-0700')
+_tz_cache = {}
+
+
+@lru_cache(maxsize=CLF_DATE_CACHE_SIZE)
 def get_datetime_from_clf_date(date):
   """
-  This method coverts the CLF time format to a python datetime object
+  This method coverts the CLF time format to a python datetime object.
+
+  Dates of the fixed form ``dd/Mon/yyyy:HH:MM:SS +zzzz`` are parsed directly and memoized, any other form is handed
+  over to ``dateutil``.
 
   :param date: a string value of the datetime extracted from the CLF log
   :type date: str
   :return: a python datetime object
   :rtype: datetime.datetime
   """
-  return parser.parse(date.replace(':', ' ', 1))
+  try:
+    if len(date) != 26 or date[2] + date[6] + date[11] + date[14] + date[17] + date[20] != '//::: ':
+      raise ValueError('Not a CLF date: %s' % date)
+    return datetime(int(date[7:11]), MONTHS[date[3:6]], int(date[0:2]), int(date[12:14]), int(date[15:17]),
+                    int(date[18:20]), tzinfo=get_tzinfo(date[21:26]))
+  except (KeyError, ValueError):
+    # not in the fixed CLF layout, let dateutil figure it out
+    return parser.parse(date.replace(':', ' ', 1))
+
+
+def get_tzinfo(offset):
+  """
+  Returns a (cached) tzinfo object for a CLF timezone offset
+
+  :param offset: the offset string of the form +zzzz or -zzzz
+  :type offset: str
+  :return: the tzinfo object for this offset
+  :rtype: datetime.tzinfo
+  :raises ValueError: if the offset is not of the form +zzzz or -zzzz
+  """
+  tzinfo = _tz_cache.get(offset)
+  if tzinfo is None:
+    if len(offset) != 5 or offset[0] not in '+-' or not offset[1:].isdigit():
+      raise ValueError('Invalid timezone offset: %s' % offset)
+    seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    if seconds == 0:
+      tzinfo = tz.tzutc()
+    else:
+      tzinfo = tz.tzoffset(None, -seconds if offset[0] == '-' else seconds)
+    _tz_cache[offset] = tzinfo
+  return tzinfo
+
+
+def get_num_bytes(size):
+  """
+  Converts the size field of a log into the number of bytes served, '-' (no content returned) counting as 0
+
+  :param size: the size field, a decimal number or '-'
+  :type size: str
+  :rtype: int
+  """
+  return 0 if size == '-' else int(size)
+
+
+# Multipliers of the units accepted by parse_size
+SIZE_UNITS = {'': 1, 'B': 1, 'K': 2 ** 10, 'KB': 2 ** 10, 'M': 2 ** 20, 'MB': 2 ** 20, 'G': 2 ** 30, 'GB': 2 ** 30,
+              'T': 2 ** 40, 'TB': 2 ** 40}
+
+
+def parse_size(size):
+  """
+  Converts a human readable size (eg. 256MB, 1.5G or 4096) into a number of bytes
+
+  :param size: the size, as a number optionally followed by one of the units B, K(B), M(B), G(B) or T(B)
+  :type size: str
+  :return: the number of bytes
+  :rtype: int
+  :raises ValueError: if the size could not be parsed
+  """
+  size_match = re.match(r'^\s*(\d+(?:\.\d*)?)\s*([a-zA-Z]*)\s*$', size)
+  if size_match is None or size_match.group(2).upper() not in SIZE_UNITS:
+    raise ValueError('Invalid size: %s' % size)
+  return int(float(size_match.group(1)) * SIZE_UNITS[size_match.group(2).upper()])
+
+
+# Multipliers of the units accepted by parse_duration
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_duration(duration):
+  """
+  Converts a human readable duration (eg. 5m, 1.5h or 30) into a number of seconds
+
+  :param duration: the duration, as a number optionally followed by one of the units s, m, h or d
+  :type duration: str
+  :return: the number of seconds
+  :rtype: float
+  :raises ValueError: if the duration could not be parsed or is not positive
+  """
+  seconds = parse_non_negative_duration(duration)
+  if seconds == 0:
+    raise ValueError('Invalid duration: %s' % duration)
+  return seconds
+
+
+def parse_non_negative_duration(duration):
+  """
+  Converts a human readable duration (eg. 5m, 1.5h, 30 or 0) into a number of seconds, zero being allowed
+
+  :param duration: the duration, as a number optionally followed by one of the units s, m, h or d
+  :type duration: str
+  :return: the number of seconds
+  :rtype: float
+  :raises ValueError: if the duration could not be parsed
+  """
+  duration_match = re.match(r'^\s*(\d+(?:\.\d*)?)\s*([a-zA-Z]*)\s*$', duration)
+  if duration_match is None or duration_match.group(2).lower() not in DURATION_UNITS:
+    raise ValueError('Invalid duration: %s' % duration)
+  return float(duration_match.group(1)) * DURATION_UNITS[duration_match.group(2).lower()]
+
+
+def parse_datetime(value):
+  """
+  Converts a date and time, either in the CLF format (eg. 10/Oct/2000:13:55:36 -0700) or in any format understood by
+  dateutil (eg. 2000-10-10T13:55:36-07:00 or '2000-10-10 13:55'), into a timezone aware datetime. Dates without a
+  timezone are taken to be in UTC.
+
+  :param value: the date and time
+  :type value: str
+  :return: a timezone aware python datetime object
+  :rtype: datetime.datetime
+  :raises ValueError: if the date and time could not be parsed
+  """
+  if re.match(r'^\d{1,2}/\w{3}/\d{4}:', value):
+    parsed_datetime = get_datetime_from_clf_date(value)
+  else:
+    parsed_datetime = parser.parse(value)
+  if parsed_datetime.tzinfo is None:
+    parsed_datetime = parsed_datetime.replace(tzinfo=tz.tzutc())
+  return parsed_datetime
+
+
+def parse_address(address):
+  """
+  Converts a network address (eg. 127.0.0.1:8080, [::1]:514 or :514) into a (host, port) tuple
+
+  :param address: the address, as a host (empty for all the interfaces) and a port separated by a colon
+  :type address: str
+  :return: the (host, port), the host being None for all the interfaces
+  :rtype: tuple
+  :raises ValueError: if the address could not be parsed
+  """
+  host, colon, port = address.rpartition(':')
+  if not colon or not port.isdigit() or int(port) > 65535:
+    raise ValueError('Invalid address: %s' % address)
+  if host.startswith('[') and host.endswith(']'):
+    host = host[1:-1]
+  return host or None, int(port)
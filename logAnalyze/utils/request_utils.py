@@ -0,0 +1,114 @@
+"""
+This file contains the normalization of the request lines of the logs into the names of the resources reported by the
+report aggregators
+"""
+import re
+from urllib.parse import unquote
+
+# The keys by which the requests can be grouped:
+#  * :request: the whole request line, eg. GET /images/rollout.gif HTTP/1.0
+#  * :method_path: the method and the path, eg. GET /images/rollout.gif
+#  * :path: the path only, eg. /images/rollout.gif
+GROUP_BY_KEYS = ('request', 'method_path', 'path')
+
+# The placeholder replacing the numeric id segments of the paths (eg. /users/42/posts becomes /users/{id}/posts)
+ID_PLACEHOLDER = '{id}'
+
+# The number of distinct request lines whose normalized name is remembered, after which they are forgotten at once
+NORMALIZED_CACHE_SIZE = 2 ** 17
+
+_numeric_segment = re.compile(r'(?<=/)\d+(?=/|;|$)')
+
+
+class RequestNormalizer:
+  """
+  Normalizes the request lines of the logs (eg. 'GET /images/rollout.gif?size=2 HTTP/1.0') into the names of the
+  resources reported by the report aggregators, so that the same resource is not reported separately per method,
+  protocol version, query string or id.
+
+  The normalized names are interned: all the request lines sharing a normalized name are given the very same string
+  object, so that it is stored only once however many hosts request it. A normalizer is meant to be shared by all the
+  report aggregators of a run.
+
+  :ivar group_by: the key by which the requests are grouped, one of GROUP_BY_KEYS
+  :ivar strip_query: True if the query strings (and the fragments) of the paths are removed
+  :ivar collapse_ids: True if the numeric segments of the paths are replaced by ID_PLACEHOLDER
+  :ivar url_decode: True if the percent-encoded characters of the paths are decoded
+  """
+
+  def __init__(self, group_by='request', strip_query=False, collapse_ids=False, url_decode=False):
+    """
+    :raises ValueError: if group_by is not one of GROUP_BY_KEYS
+    """
+    if group_by not in GROUP_BY_KEYS:
+      raise ValueError('Unknown request key: %s (expected one of %s)' % (group_by, ', '.join(GROUP_BY_KEYS)))
+    self.group_by = group_by
+    self.strip_query = strip_query
+    self.collapse_ids = collapse_ids
+    self.url_decode = url_decode
+    self._names = {}
+    self._interned = {}
+
+  def __reduce__(self):
+    # the normalizers are handed over to the parallel workers without the names they remember
+    return RequestNormalizer, (self.group_by, self.strip_query, self.collapse_ids, self.url_decode)
+
+  def normalize(self, request):
+    """
+    Normalizes a request line into the name of its resource
+
+    :param request: the request line of a log
+    :type request: str
+    :return: the interned name of the resource
+    :rtype: str
+    """
+    name = self._names.get(request)
+    if name is None:
+      if len(self._names) >= NORMALIZED_CACHE_SIZE:
+        self._names.clear()
+      name = self.get_name(request)
+      name = self._interned.setdefault(name, name)
+      self._names[request] = name
+    return name
+
+  def get_name(self, request):
+    """
+    Computes the name of the resource of a request line, without interning it
+
+    :param request: the request line of a log
+    :type request: str
+    :rtype: str
+    """
+    method, path, protocol = split_request(request)
+    if self.strip_query:
+      path = path.partition('?')[0].partition('#')[0]
+    if self.url_decode and '%' in path:
+      path = unquote(path)
+    if self.collapse_ids:
+      path = _numeric_segment.sub(ID_PLACEHOLDER, path)
+
+    if self.group_by == 'path' or not method:
+      return path
+    if self.group_by == 'method_path' or not protocol:
+      return method + ' ' + path
+    return method + ' ' + path + ' ' + protocol
+
+
+def split_request(request):
+  """
+  Splits a request line into its method, path and protocol (eg. 'GET /index.html HTTP/1.0' into 'GET', '/index.html'
+  and 'HTTP/1.0'). The method and the protocol are empty strings when the request line lacks them, and the path may
+  contain spaces.
+
+  :param request: the request line of a log
+  :type request: str
+  :return: the (method, path, protocol)
+  :rtype: tuple
+  """
+  method, space, rest = request.partition(' ')
+  if not space:
+    return '', request, ''
+  path, space, protocol = rest.rpartition(' ')
+  if space and protocol.startswith('HTTP/'):
+    return method, path, protocol
+  return method, rest, ''
@@ -0,0 +1,135 @@
+"""
+This file contains the instrumentation of a run: the time spent in every stage of the aggregation, the throughput and
+the peak memory. The stages are timed per batch of logs, never per log, and nothing is measured when no RunStats is
+handed over.
+"""
+import resource
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# The interval in seconds at which the progress of a run is printed, by default
+PROGRESS_INTERVAL = 10.0
+
+# The marker of the end of an iteration
+_END = object()
+
+
+class RunStats:
+  """
+  This class collects the statistics of a run, stage by stage:
+
+  * bisect: searching the files for the byte ranges of the time range requested
+  * read: reading and decoding the files (or waiting for the decompression thread)
+  * parse: matching the logs against the pattern of the log format
+  * time: parsing the timestamps of the logs
+  * aggregate: handing the parsed logs over to the report aggregator
+  * merge: merging the partial aggregators of parallel workers
+  * cache: writing the parse caches of the files (parsing them)
+  * report: generating and printing the reports
+  * partial: writing the partial report of the counters (log_reader --emit-partial)
+
+  :ivar stages: the cumulative seconds spent in every stage, in the order in which they were first entered
+  :ivar num_lines: the number of logs aggregated
+  :ivar num_bytes: the number of bytes of the files read
+  :ivar num_parse_errors: the number of logs which could not be parsed
+  """
+
+  def __init__(self, progress_interval=None, progress_file=None):
+    """
+    :param progress_interval: the interval in seconds at which the progress is printed, or None not to print it
+    :type progress_interval: float
+    :param progress_file: the file the progress is printed to, sys.stderr by default
+    """
+    self.stages = OrderedDict()
+    self.num_lines = 0
+    self.num_bytes = 0
+    self.num_parse_errors = 0
+    self.start_time = time.perf_counter()
+    self.progress_interval = progress_interval
+    self.progress_file = progress_file
+    self._next_progress = None if progress_interval is None else time.monotonic() + progress_interval
+
+  @contextmanager
+  def stage(self, name):
+    """
+    Adds the time spent within the context to a stage
+    """
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+  def timed(self, iterable, name):
+    """
+    Iterates over an iterable, adding the time spent getting every item to a stage
+
+    :rtype: collections.abc.Iterator
+    """
+    iterator = iter(iterable)
+    while True:
+      with self.stage(name):
+        item = next(iterator, _END)
+      if item is _END:
+        return
+      yield item
+
+  def add_batch(self, num_lines):
+    """
+    Counts a batch of aggregated logs, printing the progress of the run if it is due
+    """
+    self.num_lines += num_lines
+    if self._next_progress is not None and time.monotonic() >= self._next_progress:
+      self._next_progress = time.monotonic() + self.progress_interval
+      self.print_progress()
+
+  def print_progress(self):
+    elapsed = time.perf_counter() - self.start_time
+    print('[progress] %d logs in %.1f s (%.0f logs/sec)' % (self.num_lines, elapsed, self.num_lines / elapsed),
+          file=self.progress_file or sys.stderr)
+
+  def merge(self, other):
+    """
+    Adds the statistics of another run (eg. of a parallel worker) to this one. The times of the stages are summed,
+    so they add up to more than the elapsed time when the workers run in parallel.
+    """
+    for name, seconds in other.stages.items():
+      self.stages[name] = self.stages.get(name, 0.0) + seconds
+    self.num_lines += other.num_lines
+    self.num_bytes += other.num_bytes
+    self.num_parse_errors += other.num_parse_errors
+
+  def get_report(self, reporter=None):
+    """
+    Summarizes the statistics of the run
+
+    :param reporter: the report aggregator of the run, whose get_cardinality method gives the number of distinct
+      hosts and resources
+    :return: an ordered dict of the statistics
+    :rtype: collections.OrderedDict
+    """
+    elapsed = time.perf_counter() - self.start_time
+    report = OrderedDict()
+    report['elapsed_seconds'] = elapsed
+    for name, seconds in self.stages.items():
+      report['%s_seconds' % name] = seconds
+    report['lines'] = self.num_lines
+    report['lines_per_second'] = self.num_lines / elapsed if elapsed else 0.0
+    report['bytes'] = self.num_bytes
+    report['bytes_per_second'] = self.num_bytes / elapsed if elapsed else 0.0
+    report['parse_errors'] = self.num_parse_errors
+    if reporter is not None:
+      report['distinct_hosts'], report['distinct_resources'] = reporter.get_cardinality()
+    report['peak_rss_bytes'] = get_peak_rss()
+    return report
+
+
+def get_peak_rss():
+  """
+  The peak resident set size of this process and of its terminated children (eg. the parallel workers), in bytes
+  """
+  # ru_maxrss is in kilobytes on linux, and in bytes on macOS
+  scale = 1 if sys.platform == 'darwin' else 1024
+  return max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) * scale
@@ -9,5 +9,5 @@ setup(
   author='Siddharth Agrawal',
   author_email='agrawal97siddhath@gmail.com',
   description='Provides python packages to parse http logs and generate aggregation reports',
-  scripts=['scripts/log_reader']
+  scripts=['scripts/log_reader', 'scripts/log_daemon']
 )